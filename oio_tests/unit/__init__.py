@@ -34,6 +34,23 @@ class FakeStorageAPI(ObjectStorageApi):
         self._global_kwargs = dict()
 
 
+class FakeMemcache(object):
+
+    def __init__(self):
+        self.store = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def set(self, key, value, time=0):
+        self.store[key] = value
+        return True
+
+    def delete(self, key):
+        self.store.pop(key, None)
+        return True
+
+
 class DebugLogAdapter(utils.LogAdapter):
 
     def _send_to_logger(name):
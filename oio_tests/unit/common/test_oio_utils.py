@@ -0,0 +1,351 @@
+# Copyright (c) 2020 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import unittest
+from io import BytesIO
+
+from mock import MagicMock as Mock
+
+from swift.common.oio_utils import AutoStoragePolicies, RedisDb, \
+    SharedCounters, log2_bucket
+from swift.proxy.controllers.oio.obj import PrefetchedReader
+
+
+class TestAutoStoragePolicies(unittest.TestCase):
+
+    def test_log2_bucket(self):
+        self.assertEqual(1, log2_bucket(0))
+        self.assertEqual(1, log2_bucket(1))
+        self.assertEqual(2, log2_bucket(2))
+        self.assertEqual(4, log2_bucket(3))
+        self.assertEqual(1024, log2_bucket(1000))
+        self.assertEqual(1024, log2_bucket(1024))
+
+    def test_select(self):
+        policies = AutoStoragePolicies('EC:1000,SINGLE,THREECOPIES:10')
+        self.assertTrue(policies)
+        self.assertEqual([('SINGLE', 0), ('THREECOPIES', 10), ('EC', 1000)],
+                         list(policies))
+        self.assertEqual('SINGLE', policies.select(0))
+        self.assertEqual('SINGLE', policies.select(9))
+        self.assertEqual('THREECOPIES', policies.select(10))
+        self.assertEqual('EC', policies.select(1 << 40))
+
+    def test_no_policies(self):
+        policies = AutoStoragePolicies(None)
+        self.assertFalse(policies)
+        self.assertIsNone(policies.select(100))
+
+    def test_record(self):
+        policies = AutoStoragePolicies('SINGLE,EC:1000')
+        policies.record('EC', 3000, 0.5)
+        policies.record('EC', 4000, 0.0)
+        self.assertEqual({'EC': {
+            'objects': 2,
+            'bytes': 7000,
+            'sizes': {'4096': 2},
+            'throughputs': {'8192': 1},
+        }}, policies.stats)
+
+
+class TestPrefetchedReader(unittest.TestCase):
+
+    def test_read(self):
+        reader = PrefetchedReader(BytesIO(b'56789'), b'01234')
+        self.assertEqual(b'012', reader.read(3))
+        self.assertEqual(b'34', reader.read(3))
+        self.assertEqual(b'567', reader.read(3))
+        self.assertEqual(b'89', reader.read())
+        self.assertEqual(b'', reader.read())
+
+    def test_read_all(self):
+        reader = PrefetchedReader(BytesIO(b'56789'), b'01234')
+        self.assertEqual(b'0', reader.read(1))
+        self.assertEqual(b'123456789', reader.read(-1))
+
+    def test_readline(self):
+        reader = PrefetchedReader(BytesIO(b'a\nb\n'), b'01\n23')
+        self.assertEqual(b'01\n', reader.readline())
+        self.assertEqual(b'23a\n', reader.readline())
+        self.assertEqual(b'b\n', reader.readline())
+        self.assertEqual(b'', reader.readline())
+        reader = PrefetchedReader(BytesIO(b'a\nb\n'), b'01\n23')
+        self.assertEqual(b'0', reader.readline(1))
+        self.assertEqual(b'1\n', reader.readline(5))
+        self.assertEqual(b'23a', reader.readline(3))
+        self.assertEqual(b'\n', reader.readline())
+
+
+class FakeRedis(object):
+    """
+    Minimal in-memory Redis server, which waits `latency` seconds
+    on each round-trip.
+    """
+
+    def __init__(self, data=None, latency=0.0):
+        self.data = data if data is not None else dict()
+        self.latency = latency
+        self.round_trips = 0
+
+    def _round_trip(self):
+        self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _run(self, method, *args, **kwargs):
+        return getattr(self, '_' + method)(*args, **kwargs)
+
+    def _get(self, key):
+        return self.data.get(key)
+
+    def _hget(self, key, path):
+        return self.data.get(key, {}).get(path)
+
+    def _hexists(self, key, path):
+        return path in self.data.get(key, {})
+
+    def _hset(self, key, path, val):
+        new = path not in self.data.setdefault(key, {})
+        self.data[key][path] = val
+        return int(new)
+
+    def _hdel(self, key, path):
+        return int(self.data.get(key, {}).pop(path, None) is not None)
+
+    def _zadd(self, key, mapping, nx=False):
+        zset = self.data.setdefault(key, {})
+        added = [k for k in mapping if k not in zset]
+        zset.update(mapping)
+        return len(added)
+
+    def _zrem(self, key, path):
+        return int(self.data.get(key, {}).pop(path, None) is not None)
+
+    def _zrangebylex(self, key, start, end, offset, count):
+        if start != '-' or end != '+':
+            raise ValueError('not implemented')
+        return sorted(self.data.get(key, {}))[offset:offset + count]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def _call(*args, **kwargs):
+            self._round_trip()
+            return self._run(name, *args, **kwargs)
+        return _call
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline(object):
+
+    def __init__(self, server):
+        self.server = server
+        self.ops = list()
+
+    def __getattr__(self, name):
+        def _queue(*args, **kwargs):
+            self.ops.append((name, args, kwargs))
+            return self
+        return _queue
+
+    def execute(self, raise_on_error=True):
+        self.server._round_trip()
+        results = list()
+        for name, args, kwargs in self.ops:
+            try:
+                results.append(self.server._run(name, *args, **kwargs))
+            except Exception as exc:
+                if raise_on_error:
+                    raise
+                results.append(exc)
+        return results
+
+
+class FakeRedisDb(RedisDb):
+
+    conn = None
+    conn_slave = None
+
+    def __init__(self, master, slave):
+        self.conn = master
+        self.conn_slave = slave
+        self.zset = self.zset3
+
+
+class TestRedisBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.master = FakeRedis()
+        self.slave = FakeRedis(self.master.data)
+        self.db = FakeRedisDb(self.master, self.slave)
+
+    def test_batch(self):
+        self.master.data['h'] = {'a': b'1'}
+        with self.db.batch() as batch:
+            hget = batch.hget('h', 'a')
+            hget_missing = batch.hget('h', 'b')
+            hexists = batch.hexists('h', 'a')
+            hset = batch.hset('h', 'b', b'2')
+            zset = batch.zset('z', 'b')
+            zset2 = batch.zset('z', 'a')
+            self.assertEqual(6, len(batch))
+            self.assertFalse(hget.done)
+        self.assertEqual(0, len(batch))
+        self.assertEqual(1, self.slave.round_trips)
+        self.assertEqual(1, self.master.round_trips)
+        self.assertEqual(b'1', hget.result())
+        # Reads are sent before writes
+        self.assertIsNone(hget_missing.result())
+        self.assertTrue(hexists.result())
+        self.assertEqual(1, hset.result())
+        self.assertEqual(1, zset.result())
+        self.assertEqual(1, zset2.result())
+        self.assertEqual(b'2', self.db.hget('h', 'b'))
+
+        with self.db.batch() as batch:
+            zrange = batch.zrangebylex('z', '-', '+', 10)
+            batch.zdel('z', 'a')
+            batch.hdel('h', 'a')
+        self.assertEqual(['a', 'b'], zrange.result())
+        self.assertEqual({'z': {'b': 1}, 'h': {'b': b'2'}}, self.master.data)
+
+    def test_result_flushes(self):
+        self.master.data['h'] = {'a': b'1'}
+        batch = self.db.batch()
+        res = batch.hexists('h', 'a')
+        self.assertEqual(0, self.slave.round_trips)
+        self.assertTrue(res.result())
+        self.assertEqual(1, self.slave.round_trips)
+        self.assertTrue(res.result())
+        self.assertEqual(1, self.slave.round_trips)
+        # Nothing to send, no round-trip
+        batch.flush()
+        self.assertEqual(1, self.slave.round_trips)
+        self.assertEqual(0, self.master.round_trips)
+
+    def test_reads_on_same_server_as_single_calls(self):
+        # The slave has not replicated the last write yet
+        self.master.data['h'] = {'a': b'1'}
+        self.slave.data = {}
+        self.assertEqual(b'1', self.db.hget('h', 'a'))
+        self.assertFalse(self.db.hexists('h', 'a'))
+        with self.db.batch() as batch:
+            hget = batch.hget('h', 'a')
+            get = batch.get('h')
+            hexists = batch.hexists('h', 'a')
+        self.assertEqual(b'1', hget.result())
+        self.assertEqual({'a': b'1'}, get.result())
+        self.assertFalse(hexists.result())
+
+    def test_errors(self):
+        batch = self.db.batch()
+        ok = batch.hexists('h', 'a')
+        ko = batch.zrangebylex('z', '[a', '+', 10)
+        batch.flush()
+        self.assertFalse(ok.result())
+        self.assertRaises(ValueError, ko.result)
+
+        self.slave.pipeline = Mock(side_effect=IOError('connection lost'))
+        batch = self.db.batch()
+        read = batch.hexists('h', 'a')
+        write = batch.hset('h', 'a', b'1')
+        self.assertRaises(IOError, batch.flush)
+        self.assertRaises(IOError, read.result)
+        self.assertRaises(IOError, write.result)
+        self.assertEqual(0, self.master.round_trips)
+
+    def test_round_trips(self):
+        """Compare serial calls with one batch."""
+        self.master.data['h'] = {str(i): str(i) for i in range(100)}
+
+        serial = [self.db.hget('h', str(i)) for i in range(100)]
+        self.assertEqual(100, self.master.round_trips)
+
+        with self.db.batch() as batch:
+            futures = [batch.hget('h', str(i)) for i in range(100)]
+        batched = [f.result() for f in futures]
+        self.assertEqual(101, self.master.round_trips)
+        self.assertEqual(0, self.slave.round_trips)
+        self.assertEqual(serial, batched)
+
+
+class TestSharedCounters(unittest.TestCase):
+
+    def test_acquire_release(self):
+        counters = SharedCounters(slots=2)
+        self.assertTrue(counters.acquire('GET', 2))
+        self.assertTrue(counters.acquire('PUT', 2, 1))
+        self.assertFalse(counters.acquire('PUT', 3, 1))
+        self.assertFalse(counters.acquire('GET', 2))
+        self.assertEqual(1, counters.in_flight()['GET'])
+        self.assertEqual(1, counters.in_flight()['PUT'])
+        counters.release('PUT')
+        self.assertTrue(counters.acquire('UNKNOWN', 2))
+        self.assertEqual(1, counters.in_flight()['other'])
+        counters.release('GET')
+        counters.release('UNKNOWN')
+        counters.release('GET')
+        self.assertEqual(0, sum(counters.in_flight().values()))
+
+    def test_workers(self):
+        counters = SharedCounters(slots=2)
+        self.assertTrue(counters.acquire('GET'))
+
+        def _run_worker(max_requests):
+            pid = os.fork()
+            if pid == 0:
+                # The child takes the other slot, and dies with
+                # a request in progress.
+                ok = counters.acquire('GET', max_requests) and \
+                    not counters.acquire('GET', max_requests)
+                os._exit(0 if ok else 1)
+            return os.waitpid(pid, 0)[1]
+
+        self.assertEqual(0, _run_worker(2))
+        self.assertEqual(2, counters.in_flight()['GET'])
+        self.assertFalse(counters.acquire('GET', 2))
+        # The slot of the dead worker is reused by the next one,
+        # and its counters are reset.
+        self.assertEqual(0, _run_worker(2))
+        self.assertEqual(2, counters.in_flight()['GET'])
+
+    def test_lock_held(self):
+        # A worker killed while holding the lock must not block the others.
+        counters = SharedCounters(slots=2, claim_timeout=0.05)
+        counters._lock.acquire()
+        self.assertTrue(counters.acquire('GET', 1))
+        self.assertTrue(counters.acquire('GET', 1))
+        self.assertEqual(0, counters.in_flight()['GET'])
+        counters._lock.release()
+        self.assertTrue(counters.acquire('GET', 1))
+        self.assertFalse(counters.acquire('GET', 1))
+        self.assertEqual(1, counters.in_flight()['GET'])
+
+    def test_backends(self):
+        counters = SharedCounters()
+        counters.record_backend('container')
+        counters.record_backend('container', error=True)
+        counters.record_backend('unknown', error=True)
+        stats = counters.stats()
+        self.assertEqual({'requests': 2, 'errors': 1, 'error_rate': 0.5},
+                         stats['backends']['container'])
+        self.assertEqual({'requests': 0, 'errors': 0, 'error_rate': 0.0},
+                         stats['backends']['object'])
+        self.assertEqual(0, stats['in_flight']['GET'])
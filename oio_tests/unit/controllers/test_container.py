@@ -13,11 +13,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.from __future__ import print_function
 
+import json
 import unittest
+from eventlet import sleep
 from mock import patch
 from mock import MagicMock as Mock
 
 from swift.common.ring import FakeRing
+from swift.common.utils import LRUCache
 from swift.common.swob import Request
 from swift.proxy import oio_server as proxy_server
 from swift.proxy.controllers.base import headers_to_container_info
@@ -134,3 +137,107 @@ class TestContainerController(unittest.TestCase):
         meta = self.storage.container.container_set_properties.call_args[0][2]
         self.assertEqual(meta[sys_meta_key], 'foo')
         self.assertEqual(meta[user_meta_key], 'bar')
+
+    def _fake_object_list(self, names):
+        def _object_list(account, container, marker=None, limit=None,
+                         **kwargs):
+            remaining = [n for n in names if n > (marker or '')]
+            page = remaining[:limit]
+            return {'objects': [{'name': n, 'size': 1, 'mtime': '1.0',
+                                 'hash': 'ABCD', 'mime_type': 'text/plain'}
+                                for n in page],
+                    'truncated': len(remaining) > limit,
+                    'next_marker': page[-1] if page else None,
+                    'properties': {}, 'system': {}}
+        self.storage.object_list = Mock(side_effect=_object_list)
+
+    def _list(self, query):
+        req = Request.blank('/v1/a/c?format=json&' + query)
+        resp = req.get_response(self.app)
+        self.assertEqual(200, resp.status_int)
+        return [r['name'] for r in json.loads(resp.body)]
+
+    def test_listing_formats(self):
+        self._fake_object_list(['a', 'b'])
+        self.storage.object_list.return_value = {}
+        req = Request.blank('/v1/a/c?format=json')
+        resp = req.get_response(self.app)
+        self.assertEqual(
+            [{'name': 'a', 'bytes': 1, 'hash': 'abcd', 'is_latest': True,
+              'content_type': 'text/plain',
+              'last_modified': '1970-01-01T00:00:01.000000'},
+             {'name': 'b', 'bytes': 1, 'hash': 'abcd', 'is_latest': True,
+              'content_type': 'text/plain',
+              'last_modified': '1970-01-01T00:00:01.000000'}],
+            json.loads(resp.body))
+
+        req = Request.blank('/v1/a/c?format=xml')
+        resp = req.get_response(self.app)
+        self.assertEqual(200, resp.status_int)
+        self.assertTrue(resp.body.startswith(
+            b'<?xml version="1.0" encoding="UTF-8"?>'))
+        self.assertIn(b'<object><name>a</name><hash>abcd</hash>', resp.body)
+        self.assertIn(b'<is_latest>True</is_latest>', resp.body)
+
+        req = Request.blank('/v1/a/c')
+        resp = req.get_response(self.app)
+        self.assertEqual(b'a\nb\n', resp.body)
+
+    def test_listing_xml_container_name(self):
+        self._fake_object_list(['a'])
+        req = Request.blank('/v1/a/%E2%98%83?format=xml')
+        resp = req.get_response(self.app)
+        self.assertEqual(200, resp.status_int)
+        self.assertIn(u'<container name="\u2603">'.encode('utf-8'),
+                      resp.body)
+
+    def test_listing_xml_malformed_record(self):
+        # No hash, the XML listing would have an empty element
+        self.storage.object_list = Mock(return_value={
+            'objects': [{'name': 'a', 'size': 1, 'mtime': '1.0'}],
+            'properties': {}, 'system': {}})
+        req = Request.blank('/v1/a/c?format=xml')
+        resp = req.get_response(self.app)
+        self.assertEqual(500, resp.status_int)
+
+    def test_listing_prefetch(self):
+        names = ['obj%02d' % i for i in range(10)]
+        self._fake_object_list(names)
+        self.app.listing_cache = LRUCache(maxsize=10, maxtime=5.0)
+
+        # First page, the second one is fetched in the background
+        self.assertEqual(names[0:3], self._list('limit=3'))
+        # Like s3api, ask for one more object than the client wants,
+        # and use the last object sent to the client as the next marker.
+        self.assertEqual(names[2:5], self._list('limit=3&marker=obj01'))
+        self.assertEqual(names[5:8], self._list('limit=3&marker=obj04'))
+        self.assertEqual(names[8:], self._list('limit=3&marker=obj07'))
+        markers = [c[1]['marker']
+                   for c in self.storage.object_list.call_args_list]
+        self.assertEqual(['', 'obj02', 'obj05', 'obj08'], markers)
+
+        # Different parameters or markers out of the cursor are listed
+        # from the backend.
+        self.assertEqual(names[0:3], self._list('limit=3'))
+        self.assertEqual(names[9:], self._list('limit=3&marker=obj08'))
+        self.assertEqual(names[5:8], self._list('limit=3&marker=obj04'))
+        sleep(0)
+        self.assertEqual(['', 'obj02', 'obj08', 'obj04', 'obj07'],
+                         [c[1]['marker'] for c in
+                          self.storage.object_list.call_args_list[4:]])
+
+    def test_listing_prefetch_error(self):
+        names = ['obj%02d' % i for i in range(10)]
+        self._fake_object_list(names)
+        self.app.listing_cache = LRUCache(maxsize=10, maxtime=5.0)
+        object_list = self.storage.object_list.side_effect
+        self.storage.object_list.side_effect = \
+            [object_list('a', 'c', marker='', limit=5),
+             Exception('prefetch failed')]
+        self.assertEqual(names[0:5], self._list('limit=5'))
+        sleep(0)
+        self.storage.object_list.side_effect = object_list
+        self.assertEqual(names[5:], self._list('limit=5&marker=obj04'))
+        self.assertEqual(['obj04', 'obj04'],
+                         [c[1]['marker'] for c in
+                          self.storage.object_list.call_args_list[1:]])
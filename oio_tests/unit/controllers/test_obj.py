@@ -17,20 +17,27 @@
 # Python API, and thus will stop working at some point.
 
 import unittest
+from io import BytesIO
 from mock import MagicMock as Mock
 from mock import patch, ANY
 
-from eventlet import Timeout
+from eventlet import Timeout, sleep
 
 from oio.common import exceptions as exc
 from oio.common import green as oiogreen
+from oio.common.constants import FORCEVERSIONING_HEADER
 from oio.common.http import CustomHttpConnection
 from swift.proxy.controllers.base import get_info as _real_get_info
 from swift.common import swob
+from swift.common.exceptions import ShortReadError
 from swift.common.ring import FakeRing
-from swift.common.utils import Timestamp
+from swift.common.oio_utils import AutoStoragePolicies, \
+    clear_versioning_cache
+from swift.common.utils import LRUCache, Timestamp
 from swift.proxy import oio_server as proxy_server
-from oio_tests.unit import FakeStorageAPI, debug_logger
+from swift.proxy.controllers.oio.obj import BUCKET_NAME_HEADER, \
+    ObjectController, StreamRangeIterator, coalesce_ranges
+from oio_tests.unit import FakeMemcache, FakeStorageAPI, debug_logger
 
 
 def fake_stream(length, exception=None):
@@ -175,6 +182,151 @@ class TestObjectController(unittest.TestCase):
         self.assertEqual(resp.status_int, 200)
         self.assertIn('Accept-Ranges', resp.headers)
 
+    def _prepare_check_state(self, chunk_method, chunks):
+        self.app.check_state = True
+        self.app.check_state_timeout = 0.5
+        ret_val = {
+            'mtime': 0,
+            'hash': 'aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa',
+            'length': 1,
+            'deleted': False,
+            'version': 42,
+            'chunk_method': chunk_method,
+        }
+        self.storage.object_locate = Mock(return_value=(ret_val, chunks))
+
+    def test_HEAD_check_state(self):
+        chunks = [{'url': 'http://rawx/%d.%d' % (pos, cpy), 'pos': str(pos)}
+                  for pos in range(3) for cpy in range(2)]
+        self._prepare_check_state('plain/nb_copy=2', chunks)
+        self.storage._blob_client.chunk_head = Mock()
+        req = Request.blank('/v1/a/c/o', method='HEAD',
+                            environ={'swift.perfdata': {}})
+        resp = req.get_response(self.app)
+        self.assertEqual(resp.status_int, 200)
+        # One chunk per position is enough
+        self.assertEqual(3, self.storage._blob_client.chunk_head.call_count)
+        perfdata = req.environ['swift.perfdata']['check_state']
+        self.assertEqual({'pos0', 'pos1', 'pos2', 'overall'}, set(perfdata))
+
+    def test_HEAD_check_state_ec(self):
+        chunks = [{'url': 'http://rawx/%d.%d' % (pos, num),
+                   'pos': '%d.%d' % (pos, num)}
+                  for pos in range(2) for num in range(3)]
+        self._prepare_check_state(
+            'ec/algo=liberasurecode_rs_vand,k=2,m=1', chunks)
+
+        def _chunk_head(url, **kwargs):
+            if url == 'http://rawx/1.0':
+                raise exc.NotFound()
+            return {}
+
+        self.storage._blob_client.chunk_head = Mock(side_effect=_chunk_head)
+        req = Request.blank('/v1/a/c/o', method='HEAD')
+        resp = req.get_response(self.app)
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(5, self.storage._blob_client.chunk_head.call_count)
+
+    def test_HEAD_check_state_missing_chunks(self):
+        chunks = [{'url': 'http://rawx/%d.%d' % (pos, num),
+                   'pos': '%d.%d' % (pos, num)}
+                  for pos in range(2) for num in range(3)]
+        self._prepare_check_state(
+            'ec/algo=liberasurecode_rs_vand,k=2,m=1', chunks)
+
+        def _chunk_head(url, **kwargs):
+            if url.startswith('http://rawx/1.') and url != 'http://rawx/1.2':
+                raise exc.NotFound()
+            return {}
+
+        self.storage._blob_client.chunk_head = Mock(side_effect=_chunk_head)
+        req = Request.blank('/v1/a/c/o', method='HEAD')
+        resp = req.get_response(self.app)
+        self.assertEqual(resp.status_int, 400)
+
+    def test_HEAD_check_state_deadline(self):
+        chunks = [{'url': 'http://rawx/0.%d' % cpy, 'pos': '0'}
+                  for cpy in range(2)]
+        self._prepare_check_state('plain/nb_copy=2', chunks)
+        self.app.check_state_timeout = 0.01
+
+        def _chunk_head(url, **kwargs):
+            sleep(1.0)
+
+        self.storage._blob_client.chunk_head = Mock(side_effect=_chunk_head)
+        req = Request.blank('/v1/a/c/o', method='HEAD')
+        resp = req.get_response(self.app)
+        self.assertEqual(resp.status_int, 503)
+
+    def test_enforce_versioning_no_cache(self):
+        self.assertIsNone(self.app.versioning_cache)
+        self.app.memcache = FakeMemcache()
+        get_props = self.storage.container.container_get_properties
+        get_props.return_value = {
+            'properties': {}, 'system': {'sys.m2.policy.version': '-1'}}
+        controller = ObjectController(self.app, 'a', 'c', 'o')
+        for _ in range(2):
+            req = Request.blank('/v1/a/c/o', method='PUT',
+                                headers={BUCKET_NAME_HEADER: 'c'})
+            controller.enforce_versioning(req)
+            self.assertEqual('-1', req.headers.get(FORCEVERSIONING_HEADER))
+        # Served by memcache
+        self.assertEqual(1, get_props.call_count)
+
+    def test_enforce_versioning_cache(self):
+        self.app.versioning_cache = LRUCache(maxsize=10, maxtime=5.0)
+        self.app.memcache = FakeMemcache()
+        get_props = self.storage.container.container_get_properties
+        get_props.return_value = {
+            'properties': {}, 'system': {'sys.m2.policy.version': '-1'}}
+        controller = ObjectController(self.app, 'a', 'c', 'o')
+
+        def _enforce():
+            req = Request.blank('/v1/a/c/o', method='PUT',
+                                headers={BUCKET_NAME_HEADER: 'c'})
+            controller.enforce_versioning(req)
+            return req.headers.get(FORCEVERSIONING_HEADER)
+
+        self.assertEqual('-1', _enforce())
+        self.assertEqual(1, get_props.call_count)
+        self.assertEqual('-1', self.app.memcache.get('versioning/a/c'))
+        # Served by the worker cache, even without memcache
+        self.app.memcache.delete('versioning/a/c')
+        self.assertEqual('-1', _enforce())
+        self.assertEqual(1, get_props.call_count)
+
+        # Versioning is suspended, the change is seen once caches are clear
+        get_props.return_value = {'properties': {}, 'system': {}}
+        clear_versioning_cache(self.app, {}, 'a', 'c')
+        self.assertIsNone(_enforce())
+        self.assertEqual(2, get_props.call_count)
+        self.assertIsNone(_enforce())
+        self.assertEqual(2, get_props.call_count)
+
+    def test_enforce_versioning_cache_missing_container(self):
+        self.app.versioning_cache = LRUCache(maxsize=10, maxtime=5.0)
+        self.app.memcache = FakeMemcache()
+        get_props = self.storage.container.container_get_properties
+        get_props.side_effect = exc.NoSuchContainer()
+        controller = ObjectController(self.app, 'a', 'c', 'o')
+        for _ in range(2):
+            req = Request.blank('/v1/a/c/o', method='PUT',
+                                headers={BUCKET_NAME_HEADER: 'c'})
+            self.assertRaises(swob.HTTPException,
+                              controller.enforce_versioning, req)
+        # Missing containers are not cached
+        self.assertEqual(2, get_props.call_count)
+        self.assertIsNone(self.app.memcache.get('versioning/a/c'))
+
+        # The container is created through another worker
+        get_props.side_effect = None
+        get_props.return_value = {
+            'properties': {}, 'system': {'sys.m2.policy.version': '-1'}}
+        req = Request.blank('/v1/a/c/o', method='PUT',
+                            headers={BUCKET_NAME_HEADER: 'c'})
+        controller.enforce_versioning(req)
+        self.assertEqual('-1', req.headers.get(FORCEVERSIONING_HEADER))
+
     def test_GET_if_none_match_not_star(self):
         """
         An object with different hash exists -> accept
@@ -228,6 +380,63 @@ class TestObjectController(unittest.TestCase):
         self.assertIn('Etag', resp.headers)
         self.assertIn(ret_val[2], resp.headers['Etag'])
 
+    def test_PUT_auto_storage_policy(self):
+        self.app.oio_stgpol = AutoStoragePolicies(
+            'SINGLE,THREECOPIES:10,EC:100', buffer_size=100)
+        self.app.recon_stats = Mock()
+        ret_val = ({}, 50, 'd41d8cd98f00b204e9800998ecf8427e')
+        _, mock = self._patch_object_create(return_value=ret_val)
+
+        req = Request.blank('/v1/a/c/o', method='PUT', body=b'X' * 50)
+        resp = req.get_response(self.app)
+        self.assertEqual(201, resp.status_int)
+        self.assertEqual('THREECOPIES', mock.call_args[1]['policy'])
+        self.assertEqual({'THREECOPIES'}, set(self.app.oio_stgpol.stats))
+        stats = self.app.oio_stgpol.stats['THREECOPIES']
+        self.assertEqual(1, stats['objects'])
+        self.assertEqual(50, stats['bytes'])
+        self.assertEqual({'64': 1}, stats['sizes'])
+        self.assertEqual(1, sum(stats['throughputs'].values()))
+        self.app.recon_stats.maybe_dump.assert_called_once_with()
+
+    def test_auto_storage_policy_above_buffer_size(self):
+        proxy_server.Application(
+            {'sds_namespace': "NS",
+             'auto_storage_policies': 'SINGLE,EC:2097152',
+             'auto_storage_policies_buffer_size': '1048576'},
+            account_ring=FakeRing(), container_ring=FakeRing(),
+            storage=self.storage, logger=self.logger)
+        self.assertEqual(
+            ['Storage policy EC will not be chosen for uploads with chunked '
+             'transfer encoding, its minimum size (2097152) is above '
+             'auto_storage_policies_buffer_size (1048576)'],
+            self.logger.get_lines_for_level('warning'))
+
+    def test_PUT_auto_storage_policy_chunked(self):
+        self.app.oio_stgpol = AutoStoragePolicies(
+            'SINGLE,THREECOPIES:10,EC:100', buffer_size=100)
+        self.app.recon_stats = Mock()
+        uploaded = []
+
+        def _object_create(*args, **kwargs):
+            uploaded.append(kwargs['file_or_path'].read())
+            return ({}, len(uploaded[-1]), 'etag', {})
+
+        self.storage.object_create_ext = Mock(side_effect=_object_create)
+        for size, policy in ((5, 'SINGLE'), (99, 'THREECOPIES'),
+                             (100, 'EC'), (1000, 'EC')):
+            req = Request.blank(
+                '/v1/a/c/o', method='PUT',
+                headers={'Transfer-Encoding': 'chunked'},
+                environ={'wsgi.input': BytesIO(b'X' * size)})
+            resp = req.get_response(self.app)
+            self.assertEqual(201, resp.status_int)
+            self.assertEqual(
+                policy,
+                self.storage.object_create_ext.call_args[1]['policy'])
+            # Prefetched data is sent to the backend
+            self.assertEqual(b'X' * size, uploaded[-1])
+
     def test_PUT_last_modified_with_mtime(self):
         if not hasattr(self.storage, "object_create_ext"):
             self.skipTest("No object_create_ext method")
@@ -475,6 +684,182 @@ class TestObjectController(unittest.TestCase):
         self.assertEqual('1', resp.headers['Content-Length'])
         self.assertEqual(1, len(resp.body))
 
+    def test_GET_multiple_ranges(self):
+        data = b''.join(chr(ord('a') + i).encode('ascii') * 10
+                        for i in range(10))
+        req = Request.blank('/v1/a/c/o',
+                            headers={'Range': 'bytes=10-14,15-24,50-54,5-9'})
+
+        def _fetch_stream(ranges):
+            # Like the SDK, yield buffers not aligned with the ranges
+            for start, end in ranges:
+                for offset in range(start, end + 1, 3):
+                    yield data[offset:min(offset + 3, end + 1)]
+
+        def _object_fetch(*args, **kwargs):
+            return ({
+                'hash': 'aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa',
+                'mtime': 0,
+                'length': len(data),
+                'deleted': False,
+                'version': 42,
+            }, _fetch_stream(kwargs['ranges']))
+
+        self.storage.object_fetch = Mock(side_effect=_object_fetch)
+        resp = req.get_response(self.app)
+        self.assertEqual(resp.status_int, 206)
+        # Adjacent and overlapping ranges are fetched at once
+        self.assertEqual(1, self.storage.object_fetch.call_count)
+        self.assertEqual(
+            [(5, 24), (50, 54)],
+            self.storage.object_fetch.call_args[1]['ranges'])
+        body = resp.body
+        self.assertEqual(int(resp.headers['Content-Length']), len(body))
+        for start, end in ((10, 14), (15, 24), (50, 54), (5, 9)):
+            self.assertIn(
+                ('Content-Range: bytes %d-%d/100\r\n\r\n' %
+                 (start, end)).encode('ascii') + data[start:end + 1] +
+                b'\r\n', body)
+
+    def test_GET_multiple_ranges_reversed(self):
+        data = b''.join(chr(ord('a') + i % 26).encode('ascii') * 10
+                        for i in range(100))
+        req = Request.blank('/v1/a/c/o',
+                            headers={'Range': 'bytes=999-999,0-998'})
+
+        def _fetch_stream(ranges):
+            for start, end in ranges:
+                for offset in range(start, end + 1, 3):
+                    yield data[offset:min(offset + 3, end + 1)]
+
+        def _object_fetch(*args, **kwargs):
+            return ({
+                'hash': 'aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa',
+                'mtime': 0,
+                'length': len(data),
+                'deleted': False,
+                'version': 42,
+            }, _fetch_stream(kwargs['ranges']))
+
+        held_sizes = []
+        orig_hold = StreamRangeIterator._hold
+
+        def _hold(iterator, offset, dat):
+            orig_hold(iterator, offset, dat)
+            held_sizes.append(iterator.held_bytes)
+
+        self.storage.object_fetch = Mock(side_effect=_object_fetch)
+        self.app.object_chunk_size = 10
+        with patch.object(StreamRangeIterator, '_hold', _hold):
+            resp = req.get_response(self.app)
+            self.assertEqual(resp.status_int, 206)
+            body = resp.body
+        self.assertEqual(int(resp.headers['Content-Length']), len(body))
+        for start, end in ((999, 999), (0, 998)):
+            self.assertIn(
+                ('Content-Range: bytes %d-%d/1000\r\n\r\n' %
+                 (start, end)).encode('ascii') + data[start:end + 1] +
+                b'\r\n', body)
+        # At most 4 chunks were kept in memory, the rest was fetched again
+        self.assertTrue(held_sizes)
+        self.assertLessEqual(max(held_sizes), 40)
+        calls = self.storage.object_fetch.call_args_list
+        self.assertEqual([(0, 999)], calls[0][1]['ranges'])
+        self.assertEqual([(39, 998)], calls[1][1]['ranges'])
+        self.assertEqual(42, calls[1][1]['version'])
+        self.assertEqual(2, len(calls))
+
+    def test_GET_multiple_ranges_truncated_refetch(self):
+        data = b''.join(chr(ord('a') + i % 26).encode('ascii') * 10
+                        for i in range(100))
+        req = Request.blank('/v1/a/c/o',
+                            headers={'Range': 'bytes=999-999,0-998'})
+
+        def _object_fetch(*args, **kwargs):
+            start, end = kwargs['ranges'][0]
+            if self.storage.object_fetch.call_count > 1:
+                # The data fetched again is cut short
+                end -= 100
+            return ({
+                'hash': 'aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa',
+                'mtime': 0,
+                'length': len(data),
+                'deleted': False,
+                'version': 42,
+            }, (data[offset:min(offset + 10, end + 1)]
+                for offset in range(start, end + 1, 10)))
+
+        self.storage.object_fetch = Mock(side_effect=_object_fetch)
+        self.app.object_chunk_size = 10
+        resp = req.get_response(self.app)
+        self.assertEqual(resp.status_int, 206)
+        self.assertRaises(ShortReadError, lambda: resp.body)
+        self.assertEqual(2, self.storage.object_fetch.call_count)
+
+    def test_coalesce_ranges(self):
+        ranges = [(10, 14), (15, 24), (50, 54), (5, 9), (60, 69), (90, 99)]
+        self.assertEqual([(5, 24), (50, 54), (60, 69), (90, 99)],
+                         coalesce_ranges(ranges))
+        self.assertEqual([(5, 24), (50, 69), (90, 99)],
+                         coalesce_ranges(ranges, gap=5))
+        self.assertEqual([(5, 24), (50, 69), (90, 99)],
+                         coalesce_ranges(ranges, max_ranges=3))
+        # The smallest gap is merged first
+        self.assertEqual([(5, 24), (50, 99)],
+                         coalesce_ranges(ranges, gap=5, max_ranges=2))
+        self.assertEqual([(5, 99)], coalesce_ranges(ranges, max_ranges=1))
+        # Unknown bounds: nothing merged
+        self.assertEqual([(0, 4), (None, 10)],
+                         coalesce_ranges([(0, 4), (None, 10)], gap=100))
+
+    def test_GET_multiple_ranges_gap(self):
+        data = b''.join(chr(ord('a') + i).encode('ascii') * 10
+                        for i in range(10))
+        req = Request.blank(
+            '/v1/a/c/o', headers={'Range': 'bytes=10-14,60-64,20-24,90-94'})
+
+        def _object_fetch(*args, **kwargs):
+            return ({
+                'hash': 'aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa',
+                'mtime': 0,
+                'length': len(data),
+                'deleted': False,
+                'version': 42,
+            }, (data[start:end + 1] for start, end in kwargs['ranges']))
+
+        self.storage.object_fetch = Mock(side_effect=_object_fetch)
+        self.app.range_coalesce_gap = 5
+        self.app.max_fetched_ranges = 2
+        resp = req.get_response(self.app)
+        self.assertEqual(resp.status_int, 206)
+        self.assertEqual(
+            [(10, 24), (60, 94)],
+            self.storage.object_fetch.call_args[1]['ranges'])
+        body = resp.body
+        self.assertEqual(int(resp.headers['Content-Length']), len(body))
+        for start, end in ((10, 14), (60, 64), (20, 24), (90, 94)):
+            self.assertIn(
+                ('Content-Range: bytes %d-%d/100\r\n\r\n' %
+                 (start, end)).encode('ascii') + data[start:end + 1] +
+                b'\r\n', body)
+        # The bytes fetched between the ranges are not sent
+        self.assertNotIn(data[65:90], body)
+
+    def test_GET_range_truncated_stream(self):
+        req = Request.blank('/v1/a/c/o',
+                            headers={'Range': 'bytes=0-4,10-14'})
+        ret_value = ({
+            'hash': 'aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa',
+            'mtime': 0,
+            'length': 20,
+            'deleted': False,
+            'version': 42,
+        }, fake_stream(7))
+        self.storage.object_fetch = Mock(return_value=ret_value)
+        resp = req.get_response(self.app)
+        self.assertEqual(resp.status_int, 206)
+        self.assertRaises(ShortReadError, lambda: resp.body)
+
     def test_GET_not_found(self):
         req = Request.blank('/v1/a/c/o')
         self.storage.object_fetch = Mock(side_effect=exc.NoSuchObject)
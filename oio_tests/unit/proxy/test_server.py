@@ -0,0 +1,123 @@
+# Copyright (c) 2020 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from eventlet import sleep, spawn
+from mock import MagicMock as Mock, patch
+
+from swift.common.oio_utils import SharedCounters
+from swift.common.ring import FakeRing
+from swift.common.swob import Request
+from swift.proxy import oio_server as proxy_server
+from oio.common import exceptions as oioexc
+from oio_tests.unit import FakeStorageAPI, debug_logger
+
+
+class TestAdmissionControl(unittest.TestCase):
+    def setUp(self):
+        self.logger = debug_logger('proxy-server')
+        self.storage = FakeStorageAPI(logger=self.logger)
+        self.counters = SharedCounters()
+        self.app = proxy_server.Application(
+            {'sds_namespace': "TEST",
+             'oioswift_counters': [self.counters],
+             'max_concurrent_requests': '2',
+             'max_concurrent_requests_per_verb': 'PUT:1, post:1'},
+            account_ring=FakeRing(), container_ring=FakeRing(),
+            storage=self.storage, logger=self.logger)
+        self.storage.account_show = Mock(return_value={
+            'ctime': 0, 'containers': 2, 'objects': 2, 'bytes': 2,
+            'metadata': {}})
+
+    def _head(self):
+        req = Request.blank('/v1/AUTH_openio', method='HEAD')
+        resp = req.get_response(self.app)
+        # Consume (and close) the body, like a WSGI server would do.
+        resp.body
+        return resp
+
+    def test_conf(self):
+        self.assertEqual(2, self.app.max_concurrent_requests)
+        self.assertEqual({'PUT': 1, 'POST': 1},
+                         self.app.max_concurrent_requests_per_verb)
+        self.assertEqual(0.0, self.app.admission_queue_timeout)
+
+    def test_global_conf_callback(self):
+        global_conf = {}
+        proxy_server.global_conf_callback({'workers': '3'}, global_conf)
+        self.assertNotIn('oioswift_counters', global_conf)
+
+        proxy_server.global_conf_callback(
+            {'workers': '3', 'max_concurrent_requests_per_verb': 'PUT:1'},
+            global_conf)
+        self.assertIsInstance(global_conf['oioswift_counters'][0],
+                              SharedCounters)
+        self.assertEqual(6, global_conf['oioswift_counters'][0].slots)
+
+    def test_no_limit(self):
+        app = proxy_server.Application(
+            {'sds_namespace': "TEST",
+             'oioswift_counters': [self.counters]},
+            account_ring=FakeRing(), container_ring=FakeRing(),
+            storage=self.storage, logger=self.logger)
+        self.assertIsNone(app.shared_counters)
+
+    def test_admission(self):
+        self.assertEqual(204, self._head().status_int)
+        self.assertEqual(0, sum(self.counters.in_flight().values()))
+
+        self.counters.acquire('GET')
+        self.counters.acquire('PUT')
+        with patch.object(self.app.logger, 'increment') as increment:
+            resp = self._head()
+        self.assertEqual(503, resp.status_int)
+        self.assertEqual('1', resp.headers['Retry-After'])
+        increment.assert_called_once_with('admission.rejected')
+
+        self.counters.release('PUT')
+        self.assertEqual(204, self._head().status_int)
+        self.assertEqual({'requests': 2, 'errors': 0, 'error_rate': 0.0},
+                         self.counters.stats()['backends']['account'])
+
+    def test_release_on_close(self):
+        req = Request.blank('/v1/AUTH_openio', method='HEAD')
+        start_response = Mock()
+        app_iter = self.app(req.environ, start_response)
+        self.assertEqual('204 No Content', start_response.call_args[0][0])
+        # The request is in progress until the body has been sent.
+        self.assertEqual(1, self.counters.in_flight()['HEAD'])
+        list(app_iter)
+        self.assertEqual(1, self.counters.in_flight()['HEAD'])
+        app_iter.close()
+        self.assertEqual(0, self.counters.in_flight()['HEAD'])
+        app_iter.close()
+        self.assertEqual(0, self.counters.in_flight()['HEAD'])
+
+    def test_admission_queue(self):
+        self.app.admission_queue_timeout = 1.0
+        self.counters.acquire('GET')
+        self.counters.acquire('GET')
+
+        def _release():
+            sleep(0.05)
+            self.counters.release('GET')
+        spawn(_release)
+        self.assertEqual(204, self._head().status_int)
+
+    def test_backend_errors(self):
+        self.storage.account_show = Mock(side_effect=oioexc.ServiceBusy)
+        self.assertEqual(503, self._head().status_int)
+        self.assertEqual({'requests': 1, 'errors': 1, 'error_rate': 1.0},
+                         self.counters.stats()['backends']['account'])
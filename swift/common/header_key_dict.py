@@ -16,6 +16,41 @@
 import six
 
 
+class NormalizationCache(dict):
+    """
+    Memoize a header name normalization function.
+
+    The same few dozens of header names are normalized again and again
+    by every middleware a request goes through, so the results are
+    shared by all requests of a process. Header names come from clients,
+    hence the table is emptied when it reaches `maxsize` entries.
+
+    :param func: the normalization function, taking a single string
+    :param maxsize: maximum number of names to remember
+    """
+    def __init__(self, func, maxsize=1024):
+        super(NormalizationCache, self).__init__()
+        self.func = func
+        self.maxsize = maxsize
+
+    def __missing__(self, name):
+        normalized = self.func(name)
+        if len(self) >= self.maxsize:
+            self.clear()
+        self[name] = normalized
+        return normalized
+
+
+def _title(s):
+    if six.PY2:
+        return s.title()
+    else:
+        return s.encode('latin1').title().decode('latin1')
+
+
+_titles = NormalizationCache(_title)
+
+
 class HeaderKeyDict(dict):
     """
     A dict that title-cases all keys on the way in, so as to be
@@ -31,18 +66,16 @@ class HeaderKeyDict(dict):
 
     @staticmethod
     def _title(s):
-        if six.PY2:
-            return s.title()
-        else:
-            return s.encode('latin1').title().decode('latin1')
+        return _titles[s]
 
     def update(self, other):
+        # __setitem__ takes care of the title-casing
         if hasattr(other, 'keys'):
             for key in other.keys():
-                self[self._title(key)] = other[key]
+                self[key] = other[key]
         else:
             for key, value in other:
-                self[self._title(key)] = value
+                self[key] = value
 
     def __getitem__(self, key):
         return dict.get(self, self._title(key))
@@ -54,10 +54,15 @@ from hashlib import md5
 
 from eventlet.green import socket
 from eventlet.pools import Pool
-from eventlet import Timeout
+from eventlet import GreenPile, Timeout
 from six.moves import range
 from swift.common import utils
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 DEFAULT_MEMCACHED_PORT = 11211
 
 CONN_TIMEOUT = 0.3
@@ -65,9 +70,15 @@ POOL_TIMEOUT = 1.0  # WAG
 IO_TIMEOUT = 2.0
 PICKLE_FLAG = 1
 JSON_FLAG = 2
+MSGPACK_FLAG = 4
+SERIALIZERS = ('json', 'msgpack')
 NODE_WEIGHT = 50
 PICKLE_PROTOCOL = 2
 TRY_COUNT = 3
+# time (in seconds) a worker is given to recompute an expired near-cached
+# value, before another worker tries
+LEASE_TIME = 5
+NEAR_CACHE_PREFIXES = ('account/', 'container/')
 
 # if ERROR_LIMIT_COUNT errors occur in ERROR_LIMIT_TIME seconds, the server
 # will be considered failed for ERROR_LIMIT_DURATION seconds.
@@ -97,13 +108,13 @@ def sanitize_timeout(timeout):
     return int(timeout)
 
 
-def set_msg(key, flags, timeout, value):
+def set_msg(key, flags, timeout, value, command=b'set'):
     if not isinstance(key, bytes):
         raise TypeError('key must be bytes')
     if not isinstance(value, bytes):
         raise TypeError('value must be bytes')
     return b' '.join([
-        b'set',
+        command,
         key,
         str(flags).encode('ascii'),
         str(timeout).encode('ascii'),
@@ -160,7 +171,15 @@ class MemcacheRing(object):
     def __init__(self, servers, connect_timeout=CONN_TIMEOUT,
                  io_timeout=IO_TIMEOUT, pool_timeout=POOL_TIMEOUT,
                  tries=TRY_COUNT, allow_pickle=False, allow_unpickle=False,
-                 max_conns=2, logger=None):
+                 max_conns=2, logger=None, serializer='json',
+                 near_cache_ttl=0, near_cache_stale_ttl=0,
+                 near_cache_size=1000,
+                 near_cache_prefixes=NEAR_CACHE_PREFIXES):
+        if serializer not in SERIALIZERS:
+            raise ValueError('Unknown memcache serializer %r' % serializer)
+        if serializer == 'msgpack' and msgpack is None:
+            raise ValueError('The msgpack serializer requires the msgpack '
+                             'package')
         self._ring = {}
         self._errors = dict(((serv, []) for serv in servers))
         self._error_limited = dict(((serv, 0) for serv in servers))
@@ -178,6 +197,21 @@ class MemcacheRing(object):
         self._pool_timeout = pool_timeout
         self._allow_pickle = allow_pickle
         self._allow_unpickle = allow_unpickle or allow_pickle
+        self._serializer = serializer
+        # Values of hot keys are kept by each worker for near_cache_ttl
+        # seconds, then served (by all workers but one) for at most
+        # near_cache_stale_ttl more seconds while they are missing from
+        # memcache, while one worker holding a lease recomputes them.
+        if near_cache_ttl > 0:
+            self._near_cache = utils.LRUCache(
+                maxsize=near_cache_size,
+                maxtime=near_cache_ttl + near_cache_stale_ttl)
+        else:
+            self._near_cache = None
+        self._near_cache_ttl = near_cache_ttl
+        self._near_cache_stale_ttl = near_cache_stale_ttl
+        self._near_cache_prefixes = tuple(near_cache_prefixes)
+        self._leases = {}
         if logger is None:
             self.logger = logging.getLogger()
         else:
@@ -220,19 +254,26 @@ class MemcacheRing(object):
                 self._error_limited[server] = now + ERROR_LIMIT_DURATION
                 self.logger.error('Error limiting server %s', server)
 
-    def _get_conns(self, key):
+    def _get_servers(self, key):
         """
-        Retrieves a server conn from the pool, or connects a new one.
-        Chooses the server based on a consistent hash of "key".
+        Get the servers a key may be stored on, in the order they are
+        tried (the first one is the server the key is normally stored on).
         """
         pos = bisect(self._sorted, key)
         served = []
         while len(served) < self._tries:
             pos = (pos + 1) % len(self._sorted)
             server = self._ring[self._sorted[pos]]
-            if server in served:
-                continue
-            served.append(server)
+            if server not in served:
+                served.append(server)
+        return tuple(served)
+
+    def _get_conns(self, key):
+        """
+        Retrieves a server conn from the pool, or connects a new one.
+        Chooses the server based on a consistent hash of "key".
+        """
+        for server in self._get_servers(key):
             if self._error_limited[server] > time.time():
                 continue
             sock = None
@@ -251,10 +292,128 @@ class MemcacheRing(object):
                 self._exception_occurred(
                     server, e, action='connecting', sock=sock)
 
+    def _group_by_servers(self, keys):
+        """
+        Group hashed keys by the list of servers they may be stored on.
+
+        :returns: a dict with one of the keys of each group as key,
+                  and the list of keys of the group as value
+        """
+        groups = {}
+        for key in keys:
+            groups.setdefault(self._get_servers(key), []).append(key)
+        return {group[0]: group for group in groups.values()}
+
+    def _scatter(self, func, groups):
+        """
+        Call `func(server_key, keys)` for each group of keys, concurrently.
+
+        :returns: the list of results, in no particular order
+        """
+        if len(groups) <= 1:
+            return [func(*item) for item in groups.items()]
+        pile = GreenPile(len(groups))
+        for server_key, keys in groups.items():
+            pile.spawn(func, server_key, keys)
+        return list(pile)
+
     def _return_conn(self, server, fp, sock):
         """Returns a server connection to the pool."""
         self._client_cache[server].put((fp, sock))
 
+    def _increment(self, metric):
+        increment = getattr(self.logger, 'increment', None)
+        if increment is not None:
+            increment(metric)
+
+    def _is_near_cached(self, key):
+        return self._near_cache is not None and isinstance(key, str) and \
+            key.startswith(self._near_cache_prefixes)
+
+    def _near_cache_get(self, key):
+        """
+        Get the value of a key from the near-cache.
+
+        :returns: a tuple with the value and a boolean telling if it is
+                  still fresh, or None if the key is not near-cached
+        """
+        try:
+            stamp, value = self._near_cache.get_cache(key)
+        except KeyError:
+            self._increment('near_cache.miss')
+            return None
+        fresh = time.time() - stamp < self._near_cache_ttl
+        self._increment('near_cache.hit' if fresh else 'near_cache.miss')
+        return value, fresh
+
+    def _near_cache_set(self, key, value):
+        self._leases.pop(key, None)
+        if value is None:
+            self._near_cache.pop_cache(key)
+        else:
+            self._near_cache.set_cache((time.time(), value), key)
+
+    def _near_cache_stale(self, key, entry):
+        """
+        Decide what to return for a near-cached key missing from memcache:
+        None (the caller will recompute the value) if this worker holds
+        (or obtains) the lease of the key, otherwise the stale value.
+        """
+        if entry is None or not self._near_cache_stale_ttl:
+            return None
+        now = time.time()
+        if self._leases.get(key, 0) > now:
+            return None
+        if self.add('lease/' + key, b'1', serialize=False, time=LEASE_TIME):
+            self._leases[key] = now + LEASE_TIME
+            self._increment('near_cache.lease')
+            return None
+        self._leases.pop(key, None)
+        self._increment('near_cache.stale')
+        return entry[0]
+
+    def _serialize(self, value, serialize=True):
+        """
+        Serialize a value to be stored in memcache.
+
+        :returns: a tuple with the flags telling how the value has been
+                  serialized, and the serialized value
+        """
+        flags = 0
+        if serialize and self._allow_pickle:
+            value = pickle.dumps(value, PICKLE_PROTOCOL)
+            flags |= PICKLE_FLAG
+        elif serialize:
+            if isinstance(value, bytes):
+                value = value.decode('utf8')
+            if self._serializer == 'msgpack':
+                value = msgpack.packb(value, use_bin_type=True)
+                flags |= MSGPACK_FLAG
+            else:
+                value = json.dumps(value).encode('ascii')
+                flags |= JSON_FLAG
+        elif not isinstance(value, bytes):
+            value = str(value).encode('utf-8')
+        return flags, value
+
+    def _deserialize(self, flags, value):
+        """
+        Deserialize a value read from memcache, according to its flags.
+        Values written with any serializer can be read, whatever the
+        serializer used to write new values.
+        """
+        if flags & PICKLE_FLAG:
+            if self._allow_unpickle:
+                return pickle.loads(value)
+            return None
+        elif flags & JSON_FLAG:
+            return json.loads(value)
+        elif flags & MSGPACK_FLAG:
+            if msgpack is None:
+                return None
+            return msgpack.unpackb(value, raw=False)
+        return value
+
     def set(self, key, value, serialize=True, time=0,
             min_compress_len=0):
         """
@@ -262,28 +421,22 @@ class MemcacheRing(object):
 
         :param key: key
         :param value: value
-        :param serialize: if True, value is serialized with JSON before sending
-                          to memcache, or with pickle if configured to use
-                          pickle instead of JSON (to avoid cache poisoning)
+        :param serialize: if True, value is serialized with JSON (or msgpack,
+                          if configured to use msgpack) before sending to
+                          memcache, or with pickle if configured to use
+                          pickle instead (to avoid cache poisoning)
         :param time: the time to live
         :param min_compress_len: minimum compress length, this parameter was
                                  added to keep the signature compatible with
                                  python-memcached interface. This
                                  implementation ignores it.
         """
+        orig_key = key
         key = md5hash(key)
         timeout = sanitize_timeout(time)
-        flags = 0
-        if serialize and self._allow_pickle:
-            value = pickle.dumps(value, PICKLE_PROTOCOL)
-            flags |= PICKLE_FLAG
-        elif serialize:
-            if isinstance(value, bytes):
-                value = value.decode('utf8')
-            value = json.dumps(value).encode('ascii')
-            flags |= JSON_FLAG
-        elif not isinstance(value, bytes):
-            value = str(value).encode('utf-8')
+        flags, value = self._serialize(value, serialize)
+        if self._is_near_cached(orig_key):
+            self._near_cache_set(orig_key, self._deserialize(flags, value))
 
         for (server, fp, sock) in self._get_conns(key):
             try:
@@ -299,12 +452,24 @@ class MemcacheRing(object):
     def get(self, key):
         """
         Gets the object specified by key.  It will also unserialize the object
-        before returning if it is serialized in memcache with JSON, or if it
-        is pickled and unpickling is allowed.
+        before returning if it is serialized in memcache with JSON or msgpack,
+        or if it is pickled and unpickling is allowed.
 
         :param key: key
         :returns: value of the key in memcache
         """
+        if not self._is_near_cached(key):
+            return self._get(key)
+        entry = self._near_cache_get(key)
+        if entry is not None and entry[1]:
+            return entry[0]
+        value = self._get(key)
+        if value is None:
+            return self._near_cache_stale(key, entry)
+        self._near_cache_set(key, value)
+        return value
+
+    def _get(self, key):
         key = md5hash(key)
         value = None
         for (server, fp, sock) in self._get_conns(key):
@@ -319,14 +484,8 @@ class MemcacheRing(object):
                             break
                         if line[0].upper() == b'VALUE' and line[1] == key:
                             size = int(line[3])
-                            value = fp.read(size)
-                            if int(line[2]) & PICKLE_FLAG:
-                                if self._allow_unpickle:
-                                    value = pickle.loads(value)
-                                else:
-                                    value = None
-                            elif int(line[2]) & JSON_FLAG:
-                                value = json.loads(value)
+                            value = self._deserialize(int(line[2]),
+                                                      fp.read(size))
                             fp.readline()
                         line = fp.readline().strip().split()
                     self._return_conn(server, fp, sock)
@@ -334,6 +493,32 @@ class MemcacheRing(object):
             except (Exception, Timeout) as e:
                 self._exception_occurred(server, e, sock=sock, fp=fp)
 
+    def add(self, key, value, serialize=True, time=0):
+        """
+        Sets a key/value pair in memcache, only if the key is not
+        already there.
+
+        :param key: key
+        :param value: value
+        :param serialize: if True, value is serialized (see `set`)
+        :param time: the time to live
+        :returns: True if the value has been stored
+        """
+        key = md5hash(key)
+        timeout = sanitize_timeout(time)
+        flags, value = self._serialize(value, serialize)
+        for (server, fp, sock) in self._get_conns(key):
+            try:
+                with Timeout(self._io_timeout):
+                    sock.sendall(set_msg(key, flags, timeout, value,
+                                         command=b'add'))
+                    line = fp.readline().strip()
+                    self._return_conn(server, fp, sock)
+                    return line.upper() == b'STORED'
+            except (Exception, Timeout) as e:
+                self._exception_occurred(server, e, sock=sock, fp=fp)
+        return False
+
     def incr(self, key, delta=1, time=0):
         """
         Increments a key which has a numeric value by delta.
@@ -412,6 +597,8 @@ class MemcacheRing(object):
         :param server_key: key to use in determining which server in the ring
                             is used
         """
+        if self._is_near_cached(key):
+            self._near_cache_set(key, None)
         key = md5hash(key)
         server_key = md5hash(server_key) if server_key else key
         for (server, fp, sock) in self._get_conns(server_key):
@@ -425,61 +612,107 @@ class MemcacheRing(object):
             except (Exception, Timeout) as e:
                 self._exception_occurred(server, e, sock=sock, fp=fp)
 
-    def set_multi(self, mapping, server_key, serialize=True, time=0,
+    def set_multi(self, mapping, server_key=None, serialize=True, time=0,
                   min_compress_len=0):
         """
         Sets multiple key/value pairs in memcache.
 
         :param mapping: dictionary of keys and values to be set in memcache
         :param server_key: key to use in determining which server in the ring
-                            is used
-        :param serialize: if True, value is serialized with JSON before sending
-                          to memcache, or with pickle if configured to use
-                          pickle instead of JSON (to avoid cache poisoning)
+                            is used. If None, each key/value pair is sent
+                            to the server it would be sent to by `set`,
+                            with one request per server, concurrently.
+        :param serialize: if True, value is serialized with JSON (or msgpack,
+                          if configured to use msgpack) before sending to
+                          memcache, or with pickle if configured to use
+                          pickle instead (to avoid cache poisoning)
         :param time: the time to live
         :min_compress_len: minimum compress length, this parameter was added
                            to keep the signature compatible with
                            python-memcached interface. This implementation
                            ignores it
         """
-        server_key = md5hash(server_key)
         timeout = sanitize_timeout(time)
-        msg = []
+        msgs = {}
         for key, value in mapping.items():
+            flags, value = self._serialize(value, serialize)
+            if self._is_near_cached(key):
+                self._near_cache_set(key, self._deserialize(flags, value))
             key = md5hash(key)
-            flags = 0
-            if serialize and self._allow_pickle:
-                value = pickle.dumps(value, PICKLE_PROTOCOL)
-                flags |= PICKLE_FLAG
-            elif serialize:
-                if isinstance(value, bytes):
-                    value = value.decode('utf8')
-                value = json.dumps(value).encode('ascii')
-                flags |= JSON_FLAG
-            msg.append(set_msg(key, flags, timeout, value))
+            msgs[key] = set_msg(key, flags, timeout, value)
+        if server_key is not None:
+            self._set_multi(md5hash(server_key), list(msgs.values()))
+        else:
+            groups = self._group_by_servers(msgs)
+            self._scatter(
+                lambda server_key, keys: self._set_multi(
+                    server_key, [msgs[key] for key in keys]),
+                groups)
+
+    def _set_multi(self, server_key, msg):
+        """Send `set` commands to the server chosen with `server_key`."""
         for (server, fp, sock) in self._get_conns(server_key):
             try:
                 with Timeout(self._io_timeout):
                     sock.sendall(b''.join(msg))
                     # Wait for the set to complete
-                    for line in range(len(mapping)):
+                    for line in range(len(msg)):
                         fp.readline()
                     self._return_conn(server, fp, sock)
                     return
             except (Exception, Timeout) as e:
                 self._exception_occurred(server, e, sock=sock, fp=fp)
 
-    def get_multi(self, keys, server_key):
+    def get_multi(self, keys, server_key=None):
         """
         Gets multiple values from memcache for the given keys.
 
         :param keys: keys for values to be retrieved from memcache
         :param server_key: key to use in determining which server in the ring
-                           is used
-        :returns: list of values
+                           is used. If None, each key is read from the server
+                           it would be read from by `get`, with one request
+                           per server, concurrently.
+        :returns: list of values (None for each missing key), or None if no
+                  server could be reached (when `server_key` is specified)
+        """
+        if server_key is not None:
+            keys = [md5hash(key) for key in keys]
+            responses = self._get_multi(md5hash(server_key), keys)
+            if responses is None:
+                return None
+            return [responses.get(key) for key in keys]
+
+        values = {}
+        near_entries = {}
+        for key in keys:
+            if self._is_near_cached(key):
+                entry = near_entries[key] = self._near_cache_get(key)
+                if entry is not None and entry[1]:
+                    values[key] = entry[0]
+        hashed = {md5hash(key): key for key in keys if key not in values}
+        responses = {}
+        for result in self._scatter(self._get_multi,
+                                    self._group_by_servers(hashed)):
+            if result:
+                responses.update(result)
+        for hkey, key in hashed.items():
+            value = responses.get(hkey)
+            if key in near_entries:
+                if value is None:
+                    value = self._near_cache_stale(key, near_entries[key])
+                else:
+                    self._near_cache_set(key, value)
+            values[key] = value
+        return [values[key] for key in keys]
+
+    def _get_multi(self, server_key, keys):
+        """
+        Read the values of several keys from the server chosen with
+        `server_key`.
+
+        :returns: a dict of the values of the keys found, or None
+                  if no server could be reached
         """
-        server_key = md5hash(server_key)
-        keys = [md5hash(key) for key in keys]
         for (server, fp, sock) in self._get_conns(server_key):
             try:
                 with Timeout(self._io_timeout):
@@ -493,24 +726,12 @@ class MemcacheRing(object):
                             break
                         if line[0].upper() == b'VALUE':
                             size = int(line[3])
-                            value = fp.read(size)
-                            if int(line[2]) & PICKLE_FLAG:
-                                if self._allow_unpickle:
-                                    value = pickle.loads(value)
-                                else:
-                                    value = None
-                            elif int(line[2]) & JSON_FLAG:
-                                value = json.loads(value)
+                            value = self._deserialize(int(line[2]),
+                                                      fp.read(size))
                             responses[line[1]] = value
                             fp.readline()
                         line = fp.readline().strip().split()
-                    values = []
-                    for key in keys:
-                        if key in responses:
-                            values.append(responses[key])
-                        else:
-                            values.append(None)
                     self._return_conn(server, fp, sock)
-                    return values
+                    return responses
             except (Exception, Timeout) as e:
                 self._exception_occurred(server, e, sock=sock, fp=fp)
@@ -136,13 +136,18 @@ class EphemeralObjects(object):
         mpu_in_progress = self._get_obj_directories(
             account, container,
             limit=limit, prefix=prefix, marker=marker)
-        all_objs = []
+        # retrieve headers of each entry, in a single round-trip
+        _, hkey = self.keys(account, container)
+        batch = self.conn.batch()
+        entries = []
         for name in mpu_in_progress:
             if name is None:
                 break
-            # retrieve headers of each header
-            _, hkey = self.keys(account, container)
-            hdrs = json.loads(self.conn.hget(hkey, name))
+            entries.append((name, batch.hget(hkey, name)))
+        batch.flush()
+        all_objs = []
+        for name, res in entries:
+            hdrs = json.loads(res.result())
             all_objs.append({'name': name.decode('utf-8'),
                              'bytes': 0,
                              'hash': MD5_OF_EMPTY_STRING,
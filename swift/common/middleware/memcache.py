@@ -18,8 +18,9 @@ import os
 from six.moves.configparser import ConfigParser, NoSectionError, NoOptionError
 
 from swift.common.memcached import (MemcacheRing, CONN_TIMEOUT, POOL_TIMEOUT,
-                                    IO_TIMEOUT, TRY_COUNT)
-from swift.common.utils import get_logger
+                                    IO_TIMEOUT, TRY_COUNT,
+                                    NEAR_CACHE_PREFIXES)
+from swift.common.utils import get_logger, list_from_csv
 
 
 class MemcacheMiddleware(object):
@@ -86,6 +87,13 @@ class MemcacheMiddleware(object):
             'pool_timeout', POOL_TIMEOUT))
         tries = int(memcache_options.get('tries', TRY_COUNT))
         io_timeout = float(memcache_options.get('io_timeout', IO_TIMEOUT))
+        serializer = memcache_options.get('memcache_serializer', 'json')
+        near_cache_ttl = float(memcache_options.get('near_cache_ttl', 0))
+        near_cache_stale_ttl = float(memcache_options.get(
+            'near_cache_stale_ttl', 0))
+        near_cache_size = int(memcache_options.get('near_cache_size', 1000))
+        near_cache_prefixes = list_from_csv(memcache_options.get(
+            'near_cache_prefixes', ','.join(NEAR_CACHE_PREFIXES)))
 
         if not self.memcache_servers:
             self.memcache_servers = '127.0.0.1:11211'
@@ -105,7 +113,12 @@ class MemcacheMiddleware(object):
             allow_pickle=(serialization_format == 0),
             allow_unpickle=(serialization_format <= 1),
             max_conns=max_conns,
-            logger=self.logger)
+            logger=self.logger,
+            serializer=serializer,
+            near_cache_ttl=near_cache_ttl,
+            near_cache_stale_ttl=near_cache_stale_ttl,
+            near_cache_size=near_cache_size,
+            near_cache_prefixes=near_cache_prefixes)
 
     def __call__(self, env, start_response):
         env['swift.cache'] = self.memcache
@@ -81,7 +81,8 @@ from swift.common.utils import (get_logger, get_remote_client,
                                 config_true_value, reiterate,
                                 InputProxy, list_from_csv, get_policy_index,
                                 split_path, StrAnonymizer, StrFormatTime,
-                                LogStringFormatter)
+                                LogStringFormatter, Histogram,
+                                ReconStatsDumper)
 
 from swift.common.storage_policy import POLICIES
 
@@ -115,6 +116,16 @@ def flat_dict_from_dict(dict_):
     return flat_dict
 
 
+def perfdata_key(key):
+    """
+    Remove the variable part (chunk URL) of rawx performance data keys.
+    """
+    if key.startswith('rawx.'):
+        if 'http' in key[5:]:
+            key = key[:key.index('http') + 4]
+    return key
+
+
 def perfdata_to_str(perfdata):
     if not perfdata:
         return ''
@@ -122,13 +133,81 @@ def perfdata_to_str(perfdata):
     perfdata_list = list()
     perfdata_list.append('PERFDATA')
     for key, value in sorted(flat_perfdata.items()):
-        if key.startswith('rawx.'):
-            if 'http' in key[5:]:
-                key = key[:key.index('http') + 4]
+        key = perfdata_key(key)
         perfdata_list.append(key + ':' + '%.4f' % value)
     return '...'.join(perfdata_list)
 
 
+class PerfdataStats(object):
+    """
+    Aggregate performance data of requests into one histogram per key,
+    in the current worker.
+
+    Every `interval` seconds, the histograms are saved in the proxy
+    recon cache (see /recon/proxy/perfdata), percentiles are sent to
+    statsd, then the histograms are reset.
+    """
+
+    PERCENTILES = (50, 90, 99)
+    INVALID_METRIC_CHARS = re.compile(r'[^\w.-]')
+
+    def __init__(self, logger, recon_cache_path, interval, max_keys=1000):
+        self.logger = logger
+        self.max_keys = max_keys
+        self.histograms = dict()
+        self.dumper = ReconStatsDumper(recon_cache_path, interval, logger)
+        self.dumper.register('perfdata', self.get_stats)
+
+    def record(self, perfdata):
+        """Record the performance data of one request."""
+        for key, value in flat_dict_from_dict(perfdata).items():
+            key = perfdata_key(key)
+            hist = self.histograms.get(key)
+            if hist is None:
+                if len(self.histograms) >= self.max_keys:
+                    continue
+                hist = self.histograms[key] = Histogram()
+            hist.record(value)
+
+    def get_stats(self):
+        return {key: hist.to_dict(self.PERCENTILES)
+                for key, hist in self.histograms.items()}
+
+    def maybe_flush(self, statsd):
+        """
+        Save the histograms, and send percentiles to `statsd` (a logger),
+        if the last flush is older than `interval` seconds.
+        """
+        if not self.dumper.maybe_dump():
+            return False
+        for key, hist in self.histograms.items():
+            metric = 'perfdata.' + self.INVALID_METRIC_CHARS.sub('_', key)
+            for pct in self.PERCENTILES:
+                statsd.timing('%s.p%d' % (metric, pct),
+                              hist.percentile(pct) * 1000)
+            statsd.update_stats(metric + '.count', hist.count)
+        self.histograms.clear()
+        return True
+
+
+# PerfdataStats of the current worker, by recon cache path
+_perfdata_stats = {}
+
+
+def get_perfdata_stats(logger, recon_cache_path, interval):
+    """
+    Get the PerfdataStats of the current worker, so all proxy-logging
+    instances of a pipeline aggregate their requests in the same
+    histograms, saved under a single recon cache key.
+    """
+    key = (os.getpid(), recon_cache_path)
+    stats = _perfdata_stats.get(key)
+    if stats is None:
+        stats = _perfdata_stats[key] = PerfdataStats(
+            logger, recon_cache_path, interval)
+    return stats
+
+
 class ProxyLoggingMiddleware(object):
     """
     Middleware that logs Swift proxy requests in the swift log format.
@@ -195,6 +274,29 @@ class ProxyLoggingMiddleware(object):
                 self.logger.warn('No user-agent pattern defined, '
                                  'performance data will be logged '
                                  'for every request.')
+        # Aggregate performance data of all requests in histograms
+        if config_true_value(conf.get('perfdata_stats', 'false')):
+            self.perfdata_stats = get_perfdata_stats(
+                self.logger, conf.get('recon_cache_path', '/var/cache/swift'),
+                float(conf.get('perfdata_stats_interval', 60.0)))
+        else:
+            self.perfdata_stats = None
+
+    def perfdata_wanted(self, user_agent):
+        """
+        Tell if performance data must be logged for a request
+        with the specified user agent.
+        """
+        if not self.perfdata:
+            return False
+        if not self.perfdata_user_agents:
+            return True
+        if user_agent is None:
+            user_agent = ''
+        for pat in self.perfdata_user_agents:
+            if pat.match(user_agent):
+                return True
+        return False
 
     def check_log_msg_template_validity(self):
         replacements = {
@@ -237,6 +339,7 @@ class ProxyLoggingMiddleware(object):
             'ttfb': '0.05',
             'pid': '42',
             'wire_status_int': '200',
+            'perfdata': '',
         }
         try:
             self.log_formatter.format(self.log_msg_template, **replacements)
@@ -287,6 +390,15 @@ class ProxyLoggingMiddleware(object):
         duration_time_str = "%.4f" % (end_time - start_time)
         policy_index = get_policy_index(req.headers, resp_headers)
 
+        perfdata = req.environ.get('swift.perfdata')
+        log_perfdata = True
+        if self.perfdata_stats is not None:
+            if perfdata:
+                self.perfdata_stats.record(perfdata)
+            self.perfdata_stats.maybe_flush(self.access_logger)
+            # Performance data is now collected for every request
+            log_perfdata = self.perfdata_wanted(req.user_agent)
+
         acc, cont, obj = None, None, None
         swift_path = req.environ.get('swift.backend_path', req.path)
         if swift_path.startswith('/v1/'):
@@ -340,7 +452,7 @@ class ProxyLoggingMiddleware(object):
             'ttfb': ttfb,
             'pid': self.pid,
             'wire_status_int': wire_status_int or status_int,
-            'perfdata': perfdata_to_str(req.environ.get('swift.perfdata'))
+            'perfdata': perfdata_to_str(perfdata) if log_perfdata else '',
         }
         self.access_logger.info(
             self.log_formatter.format(self.log_msg_template,
@@ -408,20 +520,9 @@ class ProxyLoggingMiddleware(object):
 
         self.mark_req_logged(env)
 
-        if self.perfdata:
-            add_perfata = False
-            if not self.perfdata_user_agents:
-                add_perfata = True
-            else:
-                user_agent = env.get('HTTP_USER_AGENT')
-                if user_agent is None:
-                    user_agent = ''
-                for pat in self.perfdata_user_agents:
-                    if pat.match(user_agent):
-                        add_perfata = True
-                        break
-            if add_perfata:
-                env.setdefault('swift.perfdata', dict())
+        if self.perfdata_stats is not None or \
+                self.perfdata_wanted(env.get('HTTP_USER_AGENT')):
+            env.setdefault('swift.perfdata', dict())
 
         start_response_args = [None]
         input_proxy = InputProxy(env['wsgi.input'])
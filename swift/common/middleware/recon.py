@@ -27,6 +27,9 @@ from swift.common.swob import Request, Response
 from swift.common.utils import get_logger, config_true_value, \
     SWIFT_CONF_FILE, md5_hash_for_file
 
+# Statistics saved by proxy workers, see /recon/proxy/<type>
+PROXY_RECON_TYPES = ('auto_storage_policies', 'counters', 'perfdata')
+
 
 class ReconMiddleware(object):
     """
@@ -57,6 +60,8 @@ class ReconMiddleware(object):
                                                 'account.recon')
         self.drive_recon_cache = os.path.join(self.recon_cache_path,
                                               'drive.recon')
+        self.proxy_recon_cache = os.path.join(self.recon_cache_path,
+                                              'proxy.recon')
         self.account_ring_path = os.path.join(swift_dir, 'account.ring.gz')
         self.container_ring_path = os.path.join(swift_dir, 'container.ring.gz')
 
@@ -201,6 +206,17 @@ class ReconMiddleware(object):
         else:
             return None
 
+    def get_proxy_info(self, recon_type):
+        """get statistics of proxy workers"""
+        if recon_type in PROXY_RECON_TYPES:
+            return self._from_recon_cache([recon_type],
+                                          self.proxy_recon_cache)
+
+    def get_group_commit_info(self):
+        """get statistics of the group commits of object server workers"""
+        return self._from_recon_cache(['object_group_commit'],
+                                      self.object_recon_cache)
+
     def get_unmounted(self):
         """list unmounted (failed?) devices"""
         mountlist = []
@@ -352,6 +368,10 @@ class ReconMiddleware(object):
             content = self.get_auditor_info(rtype)
         elif rcheck == "expirer" and rtype == 'object':
             content = self.get_expirer_info(rtype)
+        elif rcheck == "proxy" and rtype in PROXY_RECON_TYPES:
+            content = self.get_proxy_info(rtype)
+        elif rcheck == "group_commit":
+            content = self.get_group_commit_info()
         elif rcheck == "mounted":
             content = self.get_mounted()
         elif rcheck == "unmounted":
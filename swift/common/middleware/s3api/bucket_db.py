@@ -15,7 +15,8 @@
 
 import time
 
-from swift.common.utils import config_true_value, parse_connection_string
+from swift.common.utils import config_true_value, LRUCache, \
+    parse_connection_string
 
 from oio.common.redis_conn import RedisConnection
 
@@ -129,25 +130,105 @@ class RedisBucketDb(RedisConnection):
         self.conn.delete(self._key(bucket))
 
 
+class BucketOwnerCache(object):
+    """
+    Cache of bucket owners, shared by all requests served by a worker.
+
+    Missing buckets are also cached (negative caching), usually for a
+    shorter time: a bucket created through another worker (or another
+    proxy) is not visible before the negative entry expires.
+
+    :param size: maximum number of buckets in each cache
+    :param ttl: time (in seconds) an owner stays in the cache
+    :param negative_ttl: time (in seconds) a missing bucket stays in
+        the cache, 0 to disable negative caching
+    """
+
+    def __init__(self, size=10000, ttl=30.0, negative_ttl=0.0, logger=None):
+        self.owners = LRUCache(maxsize=size, maxtime=ttl)
+        if negative_ttl > 0:
+            self.missing = LRUCache(maxsize=size, maxtime=negative_ttl)
+        else:
+            self.missing = None
+        self.logger = logger
+
+    def _increment(self, metric):
+        if self.logger:
+            self.logger.increment('bucket_db.cache.' + metric)
+
+    def get(self, bucket):
+        """
+        Get the owner of a bucket from the cache.
+
+        :returns: the name of the account owning the bucket, or None
+            if the bucket is known to be missing
+        :raises KeyError: if the bucket is not in the cache
+        """
+        try:
+            owner = self.owners.get_cache(bucket)
+            self._increment('hit')
+            return owner
+        except KeyError:
+            pass
+        if self.missing is not None:
+            try:
+                self.missing.get_cache(bucket)
+                self._increment('negative_hit')
+                return None
+            except KeyError:
+                pass
+        self._increment('miss')
+        raise KeyError(bucket)
+
+    def set(self, bucket, owner):
+        """Save the owner of a bucket, or None if it is missing."""
+        self.invalidate(bucket)
+        if owner:
+            self.owners.set_cache(owner, bucket)
+        elif self.missing is not None:
+            self.missing.set_cache(True, bucket)
+
+    def invalidate(self, bucket):
+        """Remove a bucket from the cache."""
+        self.owners.pop_cache(bucket)
+        if self.missing is not None:
+            self.missing.pop_cache(bucket)
+
+
 class BucketDbWrapper(object):
     """
     Memoizer for bucket DB. It is intended to have the same life cycle
     as an S3 request.
+
+    :param shared_cache: optional BucketOwnerCache, living longer than
+        the request, queried before the bucket DB
     """
 
-    def __init__(self, bucket_db):
+    def __init__(self, bucket_db, shared_cache=None):
         self.bucket_db = bucket_db
         self.cache = dict()
+        self.shared_cache = shared_cache
 
     def get_owner(self, bucket, **kwargs):
         cached = self.cache.get(bucket)
         if cached:
             return cached
+        if self.shared_cache is not None:
+            try:
+                owner = self.shared_cache.get(bucket)
+                self.cache[bucket] = owner
+                return owner
+            except KeyError:
+                pass
         owner = self.bucket_db.get_owner(bucket=bucket, **kwargs)
         self.cache[bucket] = owner
+        if self.shared_cache is not None:
+            self.shared_cache.set(bucket, owner)
         return owner
 
     def set_owner(self, bucket, owner, **kwargs):
+        if self.shared_cache is not None:
+            self.shared_cache.invalidate(bucket)
         res = self.bucket_db.set_owner(bucket=bucket, owner=owner, **kwargs)
         if res:
             self.cache[bucket] = owner
@@ -155,12 +236,18 @@ class BucketDbWrapper(object):
 
     def release(self, bucket, **kwargs):
         self.cache.pop(bucket, None)
+        if self.shared_cache is not None:
+            self.shared_cache.invalidate(bucket)
         return self.bucket_db.release(bucket=bucket, **kwargs)
 
     def reserve(self, bucket, owner, **kwargs):
         res = self.bucket_db.reserve(bucket=bucket, owner=owner, **kwargs)
         if res:
             self.cache[bucket] = owner
+            # Reservations are temporary, do not keep them in the
+            # shared cache (but forget the bucket was missing).
+            if self.shared_cache is not None:
+                self.shared_cache.invalidate(bucket)
         return res
 
 
@@ -13,8 +13,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from fnmatch import fnmatchcase
+from fnmatch import fnmatchcase, translate
 from functools import wraps
+import re
+import time
+
+from six import string_types
 
 from swift.common.middleware.s3api.acl_utils import ACL_EXPLICIT_ALLOW
 from swift.common.middleware.s3api.exception import IAMException
@@ -112,6 +116,26 @@ def string_like(actual, expected):
     return False
 
 
+def compile_patterns(patterns):
+    """
+    Compile wildcard patterns, as understood by `fnmatchcase`,
+    into regular expressions.
+    """
+    return [re.compile(translate(pattern)) for pattern in patterns]
+
+
+def match_patterns(actual, regexes):
+    """
+    Same as `string_like`, with patterns compiled by `compile_patterns`.
+    """
+    if actual is None:
+        return False
+    for regex in regexes:
+        if regex.match(actual):
+            return True
+    return False
+
+
 # See iam-ug.pdf document, page 569.
 IamConditionOp = {
     "StringEquals": string_equals,
@@ -126,6 +150,16 @@ IamConditionOp = {
 }
 
 
+# Same operators, as a function preparing the expected values once
+# for all, and a function comparing the actual value to them.
+IamCompiledConditionOp = {
+    "StringEquals": (frozenset, string_equals),
+    "StringNotEquals": (frozenset, lambda a, e: not string_equals(a, e)),
+    "StringLike": (compile_patterns, match_patterns),
+    "StringNotLike": (compile_patterns, lambda a, e: not match_patterns(a, e)),
+}
+
+
 # See iam-ug.pdf document, page 629.
 IamConditionKey = {
     "s3:delimiter": lambda req: req.params.get('delimiter'),
@@ -146,18 +180,146 @@ IamConditionKey = {
 }
 
 
+def _as_list(value):
+    """IAM policies accept either a string or a list of strings."""
+    if isinstance(value, string_types):
+        return [value]
+    return value
+
+
+class CompiledStatement(object):
+    """
+    IAM statement prepared for matching: resource patterns are
+    compiled into regular expressions, condition operands are
+    prepared once for all.
+    """
+
+    __slots__ = ('sid', 'effect', 'resources', 'match_all', 'conditions',
+                 'satisfiable')
+
+    def __init__(self, sid, effect):
+        self.sid = sid
+        self.effect = effect
+        # List of (resource type, compiled resource pattern)
+        self.resources = list()
+        # True if the statement applies to all resources
+        self.match_all = False
+        # List of (key name, operator, prepared operands)
+        self.conditions = list()
+        # False if the conditions can never be satisfied
+        self.satisfiable = True
+
+
 # TODO(IAM): merge this class into StaticIamMiddleware
 # so we can make subrequests to load resource-based policies.
 class IamRulesMatcher(object):
     """
     Matches an action and a resource against a set of IAM rules.
 
+    The rules are compiled when the matcher is built: statements are
+    indexed by effect and by (supported) action, resource patterns and
+    condition operands are prepared for fast matching.
+
     Only S3 actions are supported at the moment.
     """
 
     def __init__(self, rules, logger=None):
         self._rules = rules
         self.logger = logger or get_logger(None, log_route='iam')
+        self._statements = {RE_ALLOW: dict(), RE_DENY: dict()}
+        for num, statement in enumerate(rules.get('Statement', [])):
+            self._index_statement(num, statement)
+
+    def _index_statement(self, num, statement):
+        # Statement ID is optional
+        sid = statement.get('Sid', 'statement-id-%d' % num)
+        effect = statement['Effect']
+        index = self._statements.get(effect)
+        if index is None:
+            self.logger.info('IAM: skipping %s, unknown effect %s',
+                             sid, effect)
+            return
+        compiled = self.compile_statement(sid, statement)
+        if not compiled.satisfiable:
+            return
+
+        actions = set()
+        for rule_action in _as_list(statement['Action']):
+            if rule_action in SUPPORTED_ACTIONS:
+                # Found an exact match
+                actions.add(rule_action)
+            elif rule_action.endswith('*'):
+                # Found a wildcard, match it against all supported actions
+                action_prefix = rule_action[:-1]
+                actions.update(action for action in SUPPORTED_ACTIONS
+                               if action.startswith(action_prefix))
+        for action in actions:
+            index.setdefault(action, list()).append(compiled)
+
+    def compile_statement(self, sid, statement):
+        """
+        Compile the resources and the conditions of an IAM statement.
+
+        :rtype: `CompiledStatement`
+        """
+        compiled = CompiledStatement(sid, statement['Effect'])
+        for resource_str in _as_list(statement['Resource']):
+            rule_res = IamResource(resource_str)
+            if rule_res.arn == ARN_WILDCARD_BUCKET:
+                compiled.match_all = True
+            compiled.resources.append(
+                (rule_res.type, re.compile(translate(rule_res.arn))))
+        compiled.conditions, compiled.satisfiable = \
+            self.compile_conditions(statement)
+        return compiled
+
+    def compile_conditions(self, statement):
+        """
+        Prepare the conditions of an IAM statement.
+
+        To be consistent with the "default deny" rule, unverifiable
+        conditions are not satisfied in 'allow' statements, and are
+        satisfied in 'deny' statements.
+
+        :returns: a tuple with a list of (key name, operator, operands)
+            tuples, and a boolean telling if the conditions can be
+            satisfied
+        """
+        cond = statement.get('Condition', {})
+        effect = statement['Effect']
+        conditions = list()
+        for opname, operands in cond.items():
+            if IamConditionOp.get(opname, None) is None:
+                if effect == RE_ALLOW:
+                    self.logger.info(
+                        "IAM: condition operator %s not implemented. Since "
+                        "it is used in an 'allow' statement, consider the "
+                        "condition is not satisfied.", opname)
+                    return conditions, False
+                else:
+                    self.logger.info(
+                        "IAM: condition operator %s not implemented. Since "
+                        "it is used in a 'deny' statement, consider the "
+                        "condition is satisfied.", opname)
+                    continue
+            prepare, operator = IamCompiledConditionOp[opname]
+            for cond_key, values in operands.items():
+                if IamConditionKey.get(cond_key, None) is None:
+                    if effect == RE_ALLOW:
+                        self.logger.info(
+                            "IAM: condition %s not implemented. Since it is "
+                            "in an 'allow' statement, consider it is not "
+                            "satisfied.", cond_key)
+                        return conditions, False
+                    else:
+                        self.logger.info(
+                            "IAM: condition %s not implemented. Since it is "
+                            "in a 'deny' statement, consider it is satisfied.",
+                            cond_key)
+                        continue
+                conditions.append(
+                    (cond_key, operator, prepare(_as_list(values))))
+        return conditions, True
 
     def __call__(self, resource, action, req=None):
         """
@@ -198,52 +360,37 @@ class IamRulesMatcher(object):
 
     def check_condition(self, statement, req):
         """
-        Check the conditions from the statement are satisfied.
-
-        To be consistent with the "default deny" rule, for unverifiable
-        conditions, deny the request.
+        Check the conditions from the compiled statement are satisfied.
 
-        :param statement: the statement dict using the condition
+        :param statement: the `CompiledStatement` using the conditions
         :param req: the current request
         """
-        cond = statement.get('Condition', {})
-        effect = statement['Effect']
-        for opname, operands in cond.items():
-            if IamConditionOp.get(opname, None) is None:
-                if effect == RE_ALLOW:
-                    self.logger.info(
-                        "IAM: condition operator %s not implemented. Since "
-                        "it is used in an 'allow' statement, consider the "
-                        "condition is not satisfied.", opname)
-                    return False
-                else:
-                    self.logger.info(
-                        "IAM: condition operator %s not implemented. Since "
-                        "it is used in a 'deny' statement, consider the "
-                        "condition is satisfied.", opname)
-                    continue
-            operator = IamConditionOp[opname]
-            for cond_key, values in operands.items():
-                if IamConditionKey.get(cond_key, None) is None:
-                    if effect == RE_ALLOW:
-                        self.logger.info(
-                            "IAM: condition %s not implemented. Since it is "
-                            "in an 'allow' statement, consider it is not "
-                            "satisfied.", cond_key)
-                        return False
-                    else:
-                        self.logger.info(
-                            "IAM: condition %s not implemented. Since it is "
-                            "in a 'deny' statement, consider it is satisfied.",
-                            cond_key)
-                        continue
-                cond_val = self.resolve_cond_key(cond_key, req)
-                if not operator(cond_val, values):
-                    # One of the conditions is not satisfied
-                    return False
+        for cond_key, operator, operands in statement.conditions:
+            cond_val = self.resolve_cond_key(cond_key, req)
+            if not operator(cond_val, operands):
+                # One of the conditions is not satisfied
+                return False
         # All conditions are satisfied
         return True
 
+    def match_resource(self, statement, req_res):
+        """
+        Check if the requested resource matches one of the resources
+        of the compiled statement.
+        """
+        # check wildcards before everything else
+        if statement.match_all:
+            return True
+        for rule_type, regex in statement.resources:
+            # Ensure the requested and the current resource are of the
+            # same type. The specification says that a wildcard in the
+            # bucket name should not match objects (stop at first slash).
+            # Then do a case-sensitive match between the requested
+            # resource and the resource of the current rule.
+            if rule_type == req_res.type and regex.match(req_res.arn):
+                return True
+        return False
+
     def do_explicit_check(self, effect, action, req_res, req):
         """
         Lookup for an explicit deny or an explicit allow in the set of rules.
@@ -253,54 +400,13 @@ class IamRulesMatcher(object):
         :returns: a tuple with a boolean telling of the rule has been matched
             and the ID of the statement that matched.
         """
-        for num, statement in enumerate(self._rules['Statement']):
-            # Statement ID is optional
-            sid = statement.get('Sid', 'statement-id-%d' % num)
-            self.logger.info("===> Checking statement %s (%s)",
-                             sid, statement['Effect'])
-            if statement['Effect'] != effect:
-                continue
-
-            # Check Action
-            for rule_action in statement['Action']:
-                if rule_action == action:
-                    # Found an exact match
-                    break
-                elif rule_action.endswith('*'):
-                    action_prefix = rule_action[:-1]
-                    if action.startswith(action_prefix):
-                        # Found a wildcard match
-                        break
-            else:
-                self.logger.info('Skipping %s, action %s is not in the list',
-                                 sid, action)
-                continue
-
-            for resource_str in statement['Resource']:
-                rule_res = IamResource(resource_str)
-
-                # check wildcards before everything else
-                if (rule_res.arn == ARN_WILDCARD_BUCKET and
-                        self.check_condition(statement, req)):
-                    self.logger.info('%s: matches everything', sid)
-                    return True, sid
-
-                # Ensure the requested and the current resource are of the
-                # same type. The specification says that a wildcard in the
-                # bucket name should not match objects (stop at first slash).
-                if rule_res.type != req_res.type:
-                    self.logger.info('%s: skip, resource types do not match',
-                                     sid)
-                    continue
+        for statement in self._statements[effect].get(action, ()):
+            if (self.match_resource(statement, req_res) and
+                    self.check_condition(statement, req)):
+                self.logger.debug('%s: %s matches', statement.sid, effect)
+                return True, statement.sid
 
-                # Do a case-sensitive match between the requested resource
-                # and the resource of the current rule.
-                if (fnmatchcase(req_res.arn, rule_res.arn) and
-                        self.check_condition(statement, req)):
-                    self.logger.info('%s: wildcard or exact match', sid)
-                    return True, sid
-
-        self.logger.info('No %s match found', effect)
+        self.logger.debug('No %s match found', effect)
         return False, None
 
     def match_explicit_deny(self, action, resource, req):
@@ -382,9 +488,13 @@ class IamMiddleware(object):
         self.logger = get_logger(conf)
         self.connection = conf.get('connection')
         maxsize = config_auto_int_value(conf.get('cache_size'), 1000)
-        maxtime = config_auto_int_value(conf.get('cache_ttl'), 30)
-        self._load_rules_matcher = LRUCache(maxsize=maxsize, maxtime=maxtime)(
-            self._build_rules_matcher)
+        # After this delay, the version stamp of the rules is checked,
+        # and the rules are reloaded if it changed.
+        self.cache_ttl = config_auto_int_value(conf.get('cache_ttl'), 30)
+        # Compiled matchers, with the version stamp of the rules
+        # and the time the stamp has been checked, per (account, user).
+        # Expiration is managed by _load_rules_matcher.
+        self._matchers = LRUCache(maxsize=maxsize, maxtime=float('inf'))
 
     def __call__(self, env, start_response):
         # Put the rules callback in the request environment so middlewares
@@ -407,6 +517,16 @@ class IamMiddleware(object):
         """
         raise NotImplementedError
 
+    def get_rules_stamp(self, account, user_id):
+        """
+        Get a version stamp of the rules of the specified user,
+        cheaper to load than the rules themselves.
+
+        Subclasses may implement this method. When it returns None,
+        rules are reloaded each time the cache entry expires.
+        """
+        return None
+
     def _build_rules_matcher(self, account, user_id):
         """
         Load IAM rules for the specified user, then build an IamRulesMatcher
@@ -423,6 +543,33 @@ class IamMiddleware(object):
                               account, user_id)
             return None
 
+    def _load_rules_matcher(self, account, user_id):
+        """
+        Get the rules matcher of the specified user from the cache.
+        Rebuild it only if the cache entry expired and the version
+        stamp of the rules changed (or is unknown).
+        """
+        try:
+            entry = self._matchers.get_cache(account, user_id)
+        except KeyError:
+            entry = None
+        now = time.time()
+        if entry is not None:
+            checked_at, stamp, matcher = entry
+            if now - checked_at < self.cache_ttl:
+                return matcher
+            new_stamp = self.get_rules_stamp(account, user_id)
+            if new_stamp is not None and new_stamp == stamp:
+                entry[0] = now
+                return matcher
+        else:
+            new_stamp = self.get_rules_stamp(account, user_id)
+        # Load the stamp before the rules: if the rules change in the
+        # meantime, they will just be reloaded once more.
+        matcher = self._build_rules_matcher(account, user_id)
+        self._matchers.set_cache([now, new_stamp, matcher], account, user_id)
+        return matcher
+
     def rules_callback(self, s3req):
         matcher = self._load_rules_matcher(s3req.account, s3req.user_id)
         return matcher
@@ -456,6 +603,10 @@ class StaticIamMiddleware(IamMiddleware):
         rules = self.rules.get(user_id)
         return rules
 
+    def get_rules_stamp(self, account, user_id):
+        # Rules are loaded once at startup, they never change.
+        return 0
+
 
 def iam_is_enabled(env):
     """
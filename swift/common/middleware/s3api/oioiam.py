@@ -41,6 +41,13 @@ class RedisIamDb(object):
         """
         return self.key_prefix + 'account:' + account
 
+    def version_key_for_account(self, account):
+        """
+        Get the Redis key to the hash holding the version stamps
+        of the IAM rules of all users of the specified account.
+        """
+        return self.key_prefix + 'version:' + account
+
     @catch_service_errors
     def load_rules_str_for_user(self, account, user):
         """
@@ -52,6 +59,17 @@ class RedisIamDb(object):
         rules = self.redis.conn_slave.hget(acct_key, user)
         return rules
 
+    @catch_service_errors
+    def load_rules_stamp_for_user(self, account, user):
+        """
+        Load the version stamp of the IAM rules of the specified user.
+        The stamp changes each time the rules are saved.
+
+        :returns: the stamp, or None if it is not known
+        """
+        return self.redis.conn_slave.hget(
+            self.version_key_for_account(account), user)
+
     @catch_service_errors
     def save_rules_str_for_user(self, account, user, rules):
         """
@@ -69,7 +87,10 @@ class RedisIamDb(object):
         except ValueError as err:
             raise ValueError('rules is not JSON-formatted: %s' % err)
         acct_key = self.key_for_account(account)
-        self.redis.conn.hset(acct_key, user, rules)
+        trans = self.redis.conn.pipeline(True)
+        trans.hset(acct_key, user, rules)
+        trans.hincrby(self.version_key_for_account(account), user, 1)
+        trans.execute()
 
 
 class RedisIamMiddleware(IamMiddleware, RedisIamDb):
@@ -78,6 +99,9 @@ class RedisIamMiddleware(IamMiddleware, RedisIamDb):
 
     There is one hash per account.
     Each field of the hash holds the IAM rules document for one user.
+    Another hash per account holds a version stamp of the rules of each
+    user, incremented each time they are saved: compiled rules are
+    reloaded only when it changes.
 
     Examples (Keystone's style account names):
         IAM:account:AUTH_d1bcefa04c41403c92f4ee5634559e4c
@@ -100,6 +124,9 @@ class RedisIamMiddleware(IamMiddleware, RedisIamDb):
             return None
         return json.loads(rules)
 
+    def get_rules_stamp(self, account, user):
+        return self.load_rules_stamp_for_user(account, user)
+
 
 class IamCommandMixin(object):
     """
@@ -151,7 +151,7 @@ from swift.common.middleware.listing_formats import \
 from swift.common.wsgi import PipelineWrapper, loadcontext, WSGIContext
 
 from swift.common.middleware.s3api.bucket_db import get_bucket_db, \
-    BucketDbWrapper
+    BucketDbWrapper, BucketOwnerCache
 from swift.common.middleware.s3api.exception import NotS3Request, \
     InvalidSubresource
 from swift.common.middleware.s3api.s3request import get_request_class
@@ -287,12 +287,27 @@ class S3ApiMiddleware(object):
         self.slo_enabled = self.conf.allow_multipart_uploads
         self.check_pipeline(self.conf)
         self.bucket_db = get_bucket_db(conf)
+        # Owners of buckets, shared by all requests of this worker
+        # (disabled by default, owner changes are not seen immediately)
+        bucket_owner_cache_ttl = float(
+            conf.get('bucket_owner_cache_ttl', 0.0))
+        if self.bucket_db and bucket_owner_cache_ttl > 0:
+            self.bucket_owner_cache = BucketOwnerCache(
+                size=config_positive_int_value(
+                    conf.get('bucket_owner_cache_size', 10000)),
+                ttl=bucket_owner_cache_ttl,
+                negative_ttl=float(
+                    conf.get('bucket_owner_negative_cache_ttl', 0.0)),
+                logger=self.logger)
+        else:
+            self.bucket_owner_cache = None
 
     def __call__(self, env, start_response):
         try:
             # XXX(FVE): this should be done in an independant middleware
             if self.bucket_db:
-                env['s3api.bucket_db'] = BucketDbWrapper(self.bucket_db)
+                env['s3api.bucket_db'] = BucketDbWrapper(
+                    self.bucket_db, shared_cache=self.bucket_owner_cache)
             req_class = get_request_class(env, self.conf.s3_acl)
             req = req_class(
                 env, self.app, self.slo_enabled, self.conf.storage_domain,
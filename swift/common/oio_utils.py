@@ -14,10 +14,17 @@
 # limitations under the License.
 
 from functools import wraps
+import math
+import multiprocessing
+import os
+import time
+
+from eventlet import sleep
 
 from swift.common.swob import HTTPMethodNotAllowed, \
     HTTPNotFound, \
     HTTPNotModified, HTTPPreconditionFailed, HTTPServiceUnavailable
+from swift.common.utils import pid_alive
 
 from oio.common.constants import REQID_HEADER
 from oio.common.exceptions import MethodNotAllowed, NoSuchContainer, \
@@ -42,6 +49,266 @@ def obj_version_from_env(env):
     return vers
 
 
+def versioning_cache_key(account, container):
+    """Get the cache key of the versioning mode of a container."""
+    return "/".join(("versioning", account, container))
+
+
+def clear_versioning_cache(app, env, account, container):
+    """
+    Remove the versioning mode of a container from memcache and from
+    the cache of the current worker. Other workers will notice the change
+    when their own cache entry expires.
+    """
+    key = versioning_cache_key(account, container)
+    local_cache = getattr(app, 'versioning_cache', None)
+    if local_cache is not None:
+        local_cache.pop_cache(key)
+    memcache = getattr(app, 'memcache', None) or env.get('swift.cache')
+    if memcache is not None:
+        memcache.delete(key)
+
+
+def log2_bucket(value):
+    """
+    Get the upper bound of the power-of-two histogram bucket
+    a (positive) value belongs to.
+    """
+    if value <= 1:
+        return 1
+    return 2 ** int(math.ceil(math.log(value, 2)))
+
+
+class AutoStoragePolicies(object):
+    """
+    Choose the storage policy of new objects according to their size,
+    and keep size and throughput histograms of uploads for each policy.
+
+    :param conf_value: comma separated list of "POLICY:MIN_SIZE" items,
+        as found in the `auto_storage_policies` configuration parameter.
+        An item without size is used for objects of any size.
+    :param buffer_size: number of bytes to read in order to classify
+        uploads with unknown size (chunked transfer encoding). Bigger
+        uploads are classified as if they were `buffer_size` bytes long,
+        thus a policy with a greater minimum size is never chosen for them.
+    """
+
+    def __init__(self, conf_value=None, buffer_size=1048576):
+        self.policies = []
+        if conf_value:
+            for elem in conf_value.split(','):
+                if ':' in elem:
+                    name, offset = elem.split(':')
+                    self.policies.append((name, int(offset)))
+                else:
+                    self.policies.append((elem, 0))
+            self.policies.sort(key=lambda x: x[1])
+        self.buffer_size = buffer_size
+        self.stats = {}
+
+    def __bool__(self):
+        return bool(self.policies)
+    __nonzero__ = __bool__
+
+    def __iter__(self):
+        return iter(self.policies)
+
+    def select(self, size):
+        """Get the name of the policy to use for an object of `size` bytes."""
+        # the default stgpol has an offset of 0 so should always be choose
+        policy = None
+        for (name, offset) in self.policies:
+            if offset <= size:
+                policy = name
+        return policy
+
+    def record(self, policy, size, duration):
+        """
+        Record the size and the throughput (in bytes per second)
+        of an upload.
+        """
+        stats = self.stats.get(policy)
+        if stats is None:
+            stats = self.stats[policy] = {
+                'objects': 0, 'bytes': 0, 'sizes': {}, 'throughputs': {}}
+        stats['objects'] += 1
+        stats['bytes'] += size
+        bucket = str(log2_bucket(size))
+        stats['sizes'][bucket] = stats['sizes'].get(bucket, 0) + 1
+        if duration > 0:
+            bucket = str(log2_bucket(size / duration))
+            stats['throughputs'][bucket] = \
+                stats['throughputs'].get(bucket, 0) + 1
+
+
+class SharedCounters(object):
+    """
+    Request counters shared by all workers of a proxy server.
+
+    The memory is allocated by the master process, before the workers
+    are forked. Each worker claims a slot the first time it admits
+    a request, and then only writes in this slot. Readers sum the
+    counters of all slots without taking any lock, thus the limits
+    are approximate. The slot of a worker which died is reused (and
+    its in-flight counters are reset) by the next worker.
+
+    :param slots: maximum number of workers sharing the counters.
+    :param claim_timeout: time a worker waits for the lock protecting
+                          the slot allocation, before giving up (and
+                          trying again with the next request).
+    """
+
+    VERBS = ('GET', 'HEAD', 'PUT', 'POST', 'DELETE', 'COPY', 'OPTIONS',
+             'other')
+    BACKENDS = ('account', 'container', 'object')
+
+    def __init__(self, slots=1, claim_timeout=0.1):
+        self.slots = slots
+        self.claim_timeout = claim_timeout
+        # Only held while a worker claims a slot.
+        self._lock = multiprocessing.Lock()
+        # For each slot: the ID of the worker, the number of requests
+        # in progress for each verb, then the number of requests and
+        # the number of server errors of each backend.
+        self._verbs_base = 1
+        self._backends_base = self._verbs_base + len(self.VERBS)
+        self._width = self._backends_base + len(self.BACKENDS) * 2
+        self._counters = multiprocessing.RawArray('l', slots * self._width)
+        self._pid = None
+        self._slot = None
+
+    def _verb_index(self, verb):
+        try:
+            return self.VERBS.index(verb)
+        except ValueError:
+            return len(self.VERBS) - 1
+
+    def _find_slot(self, pid):
+        """Find a slot which belongs to nobody, or to a dead worker."""
+        for slot in range(self.slots):
+            owner = self._counters[slot * self._width]
+            if owner == pid or not owner or not pid_alive(owner):
+                return slot, owner
+        return None, None
+
+    def _claim_slot(self):
+        """
+        Get the slot of the current worker, claim one if necessary.
+
+        :returns: the index of the slot, or None if there is no free slot
+                  or if the lock could not be taken in time.
+        """
+        pid = os.getpid()
+        if self._pid == pid:
+            return self._slot
+        deadline = time.time() + self.claim_timeout
+        while True:
+            slot, owner = self._find_slot(pid)
+            if slot is None:
+                # More workers than expected, do not limit this one.
+                self._pid, self._slot = pid, None
+                return None
+            # Do not block the hub, the lock may be held by a worker
+            # which has been killed.
+            while not self._lock.acquire(False):
+                if time.time() >= deadline:
+                    return None
+                sleep(0.01)
+            try:
+                if self._counters[slot * self._width] != owner:
+                    # Claimed by another worker in the meantime.
+                    continue
+                base = slot * self._width
+                self._counters[base] = pid
+                for i in range(self._verbs_base, self._backends_base):
+                    self._counters[base + i] = 0
+            finally:
+                self._lock.release()
+            self._pid, self._slot = pid, slot
+            return slot
+
+    def _count(self, verb_idx=None):
+        """Count requests in progress, in all slots."""
+        total = 0
+        start = self._verbs_base
+        stop = self._backends_base
+        if verb_idx is not None:
+            start += verb_idx
+            stop = start + 1
+        for base in range(0, self.slots * self._width, self._width):
+            if self._counters[base]:
+                total += sum(self._counters[base + start:base + stop])
+        return total
+
+    def acquire(self, verb, max_requests=0, max_verb_requests=0):
+        """
+        Count a new request in progress, unless there are already
+        `max_requests` requests (or `max_verb_requests` requests with
+        the same verb) in progress in all workers.
+
+        :returns: True if the request has been admitted
+        """
+        slot = self._claim_slot()
+        if slot is None:
+            return True
+        verb_idx = self._verb_index(verb)
+        if max_requests and self._count() >= max_requests:
+            return False
+        if max_verb_requests and \
+                self._count(verb_idx) >= max_verb_requests:
+            return False
+        self._counters[
+            slot * self._width + self._verbs_base + verb_idx] += 1
+        return True
+
+    def release(self, verb):
+        """Forget a request previously admitted by `acquire`."""
+        if self._pid != os.getpid() or self._slot is None:
+            return
+        idx = self._slot * self._width + self._verbs_base + \
+            self._verb_index(verb)
+        if self._counters[idx] > 0:
+            self._counters[idx] -= 1
+
+    def record_backend(self, backend, error=False):
+        """Count a request handled by a backend, and maybe an error."""
+        try:
+            backend_idx = self.BACKENDS.index(backend)
+        except ValueError:
+            return
+        slot = self._claim_slot()
+        if slot is None:
+            return
+        idx = slot * self._width + self._backends_base + backend_idx * 2
+        self._counters[idx] += 1
+        if error:
+            self._counters[idx + 1] += 1
+
+    def in_flight(self):
+        """Get the number of requests in progress, for each verb."""
+        return {verb: self._count(i) for i, verb in enumerate(self.VERBS)}
+
+    def stats(self):
+        """
+        Get the number of requests in progress for each verb,
+        and the number of requests, errors and the error rate
+        of each backend (since the server started).
+        """
+        backends = {}
+        for i, backend in enumerate(self.BACKENDS):
+            requests = errors = 0
+            for base in range(self._backends_base + i * 2,
+                              self.slots * self._width, self._width):
+                requests += self._counters[base]
+                errors += self._counters[base + 1]
+            backends[backend] = {
+                'requests': requests,
+                'errors': errors,
+                'error_rate': float(errors) / requests if requests else 0.0
+            }
+        return {'in_flight': self.in_flight(), 'backends': backends}
+
+
 def handle_service_busy(fnc):
     @wraps(fnc)
     def _service_busy_wrapper(self, req, *args, **kwargs):
@@ -188,3 +455,142 @@ class RedisDb(RedisConnection):
 
     def pipeline(self, *args, **kwargs):
         return self.conn.pipeline(*args, **kwargs)
+
+    def batch(self):
+        """
+        Get a RedisBatch, to send several operations
+        in one round-trip to each Redis server.
+        """
+        return RedisBatch(self)
+
+
+class RedisFuture(object):
+    """
+    Result of an operation queued in a RedisBatch.
+    Reading the result flushes the batch if it has not been done yet.
+    """
+
+    __slots__ = ('batch', 'done', 'value', 'error')
+
+    def __init__(self, batch):
+        self.batch = batch
+        self.done = False
+        self.value = None
+        self.error = None
+
+    def set_result(self, value):
+        if isinstance(value, Exception):
+            self.error = value
+        else:
+            self.value = value
+        self.done = True
+
+    def result(self):
+        if not self.done:
+            self.batch.flush()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class RedisBatch(object):
+    """
+    Collect Redis operations and send them in a single pipeline
+    to each server. Each operation returns a RedisFuture.
+
+    Reads go to the same server as the matching method of RedisDb: get()
+    and hget() read the master, and see the writes of previous requests,
+    hexists() and zrangebylex() read a slave. Writes go to the master
+    (in a transaction, after the reads of the master).
+
+    Reads are sent before writes, thus they do not see the writes of
+    the same batch. Use as a context manager to flush on exit:
+
+        with redis_db.batch() as batch:
+            found = batch.hexists(key, path)
+            headers = batch.hget(key, path)
+        if found.result():
+            ...
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._reads = list()
+        self._slave_reads = list()
+        self._writes = list()
+
+    def __len__(self):
+        return len(self._reads) + len(self._slave_reads) + len(self._writes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def _queue(self, ops, method, *args, **kwargs):
+        future = RedisFuture(self)
+        ops.append((future, method, args, kwargs))
+        return future
+
+    def get(self, key):
+        return self._queue(self._reads, 'get', key)
+
+    def hget(self, key, path):
+        return self._queue(self._reads, 'hget', key, path)
+
+    def hexists(self, key, hkey):
+        return self._queue(self._slave_reads, 'hexists', key, hkey)
+
+    def zrangebylex(self, key, start, end, count):
+        return self._queue(self._slave_reads, 'zrangebylex', key, start, end,
+                           0, count)
+
+    def hset(self, key, path, val):
+        return self._queue(self._writes, 'hset', key, path, val)
+
+    def hdel(self, key, hkey):
+        return self._queue(self._writes, 'hdel', key, hkey)
+
+    def zset(self, key, path):
+        if self.db.zset == self.db.zset_legacy:
+            return self._queue(self._writes, 'zadd', key, 1, path)
+        return self._queue(self._writes, 'zadd', key, {path: 1}, nx=True)
+
+    def zdel(self, key, zkey):
+        return self._queue(self._writes, 'zrem', key, zkey)
+
+    @staticmethod
+    def _execute(conn, ops, transaction):
+        if not ops:
+            return
+        pipe = conn.pipeline(transaction)
+        for _future, method, args, kwargs in ops:
+            getattr(pipe, method)(*args, **kwargs)
+        results = pipe.execute(raise_on_error=False)
+        for (future, _method, _args, _kwargs), res in zip(ops, results):
+            future.set_result(res)
+
+    @catch_service_errors
+    def _execute_all(self, slave_reads, reads, writes):
+        self._execute(self.db.conn_slave, slave_reads, False)
+        self._execute(self.db.conn, reads + writes, bool(writes))
+
+    def flush(self):
+        """
+        Send the queued operations, and set the result of their futures.
+        If a pipeline fails as a whole, the futures which have not been
+        set will raise the same error.
+        """
+        slave_reads, self._slave_reads = self._slave_reads, list()
+        reads, self._reads = self._reads, list()
+        writes, self._writes = self._writes, list()
+        try:
+            self._execute_all(slave_reads, reads, writes)
+        except Exception as exc:
+            for future, _method, _args, _kwargs in (
+                    slave_reads + reads + writes):
+                if not future.done:
+                    future.set_result(exc)
+            raise
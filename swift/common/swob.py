@@ -49,7 +49,7 @@ import six
 from six import StringIO
 from six.moves import urllib
 
-from swift.common.header_key_dict import HeaderKeyDict
+from swift.common.header_key_dict import HeaderKeyDict, NormalizationCache
 from swift.common.utils import UTC, reiterate, split_path, Timestamp, pairs, \
     close_if_possible, closing_if_possible, config_true_value
 from swift.common.exceptions import InvalidTimestamp
@@ -204,7 +204,7 @@ def _header_int_property(header):
                     doc="Retrieve and set the %s header as an int" % header)
 
 
-def header_to_environ_key(header_name):
+def _header_to_environ_key(header_name):
     # Why the to/from wsgi dance? Headers that include something like b'\xff'
     # on the wire get translated to u'\u00ff' on py3, which gets upper()ed to
     # u'\u0178', which is nonsense in a WSGI string.
@@ -221,6 +221,24 @@ def header_to_environ_key(header_name):
     return header_name
 
 
+def _environ_key_to_header(environ_key):
+    # See the to/from WSGI comment in _header_to_environ_key
+    return bytes_to_wsgi(
+        wsgi_to_bytes(environ_key[5:]).replace(b'_', b'-').title())
+
+
+_environ_keys = NormalizationCache(_header_to_environ_key)
+_header_names = NormalizationCache(_environ_key_to_header)
+
+
+# Characters which make urlparse() do more than split the query string
+_URL_PARSED_CHARS = re.compile('[#;\t\r\n]')
+
+
+def header_to_environ_key(header_name):
+    return _environ_keys[header_name]
+
+
 class HeaderEnvironProxy(MutableMapping):
     """
     A dict-like object that proxies requests to a wsgi environ,
@@ -237,20 +255,23 @@ class HeaderEnvironProxy(MutableMapping):
             yield k
 
     def __len__(self):
-        return len(self.keys())
+        return sum(1 for key in self.environ
+                   if key.startswith('HTTP_') or
+                   key in ('CONTENT_LENGTH', 'CONTENT_TYPE'))
 
     def __getitem__(self, key):
         return self.environ[header_to_environ_key(key)]
 
     def __setitem__(self, key, value):
+        key = header_to_environ_key(key)
         if value is None:
-            self.environ.pop(header_to_environ_key(key), None)
+            self.environ.pop(key, None)
         elif six.PY2 and isinstance(value, six.text_type):
-            self.environ[header_to_environ_key(key)] = value.encode('utf-8')
+            self.environ[key] = value.encode('utf-8')
         elif not six.PY2 and isinstance(value, six.binary_type):
-            self.environ[header_to_environ_key(key)] = value.decode('latin1')
+            self.environ[key] = value.decode('latin1')
         else:
-            self.environ[header_to_environ_key(key)] = str(value)
+            self.environ[key] = str(value)
 
     def __contains__(self, key):
         return header_to_environ_key(key) in self.environ
@@ -259,10 +280,8 @@ class HeaderEnvironProxy(MutableMapping):
         del self.environ[header_to_environ_key(key)]
 
     def keys(self):
-        # See the to/from WSGI comment in header_to_environ_key
-        keys = [
-            bytes_to_wsgi(wsgi_to_bytes(key[5:]).replace(b'_', b'-').title())
-            for key in self.environ if key.startswith('HTTP_')]
+        keys = [_header_names[key]
+                for key in self.environ if key.startswith('HTTP_')]
         if 'CONTENT_LENGTH' in self.environ:
             keys.append('Content-Length')
         if 'CONTENT_TYPE' in self.environ:
@@ -936,32 +955,46 @@ class Request(object):
                 # Check that the input is valid
                 path.encode('latin1')
 
-        parsed_path = urllib.parse.urlparse(path)
-        server_name = 'localhost'
-        if parsed_path.netloc:
-            server_name = parsed_path.netloc.split(':', 1)[0]
-
-        server_port = parsed_path.port
-        if server_port is None:
-            server_port = {'http': 80,
-                           'https': 443}.get(parsed_path.scheme, 80)
-        if parsed_path.scheme and parsed_path.scheme not in ['http', 'https']:
-            raise TypeError('Invalid scheme: %s' % parsed_path.scheme)
+        if path.startswith('/') and not path.startswith('//') \
+                and not _URL_PARSED_CHARS.search(path):
+            # Fast path for the plain paths of middleware subrequests:
+            # no need to parse a URL.
+            path, _junk, query = path.partition('?')
+            scheme = 'http'
+            server_name = 'localhost'
+            server_port = 80
+        else:
+            parsed_path = urllib.parse.urlparse(path)
+            path, query = parsed_path.path, parsed_path.query
+            scheme = parsed_path.scheme or 'http'
+            server_name = 'localhost'
+            if parsed_path.netloc:
+                server_name = parsed_path.netloc.split(':', 1)[0]
+
+            server_port = parsed_path.port
+            if server_port is None:
+                server_port = {'http': 80,
+                               'https': 443}.get(parsed_path.scheme, 80)
+            if parsed_path.scheme and \
+                    parsed_path.scheme not in ['http', 'https']:
+                raise TypeError('Invalid scheme: %s' % parsed_path.scheme)
         env = {
             'REQUEST_METHOD': 'GET',
             'SCRIPT_NAME': '',
-            'QUERY_STRING': parsed_path.query,
-            'PATH_INFO': wsgi_unquote(parsed_path.path),
+            'QUERY_STRING': query,
             'SERVER_NAME': server_name,
             'SERVER_PORT': str(server_port),
             'HTTP_HOST': '%s:%d' % (server_name, server_port),
             'SERVER_PROTOCOL': 'HTTP/1.0',
             'wsgi.version': (1, 0),
-            'wsgi.url_scheme': parsed_path.scheme or 'http',
+            'wsgi.url_scheme': scheme,
             'wsgi.errors': StringIO(),
             'wsgi.multithread': False,
             'wsgi.multiprocess': False
         }
+        if 'PATH_INFO' not in environ:
+            # Subrequests usually come with their own, already unquoted
+            env['PATH_INFO'] = wsgi_unquote(path)
         env.update(environ)
         if body is not None:
             if not isinstance(body, six.binary_type):
@@ -1220,10 +1253,12 @@ def content_range_header(start, stop, size):
 
 
 def multi_range_iterator(ranges, content_type, boundary, size, sub_iter_gen):
+    part_header = b''.join([b'--', boundary, b'\r\n',
+                            b'Content-Type: ', content_type, b'\r\n'])
     for start, stop in ranges:
-        yield b''.join([b'--', boundary, b'\r\n',
-                       b'Content-Type: ', content_type, b'\r\n'])
-        yield content_range_header(start, stop, size) + b'\r\n\r\n'
+        yield b''.join([part_header,
+                        content_range_header(start, stop, size),
+                        b'\r\n\r\n'])
         sub_iter = sub_iter_gen(start, stop)
         for chunk in sub_iter:
             yield chunk
@@ -122,6 +122,11 @@ FALLOCATE_IS_PERCENT = False
 FALLOC_FL_KEEP_SIZE = 1
 FALLOC_FL_PUNCH_HOLE = 2
 
+# from /usr/include/linux/fadvise.h
+POSIX_FADV_SEQUENTIAL = 2
+POSIX_FADV_WILLNEED = 3
+POSIX_FADV_DONTNEED = 4
+
 # from /usr/src/linux-headers-*/include/uapi/linux/resource.h
 PRIO_PROCESS = 0
 
@@ -197,6 +202,9 @@ RESERVED_BYTE = b'\x00'
 RESERVED_STR = u'\x00'
 RESERVED = '\x00'
 
+# Statistics saved periodically by proxy workers
+PROXY_RECON_FILE = 'proxy.recon'
+
 
 LOG_LINE_DEFAULT_FORMAT = '{remote_addr} - - [{time.d}/{time.b}/{time.Y}' \
                           ':{time.H}:{time.M}:{time.S} +0000] ' \
@@ -1012,6 +1020,7 @@ _fallocate_enabled = True
 _fallocate_warned_about_missing = False
 _sys_fallocate = _LibcWrapper('fallocate')
 _sys_posix_fallocate = _LibcWrapper('posix_fallocate')
+_sys_syncfs = _LibcWrapper('syncfs')
 
 
 def disable_fallocate():
@@ -1145,6 +1154,24 @@ def fdatasync(fd):
         fsync(fd)
 
 
+def syncfs(fd):
+    """
+    Sync the whole filesystem containing a file to disk. If syncfs() is not
+    available, only the file is synced.
+
+    :param fd: file descriptor
+    :returns: True if the whole filesystem has been synced
+    """
+    if not _sys_syncfs.available:
+        fsync(fd)
+        return False
+    if _sys_syncfs(fd) == -1:
+        err = ctypes.get_errno()
+        raise OSError(err, 'Unable to syncfs(%s): %s' % (
+            fd, os.strerror(err)))
+    return True
+
+
 def fsync_dir(dirpath):
     """
     Sync directory entries to disk.
@@ -1167,24 +1194,36 @@ def fsync_dir(dirpath):
             os.close(dirfd)
 
 
-def drop_buffer_cache(fd, offset, length):
+def posix_fadvise(fd, offset, length, advice):
     """
-    Drop 'buffer' cache for the given range of the given file.
+    Tell the kernel how a range of a file is going to be accessed.
 
     :param fd: file descriptor
     :param offset: start offset
     :param length: length
+    :param advice: one of the POSIX_FADV_* constants
     """
     global _posix_fadvise
     if _posix_fadvise is None:
         _posix_fadvise = load_libc_function('posix_fadvise64')
-    # 4 means "POSIX_FADV_DONTNEED"
     ret = _posix_fadvise(fd, ctypes.c_uint64(offset),
-                         ctypes.c_uint64(length), 4)
+                         ctypes.c_uint64(length), advice)
     if ret != 0:
-        logging.warning("posix_fadvise64(%(fd)s, %(offset)s, %(length)s, 4) "
-                        "-> %(ret)s", {'fd': fd, 'offset': offset,
-                                       'length': length, 'ret': ret})
+        logging.warning("posix_fadvise64(%(fd)s, %(offset)s, %(length)s, "
+                        "%(advice)s) -> %(ret)s",
+                        {'fd': fd, 'offset': offset, 'length': length,
+                         'advice': advice, 'ret': ret})
+
+
+def drop_buffer_cache(fd, offset, length):
+    """
+    Drop 'buffer' cache for the given range of the given file.
+
+    :param fd: file descriptor
+    :param offset: start offset
+    :param length: length
+    """
+    posix_fadvise(fd, offset, length, POSIX_FADV_DONTNEED)
 
 
 NORMAL_FORMAT = "%016.05f"
@@ -1590,6 +1629,8 @@ def renamer(old, new, fsync=True):
     :param new: new path to be renamed to
     :param fsync: fsync on containing directory of new and also all
                   the newly created directories.
+    :returns: the directories which were fsync'd, or which should be
+              fsync'd by the caller if fsync is False
     """
     dirpath = os.path.dirname(new)
     try:
@@ -1598,14 +1639,18 @@ def renamer(old, new, fsync=True):
     except OSError:
         count = makedirs_count(dirpath)
         os.rename(old, new)
+    # If count=0, no new directories were created. But we still need to
+    # fsync leaf dir after os.rename().
+    # If count>0, starting from leaf dir, fsync parent dirs of all
+    # directories created by makedirs_count()
+    dirpaths = []
+    for i in range(0, count + 1):
+        dirpaths.append(dirpath)
+        dirpath = os.path.dirname(dirpath)
     if fsync:
-        # If count=0, no new directories were created. But we still need to
-        # fsync leaf dir after os.rename().
-        # If count>0, starting from leaf dir, fsync parent dirs of all
-        # directories created by makedirs_count()
-        for i in range(0, count + 1):
+        for dirpath in dirpaths:
             fsync_dir(dirpath)
-            dirpath = os.path.dirname(dirpath)
+    return dirpaths
 
 
 def link_fd_to_path(fd, target_path, dirs_created=0, retries=2, fsync=True):
@@ -1624,6 +1669,8 @@ def link_fd_to_path(fd, target_path, dirs_created=0, retries=2, fsync=True):
     :param retries: number of retries to make
     :param fsync: fsync on containing directory of target_path and also all
                   the newly created directories.
+    :returns: the directories which were fsync'd, or which should be
+              fsync'd by the caller if fsync is False
     """
     dirpath = os.path.dirname(target_path)
     for _junk in range(0, retries):
@@ -1643,10 +1690,14 @@ def link_fd_to_path(fd, target_path, dirs_created=0, retries=2, fsync=True):
             else:
                 raise
 
+    dirpaths = []
+    for i in range(0, dirs_created + 1):
+        dirpaths.append(dirpath)
+        dirpath = os.path.dirname(dirpath)
     if fsync:
-        for i in range(0, dirs_created + 1):
+        for dirpath in dirpaths:
             fsync_dir(dirpath)
-            dirpath = os.path.dirname(dirpath)
+    return dirpaths
 
 
 def split_path(path, minsegs=1, maxsegs=None, rest_with_last=False):
@@ -3765,6 +3816,141 @@ def dump_recon_cache(cache_dict, cache_file, logger, lock_timeout=2,
         logger.exception('Exception dumping recon cache: %s' % err)
 
 
+def pid_alive(pid):
+    """Tell if a process with the specified ID exists."""
+    try:
+        os.kill(pid, 0)
+    except OSError as err:
+        return err.errno != errno.ESRCH
+    return True
+
+
+class ReconStatsDumper(object):
+    """
+    Periodically save statistics of the current worker in a recon cache
+    file (the proxy's by default), under keys named after the worker's
+    PID, so the recon middleware can show them. The statistics of dead
+    workers are removed.
+
+    :param recon_cache_path: directory containing the recon cache files
+    :param interval: minimum number of seconds between two dumps
+    :param recon_file: name of the recon cache file
+    """
+
+    def __init__(self, recon_cache_path, interval, logger,
+                 recon_file=PROXY_RECON_FILE):
+        self.recon_cache = os.path.join(recon_cache_path, recon_file)
+        self.interval = interval
+        self.logger = logger
+        self.last_dump = time.time()
+        self.sources = {}
+
+    def register(self, key, get_stats):
+        """
+        Register a function returning statistics to save
+        in the recon cache, under `key`.
+        """
+        self.sources[key] = get_stats
+
+    def maybe_dump(self, force=False):
+        """
+        Save statistics in the recon cache, if the last dump
+        is older than `interval` seconds.
+        """
+        now = time.time()
+        if not self.sources or \
+                (not force and now - self.last_dump < self.interval):
+            return False
+        self.last_dump = now
+        pid = str(os.getpid())
+        cache_dict = {key: {pid: get_stats()} for key, get_stats
+                      in self.sources.items()}
+        # An empty dict removes the entry of a dead worker
+        existing = load_recon_cache(self.recon_cache)
+        for key, entries in cache_dict.items():
+            for other_pid in existing.get(key) or {}:
+                if other_pid != pid and other_pid.isdigit() and \
+                        not pid_alive(int(other_pid)):
+                    entries[other_pid] = {}
+        dump_recon_cache(cache_dict, self.recon_cache, self.logger)
+        return True
+
+
+class Histogram(object):
+    """
+    Histogram of positive values, with buckets of bounded relative width
+    (like HDR histograms): values are recorded as integers (in `unit`),
+    and each power of two is split in 2 ** `precision_bits` buckets.
+    With the default precision, percentiles are off by less than 12.5%.
+
+    :param precision_bits: log2 of the number of buckets
+        per power of two
+    :param unit: smallest value which can be distinguished from 0
+    """
+
+    def __init__(self, precision_bits=3, unit=1e-6):
+        self.precision_bits = precision_bits
+        self.unit = unit
+        self.reset()
+
+    def reset(self):
+        self.buckets = dict()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0
+
+    def _bucket(self, value):
+        """
+        Get the lower bound (in units) of the bucket `value` belongs to,
+        and the width of the bucket.
+        """
+        units = int(value / self.unit)
+        if units <= 0:
+            return 0, 1
+        shift = units.bit_length() - self.precision_bits - 1
+        if shift <= 0:
+            return units, 1
+        return (units >> shift) << shift, 1 << shift
+
+    def record(self, value):
+        lower, _ = self._bucket(value)
+        self.buckets[lower] = self.buckets.get(lower, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, pct):
+        """
+        Get the highest value of the bucket containing the `pct`th
+        percentile (never above the maximum recorded value).
+        """
+        if not self.count:
+            return 0
+        target = max(1, int(math.ceil(self.count * pct / 100.0)))
+        seen = 0
+        for lower in sorted(self.buckets):
+            seen += self.buckets[lower]
+            if seen >= target:
+                break
+        _, width = self._bucket(lower * self.unit)
+        return min((lower + width - 1) * self.unit, self.max)
+
+    def to_dict(self, percentiles=(50, 90, 99)):
+        """
+        Get a summary of the histogram, which can be serialized to JSON.
+        Bucket keys are their lower bounds, in units.
+        """
+        summary = {'count': self.count,
+                   'sum': self.total,
+                   'max': self.max,
+                   'buckets': {str(lower): count
+                               for lower, count in self.buckets.items()}}
+        for pct in percentiles:
+            summary['p%d' % pct] = self.percentile(pct)
+        return summary
+
+
 def load_recon_cache(cache_file):
     """
     Load a recon cache file. Treats missing file as empty.
@@ -4077,6 +4263,7 @@ class LRUCache(object):
         self.head[self.NEXT] = self.tail
 
     def set_cache(self, value, *key):
+        self.pop_cache(*key)
         while len(self.mapping) >= self.maxsize:
             old_next, old_key = self.head[self.NEXT][self.NEXT:self.NEXT + 2]
             self.head[self.NEXT], old_next[self.PREV] = old_next, self.head
@@ -4098,6 +4285,33 @@ class LRUCache(object):
         link[self.NEXT] = self.tail
         return value
 
+    def get_cache(self, *key):
+        """
+        Get a value from the cache, without calling the decorated function.
+
+        :raises KeyError: if the key is not cached or has timed out
+        """
+        link = self.mapping[key]
+        try:
+            return self.get_cached(link, *key)
+        except KeyError:
+            self.pop_cache(*key)
+            raise
+
+    def pop_cache(self, *key):
+        """
+        Remove a key from the cache.
+
+        :returns: True if the key was cached
+        """
+        link = self.mapping.pop(key, None)
+        if link is None:
+            return False
+        link_prev, link_next = link[self.PREV], link[self.NEXT]
+        link_prev[self.NEXT] = link_next
+        link_next[self.PREV] = link_prev
+        return True
+
     def __call__(self, f):
 
         class LRUCacheWrapped(object):
@@ -4123,6 +4337,12 @@ class LRUCache(object):
             def reset(im_self):
                 return self.reset()
 
+            def invalidate(im_self, *key):
+                """
+                Remove a key from the cache
+                """
+                return self.pop_cache(*key)
+
             def get_maxsize(im_self):
                 return self.maxsize
 
@@ -38,6 +38,7 @@ import fcntl
 import json
 import os
 import re
+import stat
 import time
 import uuid
 from hashlib import md5
@@ -51,7 +52,8 @@ from contextlib import contextmanager
 from collections import defaultdict
 from datetime import timedelta
 
-from eventlet import Timeout, tpool
+from eventlet import Timeout, spawn_after, tpool
+from eventlet.event import Event
 from eventlet.hubs import trampoline
 import six
 from pyeclib.ec_iface import ECDriverError, ECInvalidFragmentMetadata, \
@@ -66,7 +68,9 @@ from swift.common.utils import mkdirs, Timestamp, \
     config_true_value, listdir, split_path, remove_file, \
     get_md5_socket, F_SETPIPE_SZ, decode_timestamps, encode_timestamps, \
     MD5_OF_EMPTY_STRING, link_fd_to_path, \
-    O_TMPFILE, makedirs_count, replace_partition_in_path, remove_directory
+    O_TMPFILE, makedirs_count, replace_partition_in_path, remove_directory, \
+    syncfs, Histogram, LRUCache, posix_fadvise, POSIX_FADV_SEQUENTIAL, \
+    POSIX_FADV_WILLNEED
 from swift.common.splice import splice, tee
 from swift.common.exceptions import DiskFileQuarantined, DiskFileNotExist, \
     DiskFileCollision, DiskFileNoSpace, DiskFileDeviceUnavailable, \
@@ -83,9 +87,21 @@ PICKLE_PROTOCOL = 2
 DEFAULT_RECLAIM_AGE = timedelta(weeks=1).total_seconds()
 HASH_FILE = 'hashes.pkl'
 HASH_INVALIDATIONS_FILE = 'hashes.invalid'
+HASH_TREE_FILE = 'hashes.tree'
+# Suffixes are the leaves of hash trees, their prefixes the inner nodes.
+SUFFIX_LENGTH = 3
+PART_INDEX_FILE = 'objects.index'
+PART_INDEX_MARKER = b'# complete\n'
 METADATA_KEY = b'user.swift.metadata'
 METADATA_CHECKSUM_KEY = b'user.swift.metadata_checksum'
 DROP_CACHE_WINDOW = 1024 * 1024
+# Ways object data can be sent to clients: read and written by Python,
+# moved by splice() through an md5 socket, or sent by sendfile() without
+# checking its etag (the auditor does).
+READ_MODES = ('copy', 'splice', 'sendfile')
+# Zero-copy reads of at most this many bytes are read ahead at once, larger
+# ones are read ahead progressively.
+READAHEAD_WILLNEED_MAX = 4 * 1024 * 1024
 # These are system-set metadata keys that cannot be changed with a POST.
 # They should be lowercase.
 RESERVED_DATAFILE_META = {'content-length', 'deleted', 'etag'}
@@ -328,6 +344,7 @@ def quarantine_renamer(device_path, corrupted_file_path):
                   get_data_dir(policy),
                   basename(from_dir))
     invalidate_hash(dirname(from_dir))
+    update_part_index(from_dir, [])
     try:
         renamer(from_dir, to_dir, fsync=False)
     except OSError as e:
@@ -440,6 +457,298 @@ def invalidate_hash(suffix_dir):
         inv_fh.write(suffix + b"\n")
 
 
+def hash_tree_leaf(suffix_hash, frag_index=None):
+    """
+    Get what is compared of the hash of a suffix in a hash tree: the hash
+    itself for replicated policies; the hash of the durable state and the
+    hash of the given fragment index for EC policies.
+    """
+    if isinstance(suffix_hash, dict):
+        return '%s/%s' % (suffix_hash.get(None), suffix_hash.get(frag_index))
+    return suffix_hash
+
+
+def build_hash_tree(hashes, frag_index=None):
+    """
+    Build the hash tree of a partition from the hashes of its suffixes.
+
+    Each prefix of the suffixes ('' for the root, then their first one and
+    two characters) is given the md5 of the hashes of the suffixes starting
+    with it, so that two copies of a partition can be compared by their
+    roots, and then only down the subtrees which differ.
+
+    :param hashes: a dict of suffix hashes, as returned by get_hashes
+    :param frag_index: the fragment index compared, for EC policies
+    :returns: a dict mapping prefixes and suffixes to their hashes
+    """
+    tree = {}
+    digests = defaultdict(md5)
+    for suffix in sorted(hashes):
+        leaf = hash_tree_leaf(hashes[suffix], frag_index)
+        tree[suffix] = leaf
+        entry = ('%s %s\n' % (suffix, leaf)).encode('utf-8')
+        for length in range(SUFFIX_LENGTH):
+            digests[suffix[:length]].update(entry)
+    tree.update((prefix, digest.hexdigest())
+                for prefix, digest in digests.items())
+    return tree
+
+
+def hash_tree_children(tree, prefixes):
+    """
+    Get the nodes of a hash tree right under the given prefixes, and the
+    root itself if asked ('').
+    """
+    prefixes = set(prefixes)
+    children = {node: hsh for node, hsh in tree.items()
+                if node and node[:-1] in prefixes}
+    if '' in prefixes and '' in tree:
+        children[''] = tree['']
+    return children
+
+
+def diff_hash_trees(local_tree, remote_nodes, fetch):
+    """
+    Find the suffixes whose hashes differ between a local and a remote hash
+    tree, fetching the remote tree one level at a time, and only below the
+    nodes which differ.
+
+    :param local_tree: the local hash tree, from build_hash_tree
+    :param remote_nodes: the root of the remote tree and the nodes right
+                         under it
+    :param fetch: a function taking a list of prefixes, returning the nodes
+                  of the remote tree right under them
+    :returns: a dict mapping the suffixes which differ to their remote hash
+              (None if the remote tree does not have them)
+    """
+    differing = {}
+    if local_tree.get('') == remote_nodes.get(''):
+        return differing
+    prefixes = ['']
+    while prefixes:
+        local_nodes = hash_tree_children(local_tree, prefixes)
+        local_nodes.pop('', None)
+        remote_nodes.pop('', None)
+        subtrees = []
+        for node in set(local_nodes) | set(remote_nodes):
+            if local_nodes.get(node) == remote_nodes.get(node):
+                continue
+            if len(node) < SUFFIX_LENGTH:
+                subtrees.append(node)
+            else:
+                differing[node] = remote_nodes.get(node)
+        prefixes = sorted(subtrees)
+        if prefixes:
+            remote_nodes = fetch(prefixes)
+    return differing
+
+
+def read_hash_trees(partition_dir):
+    """
+    Read the existing hashes.tree
+
+    :returns: a dict, with the 'updated' key of the hashes the trees were
+              built from, and the trees by fragment index (None for
+              replicated policies)
+    """
+    try:
+        with open(join(partition_dir, HASH_TREE_FILE), 'rb') as tree_fp:
+            trees = pickle.loads(tree_fp.read())
+    except Exception:
+        # missing, or corrupt: the trees are built again
+        trees = None
+    if not isinstance(trees, dict) or 'trees' not in trees:
+        trees = {'updated': None, 'trees': {}}
+    return trees
+
+
+def _part_index_line(suffix, hsh, files):
+    line = ' '.join(['%s/%s' % (suffix, hsh)] + list(files)) + '\n'
+    if not isinstance(line, bytes):
+        line = line.encode('utf-8')
+    return line
+
+
+def update_part_index(hsh_path, files=None):
+    """
+    Record the files of an object directory in the index of its partition,
+    if the partition has one.
+
+    :param hsh_path: absolute path to the object directory
+    :param files: the files remaining in the object directory, listed from
+                  the directory if None
+    """
+    suffix_dir = dirname(hsh_path)
+    partition_dir = dirname(suffix_dir)
+    index_file = join(partition_dir, PART_INDEX_FILE)
+    if not exists(index_file):
+        return
+    if files is None:
+        files = sorted(listdir(hsh_path), reverse=True)
+    line = _part_index_line(basename(suffix_dir), basename(hsh_path), files)
+    with lock_path(partition_dir), open(index_file, 'ab') as index_fh:
+        index_fh.write(line)
+
+
+class PartitionIndex(object):
+    """
+    An index of the files of each object directory of a partition, kept
+    in an append-only file next to hashes.pkl.
+
+    Each line of the file gives the files of an object directory, an empty
+    list meaning the directory is gone, and the last line about a directory
+    wins. Every change made to an object directory through the DiskFile API
+    appends a line, so that the suffixes invalidated by these changes can be
+    rehashed without walking their directories. The file is only trusted
+    once it starts with a marker, written after a walk of the whole
+    partition. Changes made behind the object server's back (rsync) are
+    taken into account when their suffixes are explicitly recalculated:
+    those are walked, and the index is updated with what was found.
+
+    :param partition_dir: absolute path to the partition directory
+    :param mistrust: suffixes to walk even if the index knows them
+    """
+    def __init__(self, partition_dir, mistrust=None):
+        self.partition_dir = partition_dir
+        self.path = join(partition_dir, PART_INDEX_FILE)
+        self.mistrust = set(mistrust or [])
+        # suffix -> object hash -> files (reverse sorted)
+        self.suffixes = {}
+        # Same layout, the object directories walked since load()
+        self.walked = {}
+        self.complete = False
+        self.lines = 0
+        self.offset = 0
+
+    def _parse(self, index_fh, touched=None):
+        for line in index_fh:
+            self.offset += len(line)
+            if line == PART_INDEX_MARKER and self.lines == 0:
+                self.complete = True
+                continue
+            if not line.endswith(b'\n'):
+                # Interrupted write: nothing after this can be trusted
+                raise ValueError('truncated line')
+            if six.PY3:
+                line = line.decode('utf-8')
+            fields = line.split()
+            suffix, _junk, hsh = fields[0].partition('/')
+            if len(suffix) != 3 or not hsh.endswith(suffix):
+                raise ValueError('invalid line %r' % line)
+            entries = self.suffixes.setdefault(suffix, {})
+            if len(fields) > 1:
+                entries[hsh] = fields[1:]
+            else:
+                entries.pop(hsh, None)
+            if touched is not None:
+                touched.add((suffix, hsh))
+            self.lines += 1
+
+    def load(self, create=True):
+        """
+        Read the index.
+
+        :param create: create an empty index if there is none yet, so that
+                       the changes made while the partition is walked get
+                       recorded
+        """
+        try:
+            if create:
+                with open(self.path, 'ab'):
+                    pass
+            with open(self.path, 'rb') as index_fh:
+                self._parse(index_fh)
+        except ValueError:
+            self.complete = False
+        except (IOError, OSError) as err:
+            self.complete = False
+            if err.errno != errno.ENOENT:
+                raise
+
+    def entries(self, suffix):
+        """
+        :returns: a dict mapping the object hashes of the suffix to their
+                  files, or None if the suffix must be walked
+        """
+        if not self.complete or suffix in self.mistrust or \
+                suffix not in self.suffixes:
+            return None
+        return self.suffixes[suffix]
+
+    def record(self, suffix, hsh=None, files=None):
+        """
+        Remember that a suffix has been walked, and the files found in one
+        of its object directories.
+        """
+        entries = self.walked.setdefault(suffix, {})
+        if files:
+            entries[hsh] = list(files)
+
+    def commit(self, walked_all=False):
+        """
+        Merge what was walked since load() into the index file.
+
+        Lines appended by others in the meantime are newer than, or as new
+        as, what the walk found, so the object directories they are about
+        are left alone. The file is rewritten when it has grown much bigger
+        than its content, or to mark it complete.
+
+        :param walked_all: True if all the suffixes of the partition have
+                           been walked since load()
+        """
+        if not self.walked and (self.complete or not walked_all):
+            return
+        with lock_path(self.partition_dir):
+            touched = set()
+            try:
+                with open(self.path, 'rb') as index_fh:
+                    index_fh.seek(self.offset)
+                    self._parse(index_fh, touched)
+            except ValueError:
+                self.complete = False
+            except (IOError, OSError) as err:
+                if err.errno != errno.ENOENT:
+                    raise
+            lines = []
+            for suffix, walked in self.walked.items():
+                entries = self.suffixes.setdefault(suffix, {})
+                for hsh in set(entries) | set(walked):
+                    if (suffix, hsh) in touched:
+                        continue
+                    files = walked.get(hsh, [])
+                    if entries.get(hsh, []) == files:
+                        continue
+                    if files:
+                        entries[hsh] = files
+                    else:
+                        del entries[hsh]
+                    lines.append(_part_index_line(suffix, hsh, files))
+            self.walked = {}
+            nb_entries = sum(len(e) for e in self.suffixes.values())
+            if not walked_all and (
+                    not self.complete or
+                    self.lines + len(lines) <= 2 * nb_entries + 1000):
+                if lines:
+                    with open(self.path, 'ab') as index_fh:
+                        index_fh.write(b''.join(lines))
+                        self.offset = index_fh.tell()
+                    self.lines += len(lines)
+                return
+            # Rewrite the index, marking it complete if it is
+            fd, tmp_path = mkstemp(dir=self.partition_dir,
+                                   prefix=PART_INDEX_FILE)
+            with os.fdopen(fd, 'wb') as index_fh:
+                index_fh.write(PART_INDEX_MARKER)
+                for suffix, entries in sorted(self.suffixes.items()):
+                    index_fh.write(b''.join(
+                        _part_index_line(suffix, hsh, files)
+                        for hsh, files in sorted(entries.items())))
+                self.offset = index_fh.tell()
+            os.rename(tmp_path, self.path)
+            self.complete = True
+            self.lines = nb_entries
+
+
 def relink_paths(target_path, new_target_path, check_existing=False):
     """
     Hard-links a file located in target_path using the second path
@@ -634,6 +943,161 @@ def strip_self(f):
     return wrapper
 
 
+class GroupSyncer(object):
+    """
+    Make files and directories durable in batches, on behalf of the
+    concurrent writers of a device.
+
+    The first writer to arrive starts a batch, which others may join
+    during `window` seconds. Then all the files and directories of the
+    batch are made durable at once with syncfs() (or an fsync() of each
+    of them when syncfs() is not available), in a separate greenthread.
+    Every writer of the batch returns once it is done.
+
+    :param window: seconds a batch waits for writers to join it
+    """
+    def __init__(self, window):
+        self.window = window
+        # fds, directories and completion event of the batch being filled
+        self._pending = None
+        self.batch_sizes = Histogram(unit=1)
+        self.latencies = Histogram()
+
+    def _sync(self, fds, files, dirs):
+        if not syncfs(fds[0]):
+            for fd in files:
+                if fd != fds[0]:
+                    fsync(fd)
+            for dirpath in sorted(set(dirs)):
+                fsync_dir(dirpath)
+
+    def _flush(self, batch):
+        fds, files, dirs, done = batch
+        if self._pending is batch:
+            self._pending = None
+        err = None
+        try:
+            if fds:
+                self.batch_sizes.record(len(fds))
+                tpool.execute(self._sync, fds, files, dirs)
+        except Exception as exc:
+            err = exc
+        finally:
+            done.send(err)
+
+    def sync(self, fd, dirs=None):
+        """
+        Make a file durable, or some directories entries, with the other
+        files and directories of its batch.
+
+        :param fd: file descriptor of a file of the device
+        :param dirs: directories of the device to make durable, instead
+                     of the file
+        """
+        start = time.time()
+        if self._pending is None:
+            self._pending = ([], [], [], Event())
+            spawn_after(self.window, self._flush, self._pending)
+        batch = fds, files, batch_dirs, done = self._pending
+        fds.append(fd)
+        if dirs is None:
+            files.append(fd)
+        else:
+            batch_dirs.extend(dirs)
+        try:
+            err = done.wait()
+        except BaseException:
+            if self._pending is batch:
+                # Interrupted before the batch is synced: leave it,
+                # the caller may close its file right away.
+                fds.remove(fd)
+                if dirs is None:
+                    files.remove(fd)
+                else:
+                    for dirpath in dirs:
+                        batch_dirs.remove(dirpath)
+            else:
+                # The batch is being synced, the file must stay
+                # open until it is done.
+                done.wait()
+            raise
+        if err is not None:
+            raise err
+        self.latencies.record(time.time() - start)
+
+    def stats(self):
+        return {'batch_sizes': self.batch_sizes.to_dict(),
+                'latencies': self.latencies.to_dict()}
+
+
+class MetadataCache(object):
+    """
+    Cache of the file names and metadata of object directories, kept by
+    each worker for the objects it opens.
+
+    An entry is only used while the inode and modification time of its
+    directory are unchanged, since every change to an object adds,
+    renames or removes a file of its directory. Directories modified less
+    than `min_age` seconds ago are not cached: two changes made within
+    the granularity of filesystem timestamps may leave the same
+    modification time.
+
+    :param maxsize: maximum number of directories in the cache
+    :param min_age: seconds since its last change before a directory
+                    is cached
+    """
+    def __init__(self, maxsize, min_age=1.0):
+        self.min_age = min_age
+        self.hits = 0
+        self.misses = 0
+        self._entries = LRUCache(maxsize=maxsize, maxtime=float('inf'))
+
+    def lookup(self, datadir):
+        """
+        Get the file names of an object directory, from the cache if
+        the directory did not change since it was cached.
+
+        :param datadir: path of the object directory
+        :returns: a tuple of the list of file names and a dict mapping
+                  paths of these files to their metadata, which the
+                  caller may fill; or None if the directory could not be
+                  listed
+        """
+        try:
+            st = os.stat(datadir)
+        except OSError:
+            return None
+        if not stat.S_ISDIR(st.st_mode):
+            return None
+        validator = (st.st_ino, st.st_mtime)
+        try:
+            cached_validator, files, metadata = \
+                self._entries.get_cache(datadir)
+        except KeyError:
+            pass
+        else:
+            if cached_validator == validator:
+                self.hits += 1
+                return files, metadata
+        self.misses += 1
+        try:
+            files = os.listdir(datadir)
+        except OSError:
+            return None
+        metadata = {}
+        if time.time() - st.st_mtime >= self.min_age:
+            self._entries.set_cache((validator, files, metadata), datadir)
+        else:
+            self._entries.pop_cache(datadir)
+        return files, metadata
+
+    def invalidate(self, datadir):
+        """
+        Forget an object directory.
+        """
+        self._entries.pop_cache(datadir)
+
+
 class DiskFileRouter(object):
 
     def __init__(self, *args, **kwargs):
@@ -709,11 +1173,31 @@ class BaseDiskFileManager(object):
                 replication_concurrency_per_device)
         self.replication_lock_timeout = int(conf.get(
             'replication_lock_timeout', 15))
+        self.partition_index = config_true_value(
+            conf.get('partition_index', 'false'))
+        # Group commit: PUTs wait at most this number of seconds for other
+        # PUTs on the same device, to make their files durable together.
+        self.group_commit_window = float(conf.get('group_commit_window', 0))
+        self.group_syncers = {}
+        # File names and metadata of recently opened objects, to save
+        # directory listings and xattr reads when they are opened again.
+        metadata_cache_size = int(conf.get('metadata_cache_size', 0))
+        if metadata_cache_size > 0:
+            self.metadata_cache = MetadataCache(metadata_cache_size)
+        else:
+            self.metadata_cache = None
 
         self.use_splice = False
+        self.use_sendfile = False
         self.pipe_size = None
 
         conf_wants_splice = config_true_value(conf.get('splice', 'no'))
+        self.read_mode = conf.get(
+            'read_mode', 'splice' if conf_wants_splice else 'copy').lower()
+        if self.read_mode not in READ_MODES:
+            raise ValueError('Invalid read_mode %r, must be one of %s' % (
+                self.read_mode, ', '.join(READ_MODES)))
+        conf_wants_splice = self.read_mode == 'splice'
         # If the operator wants zero-copy with splice() but we don't have the
         # requisite kernel support, complain so they can go fix it.
         if conf_wants_splice and not splice.available:
@@ -738,6 +1222,15 @@ class BaseDiskFileManager(object):
                 with open('/proc/sys/fs/pipe-max-size') as f:
                     max_pipe_size = int(f.read())
                 self.pipe_size = min(max_pipe_size, self.disk_chunk_size)
+        if self.read_mode == 'sendfile':
+            if hasattr(os, 'sendfile'):
+                self.use_sendfile = True
+            else:
+                self.logger.warning("Use of sendfile() requested, but it is "
+                                    "not available. sendfile() will not be "
+                                    "used.")
+        if not (self.use_splice or self.use_sendfile):
+            self.read_mode = 'copy'
         self.use_linkat = True
 
     @classmethod
@@ -1055,9 +1548,6 @@ class BaseDiskFileManager(object):
                   key 'obsolete'; a list of files remaining in the directory,
                   reverse sorted, stored under the key 'files'.
         """
-        def is_reclaimable(timestamp):
-            return (time.time() - float(timestamp)) > self.reclaim_age
-
         try:
             files = os.listdir(hsh_path)
         except OSError as err:
@@ -1068,10 +1558,23 @@ class BaseDiskFileManager(object):
                 return results
             else:
                 raise
+        return self._cleanup_files(hsh_path, files, **kwargs)
+
+    def _cleanup_files(self, hsh_path, files, **kwargs):
+        """
+        Same as :meth:`cleanup_ondisk_files`, with the list of files of the
+        object directory already known.
+
+        :param hsh_path: object hash path
+        :param files: the files found in the object directory
+        """
+        def is_reclaimable(timestamp):
+            return (time.time() - float(timestamp)) > self.reclaim_age
 
         files.sort(reverse=True)
         results = self.get_ondisk_files(
             files, hsh_path, verify=False, **kwargs)
+        nb_files = len(files)
         if 'ts_info' in results and is_reclaimable(
                 results['ts_info']['timestamp']):
             remove_file(join(hsh_path, results['ts_info']['filename']))
@@ -1084,6 +1587,8 @@ class BaseDiskFileManager(object):
             remove_file(join(hsh_path, file_info['filename']))
             files.remove(file_info['filename'])
         results['files'] = files
+        if len(files) != nb_files:
+            update_part_index(hsh_path, files)
         if not files:  # everything got unlinked
             try:
                 os.rmdir(hsh_path)
@@ -1106,11 +1611,14 @@ class BaseDiskFileManager(object):
         """
         raise NotImplementedError
 
-    def _hash_suffix_dir(self, path, policy):
+    def _hash_suffix_dir(self, path, policy, index=None):
         """
 
         :param path: full path to directory
         :param policy: storage policy used
+        :param index: optional :class:`PartitionIndex` of the partition,
+                      telling the files of each object directory instead of
+                      walking the suffix directory
         """
         if six.PY2:
             hashes = defaultdict(md5)
@@ -1128,17 +1636,30 @@ class BaseDiskFileManager(object):
                 def hexdigest(self):
                     return self.md5.hexdigest()
             hashes = defaultdict(shim)
-        try:
-            path_contents = sorted(os.listdir(path))
-        except OSError as err:
-            if err.errno in (errno.ENOTDIR, errno.ENOENT):
-                raise PathNotDir()
-            raise
+        suffix = basename(path)
+        entries = index.entries(suffix) if index is not None else None
+        if entries is not None:
+            path_contents = sorted(entries)
+        else:
+            if index is not None:
+                index.record(suffix)
+            try:
+                path_contents = sorted(os.listdir(path))
+            except OSError as err:
+                if err.errno in (errno.ENOTDIR, errno.ENOENT):
+                    raise PathNotDir()
+                raise
         for hsh in path_contents:
             hsh_path = join(path, hsh)
             try:
-                ondisk_info = self.cleanup_ondisk_files(
-                    hsh_path, policy=policy)
+                if entries is not None:
+                    ondisk_info = self._cleanup_files(
+                        hsh_path, list(entries[hsh]), policy=policy)
+                else:
+                    ondisk_info = self.cleanup_ondisk_files(
+                        hsh_path, policy=policy)
+                    if index is not None:
+                        index.record(suffix, hsh, ondisk_info['files'])
             except OSError as err:
                 if err.errno == errno.ENOTDIR:
                     partition_path = dirname(path)
@@ -1199,12 +1720,13 @@ class BaseDiskFileManager(object):
             raise PathNotDir()
         return hashes
 
-    def _hash_suffix(self, path, policy=None):
+    def _hash_suffix(self, path, policy=None, index=None):
         """
         Performs reclamation and returns an md5 of all (remaining) files.
 
         :param path: full path to directory
         :param policy: storage policy used to store the files
+        :param index: optional :class:`PartitionIndex` of the partition
         :raises PathNotDir: if given path is not a valid directory
         :raises OSError: for non-ENOTDIR errors
         """
@@ -1276,18 +1798,32 @@ class BaseDiskFileManager(object):
             modified = True
             self.logger.debug('Run listdir on %s', partition_path)
         hashes.update((suffix, None) for suffix in recalculate)
+        part_index = None
+        hash_kwargs = {}
+        if self.partition_index and not all(hashes.values()):
+            part_index = PartitionIndex(partition_path, mistrust=recalculate)
+            part_index.load()
+            hash_kwargs['index'] = part_index
+            if not part_index.complete:
+                # Build the index with a walk of the whole partition
+                for suff in os.listdir(partition_path):
+                    if len(suff) == 3:
+                        hashes[suff] = None
+                modified = True
         for suffix, hash_ in list(hashes.items()):
             if not hash_:
                 suffix_dir = join(partition_path, suffix)
                 try:
                     hashes[suffix] = self._hash_suffix(
-                        suffix_dir, policy=policy)
+                        suffix_dir, policy=policy, **hash_kwargs)
                     hashed += 1
                 except PathNotDir:
                     del hashes[suffix]
                 except OSError:
                     logging.exception(_('Error hashing suffix'))
                 modified = True
+        if part_index is not None:
+            part_index.commit(walked_all=not part_index.complete)
         if modified:
             with lock_path(partition_path):
                 if read_hashes(partition_path) == orig_hashes:
@@ -1299,6 +1835,33 @@ class BaseDiskFileManager(object):
         else:
             return hashed, hashes
 
+    def _get_hash_tree(self, device, partition, policy, frag_index=None):
+        """
+        Get the hash tree of a partition, from hashes.tree if it was built
+        from the current hashes, else built and stored there.
+
+        :param device: name of target device
+        :param partition: partition name
+        :param policy: the StoragePolicy instance
+        :param frag_index: the fragment index compared, for EC policies
+        :returns: tuple of (number of suffix dirs hashed, hash tree)
+        """
+        hashed, hashes = self.__get_hashes(device, partition, policy)
+        updated = hashes.pop('updated', None)
+        hashes.pop('valid', None)
+        partition_path = get_part_path(self.get_dev_path(device), policy,
+                                       partition)
+        trees = read_hash_trees(partition_path)
+        if trees['updated'] != updated:
+            trees = {'updated': updated, 'trees': {}}
+        tree = trees['trees'].get(frag_index)
+        if tree is None:
+            tree = trees['trees'][frag_index] = build_hash_tree(
+                hashes, frag_index)
+            write_pickle(trees, join(partition_path, HASH_TREE_FILE),
+                         partition_path, PICKLE_PROTOCOL)
+        return hashed, tree
+
     def construct_dev_path(self, device):
         """
         Construct the path to a device without checking if it is mounted.
@@ -1330,6 +1893,27 @@ class BaseDiskFileManager(object):
         except ValueError:
             return None
 
+    def get_group_syncer(self, device_path):
+        """
+        Get the :class:`GroupSyncer` of a device, if group commit is
+        enabled.
+        """
+        if self.group_commit_window <= 0:
+            return None
+        syncer = self.group_syncers.get(device_path)
+        if syncer is None:
+            syncer = self.group_syncers[device_path] = GroupSyncer(
+                self.group_commit_window)
+        return syncer
+
+    def group_commit_stats(self):
+        """
+        :returns: a dict with the batch sizes and latencies of group
+                  commits, for each device
+        """
+        return {basename(device_path): syncer.stats()
+                for device_path, syncer in self.group_syncers.items()}
+
     @contextmanager
     def replication_lock(self, device, policy, partition):
         """
@@ -1407,6 +1991,7 @@ class BaseDiskFileManager(object):
         return self.diskfile_cls(self, dev_path,
                                  partition, account, container, obj,
                                  policy=policy, use_splice=self.use_splice,
+                                 use_sendfile=self.use_sendfile,
                                  pipe_size=self.pipe_size, **kwargs)
 
     def clear_auditor_status(self, policy, auditor_type="ALL"):
@@ -1516,6 +2101,26 @@ class BaseDiskFileManager(object):
             self._get_hashes, device, partition, policy, recalculate=suffixes)
         return hashes
 
+    def get_hash_tree(self, device, partition, policy, frag_index=None):
+        """
+
+        :param device: name of target device
+        :param partition: partition name
+        :param policy: the StoragePolicy instance
+        :param frag_index: the fragment index compared, for EC policies
+        :returns: a dictionary that maps the prefixes of the suffixes, and
+                  the suffixes, to their hashes
+        """
+        dev_path = self.get_dev_path(device)
+        if not dev_path:
+            raise DiskFileDeviceUnavailable()
+        partition_path = get_part_path(dev_path, policy, partition)
+        if not os.path.exists(partition_path):
+            mkdirs(partition_path)
+        _junk, tree = tpool.execute(
+            self._get_hash_tree, device, partition, policy, frag_index)
+        return tree
+
     def _listdir(self, path):
         """
         :param path: full path to directory
@@ -1595,16 +2200,33 @@ class BaseDiskFileManager(object):
             ('ts_ctype', 'ctype_info', 'ctype_timestamp'),
         )
 
+        part_index = None
+        if self.partition_index:
+            part_index = PartitionIndex(partition_path)
+            part_index.load(create=False)
+
         # cleanup_ondisk_files() will remove empty hash dirs, and we'll
         # invalidate any empty suffix dirs so they'll get cleaned up on
         # the next rehash
         for suffix_path, suffix in suffixes:
             found_files = False
-            for object_hash in self._listdir(suffix_path):
+            entries = None
+            if part_index is not None:
+                entries = part_index.entries(suffix)
+            if entries is not None:
+                object_hashes = sorted(entries)
+            else:
+                object_hashes = self._listdir(suffix_path)
+            for object_hash in object_hashes:
                 object_path = os.path.join(suffix_path, object_hash)
                 try:
-                    results = self.cleanup_ondisk_files(
-                        object_path, **kwargs)
+                    if entries is not None:
+                        results = self._cleanup_files(
+                            object_path, list(entries[object_hash]),
+                            **kwargs)
+                    else:
+                        results = self.cleanup_ondisk_files(
+                            object_path, **kwargs)
                     if results['files']:
                         found_files = True
                     timestamps = {}
@@ -1781,13 +2403,24 @@ class BaseDiskFileWriter(object):
         return self._upload_size, self._chunks_etag.hexdigest()
 
     def _finalize_put(self, metadata, target_path, cleanup):
-        # Write the metadata before calling fsync() so that both data and
-        # metadata are flushed to disk.
+        # Write the metadata before calling fsync() so that both data
+        # and metadata are flushed to disk.
         write_metadata(self._fd, metadata)
-        # We call fsync() before calling drop_cache() to lower the amount of
-        # redundant work the drop cache code will perform on the pages (now
-        # that after fsync the pages will be all clean).
+        # We call fsync() before calling drop_cache() to lower the
+        # amount of redundant work the drop cache code will perform on
+        # the pages (now that after fsync the pages will be all clean).
         fsync(self._fd)
+        self._move_into_place(target_path)
+        self._complete_put(target_path, cleanup)
+
+    def _move_into_place(self, target_path, fsync_dirs=True):
+        """
+        Rename (or link) the file to its final name, once it is durable.
+
+        :param target_path: the final path of the file
+        :param fsync_dirs: fsync the directories changed by the rename
+        :returns: the directories changed by the rename
+        """
         # From the Department of the Redundancy Department, make sure we call
         # drop_cache() after fsync() to avoid redundant work (pages all
         # clean).
@@ -1797,12 +2430,19 @@ class BaseDiskFileWriter(object):
         # requests to reference.
         if self._tmppath:
             # It was a named temp file created by mkstemp()
-            renamer(self._tmppath, target_path)
+            dirpaths = renamer(self._tmppath, target_path, fsync=fsync_dirs)
         else:
             # It was an unnamed temp file created by open() with O_TMPFILE
-            link_fd_to_path(self._fd, target_path,
-                            self._diskfile._dirs_created)
+            dirpaths = link_fd_to_path(self._fd, target_path,
+                                       self._diskfile._dirs_created,
+                                       fsync=fsync_dirs)
+        # If rename is successful, flag put as succeeded. This is done to
+        # avoid unnecessary os.unlink() of tempfile later. As renamer() has
+        # succeeded, the tempfile would no longer exist at its original path.
+        self._put_succeeded = True
+        return dirpaths
 
+    def _complete_put(self, target_path, cleanup):
         # Check if the partition power will/has been increased
         new_target_path = None
         if self.next_part_power:
@@ -1817,17 +2457,18 @@ class BaseDiskFileWriter(object):
                         'Relinking %s to %s failed: %s',
                         target_path, new_target_path, exc)
 
-        # If rename is successful, flag put as succeeded. This is done to avoid
-        # unnecessary os.unlink() of tempfile later. As renamer() has
-        # succeeded, the tempfile would no longer exist at its original path.
-        self._put_succeeded = True
         if cleanup:
             try:
-                self.manager.cleanup_ondisk_files(self._datadir)
+                files = self.manager.cleanup_ondisk_files(
+                    self._datadir)['files']
             except OSError:
                 logging.exception(_('Problem cleaning up %s'), self._datadir)
+            else:
+                update_part_index(self._datadir, files)
 
             self._part_power_cleanup(target_path, new_target_path)
+        else:
+            update_part_index(self._datadir)
 
     def _put(self, metadata, cleanup=True, *a, **kw):
         """
@@ -1854,7 +2495,20 @@ class BaseDiskFileWriter(object):
         metadata['name'] = self._name
         target_path = join(self._datadir, filename)
 
-        tpool.execute(self._finalize_put, metadata, target_path, cleanup)
+        group_syncer = self.manager.get_group_syncer(
+            self._diskfile._device_path)
+        if group_syncer is None:
+            tpool.execute(self._finalize_put, metadata, target_path, cleanup)
+        else:
+            # The file is only renamed once it has been made durable,
+            # along with the files of the concurrent PUTs on the device.
+            # The directory entries are then made durable the same way.
+            tpool.execute(write_metadata, self._fd, metadata)
+            group_syncer.sync(self._fd)
+            dirpaths = tpool.execute(self._move_into_place, target_path,
+                                     fsync_dirs=False)
+            group_syncer.sync(self._fd, dirs=dirpaths)
+            tpool.execute(self._complete_put, target_path, cleanup)
 
     def put(self, metadata):
         """
@@ -1913,6 +2567,29 @@ class BaseDiskFileWriter(object):
                     _('Problem cleaning up %s'), old_target_dir)
 
 
+class _ReaderRange(object):
+    """
+    Iterator over a range of a data file, which the object server may
+    also ask its reader to send with zero-copy.
+    """
+    def __init__(self, reader, start, stop):
+        self._reader = reader
+        self._iter = reader._app_iter_range(start, stop)
+
+    def __iter__(self):
+        return self._iter
+
+    def close(self):
+        self._iter.close()
+        self._reader.close()
+
+    def can_zero_copy_send(self):
+        return self._reader.can_zero_copy_send()
+
+    def zero_copy_send(self, wsockfd):
+        return self._reader.zero_copy_send(wsockfd)
+
+
 class BaseDiskFileReader(object):
     """
     Encapsulation of the WSGI read context for servicing GET REST API
@@ -1943,11 +2620,13 @@ class BaseDiskFileReader(object):
     :param pipe_size: size of pipe buffer used in zero-copy operations
     :param diskfile: the diskfile creating this DiskFileReader instance
     :param keep_cache: should resulting reads be kept in the buffer cache
+    :param use_sendfile: if true, use zero-copy sendfile() to send data,
+                         without checking its etag
     """
     def __init__(self, fp, data_file, obj_size, etag,
                  disk_chunk_size, keep_cache_size, device_path, logger,
                  quarantine_hook, use_splice, pipe_size, diskfile,
-                 keep_cache=False):
+                 keep_cache=False, use_sendfile=False):
         # Parameter tracking
         self._fp = fp
         self._data_file = data_file
@@ -1959,6 +2638,7 @@ class BaseDiskFileReader(object):
         self._logger = logger
         self._quarantine_hook = quarantine_hook
         self._use_splice = use_splice
+        self._use_sendfile = use_sendfile
         self._pipe_size = pipe_size
         if keep_cache:
             # Caller suggests we keep this in cache, only do it if the
@@ -1975,11 +2655,28 @@ class BaseDiskFileReader(object):
         self._md5_of_sent_bytes = None
         self._suppress_file_closing = False
         self._quarantined_dir = None
+        # the single range asked by the client, if any
+        self._range = None
+        self._read_mode = None
+        self._read_started_at = None
 
     @property
     def manager(self):
         return self._diskfile.manager
 
+    def _start_read(self, read_mode):
+        self._read_mode = read_mode
+        self._read_started_at = time.time()
+
+    def _record_read(self):
+        """Update the throughput counters of the read mode used."""
+        if self._read_started_at is None:
+            return
+        metric = 'read.%s' % self._read_mode
+        self._logger.update_stats(metric + '.bytes', self._bytes_read)
+        self._logger.timing_since(metric + '.timing', self._read_started_at)
+        self._read_started_at = None
+
     def _init_checks(self):
         if self._fp.tell() == 0:
             self._started_at_0 = True
@@ -1996,6 +2693,8 @@ class BaseDiskFileReader(object):
             self._bytes_read = 0
             self._started_at_0 = False
             self._read_to_eof = False
+            if self._read_started_at is None:
+                self._start_read('copy')
             self._init_checks()
             while True:
                 chunk = self._fp.read(self._disk_chunk_size)
@@ -2017,7 +2716,11 @@ class BaseDiskFileReader(object):
                 self.close()
 
     def can_zero_copy_send(self):
-        return self._use_splice
+        if self._range is not None:
+            # splice() can only send whole objects, since it checks their
+            # etag as it goes
+            return self._use_sendfile
+        return self._use_splice or self._use_sendfile
 
     def zero_copy_send(self, wsockfd):
         """
@@ -2027,9 +2730,10 @@ class BaseDiskFileReader(object):
         :param wsockfd: file descriptor (integer) of the socket out which to
                         send data
         """
-        # Note: if we ever add support for zero-copy ranged GET responses,
-        # we'll have to make this conditional.
+        if self._use_sendfile:
+            return self._sendfile_send(wsockfd)
         self._started_at_0 = True
+        self._start_read('splice')
 
         rfd = self._fp.fileno()
         client_rpipe, client_wpipe = os.pipe()
@@ -2122,11 +2826,71 @@ class BaseDiskFileReader(object):
             os.close(md5_sockfd)
             self.close()
 
+    def _advise(self, fd, offset, length):
+        """
+        Tell the kernel to read ahead all of a small range, or to read
+        ahead more aggressively than usual through a large one.
+        """
+        if length <= READAHEAD_WILLNEED_MAX:
+            posix_fadvise(fd, offset, length, POSIX_FADV_WILLNEED)
+        else:
+            posix_fadvise(fd, offset, length, POSIX_FADV_SEQUENTIAL)
+
+    def _sendfile_send(self, wsockfd):
+        """
+        Send the object, or the range asked by the client, with sendfile().
+        The data never reaches userspace, so only its size is checked here:
+        checking its etag is left to the auditor.
+
+        :param wsockfd: file descriptor (integer) of the socket out which to
+                        send data
+        """
+        self._start_read('sendfile')
+        rfd = self._fp.fileno()
+        if self._range is None:
+            self._started_at_0 = True
+            offset, stop = 0, self._obj_size
+        else:
+            offset, stop = self._range
+        self._advise(rfd, offset, stop - offset)
+
+        dropped_cache = offset
+        self._bytes_read = 0
+        try:
+            while offset < stop:
+                try:
+                    sent = os.sendfile(wsockfd, rfd, offset,
+                                       min(stop - offset, DROP_CACHE_WINDOW))
+                except OSError as exc:
+                    if exc.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        trampoline(wsockfd, write=True)
+                        continue
+                    raise
+                if sent == 0:
+                    # the file is shorter than expected
+                    break
+                offset += sent
+                self._bytes_read += sent
+                if offset - dropped_cache > DROP_CACHE_WINDOW:
+                    self._drop_cache(rfd, dropped_cache,
+                                     offset - dropped_cache)
+                    dropped_cache = offset
+            self._read_to_eof = True
+            self._drop_cache(rfd, dropped_cache, offset - dropped_cache)
+        finally:
+            self.close()
+
     def app_iter_range(self, start, stop):
         """
         Returns an iterator over the data file for range (start, stop)
 
         """
+        if stop is None:
+            return self._app_iter_range(start, stop)
+        self._range = (start or 0, stop)
+        return _ReaderRange(self, start, stop)
+
+    def _app_iter_range(self, start, stop):
         if start or start == 0:
             self._fp.seek(start)
         if stop is not None:
@@ -2162,7 +2926,7 @@ class BaseDiskFileReader(object):
                 self._suppress_file_closing = True
                 for chunk in multi_range_iterator(
                         ranges, content_type, boundary, size,
-                        self.app_iter_range):
+                        self._app_iter_range):
                     yield chunk
             finally:
                 self._suppress_file_closing = False
@@ -2208,6 +2972,7 @@ class BaseDiskFileReader(object):
         the file if necessary.
         """
         if self._fp:
+            self._record_read()
             try:
                 if self._started_at_0 and self._read_to_eof:
                     self._handle_close_quarantine()
@@ -2254,6 +3019,8 @@ class BaseDiskFile(object):
     :param open_expired: if True, open() will not raise a DiskFileExpired if
                          object is expired
     :param next_part_power: the next partition power to be used
+    :param use_sendfile: if true, use zero-copy sendfile() to send data,
+                         without checking its etag
     """
     reader_cls = None  # must be set by subclasses
     writer_cls = None  # must be set by subclasses
@@ -2261,13 +3028,15 @@ class BaseDiskFile(object):
     def __init__(self, mgr, device_path, partition,
                  account=None, container=None, obj=None, _datadir=None,
                  policy=None, use_splice=False, pipe_size=None,
-                 open_expired=False, next_part_power=None, **kwargs):
+                 open_expired=False, next_part_power=None,
+                 use_sendfile=False, **kwargs):
         self._manager = mgr
         self._device_path = device_path
         self._logger = mgr.logger
         self._disk_chunk_size = mgr.disk_chunk_size
         self._bytes_per_sync = mgr.bytes_per_sync
         self._use_splice = use_splice
+        self._use_sendfile = use_sendfile
         self._pipe_size = pipe_size
         self._open_expired = open_expired
         # This might look a lttle hacky i.e tracking number of newly created
@@ -2297,6 +3066,7 @@ class BaseDiskFile(object):
         self._tmpdir = join(device_path, get_tmp_dir(policy))
         self._ondisk_info = None
         self._metadata = None
+        self._cached_metadata = None
         self._datafile_metadata = None
         self._metafile_metadata = None
         self._data_file = None
@@ -2412,9 +3182,36 @@ class BaseDiskFile(object):
                                      some data did pass cross checks
         :returns: itself for use as a context manager
         """
-        # First figure out if the data directory exists
+        cached = None
+        if self.manager.metadata_cache is not None and not modernize:
+            cached = self.manager.metadata_cache.lookup(self._datadir)
+        if cached is not None:
+            files, self._cached_metadata = cached
+        else:
+            self._cached_metadata = None
+            files = self._list_datadir()
+
+        # gather info about the valid files to use to open the DiskFile
+        file_info = self._get_ondisk_files(files, self.policy)
+
+        self._data_file = file_info.get('data_file')
+        if not self._data_file:
+            raise self._construct_exception_from_ts_file(**file_info)
+        self._fp = self._construct_from_data_file(
+            current_time=current_time, modernize=modernize, **file_info)
+        # This method must populate the internal _metadata attribute.
+        self._metadata = self._metadata or {}
+        return self
+
+    def _list_datadir(self):
+        """
+        List the files of the object directory.
+
+        :returns: a list of file names, empty if the directory does
+                  not exist
+        """
         try:
-            files = os.listdir(self._datadir)
+            return os.listdir(self._datadir)
         except OSError as err:
             if err.errno == errno.ENOTDIR:
                 # If there's a file here instead of a directory, quarantine
@@ -2429,19 +3226,7 @@ class BaseDiskFile(object):
                 raise DiskFileError(
                     "Error listing directory %s: %s" % (self._datadir, err))
             # The data directory does not exist, so the object cannot exist.
-            files = []
-
-        # gather info about the valid files to use to open the DiskFile
-        file_info = self._get_ondisk_files(files, self.policy)
-
-        self._data_file = file_info.get('data_file')
-        if not self._data_file:
-            raise self._construct_exception_from_ts_file(**file_info)
-        self._fp = self._construct_from_data_file(
-            current_time=current_time, modernize=modernize, **file_info)
-        # This method must populate the internal _metadata attribute.
-        self._metadata = self._metadata or {}
-        return self
+            return []
 
     def __enter__(self):
         """
@@ -2623,6 +3408,19 @@ class BaseDiskFile(object):
         :param add_missing_checksum: if True and no metadata checksum is
             present, generate one and write it down
         """
+        if self._cached_metadata is not None and quarantine_filename:
+            metadata = self._cached_metadata.get(quarantine_filename)
+            if metadata is None:
+                metadata = self._cached_metadata[quarantine_filename] = \
+                    self._read_metadata(source, quarantine_filename,
+                                        add_missing_checksum)
+            # callers are free to modify what they get
+            return dict(metadata)
+        return self._read_metadata(source, quarantine_filename,
+                                   add_missing_checksum)
+
+    def _read_metadata(self, source, quarantine_filename,
+                       add_missing_checksum):
         try:
             return read_metadata(source, add_missing_checksum)
         except (DiskFileXattrNotSupported, DiskFileNotExist):
@@ -2797,7 +3595,8 @@ class BaseDiskFile(object):
             self._metadata['ETag'], self._disk_chunk_size,
             self._manager.keep_cache_size, self._device_path, self._logger,
             use_splice=self._use_splice, quarantine_hook=_quarantine_hook,
-            pipe_size=self._pipe_size, diskfile=self, keep_cache=keep_cache)
+            pipe_size=self._pipe_size, diskfile=self, keep_cache=keep_cache,
+            use_sendfile=self._use_sendfile)
         # At this point the reader object is now responsible for closing
         # the file pointer.
         self._fp = None
@@ -2939,17 +3738,18 @@ class DiskFileManager(BaseDiskFileManager):
             hashes[None].update(
                 file_info['timestamp'].internal + file_info['ext'])
 
-    def _hash_suffix(self, path, policy=None):
+    def _hash_suffix(self, path, policy=None, index=None):
         """
         Performs reclamation and returns an md5 of all (remaining) files.
 
         :param path: full path to directory
         :param policy: storage policy used to store the files
+        :param index: optional :class:`PartitionIndex` of the partition
         :raises PathNotDir: if given path is not a valid directory
         :raises OSError: for non-ENOTDIR errors
         :returns: md5 of files in suffix
         """
-        hashes = self._hash_suffix_dir(path, policy)
+        hashes = self._hash_suffix_dir(path, policy, index=index)
         return hashes[None].hexdigest()
 
 
@@ -2957,7 +3757,8 @@ class ECDiskFileReader(BaseDiskFileReader):
     def __init__(self, fp, data_file, obj_size, etag,
                  disk_chunk_size, keep_cache_size, device_path, logger,
                  quarantine_hook, use_splice, pipe_size, diskfile,
-                 keep_cache=False):
+                 keep_cache=False, use_sendfile=False):
+        # use_sendfile is ignored: fragments are checked as they are read
         super(ECDiskFileReader, self).__init__(
             fp, data_file, obj_size, etag,
             disk_chunk_size, keep_cache_size, device_path, logger,
@@ -3082,11 +3883,14 @@ class ECDiskFileWriter(BaseDiskFileWriter):
                     'No space left on device for %(file)s (%(err)s)' % params)
             else:
                 try:
-                    self.manager.cleanup_ondisk_files(self._datadir)
+                    files = self.manager.cleanup_ondisk_files(
+                        self._datadir)['files']
                 except OSError as os_err:
                     self.manager.logger.exception(
                         _('Problem cleaning up %(datadir)s (%(err)s)'),
                         {'datadir': self._datadir, 'err': os_err})
+                else:
+                    update_part_index(self._datadir, files)
                 self._part_power_cleanup(
                     durable_data_file_path, new_durable_data_file_path)
 
@@ -3270,6 +4074,7 @@ class ECDiskFile(BaseDiskFile):
                 timestamp, ext='.data', frag_index=frag_index, durable=True)
             remove_file(os.path.join(self._datadir, purge_file))
             remove_directory(self._datadir)
+        update_part_index(self._datadir)
         self.manager.invalidate_hash(dirname(self._datadir))
 
 
@@ -3603,12 +4408,13 @@ class ECDiskFileManager(BaseDiskFileManager):
             file_info = ondisk_info['durable_frag_set'][0]
             hashes[None].update(file_info['timestamp'].internal + '.durable')
 
-    def _hash_suffix(self, path, policy=None):
+    def _hash_suffix(self, path, policy=None, index=None):
         """
         Performs reclamation and returns an md5 of all (remaining) files.
 
         :param path: full path to directory
         :param policy: storage policy used to store the files
+        :param index: optional :class:`PartitionIndex` of the partition
         :raises PathNotDir: if given path is not a valid directory
         :raises OSError: for non-ENOTDIR errors
         :returns: dict of md5 hex digests
@@ -3617,5 +4423,5 @@ class ECDiskFileManager(BaseDiskFileManager):
         # here we flatten out the hashers hexdigest into a dictionary instead
         # of just returning the one hexdigest for the whole suffix
 
-        hash_per_fi = self._hash_suffix_dir(path, policy)
+        hash_per_fi = self._hash_suffix_dir(path, policy, index=index)
         return dict((fi, md5.hexdigest()) for fi, md5 in hash_per_fi.items())
@@ -25,6 +25,7 @@ import six.moves.cPickle as pickle
 import shutil
 
 from eventlet import (GreenPile, GreenPool, Timeout, sleep, tpool, spawn)
+from eventlet.queue import LightQueue
 from eventlet.support.greenlets import GreenletExit
 
 from swift import gettext_ as _
@@ -33,19 +34,19 @@ from swift.common.utils import (
     dump_recon_cache, mkdirs, config_true_value,
     GreenAsyncPile, Timestamp, remove_file,
     load_recon_cache, parse_override_options, distribute_evenly,
-    PrefixLoggerAdapter, remove_directory)
+    PrefixLoggerAdapter, remove_directory, close_if_possible)
 from swift.common.header_key_dict import HeaderKeyDict
 from swift.common.bufferedhttp import http_connect
 from swift.common.daemon import Daemon
 from swift.common.ring.utils import is_local_device
-from swift.obj.ssync_sender import Sender as ssync_sender
+from swift.obj.ssync_sender import Sender as ssync_sender, SsyncStats
 from swift.common.http import HTTP_OK, HTTP_NOT_FOUND, \
     HTTP_INSUFFICIENT_STORAGE
 from swift.obj.diskfile import DiskFileRouter, get_data_dir, \
-    get_tmp_dir
+    get_tmp_dir, build_hash_tree, diff_hash_trees, hash_tree_leaf
 from swift.common.storage_policy import POLICIES, EC_POLICY
 from swift.common.exceptions import ConnectionTimeout, DiskFileError, \
-    SuffixSyncError
+    SuffixSyncError, ReplicationException
 
 SYNC, REVERT = ('sync_only', 'sync_revert')
 
@@ -126,8 +127,11 @@ class RebuildingECDiskFileStream(object):
         return self._content_length
 
     def reader(self):
-        for chunk in self.rebuilt_fragment_iter:
-            yield chunk
+        try:
+            for chunk in self.rebuilt_fragment_iter:
+                yield chunk
+        finally:
+            close_if_possible(self.rebuilt_fragment_iter)
 
 
 class ObjectReconstructor(Daemon):
@@ -208,6 +212,22 @@ class ObjectReconstructor(Daemon):
                                 'of handoffs_only.')
         self.rebuild_handoff_node_count = int(conf.get(
             'rebuild_handoff_node_count', 2))
+        # Compare partitions with their hash trees when the remote object
+        # servers can, rather than with all their suffix hashes.
+        self.hash_tree = config_true_value(conf.get('hash_tree', False))
+        # Number of SSYNC subrequests receivers are asked to apply at once
+        self.ssync_concurrency = int(conf.get('ssync_concurrency', 1))
+        # Number of objects offered per compressed missing_check batch
+        # (0: one line per object)
+        self.ssync_missing_check_batch = int(
+            conf.get('ssync_missing_check_batch', 0))
+        self.ssync_stats = SsyncStats()
+        # Number of segments read ahead from the source fragment archives
+        # while rebuilding one, decoded in batches outside of the hub
+        # (0: each segment is read then decoded in turn).
+        self.rebuild_readahead = int(conf.get('rebuild_readahead', 0))
+        self.rebuilt_archives = 0
+        self.rebuilt_bytes = 0
         self._df_router = DiskFileRouter(conf, self.logger)
         self.all_local_devices = self.get_local_devices()
         self.rings_mtime = None
@@ -506,6 +526,7 @@ class ObjectReconstructor(Daemon):
 
             raise DiskFileError('Unable to reconstruct EC archive')
 
+        self.rebuilt_archives += 1
         rebuilt_fragment_iter = self.make_rebuilt_fragment_iter(
             responses[:job['policy'].ec_ndata], path, job['policy'],
             fi_to_rebuild)
@@ -516,10 +537,19 @@ class ObjectReconstructor(Daemon):
         return policy.pyeclib_driver.reconstruct(fragment_payload,
                                                  [frag_index])[0]
 
+    def _reconstruct_batch(self, policy, fragment_payloads, frag_index):
+        return [self._reconstruct(policy, fragment_payload, frag_index)
+                for fragment_payload in fragment_payloads]
+
     def make_rebuilt_fragment_iter(self, responses, path, policy, frag_index):
         """
         Turn a set of connections from backend object servers into a generator
         that yields up the rebuilt fragment archive for frag_index.
+
+        If rebuild_readahead is set, the segments are read by another
+        greenthread, up to rebuild_readahead segments ahead, and those
+        already read are rebuilt together in a native thread, while the
+        next ones are read and the rebuilt ones are sent.
         """
 
         def _get_one_fragment(resp):
@@ -554,11 +584,58 @@ class ObjectReconstructor(Daemon):
                     break
                 if not all(fragment_payload):
                     break
+                yield fragment_payload
+
+        def rebuilt_fragment_iter():
+            for fragment_payload in fragment_payload_iter():
                 rebuilt_fragment = self._reconstruct(
                     policy, fragment_payload, frag_index)
+                self.rebuilt_bytes += len(rebuilt_fragment)
                 yield rebuilt_fragment
 
-        return fragment_payload_iter()
+        def pipelined_fragment_iter():
+            queue = LightQueue(self.rebuild_readahead)
+
+            def read_ahead():
+                killed = False
+                try:
+                    for fragment_payload in fragment_payload_iter():
+                        queue.put(fragment_payload)
+                except GreenletExit:
+                    # The consumer stopped early: the queue may be full,
+                    # and nobody waits for the end marker.
+                    killed = True
+                finally:
+                    if not killed:
+                        queue.put(None)
+
+            reader = spawn(read_ahead)
+            done = False
+            try:
+                while not done:
+                    batch = [queue.get()]
+                    while batch[-1] is not None and queue.qsize():
+                        batch.append(queue.get())
+                    if batch[-1] is None:
+                        batch.pop()
+                        done = True
+                    if not batch:
+                        break
+                    for rebuilt_fragment in tpool.execute(
+                            self._reconstruct_batch, policy, batch,
+                            frag_index):
+                        self.rebuilt_bytes += len(rebuilt_fragment)
+                        yield rebuilt_fragment
+            finally:
+                reader.kill()
+                if not done:
+                    # Do not leave the remaining fragments in the sockets.
+                    for resp in responses:
+                        close_if_possible(resp)
+
+        if self.rebuild_readahead > 0:
+            return pipelined_fragment_iter()
+        return rebuilt_fragment_iter()
 
     def stats_line(self):
         """
@@ -596,6 +673,14 @@ class ObjectReconstructor(Daemon):
                      'min': self.partition_times[0],
                      'med': self.partition_times[
                          len(self.partition_times) // 2]})
+            self.ssync_stats.log(self.logger)
+            if self.rebuilt_archives:
+                self.logger.info(
+                    '%(archives)d fragment archives rebuilt, %(bytes)d bytes '
+                    '(%(rate).0f B/s)',
+                    {'archives': self.rebuilt_archives,
+                     'bytes': self.rebuilt_bytes,
+                     'rate': self.rebuilt_bytes / elapsed})
         else:
             self.logger.info(
                 _("Nothing reconstructed for %s seconds."),
@@ -713,6 +798,34 @@ class ObjectReconstructor(Daemon):
                 yield handoff_node
                 count += 1
 
+    def _diff_remote_hash_tree(self, job, node, headers, remote_nodes):
+        """
+        Compare the local suffix hashes with the hash tree of a remote
+        partition, fetching only the subtrees which differ.
+
+        :param job: the job dict, with the keys defined in ``_get_part_jobs``
+        :param node: the remote node dict
+        :param headers: the headers of REPLICATE requests
+        :param remote_nodes: the top of the remote hash tree
+        :returns: a dict mapping the suffixes which differ to their remote
+                  hash tree leaf
+        """
+        def fetch(prefixes):
+            tree_headers = dict(headers)
+            tree_headers['X-Backend-Hash-Tree-Prefixes'] = ','.join(prefixes)
+            with Timeout(self.http_timeout):
+                resp = http_connect(
+                    node['replication_ip'], node['replication_port'],
+                    node['device'], job['partition'], 'REPLICATE',
+                    '', headers=tree_headers).getresponse()
+            if resp.status != HTTP_OK:
+                raise ReplicationException(
+                    'Invalid response %s to hash tree request' % resp.status)
+            return pickle.loads(resp.read())
+
+        local_tree = build_hash_tree(job['hashes'], job['frag_index'])
+        return diff_hash_trees(local_tree, remote_nodes, fetch)
+
     def _get_suffixes_to_sync(self, job, node):
         """
         For SYNC jobs we need to make a remote REPLICATE request to get
@@ -727,6 +840,7 @@ class ObjectReconstructor(Daemon):
         """
         # get hashes from the remote node
         remote_suffixes = None
+        remote_tree_diff = None
         attempts_remaining = 1
         headers = self.headers.copy()
         headers['X-Backend-Storage-Policy-Index'] = int(job['policy'])
@@ -738,12 +852,18 @@ class ObjectReconstructor(Daemon):
             except StopIteration:
                 break
             attempts_remaining -= 1
+            check_headers = headers
+            if self.hash_tree:
+                check_headers = dict(headers)
+                check_headers['X-Backend-Hash-Tree'] = 'yes'
+                check_headers['X-Backend-Hash-Tree-Index'] = \
+                    node['backend_index']
             try:
                 with Timeout(self.http_timeout):
                     resp = http_connect(
                         node['replication_ip'], node['replication_port'],
                         node['device'], job['partition'], 'REPLICATE',
-                        '', headers=headers).getresponse()
+                        '', headers=check_headers).getresponse()
                 if resp.status == HTTP_INSUFFICIENT_STORAGE:
                     self.logger.error(
                         _('%s responded as unmounted'),
@@ -756,6 +876,11 @@ class ObjectReconstructor(Daemon):
                     self.logger.error(
                         _("Invalid response %(resp)s from %(full_path)s"),
                         {'resp': resp.status, 'full_path': full_path})
+                elif self.hash_tree and config_true_value(
+                        resp.getheader('X-Backend-Hash-Tree')):
+                    remote_tree_diff = self._diff_remote_hash_tree(
+                        job, node, check_headers, pickle.loads(resp.read()))
+                    remote_suffixes = {}
                 else:
                     remote_suffixes = pickle.loads(resp.read())
             except (Exception, Timeout):
@@ -769,20 +894,30 @@ class ObjectReconstructor(Daemon):
         if remote_suffixes is None:
             raise SuffixSyncError('Unable to get remote suffix hashes')
 
-        suffixes = self.get_suffix_delta(job['hashes'],
-                                         job['frag_index'],
-                                         remote_suffixes,
-                                         node['backend_index'])
+        if remote_tree_diff is not None:
+            suffixes = [suffix for suffix in remote_tree_diff
+                        if suffix in job['hashes']]
+        else:
+            suffixes = self.get_suffix_delta(job['hashes'],
+                                             job['frag_index'],
+                                             remote_suffixes,
+                                             node['backend_index'])
         # now recalculate local hashes for suffixes that don't
         # match so we're comparing the latest
         local_suff = self._get_hashes(job['local_dev']['device'],
                                       job['partition'],
                                       job['policy'], recalculate=suffixes)
 
-        suffixes = self.get_suffix_delta(local_suff,
-                                         job['frag_index'],
-                                         remote_suffixes,
-                                         node['backend_index'])
+        if remote_tree_diff is not None:
+            suffixes = [suffix for suffix in suffixes if suffix in local_suff
+                        and hash_tree_leaf(local_suff[suffix],
+                                           job['frag_index']) !=
+                        remote_tree_diff[suffix]]
+        else:
+            suffixes = self.get_suffix_delta(local_suff,
+                                             job['frag_index'],
+                                             remote_suffixes,
+                                             node['backend_index'])
 
         self.suffix_count += len(suffixes)
         return suffixes, node
@@ -1193,6 +1328,8 @@ class ObjectReconstructor(Daemon):
         self.reconstruction_part_count = 0
         self.last_reconstruction_count = -1
         self.handoffs_remaining = 0
+        self.rebuilt_archives = 0
+        self.rebuilt_bytes = 0
 
     def delete_partition(self, path):
         def kill_it(path):
@@ -1206,6 +1343,7 @@ class ObjectReconstructor(Daemon):
         """Run a reconstruction pass"""
         self._reset_stats()
         self.partition_times = []
+        self.ssync_stats.reset()
 
         stats = spawn(self.heartbeat)
         lockup_detector = spawn(self.detect_lockups)
@@ -1270,13 +1408,25 @@ class ObjectReconstructor(Daemon):
             'object_reconstruction_time': total,
             'object_reconstruction_last': time.time(),
         }
+        # rebuild throughput of this worker during the cycle, or nothing
+        # to remove the one of a previous cycle
+        rebuild_stats = {}
+        if self.rebuilt_archives:
+            rebuild_stats = {
+                'fragment_archives': self.rebuilt_archives,
+                'bytes': self.rebuilt_bytes,
+                'rate': self.rebuilt_bytes / ((total * 60) or 0.000001),
+            }
 
         devices = override_devices or self.all_local_devices
         if self.reconstructor_workers > 0 and devices:
             recon_update['pid'] = os.getpid()
+            if rebuild_stats:
+                recon_update['object_reconstruction_rebuild'] = rebuild_stats
             recon_update = {'object_reconstruction_per_disk': {
                 d: recon_update for d in devices}}
         else:
+            recon_update['object_reconstruction_rebuild'] = rebuild_stats
             # if not running in worker mode, kill any per_disk stats
             recon_update['object_reconstruction_per_disk'] = {}
         dump_recon_cache(recon_update, self.rcache, self.logger)
@@ -36,12 +36,14 @@ from swift.common.utils import whataremyips, unlink_older_than, \
     rsync_module_interpolation, mkdirs, config_true_value, \
     config_auto_int_value, storage_directory, \
     load_recon_cache, PrefixLoggerAdapter, parse_override_options, \
-    distribute_evenly
+    distribute_evenly, Histogram
 from swift.common.bufferedhttp import http_connect
 from swift.common.daemon import Daemon
 from swift.common.http import HTTP_OK, HTTP_INSUFFICIENT_STORAGE
 from swift.obj import ssync_sender
-from swift.obj.diskfile import get_data_dir, get_tmp_dir, DiskFileRouter
+from swift.obj.diskfile import get_data_dir, get_tmp_dir, DiskFileRouter, \
+    build_hash_tree, diff_hash_trees, update_part_index
+from swift.common.exceptions import ReplicationException
 from swift.common.storage_policy import POLICIES, REPL_POLICY
 
 DEFAULT_RSYNC_TIMEOUT = 900
@@ -113,6 +115,118 @@ class Stats(object):
             self.failure_nodes[ip][device] += 1
 
 
+class PartitionHealth(object):
+    """
+    What the previous replication passes told of the health of the local
+    partitions, used to replicate the least healthy partitions first.
+
+    For each partition, we remember the number of nodes which did not
+    match its hashes (or could not be reached) during the last pass, when
+    it was last found healthy, and since when it is not.
+    """
+
+    def __init__(self):
+        self.since = time.time()
+        # (policy index, device, partition) -> [nodes out of sync,
+        #                                        last healthy, unhealthy since]
+        self.partitions = {}
+        self.time_to_healthy = defaultdict(lambda: Histogram(unit=1))
+
+    @staticmethod
+    def _key(job):
+        return int(job['policy']), job['device'], job['partition']
+
+    def score(self, job, now=None):
+        """
+        Get the priority of a replication job: the number of seconds the
+        data of its partition may have been missing from some nodes,
+        weighted by the number of such nodes.
+
+        :param job: a replication job
+        :param now: the current time
+        :returns: a positive number, higher for less healthy partitions
+        """
+        now = now or time.time()
+        out_of_sync, last_healthy, _junk = self.partitions.get(
+            self._key(job), (0, None, None))
+        if job['delete']:
+            # No primary node is supposed to have the data of a handoff
+            # partition, it has been missing since it was written.
+            out_of_sync = max(out_of_sync, 1)
+            try:
+                age = now - os.stat(job['path']).st_mtime
+            except OSError:
+                age = 0
+        else:
+            age = now - (last_healthy or self.since)
+        return max(age, 0) * (1 + out_of_sync)
+
+    def sort(self, jobs):
+        """
+        Sort jobs by decreasing score, in place. Jobs with the same score
+        keep their relative order.
+        """
+        now = time.time()
+        jobs.sort(key=lambda job: self.score(job, now), reverse=True)
+
+    def prune(self, jobs):
+        """
+        Forget the partitions which no job is about anymore.
+        """
+        keys = set(self._key(job) for job in jobs)
+        for key in list(self.partitions):
+            if key not in keys:
+                del self.partitions[key]
+
+    def update(self, job, out_of_sync, healthy, begin):
+        """
+        Note the outcome of the replication of a partition.
+
+        :param job: the replication job
+        :param out_of_sync: number of nodes which did not match the hashes
+            of the partition, or could not be checked
+        :param healthy: True if all the nodes have the data of the
+            partition once the job is done
+        :param begin: when the job started
+        """
+        key = self._key(job)
+        entry = self.partitions.setdefault(key, [0, None, None])
+        entry[0] = out_of_sync
+        if out_of_sync and entry[2] is None:
+            entry[2] = begin
+        if healthy:
+            now = time.time()
+            entry[1] = now
+            if entry[2] is not None:
+                self.time_to_healthy[job['device']].record(now - entry[2])
+                entry[2] = None
+
+    def handoff_removed(self, job, since):
+        """
+        Note a handoff partition has been removed, its data being on all
+        its primary nodes.
+
+        :param job: the replication job
+        :param since: when the data was written on the handoff partition
+        """
+        self.partitions.pop(self._key(job), None)
+        self.time_to_healthy[job['device']].record(
+            max(time.time() - since, 0))
+
+    def unhealthy_count(self, device):
+        # Nodes found out of sync by the last pass may have been fixed
+        # by the same pass: only count partitions not healthy since.
+        return len([key for key, entry in self.partitions.items()
+                    if key[1] == device and entry[2] is not None])
+
+    def reset_stats(self):
+        self.time_to_healthy.clear()
+
+    def to_recon(self, device):
+        return {'time_to_healthy': self.time_to_healthy[device].to_dict(),
+                'unhealthy_partitions': self.unhealthy_count(device)}
+
+
 class ObjectReplicator(Daemon):
     """
     Replicate objects.
@@ -186,6 +300,22 @@ class ObjectReplicator(Daemon):
                                 'operation, please disable handoffs_first and '
                                 'handoff_delete before the next '
                                 'normal rebalance')
+        # Replicate first the partitions which were found out of sync (or
+        # not synced for the longest time) by the previous passes.
+        self.unhealthy_first = config_true_value(
+            conf.get('unhealthy_first', False))
+        self.partition_health = \
+            PartitionHealth() if self.unhealthy_first else None
+        # Compare partitions with their hash trees when the remote object
+        # servers can, rather than with all their suffix hashes.
+        self.hash_tree = config_true_value(conf.get('hash_tree', False))
+        # Number of SSYNC subrequests receivers are asked to apply at once
+        self.ssync_concurrency = int(conf.get('ssync_concurrency', 1))
+        # Number of objects offered per compressed missing_check batch
+        # (0: one line per object)
+        self.ssync_missing_check_batch = int(
+            conf.get('ssync_missing_check_batch', 0))
+        self.ssync_stats = ssync_sender.SsyncStats()
         self.is_multiprocess_worker = None
         self._df_router = DiskFileRouter(conf, self.logger)
         self._child_process_reaper_queue = queue.LightQueue()
@@ -193,6 +323,8 @@ class ObjectReplicator(Daemon):
 
     def _zero_stats(self):
         self.stats_for_dev = defaultdict(Stats)
+        if self.partition_health:
+            self.partition_health.reset_stats()
 
     @property
     def total_stats(self):
@@ -497,6 +629,11 @@ class ObjectReplicator(Daemon):
         failure_devs_info = set()
         begin = time.time()
         handoff_partition_deleted = False
+        if self.partition_health:
+            try:
+                written = os.stat(job['path']).st_mtime
+            except OSError:
+                written = begin
         try:
             responses = []
             suffixes = tpool.execute(tpool_get_suffixes, job['path'])
@@ -577,6 +714,11 @@ class ObjectReplicator(Daemon):
             stats.success += len(target_devs_info - failure_devs_info)
             if not handoff_partition_deleted:
                 self.handoffs_remaining += 1
+            if self.partition_health and handoff_partition_deleted:
+                self.partition_health.handoff_removed(job, written)
+            elif self.partition_health:
+                self.partition_health.update(
+                    job, len(failure_devs_info), False, begin)
             self.partition_times.append(time.time() - begin)
             self.logger.timing_since('partition.delete.timing', begin)
 
@@ -596,6 +738,7 @@ class ObjectReplicator(Daemon):
             object_path = storage_directory(job['obj_path'], job['partition'],
                                             object_hash)
             tpool.execute(shutil.rmtree, object_path, ignore_errors=True)
+            update_part_index(object_path, [])
             suffix_dir = dirname(object_path)
             try:
                 os.rmdir(suffix_dir)
@@ -608,6 +751,38 @@ class ObjectReplicator(Daemon):
                         suffix_dir)
         return success_paths, error_paths
 
+    def get_remote_hashes(self, node, job, headers, local_hash,
+                          remote_nodes):
+        """
+        Compare the local suffix hashes with the hash tree of a remote
+        partition, fetching only the subtrees which differ.
+
+        :param node: the remote node
+        :param job: a dict containing info about the partition
+        :param headers: the headers of REPLICATE requests
+        :param local_hash: the local suffix hashes
+        :param remote_nodes: the top of the remote hash tree
+        :returns: the remote suffix hashes, as far as they are known to
+                  differ from the local ones
+        """
+        def fetch(prefixes):
+            tree_headers = dict(headers)
+            tree_headers['X-Backend-Hash-Tree'] = 'yes'
+            tree_headers['X-Backend-Hash-Tree-Prefixes'] = ','.join(prefixes)
+            resp = http_connect(
+                node['replication_ip'], node['replication_port'],
+                node['device'], job['partition'], 'REPLICATE',
+                '', headers=tree_headers).getresponse()
+            if resp.status != HTTP_OK:
+                raise ReplicationException(
+                    'Invalid response %s to hash tree request' % resp.status)
+            return pickle.loads(resp.read())
+
+        remote_hash = dict(local_hash)
+        remote_hash.update(diff_hash_trees(
+            build_hash_tree(local_hash), remote_nodes, fetch))
+        return remote_hash
+
     def update(self, job):
         """
         High-level method that replicates a single partition.
@@ -619,8 +794,13 @@ class ObjectReplicator(Daemon):
         self.logger.increment('partition.update.count.%s' % (job['device'],))
         headers = dict(self.default_headers)
         headers['X-Backend-Storage-Policy-Index'] = int(job['policy'])
+        check_headers = dict(headers)
+        if self.hash_tree:
+            check_headers['X-Backend-Hash-Tree'] = 'yes'
         target_devs_info = set()
         failure_devs_info = set()
+        out_of_sync_devs_info = set()
+        all_nodes_checked = False
         begin = time.time()
         df_mgr = self._df_router[job['policy']]
         try:
@@ -653,7 +833,7 @@ class ObjectReplicator(Daemon):
                         resp = http_connect(
                             node['replication_ip'], node['replication_port'],
                             node['device'], job['partition'], 'REPLICATE',
-                            '', headers=headers).getresponse()
+                            '', headers=check_headers).getresponse()
                         if resp.status == HTTP_INSUFFICIENT_STORAGE:
                             self.logger.error(
                                 _('%(replication_ip)s/%(device)s '
@@ -671,6 +851,10 @@ class ObjectReplicator(Daemon):
                                                    node['device']))
                             continue
                         remote_hash = pickle.loads(resp.read())
+                        if self.hash_tree and config_true_value(
+                                resp.getheader('X-Backend-Hash-Tree')):
+                            remote_hash = self.get_remote_hashes(
+                                node, job, headers, local_hash, remote_hash)
                         del resp
                     suffixes = [suffix for suffix in local_hash if
                                 local_hash[suffix] !=
@@ -691,6 +875,8 @@ class ObjectReplicator(Daemon):
                         stats.hashmatch += 1
                         continue
                     stats.rsync += 1
+                    out_of_sync_devs_info.add((node['replication_ip'],
+                                               node['device']))
                     success, _junk = self.sync(node, job, suffixes)
                     with Timeout(self.http_timeout):
                         conn = http_connect(
@@ -712,6 +898,7 @@ class ObjectReplicator(Daemon):
                                            node['device']))
                     self.logger.exception(_("Error syncing with node: %s") %
                                           node)
+            all_nodes_checked = True
             stats.suffix_count += len(local_hash)
         except StopIteration:
             self.logger.error('Ran out of handoffs while replicating '
@@ -723,6 +910,10 @@ class ObjectReplicator(Daemon):
         finally:
             stats.add_failure_stats(failure_devs_info)
             stats.success += len(target_devs_info - failure_devs_info)
+            if self.partition_health:
+                self.partition_health.update(
+                    job, len(out_of_sync_devs_info | failure_devs_info),
+                    all_nodes_checked and not failure_devs_info, begin)
             self.partition_times.append(time.time() - begin)
             self.logger.timing_since('partition.update.timing', begin)
 
@@ -767,6 +958,7 @@ class ObjectReplicator(Daemon):
                      'min': self.partition_times[0],
                      'med': self.partition_times[
                          len(self.partition_times) // 2]})
+            self.ssync_stats.log(self.logger)
         else:
             self.logger.info(
                 _("Nothing replicated for %s seconds."),
@@ -909,6 +1101,9 @@ class ObjectReplicator(Daemon):
                 policy, ips, override_devices=override_devices,
                 override_partitions=override_partitions)
         random.shuffle(jobs)
+        if self.partition_health:
+            self.partition_health.prune(jobs)
+            self.partition_health.sort(jobs)
         if self.handoffs_first:
             # Move the handoff parts to the front of the list
             jobs.sort(key=lambda job: not job['delete'])
@@ -924,6 +1119,7 @@ class ObjectReplicator(Daemon):
         self.last_replication_count = 0
         self.replication_cycle = (self.replication_cycle + 1) % 10
         self.partition_times = []
+        self.ssync_stats.reset()
         self.my_replication_ips = self._get_my_replication_ips()
         self.all_devs_info = set()
         self.handoffs_remaining = 0
@@ -1014,12 +1210,20 @@ class ObjectReplicator(Daemon):
                          'object_replication_time': total,
                          'object_replication_last': end_time}
                     for od in override_devices}}
+            if self.partition_health:
+                for od in override_devices:
+                    update['object_replication_per_disk'][od].update(
+                        self.partition_health.to_recon(od))
         else:
             update = {'replication_stats': self.total_stats.to_recon(),
                       'replication_time': total,
                       'replication_last': end_time,
                       'object_replication_time': total,
                       'object_replication_last': end_time}
+            if self.partition_health:
+                update['object_replication_health'] = {
+                    dev: self.partition_health.to_recon(dev)
+                    for dev in self.stats_for_dev}
         dump_recon_cache(update, self.rcache, self.logger)
 
     def aggregate_recon_update(self):
@@ -1043,6 +1247,13 @@ class ObjectReplicator(Daemon):
             recon_update['replication_time'] = min_repl_time
             recon_update['object_replication_last'] = min_repl_last
             recon_update['object_replication_time'] = min_repl_time
+            health = {device_name: {key: data[key] for key in
+                                    ('time_to_healthy',
+                                     'unhealthy_partitions')}
+                      for device_name, data in per_disk_stats.items()
+                      if 'time_to_healthy' in data}
+            if health:
+                recon_update['object_replication_health'] = health
 
         # Clear out entries for old local devices that we no longer have
         devices_to_remove = set(per_disk_stats) - set(self.all_local_devices)
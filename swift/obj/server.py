@@ -37,7 +37,7 @@ from swift.common.utils import public, get_logger, \
     get_expirer_container, parse_mime_headers, \
     iter_multipart_mime_documents, extract_swift_bytes, safe_json_loads, \
     config_auto_int_value, split_path, get_redirect_data, \
-    normalize_timestamp
+    normalize_timestamp, ReconStatsDumper
 from swift.common.bufferedhttp import http_connect
 from swift.common.constraints import check_object_creation, \
     valid_timestamp, check_utf8, AUTO_CREATE_ACCOUNT_PREFIX
@@ -60,7 +60,8 @@ from swift.common.swob import HTTPAccepted, HTTPBadRequest, HTTPCreated, \
     HTTPClientDisconnect, HTTPMethodNotAllowed, Request, Response, \
     HTTPInsufficientStorage, HTTPForbidden, HTTPException, HTTPConflict, \
     HTTPServerError, wsgi_to_bytes, wsgi_to_str, normalize_etag
-from swift.obj.diskfile import RESERVED_DATAFILE_META, DiskFileRouter
+from swift.obj.diskfile import RESERVED_DATAFILE_META, DiskFileRouter, \
+    hash_tree_children
 from swift.obj.expirer import build_task_obj
 
 
@@ -234,6 +235,10 @@ class ObjectController(BaseStorageServer):
             conf.get('replication_failure_threshold') or 100)
         self.replication_failure_ratio = float(
             conf.get('replication_failure_ratio') or 1.0)
+        # Number of subrequests of an SSYNC request applied at once (at most
+        # what the sender asks), and largest PUT body read ahead to do so.
+        self.ssync_concurrency = int(conf.get('ssync_concurrency', 1))
+        self.ssync_buffer_size = int(conf.get('ssync_buffer_size', 1048576))
 
         servers_per_port = int(conf.get('servers_per_port', '0') or 0)
         if servers_per_port:
@@ -263,6 +268,22 @@ class ObjectController(BaseStorageServer):
         if tpool_size:
             tpool.set_num_threads(tpool_size)
 
+        # Statistics of the group commits of this worker, saved
+        # periodically in the recon cache
+        self.recon_stats = ReconStatsDumper(
+            conf.get('recon_cache_path', '/var/cache/swift'),
+            float(conf.get('recon_interval', 60.0)), self.logger,
+            recon_file='object.recon')
+        if any(mgr.group_commit_window > 0 for mgr in
+               self._diskfile_router.policy_to_manager.values()):
+            self.recon_stats.register('object_group_commit',
+                                      self._group_commit_stats)
+
+    def _group_commit_stats(self):
+        return {policy_index: mgr.group_commit_stats()
+                for policy_index, mgr in
+                self._diskfile_router.policy_to_manager.items()}
+
     def get_diskfile(self, device, partition, account, container, obj,
                      policy, **kwargs):
         """
@@ -1063,6 +1084,7 @@ class ObjectController(BaseStorageServer):
         self._post_commit_updates(request, device,
                                   account, container, obj, policy,
                                   orig_metadata, footers_metadata, metadata)
+        self.recon_stats.maybe_dump()
         return HTTPCreated(request=request, etag=etag)
 
     @public
@@ -1292,25 +1314,53 @@ class ObjectController(BaseStorageServer):
         Note that the name REPLICATE is preserved for historical reasons as
         this verb really just returns the hashes information for the specified
         parameters and is used, for example, by both replication and EC.
+
+        If asked with an X-Backend-Hash-Tree header, and no suffixes to
+        recalculate, the nodes of the hash tree of the partition right under
+        the prefixes listed in X-Backend-Hash-Tree-Prefixes (the root and
+        its children by default) are returned instead of all the suffix
+        hashes, and the response has an X-Backend-Hash-Tree header. Older
+        servers ignore the request header.
         """
         device, partition, suffix_parts, policy = \
             get_name_and_placement(request, 2, 3, True)
         suffixes = suffix_parts.split('-') if suffix_parts else []
+        hash_tree = not suffixes and config_true_value(
+            request.headers.get('X-Backend-Hash-Tree'))
+        frag_index = request.headers.get('X-Backend-Hash-Tree-Index')
+        try:
+            frag_index = None if frag_index is None else int(frag_index)
+        except ValueError:
+            return HTTPBadRequest(body='Invalid X-Backend-Hash-Tree-Index',
+                                  request=request)
         try:
-            hashes = self._diskfile_router[policy].get_hashes(
-                device, partition, suffixes, policy)
+            if hash_tree:
+                tree = self._diskfile_router[policy].get_hash_tree(
+                    device, partition, policy, frag_index)
+                hashes = hash_tree_children(tree, request.headers.get(
+                    'X-Backend-Hash-Tree-Prefixes', '').split(','))
+            else:
+                hashes = self._diskfile_router[policy].get_hashes(
+                    device, partition, suffixes, policy)
         except DiskFileDeviceUnavailable:
             resp = HTTPInsufficientStorage(drive=device, request=request)
         else:
             # force pickle protocol for compatibility with py2 nodes
             resp = Response(body=pickle.dumps(hashes, protocol=2))
+            if hash_tree:
+                resp.headers['X-Backend-Hash-Tree'] = 'yes'
         return resp
 
     @public
     @replication
     @timing_stats(sample_rate=0.1)
     def SSYNC(self, request):
-        return Response(app_iter=ssync_receiver.Receiver(self, request)())
+        receiver = ssync_receiver.Receiver(self, request)
+        resp = Response(app_iter=receiver())
+        if receiver.missing_check_encoding:
+            resp.headers['X-Backend-Ssync-Missing-Check-Encoding'] = \
+                receiver.missing_check_encoding
+        return resp
 
     def __call__(self, env, start_response):
         """WSGI Application entry point for the Swift Object Server."""
@@ -1358,10 +1408,11 @@ class ObjectController(BaseStorageServer):
         # socket file descriptor from the WSGI input object. Third, the
         # diskfile has to support zero-copy send.
         #
-        # There's a good chance that this could work for 206 responses too,
-        # but the common case is sending the whole object, so we'll start
-        # there.
-        if req.method == 'GET' and res.status_int == 200 and \
+        # Responses with a single range (206 with a Content-Range, as opposed
+        # to multipart ones) are sent by zero-copy readers which support it.
+        if req.method == 'GET' and (
+                res.status_int == 200 or
+                (res.status_int == 206 and res.content_range)) and \
            isinstance(env['wsgi.input'], wsgi.Input):
             app_iter = getattr(res, 'app_iter', None)
             checker = getattr(app_iter, 'can_zero_copy_send', None)
@@ -14,9 +14,12 @@
 # limitations under the License.
 
 
+import zlib
+
 import eventlet.greenio
 import eventlet.wsgi
-from eventlet import sleep
+from eventlet import GreenPool, sleep
+import six
 from six.moves import urllib
 
 from swift.common import exceptions
@@ -36,24 +39,46 @@ def decode_missing(line):
     The encoder for this line is
     :py:func:`~swift.obj.ssync_sender.encode_missing`
     """
-    result = {}
     parts = line.decode('ascii').split()
-    result['object_hash'] = urllib.parse.unquote(parts[0])
-    t_data = urllib.parse.unquote(parts[1])
-    result['ts_data'] = Timestamp(t_data)
-    result['ts_meta'] = result['ts_ctype'] = result['ts_data']
-    if len(parts) > 2:
+    return _decode_missing_parts(
+        urllib.parse.unquote(parts[0]),
+        Timestamp(urllib.parse.unquote(parts[1])), parts[2:])
+
+
+def _decode_missing_parts(object_hash, ts_data, parts):
+    result = {'object_hash': object_hash, 'ts_data': ts_data,
+              'ts_meta': ts_data, 'ts_ctype': ts_data}
+    if parts:
         # allow for a comma separated list of k:v pairs to future-proof
-        subparts = urllib.parse.unquote(parts[2]).split(',')
+        subparts = urllib.parse.unquote(parts[0]).split(',')
         for item in [subpart for subpart in subparts if ':' in subpart]:
             k, v = item.split(':')
             if k == 'm':
-                result['ts_meta'] = Timestamp(t_data, delta=int(v, 16))
+                result['ts_meta'] = Timestamp(ts_data, delta=int(v, 16))
             elif k == 't':
-                result['ts_ctype'] = Timestamp(t_data, delta=int(v, 16))
+                result['ts_ctype'] = Timestamp(ts_data, delta=int(v, 16))
     return result
 
 
+def decode_missing_batch(data):
+    """
+    Parse a zlib compressed batch of missing_check entries and return a
+    list of dicts in the form returned by :py:func:`decode_missing`.
+
+    The encoder for this batch is
+    :py:func:`~swift.obj.ssync_sender.encode_missing_batch`
+    """
+    results = []
+    previous = 0
+    for line in zlib.decompress(data).decode('ascii').splitlines():
+        parts = line.split()
+        raw, _junk, offset = parts[1].partition('_')
+        previous += int(raw, 16)
+        ts_data = Timestamp(0, offset=int(offset or '0', 16), delta=previous)
+        results.append(_decode_missing_parts(parts[0], ts_data, parts[2:]))
+    return results
+
+
 def encode_wanted(remote, local):
     """
     Compare a remote and local results and generate a wanted line.
@@ -88,6 +113,17 @@ def encode_wanted(remote, local):
     return None
 
 
+def encode_wanted_batch(lines):
+    """
+    Returns a zlib compressed batch of lines generated by
+    :py:func:`encode_wanted`.
+
+    The decoder for this batch is
+    :py:func:`~swift.obj.ssync_sender.decode_wanted_batch`
+    """
+    return zlib.compress('\n'.join(lines).encode('ascii'))
+
+
 class Receiver(object):
     """
     Handles incoming SSYNC requests to the object server.
@@ -222,6 +258,23 @@ class Receiver(object):
         self.device, self.partition, self.policy = \
             request_helpers.get_name_and_placement(self.request, 2, 2, False)
 
+        # Number of subrequests applied at once, as asked by the sender
+        # within our limit.
+        try:
+            self.concurrency = max(1, min(
+                int(self.request.headers.get('X-Backend-Ssync-Concurrency',
+                                             1)),
+                self.app.ssync_concurrency))
+        except ValueError:
+            raise swob.HTTPBadRequest(
+                'Invalid X-Backend-Ssync-Concurrency %r' %
+                self.request.headers['X-Backend-Ssync-Concurrency'])
+        # Encoding of the missing_check exchange asked by the sender, as
+        # answered in the response headers if we know it.
+        self.missing_check_encoding = None
+        if self.request.headers.get(
+                'X-Backend-Ssync-Missing-Check-Encoding') == 'zlib':
+            self.missing_check_encoding = 'zlib'
         self.frag_index = None
         if self.request.headers.get('X-Backend-Ssync-Frag-Index'):
             try:
@@ -334,6 +387,15 @@ class Receiver(object):
         The collection and then response is so the sender doesn't
         have to read while it writes to ensure network buffers don't
         fill up and block everything.
+
+        If the sender asked for the zlib encoding with an
+        X-Backend-Ssync-Missing-Check-Encoding header, and it was answered
+        in the response headers, the `hash timestamp` lines and the
+        <wanted_hash> specifiers are instead sent in batches: a
+        `:MISSING_CHECK: BATCH <hex length>` line followed by that many
+        bytes of zlib compressed lines. Sent lines are then sorted by hash,
+        with the timestamp of the data file as a delta to the one of the
+        previous line.
         """
         with exceptions.MessageTimeout(
                 self.app.client_timeout, 'missing_check start'):
@@ -342,6 +404,7 @@ class Receiver(object):
             raise Exception(
                 'Looking for :MISSING_CHECK: START got %r' % line[:1024])
         object_hashes = []
+        batches = []
         nlines = 0
         while True:
             with exceptions.MessageTimeout(
@@ -349,6 +412,21 @@ class Receiver(object):
                 line = self.fp.readline(self.app.network_chunk_size)
             if not line or line.strip() == b':MISSING_CHECK: END':
                 break
+            if self.missing_check_encoding and \
+                    line.startswith(b':MISSING_CHECK: BATCH '):
+                wanted = []
+                for remote in decode_missing_batch(self._read_batch(line)):
+                    want = encode_wanted(remote, self._check_local(remote))
+                    if want:
+                        wanted.append(want)
+                    if nlines % 5 == 0:
+                        sleep()  # Gives a chance for other greenthreads to run
+                    nlines += 1
+                if wanted:
+                    data = encode_wanted_batch(wanted)
+                    batches.append(
+                        b':MISSING_CHECK: BATCH %x\r\n%s' % (len(data), data))
+                continue
             want = self._check_missing(line)
             if want:
                 object_hashes.append(want)
@@ -356,11 +434,30 @@ class Receiver(object):
                 sleep()  # Gives a chance for other greenthreads to run
             nlines += 1
         yield b':MISSING_CHECK: START\r\n'
+        for batch in batches:
+            yield batch
         if object_hashes:
             yield b'\r\n'.join(hsh.encode('ascii') for hsh in object_hashes)
         yield b'\r\n'
         yield b':MISSING_CHECK: END\r\n'
 
+    def _read_batch(self, line):
+        """
+        Reads the compressed data announced by a ``:MISSING_CHECK: BATCH``
+        line.
+        """
+        left = int(line.split()[2], 16)
+        data = []
+        while left > 0:
+            with exceptions.MessageTimeout(
+                    self.app.client_timeout, 'missing_check batch'):
+                chunk = self.fp.read(min(left, self.app.network_chunk_size))
+            if not chunk:
+                raise Exception('Early termination of missing_check batch')
+            data.append(chunk)
+            left -= len(chunk)
+        return b''.join(data)
+
     def updates(self):
         """
         Handles the UPDATES step of an SSYNC request.
@@ -388,6 +485,13 @@ class Receiver(object):
 
             5. Sender gets `:UPDATES: START` and `:UPDATES: END`.
 
+        If the sender asked for it with an X-Backend-Ssync-Concurrency
+        header, up to that many subrequests (and at most ssync_concurrency)
+        are applied at once: DELETE and POST subrequests, and PUT
+        subrequests whose body is small enough to be read ahead, are handed
+        to a pool of greenthreads while the next ones are read. Subrequests
+        about the same object are still applied in order.
+
         If too many subrequests fail, as configured by
         replication_failure_threshold and replication_failure_ratio,
         the receiver will hang up the request early so as to not
@@ -404,8 +508,36 @@ class Receiver(object):
             line = self.fp.readline(self.app.network_chunk_size)
         if line.strip() != b':UPDATES: START':
             raise Exception('Looking for :UPDATES: START got %r' % line[:1024])
-        successes = 0
-        failures = 0
+        counts = {'successes': 0, 'failures': 0}
+        pool = GreenPool(self.concurrency) if self.concurrency > 1 else None
+        try:
+            self._receive_subrequests(pool, counts)
+        finally:
+            # Subrequests still in progress are done with the partition
+            # before the caller releases it, whatever happened.
+            if pool is not None:
+                pool.waitall()
+        if pool is not None:
+            self._check_failures(counts)
+        if counts['failures']:
+            raise swob.HTTPInternalServerError(
+                'ERROR: With :UPDATES: %(failures)d failures to '
+                '%(successes)d successes' % counts)
+        yield b':UPDATES: START\r\n'
+        yield b':UPDATES: END\r\n'
+
+    def _receive_subrequests(self, pool, counts):
+        """
+        Read the subrequests of the UPDATES step until its end, and apply
+        them, in `pool` if it is not None.
+        """
+        # path -> greenthread applying the last subrequest about it
+        in_flight = {}
+
+        def forget(thread, path):
+            if in_flight.get(path) is thread:
+                del in_flight[path]
+
         while True:
             with exceptions.MessageTimeout(
                     self.app.client_timeout, 'updates line'):
@@ -464,8 +596,12 @@ class Receiver(object):
                                 'Early termination for %s %s' % (method, path))
                         left -= len(chunk)
                         yield chunk
-                subreq.environ['wsgi.input'] = utils.FileLikeIter(
-                    subreq_iter())
+                if pool and content_length <= self.app.ssync_buffer_size:
+                    subreq.environ['wsgi.input'] = six.BytesIO(
+                        b''.join(subreq_iter()))
+                else:
+                    subreq.environ['wsgi.input'] = utils.FileLikeIter(
+                        subreq_iter())
             else:
                 raise Exception('Invalid subrequest method %s' % method)
             subreq.headers['X-Backend-Storage-Policy-Index'] = int(self.policy)
@@ -476,31 +612,45 @@ class Receiver(object):
             if replication_headers:
                 subreq.headers['X-Backend-Replication-Headers'] = \
                     ' '.join(replication_headers)
-            # Route subrequest and translate response.
-            resp = subreq.get_response(self.app)
-            if http.is_success(resp.status_int) or \
-                    resp.status_int == http.HTTP_NOT_FOUND:
-                successes += 1
+            if pool is not None:
+                previous = in_flight.get(subreq.path)
+                if previous is not None:
+                    previous.wait()
+            if pool is None or isinstance(subreq.environ['wsgi.input'],
+                                          utils.FileLikeIter):
+                # Route subrequest and translate response, while its body
+                # (if any) is read.
+                self._apply_subrequest(subreq, counts)
+                # The subreq may have failed, but we want to read the rest
+                # of the body from the remote side so we can continue on
+                # with the next subreq.
+                for junk in subreq.environ['wsgi.input']:
+                    pass
             else:
-                self.app.logger.warning(
-                    'ssync subrequest failed with %s: %s %s (%s)' %
-                    (resp.status_int, method, subreq.path, resp.body))
-                failures += 1
-            if failures >= self.app.replication_failure_threshold and (
-                    not successes or
-                    float(failures) / successes >
-                    self.app.replication_failure_ratio):
-                raise Exception(
-                    'Too many %d failures to %d successes' %
-                    (failures, successes))
-            # The subreq may have failed, but we want to read the rest of the
-            # body from the remote side so we can continue on with the next
-            # subreq.
-            for junk in subreq.environ['wsgi.input']:
-                pass
-        if failures:
-            raise swob.HTTPInternalServerError(
-                'ERROR: With :UPDATES: %d failures to %d successes' %
-                (failures, successes))
-        yield b':UPDATES: START\r\n'
-        yield b':UPDATES: END\r\n'
+                thread = pool.spawn(self._apply_subrequest, subreq, counts)
+                in_flight[subreq.path] = thread
+                thread.link(forget, subreq.path)
+            self._check_failures(counts)
+
+    def _apply_subrequest(self, subreq, counts):
+        """
+        Route a subrequest of the UPDATES step and count its outcome.
+        """
+        resp = subreq.get_response(self.app)
+        if http.is_success(resp.status_int) or \
+                resp.status_int == http.HTTP_NOT_FOUND:
+            counts['successes'] += 1
+        else:
+            self.app.logger.warning(
+                'ssync subrequest failed with %s: %s %s (%s)' %
+                (resp.status_int, subreq.method, subreq.path, resp.body))
+            counts['failures'] += 1
+
+    def _check_failures(self, counts):
+        if counts['failures'] >= self.app.replication_failure_threshold and (
+                not counts['successes'] or
+                float(counts['failures']) / counts['successes'] >
+                self.app.replication_failure_ratio):
+            raise Exception(
+                'Too many %(failures)d failures to %(successes)d successes'
+                % counts)
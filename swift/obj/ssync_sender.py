@@ -13,6 +13,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import time
+import zlib
+
 import six
 from six.moves import urllib
 
@@ -34,13 +37,45 @@ def encode_missing(object_hash, ts_data, ts_meta=None, ts_ctype=None):
     msg = ('%s %s'
            % (urllib.parse.quote(object_hash),
               urllib.parse.quote(ts_data.internal)))
+    msg += _encode_deltas(ts_data, ts_meta, ts_ctype)
+    return msg.encode('ascii')
+
+
+def _encode_deltas(ts_data, ts_meta, ts_ctype):
+    msg = ''
     if ts_meta and ts_meta != ts_data:
         delta = ts_meta.raw - ts_data.raw
-        msg = '%s m:%x' % (msg, delta)
+        msg = ' m:%x' % delta
         if ts_ctype and ts_ctype != ts_data:
             delta = ts_ctype.raw - ts_data.raw
             msg = '%s,t:%x' % (msg, delta)
-    return msg.encode('ascii')
+    return msg
+
+
+def encode_missing_batch(entries):
+    """
+    Returns a zlib compressed batch of missing_check entries, each a tuple
+    of an object hash and the dict of its timestamps. Entries are sorted by
+    hash and each one is written on a line of the form:
+    ``<hash> <hex delta to previous ts_data>[_<offset>] [m:...[,t:...]]``
+    with the same deltas to the metafile and content-type timestamps as
+    :py:func:`encode_missing`.
+
+    The decoder for this batch is
+    :py:func:`~swift.obj.ssync_receiver.decode_missing_batch`
+    """
+    lines = []
+    previous = 0
+    for object_hash, timestamps in sorted(entries, key=lambda e: e[0]):
+        ts_data = timestamps['ts_data']
+        msg = '%s %x' % (object_hash, ts_data.raw - previous)
+        if ts_data.offset:
+            msg = '%s_%x' % (msg, ts_data.offset)
+        msg += _encode_deltas(ts_data, timestamps.get('ts_meta'),
+                              timestamps.get('ts_ctype'))
+        lines.append(msg)
+        previous = ts_data.raw
+    return zlib.compress('\n'.join(lines).encode('ascii'))
 
 
 def decode_wanted(parts):
@@ -69,6 +104,20 @@ def decode_wanted(parts):
     return wanted
 
 
+def decode_wanted_batch(data):
+    """
+    Parse a zlib compressed batch of missing_check response lines.
+
+    :returns: a list of the parts of each line, as given to
+              :py:func:`decode_wanted` after the object hash
+
+    The encoder for this batch is
+    :py:func:`~swift.obj.ssync_receiver.encode_wanted_batch`
+    """
+    return [line.split()
+            for line in zlib.decompress(data).decode('ascii').splitlines()]
+
+
 class SsyncBufferedHTTPResponse(bufferedhttp.BufferedHTTPResponse, object):
     def __init__(self, *args, **kwargs):
         super(SsyncBufferedHTTPResponse, self).__init__(*args, **kwargs)
@@ -124,6 +173,40 @@ class SsyncBufferedHTTPConnection(bufferedhttp.BufferedHTTPConnection):
     response_class = SsyncBufferedHTTPResponse
 
 
+class SsyncStats(object):
+    """
+    Throughput of the UPDATES step of the SSYNC requests of a daemon,
+    logged with its stats line.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.connections = 0
+        self.updates = 0
+        self.bytes = 0
+        self.rates = []
+
+    def record(self, updates, bytes_sent, elapsed):
+        self.connections += 1
+        self.updates += updates
+        self.bytes += bytes_sent
+        self.rates.append(bytes_sent / (elapsed or 0.000001))
+
+    def log(self, logger):
+        if not self.connections:
+            return
+        self.rates.sort()
+        logger.info(
+            '%(connections)d ssync connections sent %(updates)d updates, '
+            '%(bytes)d bytes; per connection: max %(max).0f B/s, '
+            'min %(min).0f B/s, med %(med).0f B/s',
+            {'connections': self.connections, 'updates': self.updates,
+             'bytes': self.bytes, 'max': self.rates[-1],
+             'min': self.rates[0], 'med': self.rates[len(self.rates) // 2]})
+
+
 class Sender(object):
     """
     Sends SSYNC requests to the object server.
@@ -142,6 +225,10 @@ class Sender(object):
         # When remote_check_objs is given in job, ssync_sender trys only to
         # make sure those objects exist or not in remote.
         self.remote_check_objs = remote_check_objs
+        self.updates_sent = 0
+        self.bytes_sent = 0
+        # Encoding of the missing_check exchange accepted by the receiver
+        self.missing_check_encoding = None
 
     def __call__(self):
         """
@@ -239,6 +326,15 @@ class Sender(object):
                 connection.putheader('X-Backend-Ssync-Frag-Index', frag_index)
                 # Node-Index header is for backwards compat 2.4.0-2.20.0
                 connection.putheader('X-Backend-Ssync-Node-Index', frag_index)
+            # how many subrequests the receiver may apply at once; older
+            # receivers ignore this and apply them one after the other
+            concurrency = getattr(self.daemon, 'ssync_concurrency', 1)
+            if concurrency > 1:
+                connection.putheader('X-Backend-Ssync-Concurrency',
+                                     concurrency)
+            if getattr(self.daemon, 'ssync_missing_check_batch', 0) > 0:
+                connection.putheader(
+                    'X-Backend-Ssync-Missing-Check-Encoding', 'zlib')
             connection.endheaders()
         with exceptions.MessageTimeout(
                 self.daemon.node_timeout, 'connect receive'):
@@ -248,6 +344,9 @@ class Sender(object):
                 raise exceptions.ReplicationException(
                     'Expected status %s; got %s (%s)' %
                     (http.HTTP_OK, response.status, err_msg))
+            # older receivers do not answer, and get one line per object
+            self.missing_check_encoding = response.getheader(
+                'X-Backend-Ssync-Missing-Check-Encoding')
         return connection, response
 
     def missing_check(self, connection, response):
@@ -274,13 +373,22 @@ class Sender(object):
                 lambda objhash_timestamps:
                 objhash_timestamps[0] in
                 self.remote_check_objs, hash_gen)
+        batch = []
         for object_hash, timestamps in hash_gen:
             available_map[object_hash] = timestamps
+            if self.missing_check_encoding == 'zlib':
+                batch.append((object_hash, timestamps))
+                if len(batch) >= self.daemon.ssync_missing_check_batch:
+                    self.send_missing_batch(connection, batch)
+                    batch = []
+                continue
             with exceptions.MessageTimeout(
                     self.daemon.node_timeout,
                     'missing_check send line'):
                 msg = b'%s\r\n' % encode_missing(object_hash, **timestamps)
                 connection.send(b'%x\r\n%s\r\n' % (len(msg), msg))
+        if batch:
+            self.send_missing_batch(connection, batch)
         with exceptions.MessageTimeout(
                 self.daemon.node_timeout, 'missing_check end'):
             msg = b':MISSING_CHECK: END\r\n'
@@ -312,11 +420,49 @@ class Sender(object):
             line = line.strip()
             if line == b':MISSING_CHECK: END':
                 break
+            if line.startswith(b':MISSING_CHECK: BATCH '):
+                data = self.read_batch(response, line)
+                for parts in decode_wanted_batch(data):
+                    send_map[parts[0]] = decode_wanted(parts[1:])
+                continue
             parts = line.decode('ascii').split()
             if parts:
                 send_map[parts[0]] = decode_wanted(parts[1:])
         return available_map, send_map
 
+    def send_missing_batch(self, connection, batch):
+        """
+        Sends a batch of missing_check entries, as a ``:MISSING_CHECK:
+        BATCH <hex length>`` line followed by the compressed entries.
+        """
+        data = encode_missing_batch(batch)
+        with exceptions.MessageTimeout(
+                self.daemon.node_timeout, 'missing_check send batch'):
+            msg = b':MISSING_CHECK: BATCH %x\r\n%s' % (len(data), data)
+            connection.send(b'%x\r\n%s\r\n' % (len(msg), msg))
+
+    def read_batch(self, response, line):
+        """
+        Reads the compressed data announced by a ``:MISSING_CHECK: BATCH``
+        line of the response.
+        """
+        try:
+            left = int(line.split()[2], 16)
+        except ValueError:
+            raise exceptions.ReplicationException(
+                'Unexpected response: %r' % line[:1024])
+        data = []
+        while left > 0:
+            with exceptions.MessageTimeout(
+                    self.daemon.http_timeout, 'missing_check batch wait'):
+                chunk = response.readline(
+                    size=min(left, self.daemon.network_chunk_size))
+            if not chunk:
+                raise exceptions.ReplicationException('Early disconnect')
+            data.append(chunk)
+            left -= len(chunk)
+        return b''.join(data)
+
     def updates(self, connection, response, send_map):
         """
         Handles the sender-side of the UPDATES step of an SSYNC
@@ -325,6 +471,7 @@ class Sender(object):
         Full documentation of this can be found at
         :py:meth:`.Receiver.updates`.
         """
+        begin = time.time()
         # First, send all our subrequests based on the send_map.
         with exceptions.MessageTimeout(
                 self.daemon.node_timeout, 'updates start'):
@@ -393,6 +540,10 @@ class Sender(object):
                 raise exceptions.ReplicationException('Early disconnect')
             line = line.strip()
             if line == b':UPDATES: END':
+                stats = getattr(self.daemon, 'ssync_stats', None)
+                if stats is not None:
+                    stats.record(self.updates_sent, self.bytes_sent,
+                                 time.time() - begin)
                 break
             elif line:
                 if not six.PY2:
@@ -416,11 +567,14 @@ class Sender(object):
         with exceptions.MessageTimeout(self.daemon.node_timeout,
                                        'send_%s' % method.lower()):
             connection.send(b'%x\r\n%s\r\n' % (len(msg), msg))
+        self.updates_sent += 1
+        self.bytes_sent += len(msg)
 
         if df:
             bytes_read = 0
             for chunk in df.reader():
                 bytes_read += len(chunk)
+                self.bytes_sent += len(chunk)
                 with exceptions.MessageTimeout(self.daemon.node_timeout,
                                                'send_%s chunk' %
                                                method.lower()):
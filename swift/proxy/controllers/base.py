@@ -52,6 +52,7 @@ from swift.common import constraints
 from swift.common.exceptions import ChunkReadTimeout, ChunkWriteTimeout, \
     ConnectionTimeout, RangeAlreadyComplete, ShortReadError
 from swift.common.header_key_dict import HeaderKeyDict
+from swift.common.memcached import MemcacheRing
 from swift.common.http import is_informational, is_success, is_redirection, \
     is_server_error, HTTP_OK, HTTP_PARTIAL_CONTENT, HTTP_MULTIPLE_CHOICES, \
     HTTP_BAD_REQUEST, HTTP_NOT_FOUND, HTTP_SERVICE_UNAVAILABLE, \
@@ -343,6 +344,13 @@ def get_container_info(env, app, swift_source=None):
     account = wsgi_to_str(wsgi_account)
     container = wsgi_to_str(wsgi_container)
 
+    is_autocreate_account = account.startswith(
+        getattr(app, 'auto_create_account_prefix',
+                constraints.AUTO_CREATE_ACCOUNT_PREFIX))
+    if not is_autocreate_account:
+        # The account info is needed when the container info is not cached
+        _prefetch_info_from_memcache(env, account, container)
+
     # Check in environment cache and in memcache (in that order)
     info = _get_info_from_caches(app, env, account, container)
 
@@ -355,9 +363,6 @@ def get_container_info(env, app, swift_source=None):
         # HEAD the account, as a GET or HEAD response for an autocreateable
         # account is successful whether the account actually has .db files
         # on disk or not.
-        is_autocreate_account = account.startswith(
-            getattr(app, 'auto_create_account_prefix',
-                    constraints.AUTO_CREATE_ACCOUNT_PREFIX))
         if not is_autocreate_account:
             account_info = get_account_info(env, app, swift_source)
             if not account_info or not is_success(account_info['status']):
@@ -632,6 +637,34 @@ def _get_info_from_infocache(env, account, container=None):
     return None
 
 
+def _info_to_native(info):
+    """
+    Convert the text strings of info loaded from memcache (JSON) back
+    to native strings.
+    """
+    if not info or not six.PY2:
+        return info
+    new_info = {}
+    for key in info:
+        new_key = key.encode("utf-8") if isinstance(
+            key, six.text_type) else key
+        if isinstance(info[key], six.text_type):
+            new_info[new_key] = info[key].encode("utf-8")
+        elif isinstance(info[key], dict):
+            new_info[new_key] = {}
+            for subkey, value in info[key].items():
+                new_subkey = subkey.encode("utf-8") if isinstance(
+                    subkey, six.text_type) else subkey
+                if isinstance(value, six.text_type):
+                    new_info[new_key][new_subkey] = \
+                        value.encode("utf-8")
+                else:
+                    new_info[new_key][new_subkey] = value
+        else:
+            new_info[new_key] = info[key]
+    return new_info
+
+
 def _get_info_from_memcache(app, env, account, container=None):
     """
     Get cached account or container information from memcache
@@ -647,34 +680,34 @@ def _get_info_from_memcache(app, env, account, container=None):
     cache_key = get_cache_key(account, container)
     memcache = cache_from_env(env, True)
     if memcache:
-        info = memcache.get(cache_key)
-        if info and six.PY2:
-            # Get back to native strings
-            new_info = {}
-            for key in info:
-                new_key = key.encode("utf-8") if isinstance(
-                    key, six.text_type) else key
-                if isinstance(info[key], six.text_type):
-                    new_info[new_key] = info[key].encode("utf-8")
-                elif isinstance(info[key], dict):
-                    new_info[new_key] = {}
-                    for subkey, value in info[key].items():
-                        new_subkey = subkey.encode("utf-8") if isinstance(
-                            subkey, six.text_type) else subkey
-                        if isinstance(value, six.text_type):
-                            new_info[new_key][new_subkey] = \
-                                value.encode("utf-8")
-                        else:
-                            new_info[new_key][new_subkey] = value
-                else:
-                    new_info[new_key] = info[key]
-            info = new_info
+        info = _info_to_native(memcache.get(cache_key))
         if info:
             env.setdefault('swift.infocache', {})[cache_key] = info
         return info
     return None
 
 
+def _prefetch_info_from_memcache(env, account, container):
+    """
+    Load both account and container information from memcache into the
+    request-environment cache, with one request per memcached server.
+
+    Does nothing if one of them is already in the request-environment
+    cache, or if the memcache client cannot read several keys at once.
+    """
+    memcache = cache_from_env(env, True)
+    if not isinstance(memcache, MemcacheRing):
+        return
+    infocache = env.setdefault('swift.infocache', {})
+    cache_keys = [get_cache_key(account), get_cache_key(account, container)]
+    if any(key in infocache for key in cache_keys):
+        return
+    for cache_key, info in zip(cache_keys, memcache.get_multi(cache_keys)):
+        info = _info_to_native(info)
+        if info:
+            infocache[cache_key] = info
+
+
 def _get_info_from_caches(app, env, account, container=None):
     """
     Get the cached info from env or memcache (if used) in that order.
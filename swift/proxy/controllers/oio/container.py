@@ -14,16 +14,21 @@
 # limitations under the License.
 
 import json
-from xml.etree.cElementTree import Element, SubElement, tostring
+import six
+from xml.etree.cElementTree import Element, SubElement
+
+from eventlet import spawn
 
 from swift.common.oio_utils import \
     handle_oio_no_such_container, handle_oio_timeout, \
-    handle_service_busy, REQID_HEADER, BUCKET_NAME_PROP, MULTIUPLOAD_SUFFIX
+    handle_service_busy, REQID_HEADER, BUCKET_NAME_PROP, \
+    MULTIUPLOAD_SUFFIX, clear_versioning_cache
 from swift.common.utils import public, Timestamp, \
     config_true_value, override_bytes_from_content_type
 from swift.common.constraints import check_metadata
 from swift.common import constraints
-from swift.common.middleware.listing_formats import get_listing_content_type
+from swift.common.middleware.listing_formats import \
+    get_listing_content_type, to_xml
 
 from swift.common.middleware.versioned_writes.object_versioning import \
     CLIENT_VERSIONS_ENABLED, SYSMETA_VERSIONS_CONT
@@ -43,6 +48,67 @@ from swift.proxy.controllers.base import clear_info_cache, \
 from oio.common import exceptions
 
 
+def listing_records(result):
+    """
+    Get the objects and the prefixes of an object listing result,
+    as a single list sorted by name.
+    """
+    records = result['objects']
+    prefixes = result.get('prefixes')
+    if prefixes:
+        records = records + [{'name': p, 'subdir': True} for p in prefixes]
+        records.sort(key=lambda x: x['name'])
+    return records
+
+
+class ListingCursor(object):
+    """
+    Records of the last page of a paginated listing, and the next page
+    being fetched in the background, so the request for the next page
+    does not have to wait for the backend.
+
+    :param start: marker of the last page
+    :param records: records of the last page (sorted by name)
+    :param headers: response headers of the last page
+    :param next_page: greenthread returning the next listing result,
+        or None if the last page is the end of the listing
+    """
+    __slots__ = ('start', 'records', 'headers', 'next_page')
+
+    def __init__(self, start, records, headers, next_page=None):
+        self.start = start
+        self.records = records
+        self.headers = headers
+        self.next_page = next_page
+
+    def serve(self, marker, limit):
+        """
+        Get the records following `marker`.
+
+        :returns: a tuple with the records (at most `limit` + the length of
+            a page), the listing result they come from (None if the last
+            page was the end of the listing), and the response headers, or
+            None if the cursor does not hold enough records.
+        """
+        if marker < self.start:
+            return None
+        result = None
+        records = self.records
+        headers = self.headers
+        if self.next_page is not None:
+            try:
+                result = self.next_page.wait()
+            except Exception:
+                return None
+            records = records + listing_records(result)
+            headers = None
+        records = [r for r in records if r['name'] > marker]
+        if result is not None and result.get('truncated') and \
+                len(records) < limit:
+            return None
+        return records, result, headers
+
+
 class ContainerController(SwiftContainerController):
 
     pass_through_headers = ['x-container-read', 'x-container-write',
@@ -150,29 +216,67 @@ class ContainerController(SwiftContainerController):
         oio_headers = {REQID_HEADER: self.trans_id}
         oio_cache = req.environ.get('oio.cache')
         perfdata = req.environ.get('swift.perfdata')
-        result = self.app.storage.object_list(
-            self.account_name, self.container_name, prefix=prefix,
-            limit=limit, delimiter=delimiter, marker=marker,
-            end_marker=end_marker, properties=True,
-            versions=opts.get('versions', False),
-            deleted=opts.get('deleted', False),
-            force_master=opts.get('force_master', False),
-            headers=oio_headers, cache=oio_cache, perfdata=perfdata)
 
-        resp_headers = self.get_metadata_resp_headers(result)
+        def _list(marker, limit, **kwargs):
+            return self.app.storage.object_list(
+                self.account_name, self.container_name, prefix=prefix,
+                limit=limit, delimiter=delimiter, marker=marker,
+                end_marker=end_marker, properties=True,
+                versions=opts.get('versions', False),
+                deleted=opts.get('deleted', False),
+                force_master=opts.get('force_master', False),
+                headers=oio_headers, **kwargs)
+
+        cache = self.app.listing_cache
+        if cache is not None and not opts.get('force_master', False):
+            cache_key = (self.account_name, self.container_name, prefix,
+                         delimiter, end_marker,
+                         bool(opts.get('versions', False)),
+                         bool(opts.get('deleted', False)))
+            cursor = None
+            if marker:
+                try:
+                    cursor = cache.get_cache(*cache_key)
+                    cache.pop_cache(*cache_key)
+                except KeyError:
+                    pass
+        else:
+            cache_key = cursor = None
+
+        served = cursor.serve(marker, limit) if cursor else None
+        if served is not None:
+            self.app.logger.increment('listing_cache.hit')
+            records, result, resp_headers = served
+            truncated = len(records) > limit or \
+                bool(result and result.get('truncated'))
+        else:
+            if cache_key is not None and marker:
+                self.app.logger.increment('listing_cache.miss')
+            result = _list(marker, limit, cache=oio_cache, perfdata=perfdata)
+            records = listing_records(result)
+            truncated = bool(result.get('truncated'))
+        if result is not None:
+            resp_headers = self.get_metadata_resp_headers(result)
+
+        if cache_key is not None and truncated:
+            # Fetch the next page while this one is sent to the client.
+            # Keep the records of this page: clients such as s3api use
+            # the name of one of them as the next marker.
+            next_page = None
+            if result is not None and result.get('truncated'):
+                next_page = spawn(_list, result.get('next_marker') or
+                                  records[-1]['name'], limit)
+            cache.set_cache(
+                ListingCursor(marker, records, resp_headers, next_page),
+                *cache_key)
+
         resp = self.create_listing(
-            req, out_content_type, resp_headers, result,
+            req, out_content_type, resp_headers, records[:limit],
             self.container_name, **opts)
         return resp
 
     def create_listing(self, req, out_content_type, resp_headers,
-                       result, container, **kwargs):
-        container_list = result['objects']
-        for p in result.get('prefixes', []):
-            record = {'name': p,
-                      'subdir': True}
-            container_list.append(record)
-        container_list.sort(key=lambda x: x['name'])
+                       container_list, container, **kwargs):
         ret = Response(request=req, headers=resp_headers,
                        content_type=out_content_type, charset='utf-8')
         versions = kwargs.get('versions', False)
@@ -183,25 +287,27 @@ class ContainerController(SwiftContainerController):
                  for r in container_list]).encode('utf-8')
             req.environ['swift.format_listing'] = False
         elif out_content_type.endswith('/xml'):
-            doc = Element('container', name=container.decode('utf-8'))
+            # The name was unquoted by the controller, giving a native
+            # string: UTF-8 bytes on py2, already decoded on py3.
+            if six.PY2:
+                container = container.decode('utf-8')
+            doc = Element('container', name=container)
             for obj in container_list:
                 record = self.update_data_record(obj, versions, slo)
                 if 'subdir' in record:
-                    name = record['subdir'].decode('utf-8')
+                    name = record['subdir']
                     sub = SubElement(doc, 'subdir', name=name)
                     SubElement(sub, 'name').text = name
                 else:
                     obj_element = SubElement(doc, 'object')
                     for field in ["name", "hash", "bytes", "content_type",
                                   "last_modified"]:
-                        SubElement(obj_element, field).text = str(
-                            record.pop(field)).decode('utf-8')
+                        SubElement(obj_element, field).text = \
+                            six.text_type(record.pop(field))
                     for field in sorted(record):
-                        SubElement(obj_element, field).text = str(
-                            record[field]).decode('utf-8')
-            ret.body = tostring(doc, encoding='UTF-8').replace(
-                "<?xml version='1.0' encoding='UTF-8'?>",
-                '<?xml version="1.0" encoding="UTF-8"?>', 1)
+                        SubElement(obj_element, field).text = \
+                            six.text_type(record[field])
+            ret.body = to_xml(doc)
             req.environ['swift.format_listing'] = False
         else:
             if not container_list:
@@ -368,6 +474,8 @@ class ContainerController(SwiftContainerController):
         headers = self.generate_request_headers(req, transfer=True)
         clear_info_cache(self.app, req.environ, self.account_name,
                          self.container_name)
+        clear_versioning_cache(self.app, req.environ,
+                               self.account_name, self.container_name)
         resp = self.get_container_create_resp(req, headers)
         return resp
 
@@ -392,13 +500,8 @@ class ContainerController(SwiftContainerController):
         headers = self.generate_request_headers(req, transfer=True)
         clear_info_cache(self.app, req.environ,
                          self.account_name, self.container_name)
-
-        memcache = getattr(self.app, 'memcache', None) or \
-            req.environ.get('swift.cache')
-        if memcache is not None:
-            key = "/".join(("versioning", self.account_name,
-                            self.container_name))
-            memcache.delete(key)
+        clear_versioning_cache(self.app, req.environ,
+                               self.account_name, self.container_name)
 
         resp = self.get_container_post_resp(req, headers)
         return resp
@@ -447,6 +550,8 @@ class ContainerController(SwiftContainerController):
             return HTTPNotFound(request=req)
         clear_info_cache(self.app, req.environ,
                          self.account_name, self.container_name)
+        clear_versioning_cache(self.app, req.environ,
+                               self.account_name, self.container_name)
         resp = self.get_container_delete_resp(req)
         if resp.status_int == HTTP_ACCEPTED:
             return HTTPNotFound(request=req)
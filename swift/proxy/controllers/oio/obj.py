@@ -13,23 +13,28 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from bisect import bisect_right
 import json
 import mimetypes
 import time
 import math
 
+from eventlet.queue import Queue
+from eventlet.timeout import Timeout
+
 from swift import gettext_ as _
 from swift.common.utils import (
     clean_content_type, config_true_value, Timestamp, public,
-    close_if_possible, closing_if_possible)
+    close_if_possible, closing_if_possible, ContextPool)
 from swift.common.constraints import check_metadata, check_object_creation
+from swift.common.exceptions import ChunkReadTimeout, ShortReadError
 from swift.common.header_key_dict import HeaderKeyDict
 from swift.common.middleware.versioned_writes.legacy \
     import DELETE_MARKER_CONTENT_TYPE
 from swift.common.oio_utils import check_if_none_match, \
     handle_not_allowed, handle_oio_timeout, handle_service_busy, \
     REQID_HEADER, BUCKET_NAME_PROP, MULTIUPLOAD_SUFFIX, \
-    obj_version_from_env
+    obj_version_from_env, versioning_cache_key
 from swift.common.swob import HTTPAccepted, HTTPBadRequest, HTTPNotFound, \
     HTTPConflict, HTTPPreconditionFailed, HTTPRequestTimeout, \
     HTTPUnprocessableEntity, HTTPClientDisconnect, HTTPCreated, \
@@ -65,42 +70,249 @@ class ObjectControllerRouter(object):
         return ObjectController
 
 
+def coalesce_ranges(ranges, gap=0, max_ranges=0):
+    """
+    Merge overlapping or nearby byte ranges, so they can be fetched
+    from the backend in one sequential pass.
+
+    Ranges are (start, end) tuples, with end inclusive, as returned by
+    `ranges_from_http_header`. Ranges with an unknown start or end
+    (suffix or open-ended ranges) cannot be merged before the object size
+    is known: in that case the list is returned unchanged.
+
+    :param gap: ranges separated by at most this number of bytes are
+                merged (the bytes in between are fetched and dropped)
+    :param max_ranges: if there are still more ranges than this after
+                       merging, the ranges with the smallest gaps between
+                       them are merged (0 means no limit)
+    """
+    if not ranges or len(ranges) < 2 or \
+            any(start is None or end is None for start, end in ranges):
+        return ranges
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1 + gap:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    while max_ranges > 0 and len(merged) > max_ranges:
+        idx = min(range(len(merged) - 1),
+                  key=lambda i: merged[i + 1][0] - merged[i][1])
+        merged[idx:idx + 2] = [(merged[idx][0], merged[idx + 1][1])]
+    return merged
+
+
+def resolve_ranges(ranges, length):
+    """
+    Convert (start, end) tuples, end inclusive, some bounds possibly
+    unknown, to half-open (start, stop) tuples within an object
+    of `length` bytes. Unsatisfiable ranges are dropped.
+    """
+    resolved = []
+    for start, end in ranges:
+        if start is None:
+            start, stop = max(length - end, 0), length
+        elif end is None:
+            stop = length
+        else:
+            stop = min(end + 1, length)
+        if start < stop:
+            resolved.append((start, stop))
+    return resolved
+
+
 class StreamRangeIterator(object):
     """
     Data stream wrapper that handles range requests and deals with exceptions.
+
+    When the data stream has been fetched with ranges, `fetched_ranges`
+    tells which byte ranges the stream is made of (in the same order).
+    All ranges requested by the client are then served from this single
+    stream, whatever their order, keeping in memory the data which is still
+    needed by ranges not served yet, up to `max_held` bytes. Data which
+    could not be kept is fetched again with `refetch(start, stop)`, which
+    returns the data of the byte range [start, stop).
     """
 
-    def __init__(self, request, stream):
+    def __init__(self, request, stream, fetched_ranges=None, length=None,
+                 refetch=None, max_held=262144):
         self.req = request
         self._stream = stream
+        self._segments = None
+        if fetched_ranges is not None and length is not None:
+            self._segments = resolve_ranges(fetched_ranges, length)
+        self._pieces = None
+        self._refetch = refetch
+        self.max_held = max_held
+        # Pieces of data which are still needed, sorted by offset
+        self._held = []
+        self._held_offsets = []
+        self.held_bytes = 0
+        # Byte ranges of the object already read from the stream
+        self._consumed = []
+
+    def _iter_pieces(self):
+        """
+        Yield (offset, data) tuples, telling at which offset of the object
+        each buffer of the stream starts.
+        """
+        segments = iter(self._segments)
+        offset = stop = 0
+        for dat in self.stream():
+            while dat:
+                if offset >= stop:
+                    try:
+                        offset, stop = next(segments)
+                    except StopIteration:
+                        raise ShortReadError('Too much data in range stream')
+                if len(dat) <= stop - offset:
+                    yield offset, dat
+                    offset += len(dat)
+                    break
+                yield offset, dat[:stop - offset]
+                dat = dat[stop - offset:]
+                offset = stop
+
+    def _find_held(self, pos):
+        """Find a piece of data, kept in memory, containing offset `pos`."""
+        idx = bisect_right(self._held_offsets, pos)
+        while idx > 0:
+            idx -= 1
+            offset, dat = self._held[idx]
+            if pos < offset + len(dat):
+                return offset, dat
+        return None
+
+    def _hold(self, offset, dat):
+        """
+        Keep a piece of data in memory, unless that would exceed `max_held`
+        bytes and it can be fetched again.
+        """
+        if self._refetch is not None and \
+                self.held_bytes + len(dat) > self.max_held:
+            return
+        idx = bisect_right(self._held_offsets, offset)
+        self._held_offsets.insert(idx, offset)
+        self._held.insert(idx, (offset, dat))
+        self.held_bytes += len(dat)
+
+    def _consume(self, offset, end):
+        if self._consumed and self._consumed[-1][1] == offset:
+            self._consumed[-1] = (self._consumed[-1][0], end)
+        else:
+            self._consumed.append((offset, end))
 
-    def app_iter_range(self, _start, _stop):
-        # This will be called when there is only one range,
-        # no need to check the number of bytes
-        return self.stream()
+    def _consumed_until(self, pos):
+        """
+        Tell until which offset the data at `pos` has already been read
+        from the stream, or None if it has not been read yet.
+        """
+        for offset, end in self._consumed:
+            if offset <= pos < end:
+                return end
+        return None
+
+    def _fetch_again(self, start, stop):
+        """Yield the data of the range [start, stop) from a new request."""
+        stream = self._refetch(start, stop)
+        left = stop - start
+        try:
+            for dat in self.stream(stream):
+                left -= len(dat)
+                if left < 0:
+                    raise ShortReadError(
+                        'Too much data refetched at offset %d' % start)
+                yield dat
+        finally:
+            close_if_possible(stream)
+        if left > 0:
+            raise ShortReadError(
+                'Missing data at offset %d of refetched range' % (stop - left))
 
-    def _chunked_app_iter_range(self, start, stop):
-        # The stream generator give us one "chunk" per range,
-        # and as we are called once for each range, we must
-        # simulate end-of-stream by generating StopIteration
-        for dat in self.stream():
-            yield dat
-            raise StopIteration
+    def _serve_range(self, start, stop, pending):
+        """
+        Yield the data of the range [start, stop), and keep in memory
+        the data overlapping the `pending` ranges.
+        """
+        def _needed(offset, end):
+            return any(p_start < end and offset < p_stop
+                       for p_start, p_stop in pending)
+
+        if self._pieces is None:
+            self._pieces = self._iter_pieces()
+        pos = start
+        while pos < stop:
+            piece = self._find_held(pos)
+            if piece is None and self._refetch is not None:
+                consumed_end = self._consumed_until(pos)
+                if consumed_end is not None:
+                    # Already read but not kept: fetch it again, until
+                    # what is kept or not read yet.
+                    end = min(stop, consumed_end)
+                    idx = bisect_right(self._held_offsets, pos)
+                    if idx < len(self._held_offsets):
+                        end = min(end, self._held_offsets[idx])
+                    for dat in self._fetch_again(pos, end):
+                        yield dat
+                    pos = end
+                    continue
+            if piece is None:
+                try:
+                    offset, dat = next(self._pieces)
+                except StopIteration:
+                    raise ShortReadError(
+                        'Missing data at offset %d of range stream' % pos)
+                end = offset + len(dat)
+                self._consume(offset, end)
+                if _needed(offset, end) or \
+                        (pos < offset < stop and end > pos):
+                    self._hold(offset, dat)
+                if not offset <= pos < end:
+                    continue
+            else:
+                offset, dat = piece
+                end = offset + len(dat)
+            if pos == offset and end <= stop:
+                yield dat
+                pos = end
+            else:
+                pos_end = min(stop, end)
+                yield dat[pos - offset:pos_end - offset]
+                pos = pos_end
+        held = [(offset, dat) for offset, dat in self._held
+                if _needed(offset, offset + len(dat))]
+        self._held = held
+        self._held_offsets = [offset for offset, _junk in held]
+        self.held_bytes = sum(len(dat) for _junk, dat in held)
+
+    def app_iter_range(self, start, stop):
+        if self._segments is None:
+            # The stream has been fetched with the only range,
+            # no need to check the number of bytes.
+            return self.stream()
+        return self._serve_range(start, stop, [])
 
     def app_iter_ranges(self, ranges, content_type,
                         boundary, content_size,
                         *_args, **_kwargs):
+        pending = list(ranges)
+
+        def _range_iter(start, stop):
+            pending.pop(0)
+            return self._serve_range(start, stop, pending)
+
         for chunk in multi_range_iterator(
                 ranges, content_type, boundary, content_size,
-                self._chunked_app_iter_range):
+                _range_iter):
             yield chunk
 
-    def stream(self, *args, **kwargs):
+    def stream(self, source=None, *args, **kwargs):
         """
-        Get the wrapped data stream.
+        Get the wrapped data stream (or `source`).
         """
         try:
-            for dat in self._stream:
+            for dat in (self._stream if source is None else source):
                 yield dat
         except (exceptions.ServiceBusy, exceptions.ServiceUnavailable) as err:
             # We cannot use the handle_service_busy() decorator
@@ -113,6 +325,9 @@ class StreamRangeIterator(object):
     def __iter__(self):
         return self.stream()
 
+    def close(self):
+        close_if_possible(self._stream)
+
 
 class ExpectedSizeReader(object):
     """Only accept as a valid EOF an exact number of bytes received."""
@@ -144,6 +359,56 @@ class ExpectedSizeReader(object):
         return close_if_possible(self.source)
 
 
+class PrefetchedReader(object):
+    """
+    Replay data which has been read in advance from a source,
+    then continue reading from the source.
+    """
+
+    def __init__(self, source, prefetched):
+        self.source = source
+        self.prefetched = prefetched
+        self.pos = 0
+
+    def _take(self, size):
+        rc = self.prefetched[self.pos:self.pos + size]
+        self.pos += len(rc)
+        if self.pos >= len(self.prefetched):
+            self.prefetched = b''
+            self.pos = 0
+        return rc
+
+    def read(self, size=-1):
+        if not self.prefetched:
+            return self.source.read(size)
+        if size is None or size < 0:
+            return self._take(len(self.prefetched)) + self.source.read()
+        return self._take(size)
+
+    def readline(self, size=-1):
+        if not self.prefetched:
+            return self.source.readline(size)
+        end = self.prefetched.find(b'\n', self.pos) + 1
+        if end > 0:
+            length = end - self.pos
+            if size is not None and 0 <= size < length:
+                length = size
+            return self._take(length)
+        # No end of line in the prefetched data, complete it with
+        # data from the source.
+        if size is not None and size >= 0:
+            rc = self._take(size)
+            size -= len(rc)
+            if size > 0:
+                rc += self.source.readline(size)
+            return rc
+        rc = self._take(len(self.prefetched))
+        return rc + self.source.readline()
+
+    def close(self):
+        return close_if_possible(self.source)
+
+
 class ObjectController(BaseObjectController):
     allowed_headers = {'content-disposition', 'content-encoding',
                        'x-delete-at', 'x-object-manifest',
@@ -213,17 +478,43 @@ class ObjectController(BaseObjectController):
 
         # We can't use _get_info_from_caches as it would use local worker cache
         # first and an update of versioning mode may not be detected.
+        # Instead, we use a dedicated cache (if enabled), with a short TTL,
+        # which is cleared when the container is modified through this
+        # worker.
+        key = versioning_cache_key(self.account_name, root_container)
+        local_cache = getattr(self.app, 'versioning_cache', None)
+        try:
+            if local_cache is None:
+                raise KeyError(key)
+            val = local_cache.get_cache(key)
+        except KeyError:
+            val = self._load_versioning_mode(req, root_container, key)
+            # Do not remember missing containers, they may be created
+            # through another worker at any time.
+            if local_cache is not None and val is not None:
+                local_cache.set_cache(val, key)
+
+        if val is None:
+            raise HTTPNotFound(request=req)
+        if val:
+            req.headers[FORCEVERSIONING_HEADER] = val
+
+    def _load_versioning_mode(self, req, root_container, key):
+        """
+        Load the versioning mode of a container from memcache,
+        or from the container properties.
+
+        :returns: the versioning mode, an empty string if versioning is
+            not enforced, or None if the container does not exist.
+        """
         memcache = getattr(self.app, 'memcache', None) or \
             req.environ.get('swift.cache')
         if memcache is None:
-            return None
+            return ''
 
-        key = "/".join(("versioning", self.account_name, root_container))
         val = memcache.get(key)
         if val is not None:
-            if val != '':
-                req.headers[FORCEVERSIONING_HEADER] = val
-            return
+            return val
 
         oio_headers = {REQID_HEADER: self.trans_id}
         oio_cache = req.environ.get('oio.cache')
@@ -233,12 +524,11 @@ class ObjectController(BaseObjectController):
                 self.account_name, root_container, headers=oio_headers,
                 cache=oio_cache, perfdata=perfdata)
         except exceptions.NoSuchContainer:
-            raise HTTPNotFound(request=req)
+            return None
 
         val = meta['system'].get('sys.m2.policy.version', '')
         memcache.set(key, val)
-        if val:
-            req.headers[FORCEVERSIONING_HEADER] = val
+        return val
 
     def get_object_head_resp(self, req):
         storage = self.app.storage
@@ -280,29 +570,106 @@ class ObjectController(BaseObjectController):
             min_chunks = storage_method.ec_nb_data if storage_method.ec else 1
 
             chunks_by_pos = _sort_chunks(chunks, storage_method.ec)
-            for idx, entries in enumerate(chunks_by_pos.items()):
-                if idx != entries[0]:
-                    return HTTPBadRequest(request=req)
-                nb_chunks_ok = 0
-                for entry in entries[1]:
-                    try:
-                        storage.blob_client.chunk_head(
-                            entry['url'], headers=oio_headers)
-                        nb_chunks_ok += 1
-                    except exceptions.OioException:
-                        pass
-                    if nb_chunks_ok >= min_chunks:
-                        break
-                else:
+            for idx, pos in enumerate(chunks_by_pos):
+                if idx != pos:
                     return HTTPBadRequest(request=req)
+            if not self._check_chunks_state(
+                    chunks_by_pos, min_chunks, oio_headers, perfdata):
+                return HTTPBadRequest(request=req)
 
         resp = self.make_object_response(req, metadata)
         return resp
 
+    def _probe_chunk(self, pos, url, oio_headers):
+        """
+        Send a HEAD request to a chunk.
+
+        :returns: a tuple with the position of the chunk, and a boolean
+            telling if the chunk answered.
+        """
+        try:
+            self.app.storage.blob_client.chunk_head(url, headers=oio_headers)
+            return pos, True
+        except exceptions.OioException:
+            return pos, False
+
+    def _check_chunks_state(self, chunks_by_pos, min_chunks, oio_headers,
+                            perfdata=None):
+        """
+        Check, concurrently, that at least `min_chunks` chunks of each
+        position answer to a HEAD request.
+
+        Only `min_chunks` chunks of each position are probed at first,
+        another one is probed each time a chunk does not answer. The check
+        stops as soon as one position cannot reach `min_chunks` anymore.
+        The time taken by each position is saved in `perfdata`,
+        if provided.
+
+        :raises DeadlineReached: if the check takes more than
+            `check_state_timeout` seconds
+        :returns: True if all positions have enough available chunks
+        """
+        if any(len(entries) < min_chunks
+               for entries in chunks_by_pos.values()):
+            return False
+        start = time.time()
+        candidates = {pos: iter(entries)
+                      for pos, entries in chunks_by_pos.items()}
+        inflight = dict.fromkeys(chunks_by_pos, 0)
+        nb_ok = dict.fromkeys(chunks_by_pos, 0)
+        done = {}
+        results = Queue()
+
+        def _probe(pos, url):
+            results.put(self._probe_chunk(pos, url, oio_headers))
+
+        def _spawn_next(pool, pos):
+            for entry in candidates[pos]:
+                inflight[pos] += 1
+                pool.spawn(_probe, pos, entry['url'])
+                return True
+            return False
+
+        timer = Timeout(self.app.check_state_timeout)
+        try:
+            with ContextPool(self.app.check_state_concurrency) as pool:
+                for pos in chunks_by_pos:
+                    for _junk in range(min_chunks):
+                        _spawn_next(pool, pos)
+                while len(done) < len(chunks_by_pos):
+                    pos, available = results.get()
+                    inflight[pos] -= 1
+                    if pos in done:
+                        continue
+                    if available:
+                        nb_ok[pos] += 1
+                        if nb_ok[pos] >= min_chunks:
+                            done[pos] = time.time() - start
+                    elif (not _spawn_next(pool, pos) and
+                            nb_ok[pos] + inflight[pos] < min_chunks):
+                        return False
+        except Timeout as err:
+            if err is not timer:
+                raise
+            raise exceptions.DeadlineReached(
+                'check_state: chunks did not answer in %ss' %
+                self.app.check_state_timeout)
+        finally:
+            timer.cancel()
+            if perfdata is not None:
+                cs_perfdata = perfdata.setdefault('check_state', {})
+                for pos, duration in done.items():
+                    cs_perfdata['pos%d' % pos] = duration
+                cs_perfdata['overall'] = time.time() - start
+        return True
+
     def get_object_fetch_resp(self, req):
         storage = self.app.storage
         if req.headers.get('Range'):
-            ranges = ranges_from_http_header(req.headers.get('Range'))
+            ranges = coalesce_ranges(
+                ranges_from_http_header(req.headers.get('Range')),
+                gap=self.app.range_coalesce_gap,
+                max_ranges=self.app.max_fetched_ranges)
         else:
             ranges = None
         oio_headers = {REQID_HEADER: self.trans_id}
@@ -329,10 +696,21 @@ class ObjectController(BaseObjectController):
                 # To be sure, we must go check the master
                 # in case of desynchronization.
                 force_master = True
-        resp = self.make_object_response(req, metadata, stream)
+        version = metadata.get('version')
+
+        def _refetch(start, stop):
+            return storage.object_fetch(
+                self.account_name, self.container_name, self.object_name,
+                ranges=[(start, stop - 1)], headers=oio_headers,
+                version=version, force_master=force_master,
+                cache=oio_cache, perfdata=perfdata)[1]
+
+        resp = self.make_object_response(req, metadata, stream, ranges,
+                                         refetch=_refetch)
         return resp
 
-    def make_object_response(self, req, metadata, stream=None):
+    def make_object_response(self, req, metadata, stream=None, ranges=None,
+                             refetch=None):
         conditional_etag = None
         if 'X-Backend-Etag-Is-At' in req.headers:
             conditional_etag = metadata.get(
@@ -359,14 +737,18 @@ class ObjectController(BaseObjectController):
         resp.headers['etag'] = hash_
         resp.headers['x-object-sysmeta-version-id'] = metadata['version']
         resp.last_modified = int(metadata['mtime'])
+        length_ = metadata.get('length')
+        if length_ is not None:
+            length_ = int(length_)
         if stream:
             # Whether we are bothered with ranges or not, we wrap the
             # stream in order to handle exceptions.
-            resp.app_iter = StreamRangeIterator(req, stream)
+            # Data of the ranges served out of order is kept in memory
+            # up to a few chunks, the rest is fetched again.
+            resp.app_iter = StreamRangeIterator(
+                req, stream, ranges, length_, refetch=refetch,
+                max_held=4 * self.app.object_chunk_size)
 
-        length_ = metadata.get('length')
-        if length_ is not None:
-            length_ = int(length_)
         resp.content_length = length_
         resp.content_encoding = metadata.get('encoding')
         resp.accept_ranges = 'bytes'
@@ -530,13 +912,40 @@ class ObjectController(BaseObjectController):
         return headers
 
     def _get_auto_policy_from_size(self, content_length):
-        # the default stgpol has an offset of 0 so should always be choose
-        policy = None
-        for (name, offset) in self.app.oio_stgpol:
-            if offset <= content_length:
-                policy = name
+        return self.app.oio_stgpol.select(content_length)
 
-        return policy
+    def _prefetch_upload(self, req, data_source):
+        """
+        Read the beginning of an upload of unknown size (chunked transfer
+        encoding), in order to choose a storage policy.
+
+        :returns: a tuple with the size of the upload (or the number of
+            bytes read, if the upload is bigger than the buffer), and a
+            reader replaying the prefetched data.
+        """
+        chunks = []
+        size = 0
+        limit = self.app.oio_stgpol.buffer_size
+        try:
+            while size < limit:
+                with ChunkReadTimeout(self.app.client_timeout):
+                    chunk = data_source.read(limit - size)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                size += len(chunk)
+        except ChunkReadTimeout as err:
+            self.app.logger.warning(
+                _('ERROR Client read timeout (%ss)'), err.seconds)
+            self.app.logger.increment('client_timeouts')
+            raise HTTPRequestTimeout(request=req)
+        except (IOError, ValueError):
+            req.client_disconnect = True
+            self.app.logger.warning(
+                _('Client disconnected without sending last chunk'))
+            self.app.logger.increment('client_disconnects')
+            raise HTTPClientDisconnect(request=req)
+        return size, PrefetchedReader(data_source, b''.join(chunks))
 
     def _link_object(self, req):
         _, container, obj = req.headers['Oio-Copy-From'].split('/', 2)
@@ -649,6 +1058,7 @@ class ObjectController(BaseObjectController):
         kwargs = {}
         content_type = req.headers.get('content-type', 'octet/stream')
         policy = None
+        auto_policy = False
         container_info = self.container_info(self.account_name,
                                              self.container_name, req)
         if 'X-Oio-Storage-Policy' in req.headers:
@@ -666,9 +1076,17 @@ class ObjectController(BaseObjectController):
                 policy_index = 0
             if policy_index != 0:
                 policy = self.app.POLICIES.get_by_index(policy_index).name
-            else:
-                content_length = int(req.headers.get('content-length', 0))
+            elif self.app.oio_stgpol:
+                content_length = req.headers.get('content-length')
+                if content_length is not None:
+                    content_length = int(content_length)
+                elif req.is_chunked:
+                    content_length, data_source = self._prefetch_upload(
+                        req, data_source)
+                else:
+                    content_length = 0
                 policy = self._get_auto_policy_from_size(content_length)
+                auto_policy = policy is not None
 
         ct_props = {'properties': {}, 'system': {}}
         metadata = self.load_object_metadata(headers)
@@ -694,6 +1112,7 @@ class ObjectController(BaseObjectController):
             if bname and bname.endswith(MULTIUPLOAD_SUFFIX):
                 bname = bname[:-len(MULTIUPLOAD_SUFFIX)]
             ct_props['system'][BUCKET_NAME_PROP] = bname
+        start = time.time()
         try:
             _chunks, _size, checksum, _meta = self._object_create(
                 self.account_name, self.container_name,
@@ -747,6 +1166,10 @@ class ObjectController(BaseObjectController):
                 {'path': req.path})
             raise HTTPInternalServerError(request=req)
 
+        if auto_policy:
+            self.app.oio_stgpol.record(policy, _size, time.time() - start)
+            self.app.recon_stats.maybe_dump()
+
         last_modified = int(_meta.get('mtime', math.ceil(time.time())))
 
         # FIXME(FVE): if \x10 character in object name, decode version
@@ -14,16 +14,23 @@
 # limitations under the License.
 
 import multiprocessing
+import time
+
+from eventlet import sleep
+
 import swift.common.utils
 import swift.proxy.server
 from swift.common import request_helpers, storage_policy
+from swift.common.oio_utils import AutoStoragePolicies, SharedCounters
 from swift.common.ring import FakeRing
 from swift.common.storage_policy import OIO_POLICIES
+from swift.common.swob import HTTPServiceUnavailable, Request
 from swift.proxy.controllers.oio.account import AccountController
 from swift.proxy.controllers.oio.container import ContainerController
 from swift.proxy.controllers.oio.obj import ObjectControllerRouter
 from swift.proxy.server import Application as SwiftApplication
-from swift.common.utils import config_true_value
+from swift.common.utils import close_if_possible, config_auto_int_value, \
+    config_true_value, LRUCache, ReconStatsDumper
 
 from oio import ObjectStorageApi
 
@@ -59,15 +66,45 @@ class Application(SwiftApplication):
                     for k, v in conf.items()
                     if k.startswith("sds_")}
 
-        self.oio_stgpol = []
-        if 'auto_storage_policies' in conf:
-            for elem in conf['auto_storage_policies'].split(','):
-                if ':' in elem:
-                    name, offset = elem.split(':')
-                    self.oio_stgpol.append((name, int(offset)))
-                else:
-                    self.oio_stgpol.append((elem, 0))
-            self.oio_stgpol.sort(key=lambda x: x[1])
+        self.oio_stgpol = AutoStoragePolicies(
+            conf.get('auto_storage_policies'),
+            buffer_size=int(conf.get('auto_storage_policies_buffer_size',
+                                     1048576)))
+        for name, min_size in self.oio_stgpol:
+            if min_size > self.oio_stgpol.buffer_size:
+                self.logger.warning(
+                    'Storage policy %s will not be chosen for uploads with '
+                    'chunked transfer encoding, its minimum size (%d) is '
+                    'above auto_storage_policies_buffer_size (%d)',
+                    name, min_size, self.oio_stgpol.buffer_size)
+        # Statistics of this worker, saved periodically in the recon cache
+        self.recon_stats = ReconStatsDumper(
+            conf.get('recon_cache_path', '/var/cache/swift'),
+            float(conf.get('recon_interval', 60.0)), self.logger)
+        if self.oio_stgpol:
+            self.recon_stats.register('auto_storage_policies',
+                                      lambda: self.oio_stgpol.stats)
+
+        # Admission control: maximum number of requests in progress
+        # in all workers (0 means no limit), globally and for each verb.
+        self.max_concurrent_requests, self.max_concurrent_requests_per_verb = \
+            parse_admission_limits(conf)
+        # Counters shared by all workers, allocated by global_conf_callback
+        # when a limit is configured. The value was put in a list so it
+        # could get past paste.
+        if conf.get('oioswift_counters') and (
+                self.max_concurrent_requests or
+                any(self.max_concurrent_requests_per_verb.values())):
+            self.shared_counters = conf['oioswift_counters'][0]
+            self.recon_stats.register('counters', self.shared_counters.stats)
+        else:
+            self.shared_counters = None
+        # Time a request waits for a slot before being rejected
+        # with '503 Service Unavailable'.
+        self.admission_queue_timeout = \
+            float(conf.get('admission_queue_timeout', 0.0))
+        self.admission_queue_interval = \
+            float(conf.get('admission_queue_interval', 0.01))
 
         policies = []
         if 'oio_storage_policies' in conf:
@@ -100,12 +137,139 @@ class Application(SwiftApplication):
             config_true_value(conf.get('delete_slo_parts', False))
         self.check_state = \
             config_true_value(conf.get('check_state', False))
+        # Number of chunks probed at the same time when checking the
+        # state of an object, and time allowed for the whole check.
+        self.check_state_concurrency = \
+            int(conf.get('check_state_concurrency', 10))
+        self.check_state_timeout = \
+            float(conf.get('check_state_timeout', 5.0))
+        # Versioning mode of existing containers, cached by each worker
+        # in front of memcache (disabled by default). Changes made through
+        # another worker are noticed after at most versioning_cache_ttl
+        # seconds.
+        versioning_cache_ttl = float(conf.get('versioning_cache_ttl', 0.0))
+        if versioning_cache_ttl > 0:
+            self.versioning_cache = LRUCache(
+                maxsize=int(conf.get('versioning_cache_size', 1000)),
+                maxtime=versioning_cache_ttl)
+        else:
+            self.versioning_cache = None
+        # Byte ranges of a GET request are fetched from the backend in one
+        # pass: ranges at most range_coalesce_gap bytes apart are merged,
+        # and at most max_fetched_ranges ranges are asked (0: no limit).
+        self.range_coalesce_gap = int(conf.get('range_coalesce_gap', 0))
+        self.max_fetched_ranges = int(conf.get('max_fetched_ranges', 0))
+        # Cursors of paginated container listings: each worker fetches
+        # the next page in the background, and keeps it at most
+        # listing_prefetch_ttl seconds, waiting for the client to ask.
+        listing_prefetch_ttl = float(conf.get('listing_prefetch_ttl', 0.0))
+        if listing_prefetch_ttl > 0:
+            self.listing_cache = LRUCache(
+                maxsize=int(conf.get('listing_prefetch_cache_size', 100)),
+                maxtime=listing_prefetch_ttl)
+        else:
+            self.listing_cache = None
+
+    def get_controller(self, req):
+        controller, path_parts = \
+            super(Application, self).get_controller(req)
+        if controller is not None:
+            req.environ['oio.backend'] = controller.server_type.lower()
+        return controller, path_parts
+
+    def admit_request(self, req):
+        """
+        Count the request as in progress, waiting at most
+        `admission_queue_timeout` seconds if there are already too many
+        requests in progress in all workers.
+
+        :returns: True if the request has been admitted
+        """
+        max_verb_requests = \
+            self.max_concurrent_requests_per_verb.get(req.method, 0)
+        deadline = time.time() + self.admission_queue_timeout
+        while not self.shared_counters.acquire(
+                req.method, self.max_concurrent_requests, max_verb_requests):
+            if time.time() >= deadline:
+                return False
+            sleep(self.admission_queue_interval)
+        return True
+
+    def __call__(self, env, start_response):
+        if self.shared_counters is None:
+            return super(Application, self).__call__(env, start_response)
+        req = Request(env)
+        if not self.admit_request(req):
+            self.logger.set_statsd_prefix('proxy-server')
+            self.logger.increment('admission.rejected')
+            resp = HTTPServiceUnavailable(
+                request=req, headers={'Retry-After': '1'},
+                body='Too many requests in progress')
+            return resp(env, start_response)
+        # The request is in progress until the response body
+        # has been sent (or the client went away).
+        try:
+            app_iter = super(Application, self).__call__(env, start_response)
+        except BaseException:
+            self.shared_counters.release(req.method)
+            raise
+        return ReleasingIterable(
+            app_iter, lambda: self.shared_counters.release(req.method))
+
+    def handle_request(self, req):
+        resp = super(Application, self).handle_request(req)
+        if self.shared_counters is None:
+            return resp
+        backend = req.environ.get('oio.backend')
+        if backend:
+            self.shared_counters.record_backend(
+                backend, getattr(resp, 'status_int', 200) >= 500)
+        self.recon_stats.maybe_dump()
+        return resp
+
+
+class ReleasingIterable(object):
+    """
+    Wrap a WSGI iterable, and call `release` once, when it is closed.
+    """
+
+    def __init__(self, iterable, release):
+        self.iterable = iterable
+        self.release = release
+
+    def __iter__(self):
+        return iter(self.iterable)
+
+    def close(self):
+        try:
+            close_if_possible(self.iterable)
+        finally:
+            release, self.release = self.release, None
+            if release is not None:
+                release()
+
+
+def parse_admission_limits(conf):
+    """
+    Read the maximum number of requests in progress in all workers
+    (0 means no limit), globally and for each verb.
+
+    :returns: a tuple with the global limit and a dict of limits per verb
+    """
+    max_requests = int(conf.get('max_concurrent_requests', 0))
+    max_requests_per_verb = dict()
+    for elem in conf.get('max_concurrent_requests_per_verb', '').split(','):
+        if ':' in elem:
+            verb, limit = elem.split(':')
+            max_requests_per_verb[verb.strip().upper()] = int(limit)
+    return max_requests, max_requests_per_verb
 
 
 def global_conf_callback(preloaded_app_conf, global_conf):
     """
     Callback for swift.common.wsgi.run_wsgi during the global_conf
-    creation so that we can add our shared memory manager.
+    creation so that we can add our shared memory counters, used to
+    limit the number of concurrent requests across all workers.
 
     :param preloaded_app_conf: The preloaded conf for the WSGI app.
                                This conf instance will go away, so
@@ -116,9 +280,16 @@ def global_conf_callback(preloaded_app_conf, global_conf):
                         subprocesses are forked, so can be useful to
                         set up semaphores, shared memory, etc.
     """
-    global_conf['oioswift_counters'] = {
-        'current_requests': multiprocessing.Value('i', 0),
-    }
+    max_requests, max_requests_per_verb = \
+        parse_admission_limits(preloaded_app_conf)
+    if not max_requests and not any(max_requests_per_verb.values()):
+        return
+    workers = config_auto_int_value(preloaded_app_conf.get('workers'),
+                                    multiprocessing.cpu_count())
+    # Leave room for workers started while old ones are still exiting.
+    # Have to put the value in a list so it can get past paste.
+    global_conf['oioswift_counters'] = [
+        SharedCounters(slots=max(workers, 1) * 2)]
 
 
 def app_factory(global_conf, **local_conf):
@@ -13,12 +13,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import time
+import unittest
+
+import mock
+
 from swift.common import swob
 from swift.common.swob import Request
 from swift.common.utils import json
 from swift.common.middleware.s3api.bucket_db import get_bucket_db, \
-    BucketDbWrapper
+    BucketDbWrapper, BucketOwnerCache, DummyBucketDb
 from swift.common.middleware.s3api.etree import fromstring
+from test.unit import debug_logger
 from test.unit.common.middleware.s3api import S3ApiTestCase
 
 
@@ -170,3 +176,73 @@ class TestSwift3BucketDb(S3ApiTestCase):
         elem = fromstring(body, "ListBucketResult")
         self.assertEqual(status.split()[0], '200')
         self.assertEqual(elem.find('Contents').find('Key').text, "expected")
+
+
+class TestBucketOwnerCache(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = debug_logger()
+        self.bucket_db = DummyBucketDb()
+        self.bucket_db.get_owner = mock.Mock(
+            wraps=self.bucket_db.get_owner)
+        self.cache = BucketOwnerCache(
+            size=10, ttl=30.0, negative_ttl=2.0, logger=self.logger)
+
+    def _wrapper(self):
+        """Get a new wrapper, as if it was a new request."""
+        return BucketDbWrapper(self.bucket_db, shared_cache=self.cache)
+
+    def test_get_owner(self):
+        self.bucket_db.set_owner('bucket', 'AUTH_test')
+        self.assertEqual('AUTH_test', self._wrapper().get_owner('bucket'))
+        self.assertEqual('AUTH_test', self._wrapper().get_owner('bucket'))
+        self.assertEqual(1, self.bucket_db.get_owner.call_count)
+        self.assertEqual({'bucket_db.cache.miss': 1,
+                          'bucket_db.cache.hit': 1},
+                         self.logger.get_increment_counts())
+
+        # Ownership changed through another worker
+        self.bucket_db.set_owner('bucket', 'AUTH_test2')
+        self.assertEqual('AUTH_test', self._wrapper().get_owner('bucket'))
+        with mock.patch('time.time', return_value=time.time() + 31):
+            self.assertEqual('AUTH_test2',
+                             self._wrapper().get_owner('bucket'))
+        self.assertEqual(2, self.bucket_db.get_owner.call_count)
+
+    def test_get_owner_missing(self):
+        self.assertIsNone(self._wrapper().get_owner('bucket'))
+        self.assertIsNone(self._wrapper().get_owner('bucket'))
+        self.assertEqual(1, self.bucket_db.get_owner.call_count)
+        self.assertEqual({'bucket_db.cache.miss': 1,
+                          'bucket_db.cache.negative_hit': 1},
+                         self.logger.get_increment_counts())
+
+        # Bucket created through another worker
+        self.bucket_db.set_owner('bucket', 'AUTH_test')
+        self.assertIsNone(self._wrapper().get_owner('bucket'))
+        with mock.patch('time.time', return_value=time.time() + 3):
+            self.assertEqual('AUTH_test',
+                             self._wrapper().get_owner('bucket'))
+
+    def test_get_owner_no_negative_cache(self):
+        self.cache = BucketOwnerCache(size=10, ttl=30.0, logger=self.logger)
+        self.assertIsNone(self._wrapper().get_owner('bucket'))
+        self.assertIsNone(self._wrapper().get_owner('bucket'))
+        self.assertEqual(2, self.bucket_db.get_owner.call_count)
+        self.assertEqual({'bucket_db.cache.miss': 2},
+                         self.logger.get_increment_counts())
+
+    def test_invalidate(self):
+        self.assertIsNone(self._wrapper().get_owner('bucket'))
+        self.assertTrue(self._wrapper().reserve('bucket', 'AUTH_test'))
+        self.bucket_db.get_owner.reset_mock()
+        self.assertEqual('AUTH_test', self._wrapper().get_owner('bucket'))
+        self.assertEqual(1, self.bucket_db.get_owner.call_count)
+
+        self.assertTrue(self._wrapper().set_owner('bucket', 'AUTH_test'))
+        self.assertEqual('AUTH_test', self._wrapper().get_owner('bucket'))
+        self.assertEqual(2, self.bucket_db.get_owner.call_count)
+
+        self._wrapper().release('bucket')
+        self.assertIsNone(self._wrapper().get_owner('bucket'))
+        self.assertEqual(3, self.bucket_db.get_owner.call_count)
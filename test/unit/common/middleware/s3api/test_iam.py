@@ -14,12 +14,13 @@
 # limitations under the License.
 
 import json
+import time
 from unittest import TestCase
-from mock import MagicMock
+from mock import MagicMock, patch
 
 from swift.common.middleware.s3api.exception import IAMException
-from swift.common.middleware.s3api.iam import IamResource, IamRulesMatcher, \
-    EXPLICIT_DENY, EXPLICIT_ALLOW
+from swift.common.middleware.s3api.iam import IamMiddleware, IamResource, \
+    IamRulesMatcher, EXPLICIT_DENY, EXPLICIT_ALLOW
 
 
 class TestS3Iam(TestCase):
@@ -269,3 +270,132 @@ class TestS3Iam(TestCase):
             ('ALLOW', 'AllowListingOfUserFolder'),
             check(bucket_res, "s3:ListBucket",
                   MagicMock(params={'prefix': 'home/David/foo/'})))
+
+    def test_string_action_and_resource(self):
+        rules = {
+            "Statement": [
+                {
+                    "Sid": "ReadOnly",
+                    "Action": "s3:Get*",
+                    "Effect": "Allow",
+                    "Resource": "arn:aws:s3:::bucket/*"
+                }
+            ]
+        }
+        check = IamRulesMatcher(rules)
+        self.assertEqual((EXPLICIT_ALLOW, 'ReadOnly'),
+                         check(IamResource("bucket/obj"), "s3:GetObject"))
+        self.assertEqual((None, None),
+                         check(IamResource("bucket/obj"), "s3:PutObject"))
+        self.assertEqual((None, None),
+                         check(IamResource("other/obj"), "s3:GetObject"))
+
+    def test_statement_condition_not_implemented(self):
+        rules = {
+            "Statement": [
+                {
+                    "Sid": "AllowFromLocalhost",
+                    "Action": ["s3:*"],
+                    "Effect": "Allow",
+                    "Resource": ["*"],
+                    "Condition": {
+                        "IpAddress": {"aws:SourceIp": ["127.0.0.1"]}
+                    }
+                },
+                {
+                    "Sid": "DenyUserAgent",
+                    "Action": ["s3:PutObject"],
+                    "Effect": "Deny",
+                    "Resource": ["*"],
+                    "Condition": {
+                        "StringLike": {"aws:UserAgent": ["curl/*"]}
+                    }
+                }
+            ]
+        }
+        check = IamRulesMatcher(rules)
+        req = MagicMock(params={})
+        # Unverifiable conditions are not satisfied in 'allow' statements,
+        # and satisfied in 'deny' statements.
+        self.assertEqual((None, None),
+                         check(IamResource("bucket"), "s3:ListBucket", req))
+        self.assertEqual((EXPLICIT_DENY, 'DenyUserAgent'),
+                         check(IamResource("bucket/obj"), "s3:PutObject",
+                               req))
+
+
+class FakeIamMiddleware(IamMiddleware):
+
+    def __init__(self, app, conf):
+        super(FakeIamMiddleware, self).__init__(app, conf)
+        self.rules = dict()
+        self.stamps = dict()
+        self.loads = 0
+
+    def load_rules_for_user(self, account, user_id):
+        self.loads += 1
+        return self.rules.get((account, user_id))
+
+    def get_rules_stamp(self, account, user_id):
+        return self.stamps.get((account, user_id))
+
+
+class TestIamMiddleware(TestCase):
+
+    rules = {
+        "Statement": [
+            {
+                "Sid": "FullAccess",
+                "Action": ["s3:*"],
+                "Effect": "Allow",
+                "Resource": ["*"]
+            }
+        ]
+    }
+
+    def setUp(self):
+        self.iam = FakeIamMiddleware(None, {'cache_ttl': '30'})
+        self.iam.rules[('AUTH_test', 'test:tester')] = self.rules
+        self.req = MagicMock(account='AUTH_test', user_id='test:tester')
+
+    def test_rules_callback_cache(self):
+        matcher = self.iam.rules_callback(self.req)
+        self.assertIsInstance(matcher, IamRulesMatcher)
+        self.assertIs(matcher, self.iam.rules_callback(self.req))
+        self.assertEqual(1, self.iam.loads)
+
+        # No version stamp, rules are reloaded when the entry expires
+        with patch('time.time', return_value=time.time() + 31):
+            matcher2 = self.iam.rules_callback(self.req)
+        self.assertIsNot(matcher, matcher2)
+        self.assertEqual(2, self.iam.loads)
+
+    def test_rules_callback_stamp(self):
+        self.iam.stamps[('AUTH_test', 'test:tester')] = b'1'
+        matcher = self.iam.rules_callback(self.req)
+        self.assertEqual(1, self.iam.loads)
+
+        # The stamp did not change, keep the compiled rules
+        now = time.time()
+        with patch('time.time', return_value=now + 31):
+            self.assertIs(matcher, self.iam.rules_callback(self.req))
+        self.assertEqual(1, self.iam.loads)
+
+        # The rules changed
+        self.iam.rules[('AUTH_test', 'test:tester')] = {"Statement": []}
+        self.iam.stamps[('AUTH_test', 'test:tester')] = b'2'
+        with patch('time.time', return_value=now + 32):
+            # The stamp has been checked recently
+            self.assertIs(matcher, self.iam.rules_callback(self.req))
+        with patch('time.time', return_value=now + 62):
+            matcher2 = self.iam.rules_callback(self.req)
+        self.assertIsNot(matcher, matcher2)
+        self.assertEqual(2, self.iam.loads)
+        self.assertEqual((None, None),
+                         matcher2(IamResource("bucket"), "s3:ListBucket"))
+
+    def test_rules_callback_no_rules(self):
+        req = MagicMock(account='AUTH_test', user_id='test:other')
+        self.assertIsNone(self.iam.rules_callback(req))
+        self.assertIsNone(self.iam.rules_callback(req))
+        self.assertEqual(1, self.iam.loads)
@@ -160,6 +160,29 @@ class TestCacheMiddleware(unittest.TestCase):
         self.assertEqual(
             app.memcache._client_cache['6.7.8.9:10'].max_size, 5)
 
+    def test_conf_serializer(self):
+        with mock.patch.object(memcache, 'ConfigParser', EmptyConfigParser):
+            app = memcache.MemcacheMiddleware(FakeApp(), {})
+        self.assertEqual('json', app.memcache._serializer)
+        with mock.patch.object(memcache, 'ConfigParser', EmptyConfigParser), \
+                mock.patch('swift.common.memcached.msgpack', object()):
+            app = memcache.MemcacheMiddleware(
+                FakeApp(), {'memcache_serializer': 'msgpack'})
+        self.assertEqual('msgpack', app.memcache._serializer)
+
+    def test_conf_near_cache(self):
+        with mock.patch.object(memcache, 'ConfigParser', EmptyConfigParser):
+            app = memcache.MemcacheMiddleware(FakeApp(), {})
+        self.assertIsNone(app.memcache._near_cache)
+        with mock.patch.object(memcache, 'ConfigParser', EmptyConfigParser):
+            app = memcache.MemcacheMiddleware(
+                FakeApp(), {'near_cache_ttl': '2', 'near_cache_size': '10',
+                            'near_cache_stale_ttl': '30',
+                            'near_cache_prefixes': 'container/'})
+        self.assertEqual(10, app.memcache._near_cache.maxsize)
+        self.assertEqual(32, app.memcache._near_cache.maxtime)
+        self.assertEqual(('container/',), app.memcache._near_cache_prefixes)
+
     def test_conf_extra_no_section(self):
         with mock.patch.object(memcache, 'ConfigParser',
                                get_config_parser(section='foobar')):
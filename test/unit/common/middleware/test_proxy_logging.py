@@ -13,7 +13,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
 import mock
+import os
+import shutil
+import tempfile
+import time
 import unittest
 from io import BytesIO
 from logging.handlers import SysLogHandler
@@ -1119,3 +1124,120 @@ class TestProxyLogging(unittest.TestCase):
             b''.join(resp)
         log_parts = self._log_parts(app)
         self.assertEqual(log_parts[20], '1')
+
+
+class TestPerfdataStats(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.perfdata = {'meta2': 0.01,
+                         'rawx': {'http://127.0.0.1:6201/AAAA': 0.1,
+                                  'overall': 0.2}}
+
+        def perfdata_app(env, start_response):
+            for key, value in self.perfdata.items():
+                env['swift.perfdata'][key] = value
+            return FakeApp()(env, start_response)
+        self.fake_app = perfdata_app
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def _call(self, app, user_agent='curl'):
+        req = Request.blank('/v1/a/c/o', environ={'REQUEST_METHOD': 'GET'},
+                            headers={'User-Agent': user_agent})
+        b''.join(app(req.environ, start_response))
+
+    def test_perfdata_stats(self):
+        app = proxy_logging.ProxyLoggingMiddleware(self.fake_app, {
+            'perfdata_stats': 'true',
+            'recon_cache_path': self.tempdir,
+            'log_msg_template': '{method} {perfdata}'})
+        app.access_logger = FakeLogger()
+        for _junk in range(3):
+            self._call(app)
+        # Performance data is not logged, perfdata is disabled
+        self.assertEqual(['GET', '-'], app.access_logger.get_lines_for_level(
+            'info')[0].split(' '))
+        stats = app.perfdata_stats.get_stats()
+        self.assertEqual({'meta2', 'rawx.http', 'rawx.overall'}, set(stats))
+        self.assertEqual(3, stats['meta2']['count'])
+        self.assertAlmostEqual(0.01, stats['meta2']['p99'], delta=0.01 / 8)
+        self.assertFalse(app.access_logger.get_increment_counts())
+        self.assertFalse(os.path.exists(
+            os.path.join(self.tempdir, 'proxy.recon')))
+
+        with mock.patch('time.time', return_value=time.time() + 61), \
+                mock.patch('os.getpid', return_value=1234):
+            self._call(app)
+        with open(os.path.join(self.tempdir, 'proxy.recon')) as recon:
+            dumped = json.load(recon)['perfdata']['1234']
+        self.assertEqual({'meta2', 'rawx.http', 'rawx.overall'},
+                         set(dumped))
+        self.assertEqual(4, dumped['rawx.http']['count'])
+        self.assertAlmostEqual(0.1, dumped['rawx.http']['p50'],
+                               delta=0.1 / 8)
+        timings = {call[0][0]: call[0][1]
+                   for call in app.access_logger.log_dict['timing']}
+        self.assertAlmostEqual(200, timings['perfdata.rawx.overall.p90'],
+                               delta=200 / 8)
+        self.assertIn('perfdata.meta2.p50', timings)
+        update_stats = {call[0][0]: call[0][1]
+                        for call in app.access_logger.log_dict['update_stats']}
+        self.assertEqual(4, update_stats['perfdata.meta2.count'])
+        # Histograms are reset after each flush
+        self.assertEqual({}, app.perfdata_stats.get_stats())
+
+    def test_perfdata_stats_and_log(self):
+        app = proxy_logging.ProxyLoggingMiddleware(self.fake_app, {
+            'perfdata': 'true',
+            'perfdata_user_agent_0': '^aws-cli',
+            'perfdata_stats': 'true',
+            'recon_cache_path': self.tempdir,
+            'log_msg_template': '{perfdata}'})
+        app.access_logger = FakeLogger()
+        self._call(app)
+        self._call(app, user_agent='aws-cli/1.18')
+        lines = app.access_logger.get_lines_for_level('info')
+        self.assertEqual('-', lines[0])
+        self.assertEqual('PERFDATA...meta2:0.0100...rawx.http:0.1000...'
+                         'rawx.overall:0.2000', lines[1])
+        self.assertEqual(2, app.perfdata_stats.get_stats()['meta2']['count'])
+
+    def test_perfdata_stats_shared(self):
+        conf = {'perfdata_stats': 'true', 'recon_cache_path': self.tempdir}
+        # Like the two proxy-logging instances of the default pipeline
+        inner = proxy_logging.ProxyLoggingMiddleware(self.fake_app, conf)
+        outer = proxy_logging.ProxyLoggingMiddleware(inner, conf)
+        outer.access_logger = FakeLogger()
+        inner.access_logger = FakeLogger()
+        self.assertIs(outer.perfdata_stats, inner.perfdata_stats)
+        self._call(outer)
+        self._call(inner)
+        self.assertEqual(2, inner.perfdata_stats.get_stats()['meta2']['count'])
+
+        with mock.patch('time.time', return_value=time.time() + 61), \
+                mock.patch('os.getpid', return_value=1234):
+            self._call(outer)
+            self._call(inner)
+        with open(os.path.join(self.tempdir, 'proxy.recon')) as recon:
+            dumped = json.load(recon)['perfdata']
+        self.assertEqual(['1234'], list(dumped))
+        self.assertEqual(3, dumped['1234']['meta2']['count'])
+
+        # Flushed once to statsd
+        def perfdata_counts(app):
+            return [call[0][0]
+                    for call in app.access_logger.log_dict['update_stats']
+                    if call[0][0].startswith('perfdata.')]
+        self.assertEqual(3, len(perfdata_counts(outer)))
+        self.assertEqual([], perfdata_counts(inner))
+        self.assertEqual(1, inner.perfdata_stats.get_stats()['meta2']['count'])
+
+    def test_perfdata_stats_max_keys(self):
+        stats = proxy_logging.PerfdataStats(
+            FakeLogger(), self.tempdir, 60, max_keys=2)
+        stats.record({'a': 1.0, 'b': {'c': 2.0}})
+        stats.record({'d': 1.0, 'a': 1.0})
+        self.assertEqual({'a', 'b.c'}, set(stats.get_stats()))
+        self.assertEqual(2, stats.get_stats()['a']['count'])
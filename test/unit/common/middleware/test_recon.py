@@ -199,6 +199,13 @@ class FakeRecon(object):
     def fake_time(self):
         return {'timetest': "1"}
 
+    def fake_proxy(self, recon_type):
+        self.fake_proxy_rtype = recon_type
+        return {'proxytest': "1"}
+
+    def fake_group_commit(self):
+        return {'groupcommittest': "1"}
+
     def nocontent(self):
         return None
 
@@ -1098,6 +1105,33 @@ class TestReconSuccess(TestCase):
                             '/var/cache/swift/drive.recon'), {})])
         self.assertEqual(rv, {'drive_audit_errors': 7})
 
+    def test_get_proxy_info(self):
+        from_cache_response = {'auto_storage_policies': {
+            '1234': {'EC': {'objects': 1, 'bytes': 3000000,
+                            'sizes': {'4194304': 1},
+                            'throughputs': {'33554432': 1}}}}}
+        self.fakecache.fakeout = from_cache_response
+        rv = self.app.get_proxy_info('auto_storage_policies')
+        self.assertEqual(self.fakecache.fakeout_calls,
+                         [((['auto_storage_policies'],
+                            '/var/cache/swift/proxy.recon'), {})])
+        self.assertEqual(rv, from_cache_response)
+        self.assertIsNone(self.app.get_proxy_info('whatever'))
+
+    def test_get_group_commit_info(self):
+        from_cache_response = {'object_group_commit': {
+            '1234': {'0': {'sda1': {
+                'batch_sizes': {'count': 2, 'sum': 6, 'max': 3,
+                                'buckets': {'3': 2}},
+                'latencies': {'count': 6, 'sum': 0.03, 'max': 0.006,
+                              'buckets': {'4096': 6}}}}}}}
+        self.fakecache.fakeout = from_cache_response
+        rv = self.app.get_group_commit_info()
+        self.assertEqual(self.fakecache.fakeout_calls,
+                         [((['object_group_commit'],
+                            '/var/cache/swift/object.recon'), {})])
+        self.assertEqual(rv, from_cache_response)
+
     def test_get_time(self):
         def fake_time():
             return 1430000000.0
@@ -1139,6 +1173,8 @@ class TestReconMiddleware(unittest.TestCase):
         self.app.get_socket_info = self.frecon.fake_sockstat
         self.app.get_driveaudit_error = self.frecon.fake_driveaudit
         self.app.get_time = self.frecon.fake_time
+        self.app.get_proxy_info = self.frecon.fake_proxy
+        self.app.get_group_commit_info = self.frecon.fake_group_commit
 
     def test_recon_get_mem(self):
         get_mem_resp = [b'{"memtest": "1"}']
@@ -1374,6 +1410,31 @@ class TestReconMiddleware(unittest.TestCase):
         resp = self.app(req.environ, start_response)
         self.assertEqual(resp, get_driveaudit_resp)
 
+    def test_recon_get_group_commit(self):
+        get_group_commit_resp = [b'{"groupcommittest": "1"}']
+        req = Request.blank('/recon/group_commit',
+                            environ={'REQUEST_METHOD': 'GET'})
+        resp = self.app(req.environ, start_response)
+        self.assertEqual(resp, get_group_commit_resp)
+
+    def test_recon_get_proxy(self):
+        get_proxy_resp = [b'{"proxytest": "1"}']
+        req = Request.blank('/recon/proxy/auto_storage_policies',
+                            environ={'REQUEST_METHOD': 'GET'})
+        resp = self.app(req.environ, start_response)
+        self.assertEqual(resp, get_proxy_resp)
+        self.assertEqual(self.frecon.fake_proxy_rtype,
+                         'auto_storage_policies')
+        req = Request.blank('/recon/proxy/perfdata',
+                            environ={'REQUEST_METHOD': 'GET'})
+        resp = self.app(req.environ, start_response)
+        self.assertEqual(resp, get_proxy_resp)
+        self.assertEqual(self.frecon.fake_proxy_rtype, 'perfdata')
+        req = Request.blank('/recon/proxy/whatever',
+                            environ={'REQUEST_METHOD': 'GET'})
+        resp = self.app(req.environ, start_response)
+        self.assertEqual(resp, [b'Invalid path: /recon/proxy/whatever'])
+
     def test_recon_get_time(self):
         get_time_resp = [b'{"timetest": "1"}']
         req = Request.blank('/recon/time',
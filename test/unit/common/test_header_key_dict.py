@@ -14,10 +14,31 @@
 # limitations under the License.
 
 import unittest
-from swift.common.header_key_dict import HeaderKeyDict
+from swift.common.header_key_dict import HeaderKeyDict, NormalizationCache
 from swift.common.swob import bytes_to_wsgi
 
 
+class TestNormalizationCache(unittest.TestCase):
+    def test_cache(self):
+        calls = []
+
+        def upper(name):
+            calls.append(name)
+            return name.upper()
+
+        cache = NormalizationCache(upper, maxsize=2)
+        self.assertEqual('A', cache['a'])
+        self.assertEqual('A', cache['a'])
+        self.assertEqual('B', cache['b'])
+        self.assertEqual(['a', 'b'], calls)
+        self.assertEqual({'a': 'A', 'b': 'B'}, cache)
+        # full: forget everything rather than growing without bound
+        self.assertEqual('C', cache['c'])
+        self.assertEqual({'c': 'C'}, cache)
+        self.assertEqual('A', cache['a'])
+        self.assertEqual(['a', 'b', 'c', 'a'], calls)
+
+
 class TestHeaderKeyDict(unittest.TestCase):
     def test_case_insensitive(self):
         headers = HeaderKeyDict()
@@ -20,6 +20,7 @@ from collections import defaultdict
 import errno
 from hashlib import md5
 import io
+import json
 import logging
 import six
 import socket
@@ -34,6 +35,10 @@ from eventlet import GreenPool, sleep, Queue
 from eventlet.pools import Pool
 
 from swift.common import memcached
+from swift.common.memcached import md5hash
+from swift.common.swob import Request
+from swift.proxy.controllers.base import get_container_info, \
+    headers_to_container_info
 from mock import patch, MagicMock
 from test.unit import debug_logger
 
@@ -612,6 +617,200 @@ class TestMemcached(unittest.TestCase):
         self.assertEqual(memcache_client.get('some_key0'), [7, 8, 9])
         self.assertIn(key, mock2.cache)
 
+    def test_multi_scatter(self):
+        memcache_client = memcached.MemcacheRing(['1.2.3.4:11211',
+                                                  '1.2.3.5:11211'],
+                                                 logger=self.logger)
+        mock1 = MockMemcached()
+        mock2 = MockMemcached()
+        memcache_client._client_cache['1.2.3.4:11211'] = MockedMemcachePool(
+            [(mock1, mock1)] * 2)
+        memcache_client._client_cache['1.2.3.5:11211'] = MockedMemcachePool(
+            [(mock2, mock2)] * 2)
+
+        # Without server_key, each key goes to the server it would be
+        # sent to by set(): 'some_key0' to 1.2.3.5:11211 and 'some_key1'
+        # to 1.2.3.4:11211
+        memcache_client.set_multi(
+            {'some_key0': [1, 2, 3], 'some_key1': [4, 5, 6]}, time=20)
+        key0 = md5(b'some_key0').hexdigest().encode('ascii')
+        key1 = md5(b'some_key1').hexdigest().encode('ascii')
+        self.assertEqual([key1], list(mock1.cache))
+        self.assertEqual([key0], list(mock2.cache))
+        self.assertEqual(b'20', mock2.cache[key0][1])
+        self.assertEqual(memcache_client.get('some_key0'), [1, 2, 3])
+        self.assertEqual(memcache_client.get('some_key1'), [4, 5, 6])
+
+        memcache_client.set('some_key2', [7, 8, 9])
+        key2 = md5(b'some_key2').hexdigest().encode('ascii')
+        self.assertIn(key2, mock1.cache)
+        with patch.object(mock1, 'sendall', wraps=mock1.sendall) as send1, \
+                patch.object(mock2, 'sendall', wraps=mock2.sendall) as send2:
+            self.assertEqual(
+                memcache_client.get_multi(
+                    ('some_key2', 'some_key0', 'not_exists', 'some_key1')),
+                [[7, 8, 9], [1, 2, 3], None, [4, 5, 6]])
+        # One request per server
+        self.assertEqual(1, send1.call_count)
+        self.assertEqual(1, send2.call_count)
+        self.assertEqual([], memcache_client.get_multi([]))
+
+        # A server is down: its keys are missing, like with get()
+        mock2.down = True
+        self.assertEqual(
+            memcache_client.get_multi(('some_key0', 'some_key1')),
+            [None, [4, 5, 6]])
+        self.assertEqual(['Error talking to memcached: 1.2.3.5:11211: '],
+                         [line.split('\n')[0] for line in
+                          self.logger.get_lines_for_level('error')])
+
+    def test_serializer(self):
+        self.assertRaises(ValueError, memcached.MemcacheRing,
+                          ['1.2.3.4:11211'], serializer='yaml')
+        with patch('swift.common.memcached.msgpack', None):
+            self.assertRaises(ValueError, memcached.MemcacheRing,
+                              ['1.2.3.4:11211'], serializer='msgpack')
+
+    def test_serializer_msgpack(self):
+        class FakeMsgpack(object):
+            # Same as JSON, with a recognizable prefix
+            def packb(self, value, use_bin_type=False):
+                return b'MP' + json.dumps(value).encode('ascii')
+
+            def unpackb(self, value, raw=True):
+                self.assertFalse(raw)
+                return json.loads(value[2:])
+        fake_msgpack = FakeMsgpack()
+        fake_msgpack.assertFalse = self.assertFalse
+
+        mock = MockMemcached()
+        with patch('swift.common.memcached.msgpack', fake_msgpack):
+            mp_client = memcached.MemcacheRing(
+                ['1.2.3.4:11211'], logger=self.logger, serializer='msgpack')
+            json_client = memcached.MemcacheRing(
+                ['1.2.3.4:11211'], logger=self.logger)
+            for client in (mp_client, json_client):
+                client._client_cache['1.2.3.4:11211'] = MockedMemcachePool(
+                    [(mock, mock)] * 2)
+
+            mp_client.set('some_key', {'status': 200})
+            _flags, _junk, value = mock.cache[md5hash('some_key')]
+            self.assertEqual(b'4', _flags)
+            self.assertEqual(b'MP{"status": 200}', value)
+            json_client.set('other_key', [1, 2])
+            mp_client.set_multi({'multi_key': b'bytes'})
+
+            # Both clients read both formats (mixed-mode rollout)
+            for client in (mp_client, json_client):
+                self.assertEqual({'status': 200}, client.get('some_key'))
+                self.assertEqual(
+                    [[1, 2], 'bytes', None],
+                    client.get_multi(['other_key', 'multi_key', 'nope']))
+
+        # Without msgpack, values written with msgpack are not readable
+        with patch('swift.common.memcached.msgpack', None):
+            self.assertIsNone(json_client.get('some_key'))
+            self.assertEqual([1, 2], json_client.get('other_key'))
+
+    @unittest.skipIf(memcached.msgpack is None, 'msgpack is not installed')
+    def test_serializer_container_info(self):
+        """Container info cache hits give the same info in both formats."""
+        info = headers_to_container_info({
+            'X-Container-Object-Count': '1000',
+            'X-Container-Bytes-Used': '6666',
+            'X-Container-Meta-Color': 'blue',
+            'X-Container-Sysmeta-Versions-Location': 'versions',
+            'X-Container-Read': '.r:*',
+        }, 200)
+        found = {}
+        sizes = {}
+        for serializer in ('json', 'msgpack'):
+            mock = MockMemcached()
+            client = memcached.MemcacheRing(
+                ['1.2.3.4:11211'], logger=self.logger, serializer=serializer)
+            client._client_cache['1.2.3.4:11211'] = MockedMemcachePool(
+                [(mock, mock)] * 2)
+            client.set('container/a/c', info)
+            sizes[serializer] = len(
+                mock.cache[md5hash('container/a/c')][2])
+            req = Request.blank('/v1/a/c', environ={'swift.cache': client})
+            found[serializer] = get_container_info(req.environ, None)
+        self.assertEqual(found['json'], found['msgpack'])
+        self.assertEqual('blue', found['msgpack']['meta']['color'])
+        self.assertLess(sizes['msgpack'], sizes['json'])
+
+    def _near_cache_client(self, mock, logger):
+        client = memcached.MemcacheRing(
+            ['1.2.3.4:11211'], logger=logger,
+            near_cache_ttl=10, near_cache_stale_ttl=20)
+        client._client_cache['1.2.3.4:11211'] = MockedMemcachePool(
+            [(mock, mock)] * 2)
+        return client
+
+    def test_near_cache(self):
+        mock = MockMemcached()
+        client = self._near_cache_client(mock, self.logger)
+        client.set('container/a/c', {'status': 200})
+        client.set('other_key', [1, 2])
+        mock.cache.clear()
+        with patch.object(mock, 'sendall') as sendall:
+            self.assertEqual({'status': 200}, client.get('container/a/c'))
+            self.assertEqual([{'status': 200}, None],
+                             client.get_multi(['container/a/c', 'other_key']))
+        # The key which is not near-cached has been asked for
+        self.assertEqual(1, sendall.call_count)
+        self.assertIsNone(client.get('other_key'))
+        self.assertEqual({'near_cache.hit': 2},
+                         self.logger.get_increment_counts())
+
+        client.delete('container/a/c')
+        self.assertIsNone(client.get('container/a/c'))
+        self.assertEqual({'near_cache.hit': 2, 'near_cache.miss': 1},
+                         self.logger.get_increment_counts())
+
+        # A value is only kept in the near-cache for near_cache_ttl seconds
+        client.set('account/a', {'status': 204})
+        mock.cache[md5hash('account/a')] = \
+            (b'2', b'0', b'{"status": 404}')
+        now = time.time()
+        with patch('time.time', return_value=now + 5):
+            self.assertEqual({'status': 204}, client.get('account/a'))
+        with patch('time.time', return_value=now + 11):
+            self.assertEqual({'status': 404}, client.get('account/a'))
+        with patch('time.time', return_value=now + 12):
+            self.assertEqual({'status': 404}, client.get('account/a'))
+
+    def test_near_cache_lease(self):
+        mock = MockMemcached()
+        logger1, logger2 = debug_logger(), debug_logger()
+        worker1 = self._near_cache_client(mock, logger1)
+        worker2 = self._near_cache_client(mock, logger2)
+        worker1.set('container/a/c', {'status': 200})
+        self.assertEqual({'status': 200}, worker2.get('container/a/c'))
+
+        # The value expires from memcache, and from the near-caches
+        mock.cache.clear()
+        now = time.time()
+        with patch('time.time', return_value=now + 15):
+            # The first worker gets the lease and recomputes the value,
+            # the other ones serve the stale value meanwhile.
+            self.assertIsNone(worker1.get('container/a/c'))
+            self.assertIsNone(worker1.get('container/a/c'))
+            self.assertEqual([{'status': 200}],
+                             worker2.get_multi(['container/a/c']))
+            self.assertEqual({'status': 200}, worker2.get('container/a/c'))
+            worker1.set('container/a/c', {'status': 204})
+            self.assertEqual({'status': 204}, worker2.get('container/a/c'))
+        self.assertEqual(1, logger1.get_increment_counts()['near_cache.lease'])
+        self.assertEqual(2, logger2.get_increment_counts()['near_cache.stale'])
+        self.assertNotIn('near_cache.lease', logger2.get_increment_counts())
+
+        # Values are not served after near_cache_stale_ttl
+        mock.cache.clear()
+        with patch('time.time', return_value=now + 50):
+            self.assertIsNone(worker1.get('container/a/c'))
+            self.assertIsNone(worker2.get('container/a/c'))
+
     def test_serialization(self):
         memcache_client = memcached.MemcacheRing(['1.2.3.4:11211'],
                                                  allow_pickle=True,
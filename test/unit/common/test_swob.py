@@ -22,11 +22,13 @@ import time
 
 from io import BytesIO
 
+import mock
 import six
 from six.moves.urllib.parse import quote
 
 import swift.common.swob as swob
-from swift.common import utils, exceptions
+from swift.common import header_key_dict, utils, exceptions
+from swift.common.header_key_dict import HeaderKeyDict, NormalizationCache
 
 
 class TestHeaderEnvironProxy(unittest.TestCase):
@@ -54,6 +56,78 @@ class TestHeaderEnvironProxy(unittest.TestCase):
         self.assertEqual(list(iter(proxy)), proxy.keys())
         self.assertEqual(4, len(proxy))
 
+    def test_normalization_cache(self):
+        to_environ = mock.Mock(side_effect=swob._header_to_environ_key)
+        environ = {}
+        proxy = swob.HeaderEnvironProxy(environ)
+        with mock.patch.object(swob, '_environ_keys',
+                               NormalizationCache(to_environ)):
+            for _ in range(3):
+                proxy['X-Object-Meta-Color'] = 'blue'
+                self.assertEqual('blue', proxy['x-object-meta-color'])
+                self.assertIn('X-OBJECT-META-COLOR', proxy)
+                self.assertEqual(['X-Object-Meta-Color'], proxy.keys())
+        self.assertEqual(3, to_environ.call_count)
+        self.assertEqual({'HTTP_X_OBJECT_META_COLOR': 'blue'}, environ)
+
+    def test_normalization_pipeline(self):
+        """Replay the header accesses of a proxy pipeline, and check
+        each header name is only normalized once."""
+        # Headers looked at by s3api, tempauth, slo and versioned_writes
+        # (and the proxy itself) while handling a single object PUT.
+        looked_at = [
+            'Authorization', 'X-Amz-Date', 'X-Amz-Content-Sha256',
+            'Content-Md5', 'X-Auth-Token', 'X-Storage-Token',
+            'X-Static-Large-Object', 'X-Copy-From', 'X-Object-Manifest',
+            'X-Versions-Location', 'X-History-Location', 'Transfer-Encoding',
+            'X-Timestamp', 'X-Backend-Storage-Policy-Index', 'If-None-Match',
+            'X-Delete-At', 'X-Delete-After', 'X-Object-Meta-Color']
+
+        def pipeline():
+            req = swob.Request.blank('/v1/a/c/o', method='PUT', headers={
+                'Authorization': 'AWS test:tester:signature',
+                'X-Amz-Date': '20200101T000000Z',
+                'Content-Type': 'text/plain',
+                'Content-Length': '4',
+                'X-Object-Meta-Color': 'blue'})
+            for _ in range(10):
+                for name in looked_at:
+                    self.assertEqual(name in req.headers,
+                                     req.headers.get(name) is not None)
+            req.headers['X-Timestamp'] = '1234567890.12345'
+            resp_headers = HeaderKeyDict(req.headers)
+            for name in looked_at:
+                self.assertEqual(req.headers.get(name),
+                                 resp_headers.get(name))
+
+        funcs = {
+            'environ_keys': mock.Mock(
+                side_effect=swob._header_to_environ_key),
+            'header_names': mock.Mock(
+                side_effect=swob._environ_key_to_header),
+            'titles': mock.Mock(side_effect=header_key_dict._title),
+        }
+        with mock.patch.object(swob, '_environ_keys', NormalizationCache(
+                funcs['environ_keys'])), \
+                mock.patch.object(swob, '_header_names', NormalizationCache(
+                    funcs['header_names'])), \
+                mock.patch.object(header_key_dict, '_titles',
+                                  NormalizationCache(funcs['titles'])):
+            pipeline()
+            first_counts = {name: func.call_count
+                            for name, func in funcs.items()}
+            for _ in range(5):
+                pipeline()
+        for name, func in funcs.items():
+            self.assertGreater(func.call_count, 0, name)
+            # the next requests only hit the caches
+            self.assertEqual(first_counts[name], func.call_count, name)
+            # and the first one never normalized a name twice
+            self.assertEqual(
+                func.call_count,
+                len(set(args for args, _kwargs in func.call_args_list)),
+                name)
+
     def test_ignored_keys(self):
         # Constructor doesn't normalize keys
         key = 'wsgi.input'
@@ -594,6 +668,30 @@ class TestRequest(unittest.TestCase):
         self.assertRaises(TypeError, swob.Request.blank,
                           'ftp://test.com/')
 
+    def test_blank_fast_path(self):
+        # Plain paths are not parsed as URLs, but must give the same result
+        for path in ('/', '/v1/a/c/o', '/v1/a/c/o?multipart-manifest=get',
+                     '/v1/a/c?format=json&marker=%E1%88%B4', '/v1/a/c/%20o',
+                     '/v1/a/c/o;p', '/v1/a/c/o#f', '/v1/a/c/o?a=b;c',
+                     '//host/v1/a/c/o', '/v1/a/c/\xe1\x88\xb4'):
+            req = swob.Request.blank(path)
+            expected = swob.Request.blank('http://localhost' + path)
+            for env in (req.environ, expected.environ):
+                env.pop('wsgi.errors')
+                env.pop('wsgi.input')
+            if path.startswith('//'):
+                expected.environ.update(
+                    SERVER_NAME='host', HTTP_HOST='host:80',
+                    PATH_INFO='/v1/a/c/o')
+            self.assertEqual(expected.environ, req.environ, path)
+
+        # PATH_INFO given by the caller is not unquoted again
+        with mock.patch.object(swob, 'wsgi_unquote') as unquote:
+            req = swob.Request.blank('/v1/a/c/%20o',
+                                     environ={'PATH_INFO': '/v1/a/c/ o'})
+        self.assertFalse(unquote.called)
+        self.assertEqual('/v1/a/c/ o', req.path_info)
+
     def test_params(self):
         req = swob.Request.blank('/?a=b&c=d')
         self.assertEqual(req.params['a'], 'b')
@@ -5910,6 +5910,29 @@ class TestStatsdLoggingDelegation(unittest.TestCase):
                 utils.fsync(12345)
                 self.assertEqual(called, [12345])
 
+    def test_syncfs(self):
+        with patch.object(utils, '_sys_syncfs', available=True,
+                          return_value=0) as sys_syncfs, \
+                patch.object(utils, 'fsync') as mock_fsync:
+            self.assertTrue(utils.syncfs(12345))
+        self.assertEqual([mock.call(12345)], sys_syncfs.call_args_list)
+        self.assertFalse(mock_fsync.called)
+
+        with patch.object(utils, '_sys_syncfs', available=True,
+                          return_value=-1), \
+                patch('ctypes.get_errno', return_value=errno.EIO):
+            with self.assertRaises(OSError) as caught:
+                utils.syncfs(12345)
+        self.assertEqual(errno.EIO, caught.exception.errno)
+
+    def test_syncfs_unavailable(self):
+        with patch.object(utils, '_sys_syncfs', available=False) \
+                as sys_syncfs, \
+                patch.object(utils, 'fsync') as mock_fsync:
+            self.assertFalse(utils.syncfs(12345))
+        self.assertFalse(sys_syncfs.called)
+        self.assertEqual([mock.call(12345)], mock_fsync.call_args_list)
+
 
 class TestAuditLocationGenerator(unittest.TestCase):
 
@@ -6395,6 +6418,96 @@ class TestGreenAsyncPile(unittest.TestCase):
         self.assertEqual(pile._pending, 0)
 
 
+class TestReconStatsDumper(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.tempdir, ignore_errors=True)
+
+    def test_maybe_dump(self):
+        dumper = utils.ReconStatsDumper(self.tempdir, 60, debug_logger())
+        self.assertFalse(dumper.maybe_dump(force=True))
+        stats = {'EC': {'objects': 1}}
+        dumper.register('auto_storage_policies', lambda: stats)
+        self.assertFalse(dumper.maybe_dump())
+        with patch('time.time', return_value=dumper.last_dump + 61), \
+                patch('os.getpid', return_value=1234):
+            self.assertTrue(dumper.maybe_dump())
+        with open(os.path.join(self.tempdir, 'proxy.recon')) as recon:
+            self.assertEqual(
+                {'auto_storage_policies': {'1234': stats}},
+                json.load(recon))
+
+    def test_dead_workers(self):
+        recon_file = os.path.join(self.tempdir, 'proxy.recon')
+        with open(recon_file, 'w') as recon:
+            json.dump({'auto_storage_policies': {'1': {'EC': {}},
+                                                 '4321': {'EC': {}}},
+                       'other': {'4321': 'kept'}}, recon)
+        dumper = utils.ReconStatsDumper(self.tempdir, 60, debug_logger())
+        stats = {'EC': {'objects': 1}}
+        dumper.register('auto_storage_policies', lambda: stats)
+        with patch('os.getpid', return_value=1234), \
+                patch('swift.common.utils.pid_alive',
+                      side_effect=lambda pid: pid != 4321) as pid_alive:
+            self.assertTrue(dumper.maybe_dump(force=True))
+        self.assertEqual({1, 4321}, {
+            args[0] for args, _kwargs in pid_alive.call_args_list})
+        with open(recon_file) as recon:
+            self.assertEqual(
+                {'auto_storage_policies': {'1': {'EC': {}}, '1234': stats},
+                 'other': {'4321': 'kept'}},
+                json.load(recon))
+
+    def test_recon_file(self):
+        dumper = utils.ReconStatsDumper(self.tempdir, 60, debug_logger(),
+                                        recon_file='object.recon')
+        stats = {'0': {'sda1': {'batch_sizes': {'count': 1}}}}
+        dumper.register('object_group_commit', lambda: stats)
+        with patch('os.getpid', return_value=1234):
+            self.assertTrue(dumper.maybe_dump(force=True))
+        with open(os.path.join(self.tempdir, 'object.recon')) as recon:
+            self.assertEqual({'object_group_commit': {'1234': stats}},
+                             json.load(recon))
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_buckets(self):
+        hist = utils.Histogram(precision_bits=2, unit=1)
+        for value in (0, 1, 7, 8, 9, 10, 11, 12, 1000, 1023):
+            hist.record(value)
+        # 4 buckets per power of two: [512, 640), ..., [896, 1024)
+        self.assertEqual({0: 1, 1: 1, 7: 1, 8: 2, 10: 2, 12: 1, 896: 2},
+                         hist.buckets)
+        self.assertEqual(10, hist.count)
+        self.assertEqual(2081, hist.total)
+        self.assertEqual(1023, hist.max)
+
+    def test_percentile(self):
+        hist = utils.Histogram()
+        self.assertEqual(0, hist.percentile(50))
+        for i in range(1, 1001):
+            hist.record(i / 1000.0)
+        for pct in (1, 50, 90, 99):
+            self.assertAlmostEqual(pct / 100.0, hist.percentile(pct),
+                                   delta=pct / 100.0 / 8)
+            self.assertGreaterEqual(hist.percentile(pct), pct / 100.0)
+        self.assertEqual(1.0, hist.percentile(100))
+
+        summary = hist.to_dict()
+        self.assertEqual(1000, summary['count'])
+        self.assertEqual(1000, sum(summary['buckets'].values()))
+        self.assertEqual(hist.percentile(99), summary['p99'])
+        json.dumps(summary)
+
+        hist.reset()
+        self.assertEqual(0, hist.count)
+        self.assertEqual({}, hist.buckets)
+
+
 class TestLRUCache(unittest.TestCase):
 
     def test_maxsize(self):
@@ -6489,6 +6602,44 @@ class TestLRUCache(unittest.TestCase):
             f(i)
         self.assertEqual(f.size(), 4)
 
+    def test_invalidate(self):
+        @utils.LRUCache(maxsize=10)
+        def f(*args):
+            return math.sqrt(*args)
+        for i in range(5):
+            f(i)
+        self.assertEqual(f.size(), 5)
+        self.assertTrue(f.invalidate(4))
+        self.assertFalse(f.invalidate(4))
+        self.assertEqual(f.size(), 4)
+        with patch('math.sqrt', return_value='recomputed'):
+            self.assertEqual('recomputed', f(4))
+            self.assertEqual(1, f(1))
+        self.assertEqual(f.size(), 5)
+
+    def test_get_cache_and_pop_cache(self):
+        cache = utils.LRUCache(maxsize=2, maxtime=30)
+        self.assertRaises(KeyError, cache.get_cache, 'a')
+        cache.set_cache(1, 'a')
+        cache.set_cache(None, 'b')
+        self.assertEqual(1, cache.get_cache('a'))
+        self.assertIsNone(cache.get_cache('b'))
+        # setting an existing key does not grow the cache
+        cache.set_cache(2, 'a')
+        self.assertEqual(2, len(cache.mapping))
+        self.assertEqual(2, cache.get_cache('a'))
+        # 'b' is now the least recently used key
+        cache.set_cache(3, 'c')
+        self.assertRaises(KeyError, cache.get_cache, 'b')
+        self.assertTrue(cache.pop_cache('a'))
+        self.assertFalse(cache.pop_cache('a'))
+        self.assertRaises(KeyError, cache.get_cache, 'a')
+        self.assertEqual(3, cache.get_cache('c'))
+        # expired entries are removed
+        with patch('time.time', return_value=time.time() + 31):
+            self.assertRaises(KeyError, cache.get_cache, 'c')
+        self.assertEqual({}, cache.mapping)
+
 
 class TestSpliterator(unittest.TestCase):
     def test_string(self):
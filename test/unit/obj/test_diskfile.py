@@ -29,6 +29,7 @@ import uuid
 import xattr
 import re
 import six
+import socket
 import struct
 from collections import defaultdict
 from random import shuffle, randint
@@ -40,7 +41,7 @@ from contextlib import closing, contextmanager
 from gzip import GzipFile
 import pyeclib.ec_iface
 
-from eventlet import hubs, timeout, tpool
+from eventlet import hubs, timeout, tpool, GreenPool, sleep, Timeout
 from swift.obj.diskfile import MD5_OF_EMPTY_STRING, update_auditor_status
 from test.unit import (mock as unit_mock, temptree, mock_check_drive,
                        patch_policies, debug_logger, EMPTY_ETAG,
@@ -730,6 +731,226 @@ class TestDiskFileRouter(unittest.TestCase):
                       str(cm.exception))
 
 
+class TestMetadataCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.tempdir, ignore_errors=True)
+
+    def _make_dir(self, name, files=()):
+        path = os.path.join(self.tempdir, name)
+        mkdirs(path)
+        for filename in files:
+            with open(os.path.join(path, filename), 'w'):
+                pass
+        old = time() - 10
+        os.utime(path, (old, old))
+        return path
+
+    def test_lookup(self):
+        cache = diskfile.MetadataCache(2)
+        self.assertIsNone(cache.lookup(os.path.join(self.tempdir, 'nope')))
+        path = self._make_dir('d1', ['1.data'])
+        self.assertIsNone(cache.lookup(os.path.join(path, '1.data')))
+
+        files, metadata = cache.lookup(path)
+        self.assertEqual(['1.data'], files)
+        metadata['1.data'] = {'name': '/a/c/o'}
+        self.assertEqual((files, metadata), cache.lookup(path))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+        # a new file changes the modification time of the directory
+        with open(os.path.join(path, '2.meta'), 'w'):
+            pass
+        files, metadata = cache.lookup(path)
+        self.assertEqual(['1.data', '2.meta'], sorted(files))
+        self.assertEqual({}, metadata)
+        # it was changed too recently to be cached
+        cache.lookup(path)
+        self.assertEqual((1, 3), (cache.hits, cache.misses))
+
+        cache.invalidate(path)
+        cache.invalidate(path)
+
+    def test_maxsize(self):
+        cache = diskfile.MetadataCache(2)
+        paths = [self._make_dir('d%d' % i) for i in range(3)]
+        for path in paths:
+            cache.lookup(path)
+        self.assertEqual(3, cache.misses)
+        cache.lookup(paths[2])
+        cache.lookup(paths[1])
+        self.assertEqual(2, cache.hits)
+        # the least recently used directory was evicted
+        cache.lookup(paths[0])
+        self.assertEqual(4, cache.misses)
+
+
+class TestGroupSyncer(unittest.TestCase):
+
+    def setUp(self):
+        self._orig_tpool_exc = tpool.execute
+        tpool.execute = lambda f, *args, **kwargs: f(*args, **kwargs)
+
+    def tearDown(self):
+        tpool.execute = self._orig_tpool_exc
+
+    def _sync_concurrently(self, syncer, fds):
+        pool = GreenPool()
+        for fd in fds:
+            pool.spawn(syncer.sync, fd)
+        pool.waitall()
+
+    def test_batch(self):
+        syncer = diskfile.GroupSyncer(0.01)
+        with mock.patch('swift.obj.diskfile.fsync') as mock_fsync, \
+                mock.patch('swift.obj.diskfile.syncfs',
+                           return_value=True) as mock_syncfs:
+            self._sync_concurrently(syncer, [3, 4, 5])
+        self.assertEqual([mock.call(3)], mock_syncfs.call_args_list)
+        self.assertFalse(mock_fsync.called)
+        stats = syncer.stats()
+        self.assertEqual(1, stats['batch_sizes']['count'])
+        self.assertEqual(3, stats['batch_sizes']['max'])
+        self.assertEqual(3, stats['latencies']['count'])
+
+        # next writers start a new batch
+        with mock.patch('swift.obj.diskfile.fsync') as mock_fsync, \
+                mock.patch('swift.obj.diskfile.syncfs',
+                           return_value=True) as mock_syncfs:
+            self._sync_concurrently(syncer, [6])
+        self.assertEqual([mock.call(6)], mock_syncfs.call_args_list)
+        self.assertEqual(2, syncer.stats()['batch_sizes']['count'])
+
+    def test_batch_without_syncfs(self):
+        syncer = diskfile.GroupSyncer(0.01)
+        with mock.patch('swift.obj.diskfile.fsync') as mock_fsync, \
+                mock.patch('swift.obj.diskfile.syncfs',
+                           return_value=False) as mock_syncfs:
+            self._sync_concurrently(syncer, [3, 4, 5])
+        self.assertEqual([mock.call(3)], mock_syncfs.call_args_list)
+        self.assertEqual([mock.call(4), mock.call(5)],
+                         mock_fsync.call_args_list)
+
+    def test_batch_error(self):
+        syncer = diskfile.GroupSyncer(0.01)
+        errors = []
+
+        def do_sync(fd):
+            try:
+                syncer.sync(fd)
+            except OSError as err:
+                errors.append((fd, err.errno))
+
+        with mock.patch('swift.obj.diskfile.syncfs',
+                        side_effect=OSError(errno.EIO, 'EIO')):
+            pool = GreenPool()
+            for fd in (3, 4):
+                pool.spawn(do_sync, fd)
+            pool.waitall()
+        self.assertEqual([(3, errno.EIO), (4, errno.EIO)], sorted(errors))
+        self.assertIsNone(syncer._pending)
+
+    def test_batch_dirs_without_syncfs(self):
+        syncer = diskfile.GroupSyncer(0.01)
+        with mock.patch('swift.obj.diskfile.fsync') as mock_fsync, \
+                mock.patch('swift.obj.diskfile.fsync_dir') as mock_fsync_dir, \
+                mock.patch('swift.obj.diskfile.syncfs',
+                           return_value=False) as mock_syncfs:
+            pool = GreenPool()
+            pool.spawn(syncer.sync, 3, dirs=['/d/p/s/h', '/d/p/s'])
+            pool.spawn(syncer.sync, 4)
+            pool.spawn(syncer.sync, 5, dirs=['/d/p/s/h2', '/d/p/s'])
+            pool.waitall()
+        self.assertEqual([mock.call(3)], mock_syncfs.call_args_list)
+        # only files are synced, not the fds of writers syncing directories
+        self.assertEqual([mock.call(4)], mock_fsync.call_args_list)
+        # each directory is synced once
+        self.assertEqual(
+            [mock.call('/d/p/s'), mock.call('/d/p/s/h'),
+             mock.call('/d/p/s/h2')],
+            mock_fsync_dir.call_args_list)
+        self.assertEqual(3, syncer.stats()['batch_sizes']['max'])
+
+    def test_batch_follower_interrupted(self):
+        syncer = diskfile.GroupSyncer(0.05)
+
+        def impatient_sync(fd):
+            try:
+                with Timeout(0.01):
+                    syncer.sync(fd)
+            except Timeout:
+                pass
+
+        with mock.patch('swift.obj.diskfile.fsync') as mock_fsync, \
+                mock.patch('swift.obj.diskfile.syncfs',
+                           return_value=False):
+            pool = GreenPool()
+            pool.spawn(syncer.sync, 3)
+            pool.spawn(impatient_sync, 4)
+            pool.spawn(syncer.sync, 5)
+            pool.waitall()
+        # the file of the writer which gave up was left out of the batch
+        self.assertEqual([mock.call(5)], mock_fsync.call_args_list)
+        self.assertEqual(2, syncer.stats()['batch_sizes']['max'])
+
+    def test_batch_leader_interrupted_while_syncing(self):
+        syncer = diskfile.GroupSyncer(0.01)
+        events = []
+
+        def slow_syncfs(fd):
+            sleep(0.1)
+            events.append('synced')
+            return True
+
+        def do_sync(fd, timeout):
+            try:
+                with Timeout(timeout):
+                    syncer.sync(fd)
+                events.append('done %d' % fd)
+            except Timeout:
+                events.append('gave up %d' % fd)
+
+        with mock.patch('swift.obj.diskfile.syncfs', slow_syncfs):
+            pool = GreenPool()
+            pool.spawn(do_sync, 3, 0.03)
+            pool.spawn(do_sync, 4, 1)
+            with Timeout(0.5):
+                pool.waitall()
+        # the writer which started the batch did not return before the
+        # batch was synced, and the other one was not left waiting
+        self.assertEqual('synced', events[0])
+        self.assertEqual(['done 4', 'gave up 3'], sorted(events[1:]))
+        self.assertIsNone(syncer._pending)
+
+    def test_batch_follower_interrupted_while_syncing(self):
+        syncer = diskfile.GroupSyncer(0.01)
+        events = []
+
+        def slow_syncfs(fd):
+            sleep(0.05)
+            events.append('synced')
+            return True
+
+        def impatient_sync(fd):
+            try:
+                with Timeout(0.03):
+                    syncer.sync(fd)
+            except Timeout:
+                events.append('gave up')
+
+        with mock.patch('swift.obj.diskfile.syncfs', slow_syncfs):
+            pool = GreenPool()
+            pool.spawn(syncer.sync, 3)
+            pool.spawn(impatient_sync, 4)
+            pool.waitall()
+        # the writer did not return (and close its file) before the
+        # batch it belongs to was synced
+        self.assertEqual(['synced', 'gave up'], events)
+
+
 class BaseDiskFileTestMixin(object):
     """
     Bag of helpers that are useful in the per-policy DiskFile test classes,
@@ -3381,6 +3602,66 @@ class DiskFileMixin(BaseDiskFileTestMixin):
         md = df.read_metadata()
         self.assertEqual(md['X-Timestamp'], timestamp)
 
+    def test_read_metadata_cached(self):
+        self.conf['metadata_cache_size'] = '10'
+        self.df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        timestamp = self.ts().internal
+        df, _ = self._create_test_file(b'1234567890', timestamp=timestamp)
+        cache = df.manager.metadata_cache
+        # the object was just written: its directory is not cached yet
+        self.assertEqual(0, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+        def backdate():
+            old = time() - 10
+            os.utime(df._datadir, (old, old))
+
+        def read_metadata(fresh):
+            df = self._simple_get_diskfile()
+            with mock.patch('os.listdir', wraps=os.listdir) as mock_listdir, \
+                    mock.patch('swift.obj.diskfile.read_metadata',
+                               wraps=diskfile.read_metadata) as mock_read:
+                md = df.read_metadata()
+            self.assertEqual(fresh, mock_listdir.called)
+            self.assertEqual(fresh, mock_read.called)
+            return md
+
+        self.assertEqual(timestamp, read_metadata(True)['X-Timestamp'])
+        backdate()
+        self.assertEqual(timestamp, read_metadata(True)['X-Timestamp'])
+        md = read_metadata(False)
+        self.assertEqual(timestamp, md['X-Timestamp'])
+        self.assertEqual(1, cache.hits)
+        # metadata handed out can be modified safely
+        md['X-Timestamp'] = 'bogus'
+        self.assertEqual(timestamp, read_metadata(False)['X-Timestamp'])
+
+        # a POST changes the directory
+        df = self._simple_get_diskfile()
+        post_timestamp = self.ts().internal
+        df.write_metadata({'X-Timestamp': post_timestamp,
+                           'X-Object-Meta-Color': 'blue'})
+        md = read_metadata(True)
+        self.assertEqual(post_timestamp, md['X-Timestamp'])
+        self.assertEqual('blue', md['X-Object-Meta-Color'])
+        backdate()
+        read_metadata(True)
+        md = read_metadata(False)
+        self.assertEqual('blue', md['X-Object-Meta-Color'])
+
+        # and so does a DELETE
+        df = self._simple_get_diskfile()
+        df.delete(self.ts())
+        with self.assertRaises(DiskFileDeleted):
+            df.read_metadata()
+
+        # modernizing the metadata reads it from the file
+        df = self._simple_get_diskfile()
+        df.manager.metadata_cache = cache = mock.MagicMock()
+        with self.assertRaises(DiskFileDeleted):
+            df.open(modernize=True)
+        self.assertFalse(cache.lookup.called)
+
     def test_read_metadata_no_xattr(self):
         def mock_getxattr(*args, **kargs):
             error_num = errno.ENOTSUP if hasattr(errno, 'ENOTSUP') else \
@@ -3580,6 +3861,102 @@ class DiskFileMixin(BaseDiskFileTestMixin):
         self.assertEqual(quarantine_msgs, [])
         self.assertTrue(reader._fp is None)
 
+    def test_read_mode(self):
+        self.assertEqual('copy', self.df_mgr.read_mode)
+        self.conf['read_mode'] = 'bogus'
+        with self.assertRaises(ValueError):
+            self.mgr_cls(self.conf, self.logger)
+        self.conf['read_mode'] = 'Sendfile'
+        if hasattr(os, 'sendfile'):
+            mgr = self.mgr_cls(self.conf, self.logger)
+            self.assertEqual('sendfile', mgr.read_mode)
+            self.assertTrue(mgr.use_sendfile)
+            self.assertFalse(mgr.use_splice)
+        with mock.patch('swift.obj.diskfile.os', spec=['listdir']):
+            mgr = self.mgr_cls(self.conf, self.logger)
+        self.assertEqual('copy', mgr.read_mode)
+        self.assertFalse(mgr.use_sendfile)
+        self.assertIn('sendfile()',
+                      self.logger.get_lines_for_level('warning')[-1])
+
+    def _sendfile(self, reader):
+        rsock, wsock = socket.socketpair()
+        with closing(rsock), closing(wsock):
+            with mock.patch('swift.obj.diskfile.posix_fadvise') as fadvise:
+                reader.zero_copy_send(wsock.fileno())
+            wsock.shutdown(socket.SHUT_WR)
+            received = b''
+            while True:
+                chunk = rsock.recv(65536)
+                if not chunk:
+                    break
+                received += chunk
+        return received, fadvise
+
+    def test_sendfile_send(self):
+        if not hasattr(os, 'sendfile'):
+            raise unittest.SkipTest('sendfile() is missing')
+        self.conf['read_mode'] = 'sendfile'
+        self.df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        df, df_data = self._create_test_file(b'1234567890' * 100)
+        quarantine_msgs = []
+        reader = df.reader(_quarantine_hook=quarantine_msgs.append)
+        if df.policy.policy_type == EC_POLICY:
+            # fragment archives are checked as they are read
+            self.assertFalse(reader.can_zero_copy_send())
+            return
+        self.assertTrue(reader.can_zero_copy_send())
+        received, fadvise = self._sendfile(reader)
+        self.assertEqual(df_data, received)
+        self.assertIsNone(reader._fp)
+        self.assertEqual([], quarantine_msgs)
+        self.assertEqual(
+            [mock.call(mock.ANY, 0, 1000, utils.POSIX_FADV_WILLNEED)],
+            fadvise.call_args_list)
+        self.assertIn((('read.sendfile.bytes', 1000), {}),
+                      self.logger.log_dict['update_stats'])
+
+        # a single range
+        df = self._simple_get_diskfile()
+        with df.open():
+            reader = df.reader()
+        reader.app_iter_range(100, 900)
+        self.assertTrue(reader.can_zero_copy_send())
+        with mock.patch('swift.obj.diskfile.READAHEAD_WILLNEED_MAX', 100):
+            received, fadvise = self._sendfile(reader)
+        self.assertEqual(df_data[100:900], received)
+        self.assertEqual(
+            [mock.call(mock.ANY, 100, 800, utils.POSIX_FADV_SEQUENTIAL)],
+            fadvise.call_args_list)
+        self.assertIn((('read.sendfile.bytes', 800), {}),
+                      self.logger.log_dict['update_stats'])
+
+    def test_sendfile_send_quarantine(self):
+        if not hasattr(os, 'sendfile'):
+            raise unittest.SkipTest('sendfile() is missing')
+        self.conf['read_mode'] = 'sendfile'
+        self.df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        df, df_data = self._create_test_file(b'1234567890' * 100)
+        if df.policy.policy_type == EC_POLICY:
+            return
+        quarantine_msgs = []
+        reader = df.reader(_quarantine_hook=quarantine_msgs.append)
+        # the etag is not checked, but the size is
+        os.truncate(reader._data_file, 500)
+        received, _ = self._sendfile(reader)
+        self.assertEqual(df_data[:500], received)
+        self.assertEqual(1, len(quarantine_msgs))
+        self.assertIn('Bytes read: 500', quarantine_msgs[0])
+
+    def test_reader_read_stats(self):
+        df, df_data = self._create_test_file(b'1234567890')
+        reader = df.reader()
+        self.assertEqual(df_data, b''.join(reader))
+        self.assertIn((('read.copy.bytes', len(df_data)), {}),
+                      self.logger.log_dict['update_stats'])
+        self.assertEqual('read.copy.timing',
+                         self.logger.log_dict['timing_since'][-1][0][0])
+
     def test_disk_file_app_iter_ranges(self):
         df, df_data = self._create_test_file(b'012345678911234567892123456789')
         quarantine_msgs = []
@@ -4482,6 +4859,38 @@ class DiskFileMixin(BaseDiskFileTestMixin):
             if policy.policy_type == EC_POLICY:
                 self.assertIsInstance(mock_fsync.call_args[0][0], int)
 
+    def test_commit_group_sync(self):
+        self.conf['group_commit_window'] = '0.01'
+        self.df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        for policy in POLICIES:
+            df = self._simple_get_diskfile(account='a', container='c',
+                                           obj='o', policy=policy)
+            timestamp = Timestamp.now()
+            with df.create() as writer:
+                metadata = {
+                    'ETag': 'bogus_etag',
+                    'X-Timestamp': timestamp.internal,
+                    'Content-Length': '0',
+                }
+                with mock.patch('swift.obj.diskfile.fsync') as mock_fsync, \
+                        mock.patch('swift.obj.diskfile.syncfs',
+                                   return_value=True) as mock_syncfs:
+                    with mock.patch('swift.common.utils.fsync_dir') as \
+                            mock_fsync_dir:
+                        writer.put(metadata)
+                    self.assertEqual(0, mock_fsync.call_count)
+                    self.assertEqual(0, mock_fsync_dir.call_count)
+                    # once for the file, then once for its directory
+                    self.assertEqual([mock.call(writer._fd)] * 2,
+                                     mock_syncfs.call_args_list)
+                    writer.commit(timestamp)
+            # the file is renamed after being synced
+            self.assertTrue(os.listdir(df._datadir))
+            stats = df.manager.group_commit_stats()
+            self.assertEqual(['sda1'], list(stats))
+            self.assertEqual(2, stats['sda1']['batch_sizes']['count'])
+            self.assertEqual(2, stats['sda1']['latencies']['count'])
+
     def test_commit_ignores_cleanup_ondisk_files_error(self):
         for policy in POLICIES:
             # Check OSError from cleanup_ondisk_files is caught and ignored
@@ -8380,6 +8789,183 @@ class TestSuffixHashes(unittest.TestCase):
                  '003': 'fake', '004': 'fake'},  # not modifed
             ])
 
+    def _put_data(self, df, timestamp, commit=True):
+        with df.create() as writer:
+            test_data = b'test file'
+            writer.write(test_data)
+            writer.put({
+                'X-Timestamp': timestamp.internal,
+                'ETag': md5(test_data).hexdigest(),
+                'Content-Length': len(test_data),
+            })
+            if commit:
+                writer.commit(timestamp)
+
+    def test_partition_index(self):
+        conf = dict(self.conf, partition_index='true')
+        df_router = diskfile.DiskFileRouter(conf, self.logger)
+        for policy in self.iter_policies():
+            df_mgr = df_router[policy]
+            df = df_mgr.get_diskfile(
+                'sda1', '0', 'a', 'c', 'o', policy=policy, frag_index=7)
+            self._put_data(df, self.ts())
+            part_path = os.path.join(self.devices, 'sda1',
+                                     diskfile.get_data_dir(policy), '0')
+            index_path = os.path.join(part_path, diskfile.PART_INDEX_FILE)
+            # The first rehash walks the partition and builds the index
+            hashes = df_mgr.get_hashes('sda1', '0', [], policy)
+            with open(index_path, 'rb') as index_fh:
+                self.assertEqual(diskfile.PART_INDEX_MARKER,
+                                 index_fh.readline())
+
+            # Changes are appended to the index, and suffixes invalidated
+            # by them are rehashed without walking
+            df.delete(self.ts())
+            df2 = self.get_different_suffix_df(df, frag_index=3)
+            self._put_data(df2, self.ts(), commit=False)
+            df2.delete(self.ts())
+            with mock.patch('os.listdir',
+                            side_effect=AssertionError('walked')):
+                hashes = df_mgr.get_hashes('sda1', '0', [], policy)
+            # Same hashes as a walk of the partition
+            os.unlink(os.path.join(part_path, diskfile.HASH_FILE))
+            expected = self.df_router[policy].get_hashes(
+                'sda1', '0', [], policy)
+            self.assertEqual(expected, hashes)
+            self.assertEqual(2, len(hashes))
+            hashes_from_index = hashes
+
+            # Files added behind our back (rsync) are found when the suffix
+            # is explicitly recalculated, and the index updated
+            df3 = self.get_different_suffix_df(df2, frag_index=1)
+            suffix3 = os.path.basename(os.path.dirname(df3._datadir))
+            self._put_data(df3, self.ts())
+            with open(index_path, 'rb') as index_fh:
+                lines = index_fh.readlines()
+            with open(index_path, 'wb') as index_fh:
+                index_fh.writelines(
+                    line for line in lines
+                    if not line.startswith(suffix3.encode('ascii')))
+            hashes = df_mgr.get_hashes('sda1', '0', [suffix3], policy)
+            self.assertEqual(3, len(hashes))
+            index = diskfile.PartitionIndex(part_path)
+            index.load(create=False)
+            self.assertTrue(index.complete)
+            self.assertEqual(
+                [os.path.basename(df3._datadir)],
+                list(index.entries(suffix3)))
+            self.assertEqual(
+                set(os.path.basename(d._datadir) for d in (df, df2, df3)),
+                set(h for entries in index.suffixes.values()
+                    for h in entries))
+
+            # Quarantined object directories leave the index
+            df_mgr.quarantine_renamer(
+                os.path.join(self.devices, 'sda1'),
+                os.path.join(df3._datadir, 'made-up-filename'))
+            with mock.patch('os.listdir',
+                            side_effect=AssertionError('walked')):
+                hashes = df_mgr.get_hashes('sda1', '0', [], policy)
+            self.assertEqual(hashes_from_index, hashes)
+
+    def test_partition_index_yield_hashes(self):
+        conf = dict(self.conf, partition_index='true')
+        df_router = diskfile.DiskFileRouter(conf, self.logger)
+        for policy in self.iter_policies():
+            df_mgr = df_router[policy]
+            df = df_mgr.get_diskfile(
+                'sda1', '0', 'a', 'c', 'o', policy=policy, frag_index=7)
+            timestamp = self.ts()
+            self._put_data(df, timestamp)
+            suffix = os.path.basename(os.path.dirname(df._datadir))
+            df_mgr.get_hashes('sda1', '0', [], policy)
+            with mock.patch('os.listdir',
+                            side_effect=AssertionError('walked')):
+                found = list(df_mgr.yield_hashes(
+                    'sda1', '0', policy, suffixes=[suffix]))
+            self.assertEqual(
+                [(os.path.basename(df._datadir), {'ts_data': timestamp})],
+                found)
+            self.assertEqual(found, list(self.df_router[policy].yield_hashes(
+                'sda1', '0', policy, suffixes=[suffix])))
+
+    def test_partition_index_concurrent_changes(self):
+        for policy in self.iter_policies():
+            df_mgr = self.df_router[policy]
+            df = df_mgr.get_diskfile(
+                'sda1', '0', 'a', 'c', 'o', policy=policy, frag_index=7)
+            self._put_data(df, self.ts())
+            part_path = os.path.dirname(os.path.dirname(df._datadir))
+            suffix = os.path.basename(os.path.dirname(df._datadir))
+            hsh = os.path.basename(df._datadir)
+            index = diskfile.PartitionIndex(part_path)
+            index.load()
+            self.assertFalse(index.complete)
+            index.record(suffix, hsh, ['old.data'])
+            index.record('fff', 'ffffffffffffffffffffffffffffffff', ['x.ts'])
+            # Changed while the partition was walked: the line appended
+            # is newer than what was walked
+            diskfile.update_part_index(df._datadir, ['new.data'])
+            index.commit(walked_all=True)
+            index = diskfile.PartitionIndex(part_path)
+            index.load(create=False)
+            self.assertTrue(index.complete)
+            self.assertEqual({
+                suffix: {hsh: ['new.data']},
+                'fff': {'ffffffffffffffffffffffffffffffff': ['x.ts']},
+            }, index.suffixes)
+            # A truncated line makes the index untrusted
+            with open(index.path, 'ab') as index_fh:
+                index_fh.write(b'fff/fff')
+            index = diskfile.PartitionIndex(part_path)
+            index.load(create=False)
+            self.assertFalse(index.complete)
+            os.unlink(index.path)
+
+    def test_get_hash_tree(self):
+        for policy in self.iter_policies():
+            df_mgr = self.df_router[policy]
+            frag_index = 7 if policy.policy_type == EC_POLICY else None
+            df = df_mgr.get_diskfile(
+                'sda1', '0', 'a', 'c', 'o', policy=policy, frag_index=7)
+            self._put_data(df, self.ts())
+            part_path = os.path.join(self.devices, 'sda1',
+                                     diskfile.get_data_dir(policy), '0')
+            tree = df_mgr.get_hash_tree('sda1', '0', policy, frag_index)
+            hashes = df_mgr.get_hashes('sda1', '0', [], policy)
+            self.assertEqual(
+                diskfile.build_hash_tree(hashes, frag_index), tree)
+            suffix = os.path.basename(os.path.dirname(df._datadir))
+            self.assertEqual(
+                diskfile.hash_tree_leaf(hashes[suffix], frag_index),
+                tree[suffix])
+            if frag_index is not None:
+                self.assertIn('/', tree[suffix])
+            self.assertTrue(os.path.exists(
+                os.path.join(part_path, diskfile.HASH_TREE_FILE)))
+
+            # stored along the hashes it was built from
+            with mock.patch('swift.obj.diskfile.build_hash_tree') as build:
+                self.assertEqual(tree, df_mgr.get_hash_tree(
+                    'sda1', '0', policy, frag_index))
+            self.assertFalse(build.called)
+
+            # and built again once they change
+            df = df_mgr.get_diskfile(
+                'sda1', '0', 'a', 'c', 'o2', policy=policy, frag_index=7)
+            self._put_data(df, self.ts())
+            new_tree = df_mgr.get_hash_tree('sda1', '0', policy, frag_index)
+            self.assertNotEqual(tree[''], new_tree[''])
+            self.assertEqual(diskfile.build_hash_tree(
+                df_mgr.get_hashes('sda1', '0', [], policy), frag_index),
+                new_tree)
+
+    def test_get_hash_tree_bad_dev(self):
+        for policy in self.iter_policies():
+            df_mgr = self.df_router[policy]
+            self.assertRaises(DiskFileDeviceUnavailable,
+                              df_mgr.get_hash_tree, 'sdz', '0', policy)
+
 
 class TestHashesHelpers(unittest.TestCase):
 
@@ -8389,6 +8975,95 @@ class TestHashesHelpers(unittest.TestCase):
     def tearDown(self):
         rmtree(self.testdir, ignore_errors=1)
 
+    def test_build_hash_tree(self):
+        self.assertEqual({}, diskfile.build_hash_tree({}))
+        hashes = {'abc': 'h1', 'abd': 'h2', 'a00': 'h3', 'f12': 'h4'}
+        tree = diskfile.build_hash_tree(hashes)
+        self.assertEqual(
+            sorted(['', 'a', 'f', 'ab', 'a0', 'f1'] + list(hashes)),
+            sorted(tree))
+        for suffix, hsh in hashes.items():
+            self.assertEqual(hsh, tree[suffix])
+        self.assertEqual(md5(b'abc h1\nabd h2\n').hexdigest(), tree['ab'])
+        self.assertEqual(md5(b'a00 h3\nabc h1\nabd h2\n').hexdigest(),
+                         tree['a'])
+        # a change in a suffix changes its ancestors only
+        other = diskfile.build_hash_tree(dict(hashes, abd='h5'))
+        self.assertEqual(
+            ['', 'a', 'ab', 'abd'],
+            sorted(node for node in tree if tree[node] != other[node]))
+
+    def test_build_hash_tree_ec(self):
+        hashes = {'abc': {None: 'd1', 1: 'f1', 2: 'f2'},
+                  'abd': {None: 'd2', 1: 'f3'}}
+        tree = diskfile.build_hash_tree(hashes, 1)
+        self.assertEqual('d1/f1', tree['abc'])
+        self.assertEqual('d2/f3', tree['abd'])
+        tree = diskfile.build_hash_tree(hashes, 2)
+        self.assertEqual('d1/f2', tree['abc'])
+        self.assertEqual('d2/None', tree['abd'])
+
+    def test_hash_tree_children(self):
+        tree = diskfile.build_hash_tree(
+            {'abc': 'h1', 'abd': 'h2', 'a00': 'h3', 'f12': 'h4'})
+        self.assertEqual(['', 'a', 'f'], sorted(
+            diskfile.hash_tree_children(tree, [''])))
+        self.assertEqual(['a0', 'ab'], sorted(
+            diskfile.hash_tree_children(tree, ['a'])))
+        self.assertEqual({'abc': 'h1', 'abd': 'h2', 'f12': 'h4'},
+                         diskfile.hash_tree_children(tree, ['ab', 'f1']))
+        self.assertEqual({}, diskfile.hash_tree_children(tree, ['b']))
+        self.assertEqual({}, diskfile.hash_tree_children({}, ['']))
+
+    def test_diff_hash_trees(self):
+        hashes = {'%03x' % i: 'h%d' % i for i in range(0, 4096, 7)}
+        local_tree = diskfile.build_hash_tree(hashes)
+        fetched = []
+
+        def make_fetch(remote_tree):
+            def fetch(prefixes):
+                fetched.append(prefixes)
+                return diskfile.hash_tree_children(remote_tree, prefixes)
+            return fetch
+
+        # in sync: the roots match
+        remote_tree = diskfile.build_hash_tree(hashes)
+        self.assertEqual({}, diskfile.diff_hash_trees(
+            local_tree, diskfile.hash_tree_children(remote_tree, ['']),
+            make_fetch(remote_tree)))
+        self.assertEqual([], fetched)
+
+        # a suffix changed, another is missing, and a third one is new
+        remote_hashes = dict(hashes, **{'007': 'other', 'abc': 'new'})
+        del remote_hashes['e0e']
+        remote_tree = diskfile.build_hash_tree(remote_hashes)
+        self.assertEqual(
+            {'007': 'other', 'abc': 'new', 'e0e': None},
+            diskfile.diff_hash_trees(
+                local_tree, diskfile.hash_tree_children(remote_tree, ['']),
+                make_fetch(remote_tree)))
+        # only down the subtrees which differ
+        self.assertEqual([['0', 'a', 'e'], ['00', 'ab', 'e0']], fetched)
+
+        # the remote partition is empty
+        del fetched[:]
+        self.assertEqual(
+            dict.fromkeys(hashes),
+            diskfile.diff_hash_trees(local_tree, {}, make_fetch({})))
+        self.assertEqual(2, len(fetched))
+
+    def test_read_hash_trees(self):
+        empty = {'updated': None, 'trees': {}}
+        self.assertEqual(empty, diskfile.read_hash_trees(self.testdir))
+        tree_file = os.path.join(self.testdir, diskfile.HASH_TREE_FILE)
+        with open(tree_file, 'wb') as f:
+            f.write(b'garbage')
+        self.assertEqual(empty, diskfile.read_hash_trees(self.testdir))
+        trees = {'updated': 1234.5, 'trees': {None: {'': 'root'}}}
+        with open(tree_file, 'wb') as f:
+            pickle.dump(trees, f)
+        self.assertEqual(trees, diskfile.read_hash_trees(self.testdir))
+
     def test_read_legacy_hashes(self):
         hashes = {'stub': 'fake'}
         hashes_file = os.path.join(self.testdir, diskfile.HASH_FILE)
@@ -1881,6 +1881,55 @@ class TestWorkerReconstructor(unittest.TestCase):
                         return_value=12):
             self.assertTrue(reconstructor.is_healthy())
 
+    def test_final_recon_dump_rebuild_stats(self):
+        reconstructor = object_reconstructor.ObjectReconstructor(
+            {'recon_cache_path': self.recon_cache_path},
+            logger=self.logger)
+        reconstructor.all_local_devices = ['sda', 'sdc']
+        reconstructor.rebuilt_archives = 3
+        reconstructor.rebuilt_bytes = 6000
+        now = time.time()
+        with mock.patch('swift.obj.reconstructor.time.time', return_value=now):
+            reconstructor.final_recon_dump(0.5)
+        with open(self.rcache) as f:
+            data = json.load(f)
+        self.assertEqual({
+            'object_reconstruction_last': now,
+            'object_reconstruction_time': 0.5,
+            'object_reconstruction_rebuild': {
+                'fragment_archives': 3, 'bytes': 6000, 'rate': 200.0},
+        }, data)
+
+        # nothing rebuilt in the next cycle
+        reconstructor.rebuilt_archives = reconstructor.rebuilt_bytes = 0
+        with mock.patch('swift.obj.reconstructor.time.time', return_value=now):
+            reconstructor.final_recon_dump(0.5)
+        with open(self.rcache) as f:
+            data = json.load(f)
+        self.assertEqual({
+            'object_reconstruction_last': now,
+            'object_reconstruction_time': 0.5,
+        }, data)
+
+        # per worker
+        reconstructor.reconstructor_workers = 1
+        reconstructor.rebuilt_archives = 1
+        reconstructor.rebuilt_bytes = 1200
+        with mock.patch('swift.obj.reconstructor.time.time',
+                        return_value=now), \
+                mock.patch('swift.obj.reconstructor.os.getpid',
+                           return_value='pid-1'):
+            reconstructor.final_recon_dump(0.1, override_devices=['sda'])
+        with open(self.rcache) as f:
+            data = json.load(f)
+        self.assertEqual({
+            'object_reconstruction_last': now,
+            'object_reconstruction_time': 0.1,
+            'pid': 'pid-1',
+            'object_reconstruction_rebuild': {
+                'fragment_archives': 1, 'bytes': 1200, 'rate': 200.0},
+        }, data['object_reconstruction_per_disk']['sda'])
+
     def test_final_recon_dump(self):
         reconstructor = object_reconstructor.ObjectReconstructor(
             {'recon_cache_path': self.recon_cache_path},
@@ -3697,6 +3746,58 @@ class TestObjectReconstructor(BaseTestObjectReconstructor):
         self.assertEqual(suffixes, [])
         self.assertEqual(new_node, node)
 
+    def test_get_suffixes_to_sync_hash_tree(self):
+        self.reconstructor.hash_tree = True
+        part_path = os.path.join(self.devices, self.local_dev['device'],
+                                 diskfile.get_data_dir(self.policy), '1')
+        utils.mkdirs(part_path)
+        part_info = {
+            'local_dev': self.local_dev,
+            'policy': self.policy,
+            'partition': 1,
+            'part_path': part_path,
+        }
+        job = self.reconstructor.build_reconstruction_jobs(part_info)[0]
+        node = job['sync_to'][0]
+        job['hashes'] = local_hashes = {
+            '123': {job['frag_index']: 'hash', None: 'hash'},
+            'abc': {job['frag_index']: 'hash', None: 'hash'},
+            'abd': {job['frag_index']: 'hash', None: 'hash'},
+        }
+        remote_index = self.policy.get_backend_index(node['index'])
+        remote_hashes = {
+            '123': {remote_index: 'hash', None: 'hash'},
+            'abc': {remote_index: 'other', None: 'hash'},
+            'abd': {remote_index: 'hash', None: 'hash'},
+        }
+        remote_tree = diskfile.build_hash_tree(remote_hashes, remote_index)
+        bodies = [pickle.dumps(diskfile.hash_tree_children(
+            remote_tree, prefixes)) for prefixes in ([''], ['a'], ['ab'])]
+        with mock.patch('swift.obj.diskfile.ECDiskFileManager._get_hashes',
+                        return_value=(None, local_hashes)), \
+                mocked_http_conn(200, 200, 200, body_iter=bodies, headers={
+                    'X-Backend-Hash-Tree': 'yes'}) as request_log:
+            suffixes, new_node = self.reconstructor._get_suffixes_to_sync(
+                job, node)
+        self.assertEqual(['abc'], suffixes)
+        self.assertEqual(new_node, node)
+        self.assertEqual(
+            [(None, str(remote_index)), ('a', str(remote_index)),
+             ('ab', str(remote_index))],
+            [(r['headers'].get('X-Backend-Hash-Tree-Prefixes'),
+              str(r['headers']['X-Backend-Hash-Tree-Index']))
+             for r in request_log.requests])
+
+        # servers which do not know about hash trees send all the hashes
+        with mock.patch('swift.obj.diskfile.ECDiskFileManager._get_hashes',
+                        return_value=(None, local_hashes)), \
+                mocked_http_conn(200, body=pickle.dumps(remote_hashes)) \
+                as request_log:
+            suffixes, new_node = self.reconstructor._get_suffixes_to_sync(
+                job, node)
+        self.assertEqual(['abc'], suffixes)
+        self.assertEqual(1, len(request_log.requests))
+
     def test_get_suffix_delta(self):
         # different
         local_suff = {'123': {None: 'abc', 0: 'def'}}
@@ -4693,6 +4794,106 @@ class TestReconstructFragmentArchive(BaseTestObjectReconstructor):
         self.assertFalse(self.logger.get_lines_for_level('error'))
         self.assertFalse(self.logger.get_lines_for_level('warning'))
 
+    def test_reconstruct_fa_readahead(self):
+        job = {
+            'partition': 0,
+            'policy': self.policy,
+        }
+        part_nodes = self.policy.object_ring.get_part_nodes(0)
+        node = part_nodes[1]
+        node['backend_index'] = self.policy.get_backend_index(node['index'])
+
+        test_data = (b'rebuild' * self.policy.ec_segment_size)[:-777]
+        etag = md5(test_data).hexdigest()
+        ec_archive_bodies = encode_frag_archive_bodies(self.policy, test_data)
+        broken_body = ec_archive_bodies.pop(1)
+
+        responses = list()
+        for body in ec_archive_bodies:
+            headers = get_header_frag_index(self, body)
+            headers.update({'X-Object-Sysmeta-Ec-Etag': etag})
+            responses.append((200, body, headers))
+
+        self.reconstructor.rebuild_readahead = 3
+        self.reconstructor._reset_stats()
+        batches = []
+        orig_func = self.reconstructor._reconstruct_batch
+
+        def _reconstruct_batch(policy, fragment_payloads, frag_index):
+            if not batches:
+                # the next segments are read meanwhile
+                time.sleep(0.05)
+            batches.append(len(fragment_payloads))
+            return orig_func(policy, fragment_payloads, frag_index)
+
+        codes, body_iter, headers = zip(*responses)
+        with mock.patch.object(self.reconstructor, '_reconstruct_batch',
+                               _reconstruct_batch), \
+                mocked_http_conn(*codes, body_iter=body_iter,
+                                 headers=headers):
+            df = self.reconstructor.reconstruct_fa(
+                job, node, self.obj_metadata)
+            fixed_body = b''.join(df.reader())
+        self.assertEqual(len(fixed_body), len(broken_body))
+        self.assertEqual(md5(fixed_body).hexdigest(),
+                         md5(broken_body).hexdigest())
+        # every segment was rebuilt, some of them together
+        self.assertEqual(7, sum(batches))
+        self.assertLess(len(batches), 7)
+        self.assertEqual(1, self.reconstructor.rebuilt_archives)
+        self.assertEqual(len(fixed_body), self.reconstructor.rebuilt_bytes)
+        self.assertFalse(self.logger.get_lines_for_level('error'))
+        self.assertFalse(self.logger.get_lines_for_level('warning'))
+
+    def test_reconstruct_fa_readahead_stopped(self):
+        job = {
+            'partition': 0,
+            'policy': self.policy,
+        }
+        part_nodes = self.policy.object_ring.get_part_nodes(0)
+        node = part_nodes[1]
+        node['backend_index'] = self.policy.get_backend_index(node['index'])
+
+        test_data = (b'rebuild' * self.policy.ec_segment_size)[:-777]
+        etag = md5(test_data).hexdigest()
+        ec_archive_bodies = encode_frag_archive_bodies(self.policy, test_data)
+        broken_body = ec_archive_bodies.pop(1)
+
+        responses = list()
+        for body in ec_archive_bodies:
+            headers = get_header_frag_index(self, body)
+            headers.update({'X-Object-Sysmeta-Ec-Etag': etag})
+            responses.append((200, body, headers))
+
+        self.reconstructor.rebuild_readahead = 1
+        readers = []
+        orig_spawn = object_reconstructor.spawn
+
+        def _spawn(func, *args, **kwargs):
+            readers.append(orig_spawn(func, *args, **kwargs))
+            return readers[-1]
+
+        codes, body_iter, headers = zip(*responses)
+        with mock.patch('swift.obj.reconstructor.spawn', _spawn), \
+                mocked_http_conn(*codes, body_iter=body_iter,
+                                 headers=headers) as fake_conn:
+            df = self.reconstructor.reconstruct_fa(
+                job, node, self.obj_metadata)
+            reader = df.reader()
+            first_fragment = next(reader)
+            # the consumer goes away in the middle of the rebuild,
+            # while the read-ahead queue is full
+            sleep(0.01)
+            reader.close()
+            sleep(0.01)
+        self.assertEqual(broken_body[:len(first_fragment)], first_fragment)
+        self.assertLess(len(first_fragment), len(broken_body))
+        self.assertEqual(1, len(readers))
+        self.assertTrue(readers[0].dead)
+        # the responses used for the rebuild were closed
+        self.assertEqual(self.policy.ec_ndata, len(
+            [conn for conn in fake_conn.responses if conn.closed]))
+
     def test_reconstruct_fa_errors_works(self):
         job = {
             'partition': 0,
@@ -855,6 +855,181 @@ class TestObjectReplicator(unittest.TestCase):
         self.assertTrue(jobs[0]['delete'])
         self.assertEqual('1', jobs[0]['partition'])
 
+    def test_collect_jobs_unhealthy_first(self):
+        self.conf['unhealthy_first'] = 'yes'
+        self._create_replicator()
+        health = self.replicator.partition_health
+        now = time.time()
+        health.since = now - 100
+        # handoffs have been out of sync since they were written
+        for path in (self.parts['1'], self.parts_1['1']):
+            os.utime(path, (now - 100, now - 100))
+        jobs = self.replicator.collect_jobs()
+        self.assertEqual([True, True], [job['delete'] for job in jobs[:2]])
+        self.assertFalse(any(job['delete'] for job in jobs[2:]))
+
+        # a primary partition two nodes did not match the last time
+        unhealthy = jobs[-1]
+        health.update(unhealthy, 2, False, now - 50)
+        # and another one found in sync a few seconds ago
+        healthy = jobs[-2]
+        health.update(healthy, 0, True, now - 5)
+        jobs = self.replicator.collect_jobs()
+        self.assertEqual(unhealthy['path'], jobs[0]['path'])
+        self.assertEqual([True, True], [job['delete'] for job in jobs[1:3]])
+        self.assertEqual(healthy['path'], jobs[-1]['path'])
+
+        # partitions no job is about anymore are forgotten
+        health.partitions[(0, 'sdz', '0')] = [1, None, now]
+        self.replicator.collect_jobs()
+        self.assertEqual(2, len(health.partitions))
+        self.assertEqual(1, health.unhealthy_count('sda'))
+
+    def test_collect_jobs_unhealthy_first_handoffs_first(self):
+        self.conf.update({'unhealthy_first': 'yes', 'handoffs_first': 'yes'})
+        self._create_replicator()
+        jobs = self.replicator.collect_jobs()
+        health = self.replicator.partition_health
+        health.update(jobs[-1], 2, False, time.time())
+        jobs = self.replicator.collect_jobs()
+        self.assertEqual([True, True], [job['delete'] for job in jobs[:2]])
+        self.assertFalse(jobs[2]['delete'])
+
+    @mock.patch('swift.obj.replicator.tpool.execute')
+    @mock.patch('swift.obj.replicator.http_connect', autospec=True)
+    def test_update_unhealthy_first(self, mock_http, mock_tpool_execute):
+        self.conf['unhealthy_first'] = 'yes'
+        self._create_replicator()
+        health = self.replicator.partition_health
+        self.replicator._zero_stats()
+        job = [job for job in self.replicator.collect_jobs()
+               if job['partition'] == '0' and int(job['policy']) == 0][0]
+        key = (0, 'sda', '0')
+        mock_tpool_execute.return_value = (1, {'a83': 'abcd'})
+        mock_http.return_value = answer = mock.MagicMock()
+        answer.getresponse.return_value = resp = mock.MagicMock()
+        resp.status = 200
+        resp.read.return_value = pickle.dumps({'a83': 'dcba'})
+
+        # the remote nodes could not be synced
+        self.replicator.sync = mock.MagicMock(return_value=(False, []))
+        begin = time.time()
+        self.replicator.update(job)
+        self.assertEqual([2, None, mock.ANY], health.partitions[key])
+        unhealthy_since = health.partitions[key][2]
+        self.assertGreaterEqual(unhealthy_since, begin)
+        self.assertEqual(0, health.time_to_healthy['sda'].count)
+
+        # they could the next time
+        self.replicator.sync = mock.MagicMock(return_value=(True, []))
+        self.replicator.update(job)
+        self.assertEqual([2, mock.ANY, None], health.partitions[key])
+        last_healthy = health.partitions[key][1]
+        self.assertGreaterEqual(last_healthy, unhealthy_since)
+        self.assertEqual(1, health.time_to_healthy['sda'].count)
+        self.assertEqual(last_healthy - unhealthy_since,
+                         health.time_to_healthy['sda'].max)
+
+        # and they match now
+        resp.read.return_value = pickle.dumps({'a83': 'abcd'})
+        self.replicator.update(job)
+        self.assertEqual([0, mock.ANY, None], health.partitions[key])
+        self.assertGreaterEqual(health.partitions[key][1], last_healthy)
+        self.assertEqual(1, health.time_to_healthy['sda'].count)
+
+        self.replicator.update_recon(1, time.time(), None)
+        with open(self.replicator.rcache) as fh:
+            recon = json.load(fh)
+        self.assertEqual(
+            {'sda': {
+                'time_to_healthy': health.time_to_healthy['sda'].to_dict(),
+                'unhealthy_partitions': 0}},
+            recon['object_replication_health'])
+
+    @mock.patch('swift.obj.replicator.tpool.execute')
+    @mock.patch('swift.obj.replicator.http_connect', autospec=True)
+    def test_update_hash_tree(self, mock_http, mock_tpool_execute):
+        self.conf['hash_tree'] = 'yes'
+        self._create_replicator()
+        self.replicator._zero_stats()
+        job = [job for job in self.replicator.collect_jobs()
+               if job['partition'] == '0' and int(job['policy']) == 0][0]
+        local_hash = {'%03x' % i: 'h%d' % i for i in range(0, 4096, 5)}
+        mock_tpool_execute.return_value = (0, local_hash)
+        remote_hash = dict(local_hash, **{'005': 'other', 'abc': 'new'})
+        requests = []
+
+        def fake_http_connect(ip, port, device, partition, method, path,
+                              headers=None):
+            requests.append((path, dict(headers)))
+            resp = mock.MagicMock(status=200)
+            if path or not server_hash_tree:
+                resp.read.return_value = pickle.dumps(remote_hash)
+                resp.getheader.return_value = None
+            else:
+                tree = diskfile.build_hash_tree(remote_hash)
+                resp.read.return_value = pickle.dumps(
+                    diskfile.hash_tree_children(tree, headers.get(
+                        'X-Backend-Hash-Tree-Prefixes', '').split(',')))
+                resp.getheader.side_effect = {
+                    'X-Backend-Hash-Tree': 'yes'}.get
+            conn = mock.MagicMock()
+            conn.getresponse.return_value = resp
+            return conn
+
+        mock_http.side_effect = fake_http_connect
+        for server_hash_tree in (True, False):
+            del requests[:]
+            self.replicator.sync = mock.MagicMock(return_value=(True, []))
+            self.replicator.update(job)
+            self.assertEqual([mock.call(node, job, ['005'])
+                              for node in job['nodes']],
+                             self.replicator.sync.call_args_list)
+            self.assertEqual([], self.logger.get_lines_for_level('error'))
+            # remote hash tree requests, then suffixes to recalculate
+            self.assertEqual(
+                [('', 'yes'), ('0,a', 'yes'),
+                 ('00,ab', 'yes'), ('/005', None)] * 2
+                if server_hash_tree else [('', 'yes'), ('/005', None)] * 2,
+                [(headers.get('X-Backend-Hash-Tree-Prefixes', path),
+                  headers.get('X-Backend-Hash-Tree'))
+                 for path, headers in requests])
+
+    def test_delete_partition_unhealthy_first(self):
+        self.conf['unhealthy_first'] = 'yes'
+        self._create_replicator()
+        self.replicator._zero_stats()
+        health = self.replicator.partition_health
+        part_path = os.path.join(self.objects, '1')
+        df = self.df_mgr.get_diskfile('sda', '1', 'a', 'c', 'o',
+                                      policy=POLICIES.legacy)
+        mkdirs(df._datadir)
+        with open(os.path.join(df._datadir,
+                               normalize_timestamp(time.time()) + '.data'),
+                  'wb') as f:
+            f.write(b'1234567890')
+        written = time.time() - 60
+        os.utime(part_path, (written, written))
+        with mock.patch('swift.obj.replicator.http_connect',
+                        mock_http_connect(200)), \
+                _mock_process([(1, '', [])] * 3):
+            self.replicator.replicate(override_partitions=[1],
+                                      override_policies=[0])
+        self.assertTrue(os.access(part_path, os.F_OK))
+        self.assertEqual([3, None, mock.ANY],
+                         health.partitions[(0, 'sda', '1')])
+        self.assertEqual(0, health.time_to_healthy['sda'].count)
+
+        with mock.patch('swift.obj.replicator.http_connect',
+                        mock_http_connect(200)), \
+                _mock_process([(0, '', [])] * 3):
+            self.replicator.replicate(override_partitions=[1],
+                                      override_policies=[0])
+        self.assertFalse(os.access(part_path, os.F_OK))
+        self.assertNotIn((0, 'sda', '1'), health.partitions)
+        self.assertEqual(1, health.time_to_healthy['sda'].count)
+        self.assertGreaterEqual(health.time_to_healthy['sda'].max, 60)
+
     def test_handoffs_first_mode_will_process_all_jobs_after_handoffs(self):
         # make an object in the handoff & primary partition
         expected_suffix_paths = []
@@ -1591,6 +1766,36 @@ class TestObjectReplicator(unittest.TestCase):
 
             del self.call_nums
 
+    def test_delete_handoff_objs_updates_partition_index(self):
+        self.conf['partition_index'] = 'true'
+        self._create_replicator()
+        df_mgr = self.df_mgr
+        hashes = []
+        suffixes = []
+        for obj in ('o1', 'o2'):
+            df = df_mgr.get_diskfile('sda', '1', 'a', 'c', obj,
+                                     policy=POLICIES.legacy)
+            mkdirs(df._datadir)
+            with open(os.path.join(
+                    df._datadir, next(self.ts).internal + '.data'),
+                    'wb') as fh:
+                fh.write(b'0')
+            hashes.append(os.path.basename(df._datadir))
+            suffixes.append(os.path.basename(os.path.dirname(df._datadir)))
+        # walk the partition once, so that its index is complete
+        df_mgr.get_hashes('sda', '1', [], POLICIES.legacy)
+        job = {'obj_path': self.objects, 'partition': '1'}
+        success_paths, error_paths = self.replicator.delete_handoff_objs(
+            job, hashes[:1])
+        self.assertEqual([], error_paths)
+        self.assertEqual(1, len(success_paths))
+        # the object directory which was deleted has left the index
+        with mock.patch('os.listdir',
+                        side_effect=AssertionError('walked')):
+            found = [hsh for hsh, _ts in df_mgr.yield_hashes(
+                'sda', '1', POLICIES.legacy, suffixes=suffixes)]
+        self.assertEqual(hashes[1:], found)
+
     def test_delete_partition_ssync_with_cleanup_failure(self):
         with mock.patch('swift.obj.replicator.http_connect',
                         mock_http_connect(200)):
@@ -2556,6 +2761,48 @@ class TestMultiProcessReplicator(unittest.TestCase):
         self.assertEqual(recon_data['object_replication_time'], 2)  # minutes
         self.assertEqual(recon_data['object_replication_last'], 1521680120)
 
+    def test_recon_run_once_unhealthy_first(self):
+        self.conf['unhealthy_first'] = 'yes'
+        self.replicator = object_replicator.ObjectReplicator(
+            self.conf, logger=self.logger)
+        self.replicator.replicator_workers = 2
+        health = self.replicator.partition_health
+
+        def fake_replicate(override_devices, **kw):
+            for device in override_devices:
+                job = {'policy': POLICIES[0], 'device': device,
+                       'partition': '0', 'delete': False}
+                health.update(job, 1, False, time.time())
+                if device == 'sda':
+                    health.update(job, 1, True, time.time())
+
+        with mock.patch.object(self.replicator, 'replicate',
+                               fake_replicate):
+            self.replicator.get_worker_args()
+            self.replicator.run_once(multiprocess_worker_index=0,
+                                     override_devices=['sda', 'sdb', 'sdc'])
+            self.replicator.run_once(multiprocess_worker_index=1,
+                                     override_devices=['sdd', 'sde'])
+
+        with open(self.recon_file) as fh:
+            recon_data = json.load(fh)
+        per_disk = recon_data['object_replication_per_disk']
+        self.assertEqual(1, per_disk['sda']['time_to_healthy']['count'])
+        self.assertEqual(0, per_disk['sda']['unhealthy_partitions'])
+        self.assertEqual(0, per_disk['sdb']['time_to_healthy']['count'])
+        self.assertEqual(1, per_disk['sdb']['unhealthy_partitions'])
+
+        self.replicator.post_multiprocess_run()
+        with open(self.recon_file) as fh:
+            recon_data = json.load(fh)
+        self.assertEqual(
+            ['sda', 'sdb', 'sdc', 'sdd', 'sde'],
+            sorted(recon_data['object_replication_health']))
+        self.assertEqual(
+            per_disk['sda']['time_to_healthy'],
+            recon_data['object_replication_health']['sda'][
+                'time_to_healthy'])
+
     def test_recon_skipped_with_overrides(self):
         self.replicator.replicator_workers = 3
 
@@ -2750,5 +2997,81 @@ class TestReplicatorStats(unittest.TestCase):
         })
 
 
+class TestPartitionHealth(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.health = object_replicator.PartitionHealth()
+        self.now = time.time()
+        self.health.since = self.now - 1000
+
+    def tearDown(self):
+        rmtree(self.tempdir, ignore_errors=True)
+
+    def _job(self, partition, delete=False, device='sda'):
+        return {'policy': POLICIES[0], 'device': device,
+                'partition': partition, 'delete': delete,
+                'path': os.path.join(self.tempdir, partition)}
+
+    def test_score(self):
+        job = self._job('1')
+        # nothing known: as unhealthy as could be since the replicator
+        # started
+        self.assertEqual(1000, self.health.score(job, self.now))
+        self.health.update(job, 0, True, self.now - 20)
+        last_healthy = self.health.partitions[(0, 'sda', '1')][1]
+        self.assertAlmostEqual(self.now + 10 - last_healthy,
+                               self.health.score(job, self.now + 10))
+        # weighted by the number of nodes out of sync
+        self.health.update(job, 2, False, self.now)
+        self.assertAlmostEqual(3 * (self.now + 10 - last_healthy),
+                               self.health.score(job, self.now + 10))
+
+        handoff = self._job('2', delete=True)
+        self.assertEqual(0, self.health.score(handoff, self.now))
+        os.mkdir(handoff['path'])
+        os.utime(handoff['path'], (self.now - 30, self.now - 30))
+        self.assertAlmostEqual(60, self.health.score(handoff, self.now))
+        self.health.update(handoff, 3, False, self.now)
+        self.assertAlmostEqual(120, self.health.score(handoff, self.now))
+
+    def test_sort(self):
+        jobs = [self._job(str(i)) for i in range(5)]
+        self.health.update(jobs[3], 1, False, self.now)
+        self.health.update(jobs[1], 0, True, self.now)
+        self.health.sort(jobs)
+        self.assertEqual(['3', '0', '2', '4', '1'],
+                         [job['partition'] for job in jobs])
+
+    def test_time_to_healthy(self):
+        job = self._job('1')
+        self.health.update(job, 2, False, self.now - 100)
+        self.health.update(job, 1, False, self.now - 50)
+        self.assertEqual(0, self.health.time_to_healthy['sda'].count)
+        self.assertEqual(1, self.health.unhealthy_count('sda'))
+        self.assertEqual(0, self.health.unhealthy_count('sdb'))
+        self.health.update(job, 1, True, self.now)
+        self.assertEqual(1, self.health.time_to_healthy['sda'].count)
+        self.assertGreaterEqual(self.health.time_to_healthy['sda'].max, 100)
+        # out of sync when the job started, but fixed by the job
+        self.assertEqual(0, self.health.unhealthy_count('sda'))
+
+        handoff = self._job('2', delete=True, device='sdb')
+        self.health.update(handoff, 1, False, self.now)
+        self.health.handoff_removed(handoff, self.now - 10)
+        self.assertNotIn((0, 'sdb', '2'), self.health.partitions)
+        self.assertEqual(0, self.health.unhealthy_count('sdb'))
+        recon = self.health.to_recon('sdb')
+        self.assertEqual(1, recon['time_to_healthy']['count'])
+        self.assertEqual(0, recon['unhealthy_partitions'])
+
+        self.health.update(job, 1, False, self.now)
+        self.health.reset_stats()
+        self.assertEqual(0, self.health.to_recon('sda')[
+            'time_to_healthy']['count'])
+        self.assertEqual(1, self.health.to_recon('sda')[
+            'unhealthy_partitions'])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1447,6 +1447,38 @@ class TestObjectController(unittest.TestCase):
                           'X-Object-Meta-Test': 'one',
                           'Custom-Header': '*'})
 
+    def test_PUT_group_commit(self):
+        conf = dict(self.conf, group_commit_window='0.01',
+                    recon_cache_path=self.tmpdir)
+        object_controller = object_server.ObjectController(
+            conf, logger=self.logger)
+        timestamp = normalize_timestamp(time())
+        req = Request.blank(
+            '/sda1/p/a/c/o', environ={'REQUEST_METHOD': 'PUT'},
+            headers={'X-Timestamp': timestamp,
+                     'Content-Length': '6',
+                     'Content-Type': 'application/octet-stream'})
+        req.body = 'VERIFY'
+        with mock.patch('swift.obj.diskfile.syncfs',
+                        return_value=True) as mock_syncfs, \
+                mock.patch('os.getpid', return_value=1234), \
+                mock.patch.object(object_controller.recon_stats,
+                                  'interval', 0):
+            resp = req.get_response(object_controller)
+        self.assertEqual(resp.status_int, 201)
+        # the data file, then the directory entry
+        self.assertEqual(2, mock_syncfs.call_count)
+        objfile = os.path.join(
+            self.testdir, 'sda1',
+            storage_directory(diskfile.get_data_dir(POLICIES[0]),
+                              'p', hash_path('a', 'c', 'o')),
+            utils.Timestamp(timestamp).internal + '.data')
+        self.assertTrue(os.path.isfile(objfile))
+        with open(os.path.join(self.tmpdir, 'object.recon')) as recon:
+            stats = json.load(recon)['object_group_commit']['1234']
+        self.assertEqual(
+            2, stats[str(int(POLICIES[0]))]['sda1']['batch_sizes']['count'])
+
     def test_PUT_overwrite(self):
         req = Request.blank(
             '/sda1/p/a/c/o', environ={'REQUEST_METHOD': 'PUT'},
@@ -2850,6 +2882,43 @@ class TestObjectController(unittest.TestCase):
         self.assertEqual(resp.headers['X-Backend-Timestamp'],
                          utils.Timestamp(timestamp).internal)
 
+    def test_HEAD_metadata_cache_hit_ratio(self):
+        conf = dict(self.conf, metadata_cache_size='100')
+        object_controller = object_server.ObjectController(
+            conf, logger=self.logger)
+        cache = object_controller._diskfile_router[
+            POLICIES[0]].metadata_cache
+        datadirs = []
+        for i in range(20):
+            req = Request.blank(
+                '/sda1/p/a/c/o%d' % i, environ={'REQUEST_METHOD': 'PUT'},
+                headers={'X-Timestamp': next(self.ts).internal,
+                         'Content-Type': 'application/octet-stream',
+                         'X-Object-Meta-Color': 'blue'},
+                body=b'VERIFY')
+            resp = req.get_response(object_controller)
+            self.assertEqual(201, resp.status_int)
+            datadir = object_controller.get_diskfile(
+                'sda1', 'p', 'a', 'c', 'o%d' % i, POLICIES[0])._datadir
+            old = time() - 10
+            os.utime(datadir, (old, old))
+            datadirs.append(datadir)
+
+        # out of every 10 HEAD requests, how many may hit the cache
+        for cached in (0, 5, 9, 10):
+            hits, misses = cache.hits, cache.misses
+            for i in range(100):
+                if (i % 10) >= cached:
+                    cache.invalidate(datadirs[i % 20])
+                req = Request.blank('/sda1/p/a/c/o%d' % (i % 20),
+                                    environ={'REQUEST_METHOD': 'HEAD'})
+                resp = req.get_response(object_controller)
+                self.assertEqual(200, resp.status_int)
+                self.assertEqual('blue', resp.headers['X-Object-Meta-Color'])
+            # every object was cached by the first pass
+            self.assertEqual(10 * cached, cache.hits - hits)
+            self.assertEqual(100 - 10 * cached, cache.misses - misses)
+
     def test_HEAD_quarantine_zbyte(self):
         # Test swift.obj.server.ObjectController.GET
         timestamp = normalize_timestamp(time())
@@ -6999,6 +7068,58 @@ class TestObjectController(unittest.TestCase):
             tpool.execute = was_tpool_exe
             diskfile.DiskFileManager._get_hashes = was_get_hashes
 
+    def test_REPLICATE_hash_tree(self):
+        tree = diskfile.build_hash_tree({'abc': 'h1', 'abd': 'h2',
+                                         'f12': 'h3'})
+
+        def fake_get_hash_tree(self, device, partition, policy,
+                               frag_index=None):
+            calls.append(frag_index)
+            return 0, tree
+
+        def do_replicate(path, headers):
+            req = Request.blank(path, environ={'REQUEST_METHOD': 'REPLICATE'},
+                                headers=headers)
+            with mock.patch('swift.obj.diskfile.tpool.execute',
+                            lambda func, *a, **kw: func(*a, **kw)), \
+                    mock.patch.object(diskfile.DiskFileManager,
+                                      '_get_hash_tree', fake_get_hash_tree), \
+                    mock.patch.object(diskfile.DiskFileManager,
+                                      '_get_hashes',
+                                      return_value=(0, {'abc': 'h1'})):
+                return req.get_response(self.object_controller)
+
+        calls = []
+        resp = do_replicate('/sda1/p', {'X-Backend-Hash-Tree': 'yes'})
+        self.assertEqual(200, resp.status_int)
+        self.assertEqual('yes', resp.headers['X-Backend-Hash-Tree'])
+        self.assertEqual(['', 'a', 'f'], sorted(pickle.loads(resp.body)))
+        self.assertEqual([None], calls)
+
+        resp = do_replicate('/sda1/p', {'X-Backend-Hash-Tree': 'yes',
+                                        'X-Backend-Hash-Tree-Prefixes':
+                                        'ab,f1',
+                                        'X-Backend-Hash-Tree-Index': '3'})
+        self.assertEqual(200, resp.status_int)
+        self.assertEqual({'abc': 'h1', 'abd': 'h2', 'f12': 'h3'},
+                         pickle.loads(resp.body))
+        self.assertEqual([None, 3], calls)
+
+        # suffixes to recalculate are always answered with suffix hashes
+        resp = do_replicate('/sda1/p/abc', {'X-Backend-Hash-Tree': 'yes'})
+        self.assertEqual(200, resp.status_int)
+        self.assertNotIn('X-Backend-Hash-Tree', resp.headers)
+        self.assertEqual({'abc': 'h1'}, pickle.loads(resp.body))
+
+        resp = do_replicate('/sda1/p', {})
+        self.assertNotIn('X-Backend-Hash-Tree', resp.headers)
+        self.assertEqual({'abc': 'h1'}, pickle.loads(resp.body))
+        self.assertEqual([None, 3], calls)
+
+        resp = do_replicate('/sda1/p', {'X-Backend-Hash-Tree': 'yes',
+                                        'X-Backend-Hash-Tree-Index': 'x'})
+        self.assertEqual(400, resp.status_int)
+
     def test_REPLICATE_timeout(self):
 
         def fake_get_hashes(*args, **kwargs):
@@ -8440,6 +8561,8 @@ class TestObjectServer(unittest.TestCase):
 class TestZeroCopy(unittest.TestCase):
     """Test the object server's zero-copy functionality"""
 
+    read_conf = {'splice': 'yes'}
+
     def _system_can_zero_copy(self):
         if not splice.available:
             return False
@@ -8459,10 +8582,8 @@ class TestZeroCopy(unittest.TestCase):
         self.testdir = mkdtemp(suffix="obj_server_zero_copy")
         mkdirs(os.path.join(self.testdir, 'sda1', 'tmp'))
 
-        conf = {'devices': self.testdir,
-                'mount_check': 'false',
-                'splice': 'yes',
-                'disk_chunk_size': '4096'}
+        conf = dict(self.read_conf, devices=self.testdir,
+                    mount_check='false', disk_chunk_size='4096')
         self.object_controller = object_server.ObjectController(
             conf, logger=debug_logger())
         self.df_mgr = diskfile.DiskFileManager(
@@ -8573,6 +8694,75 @@ class TestZeroCopy(unittest.TestCase):
         self.assertEqual(contents, b'')
 
 
+class TestZeroCopySendfile(TestZeroCopy):
+    """Test the object server's zero-copy functionality with sendfile()"""
+
+    read_conf = {'read_mode': 'sendfile'}
+
+    def _system_can_zero_copy(self):
+        return hasattr(os, 'sendfile')
+
+    def test_GET_range(self):
+        obj_contents = b'0123456789' * 1000
+        url_path = '/sda1/2100/a/c/o'
+
+        self.http_conn.request('PUT', url_path, obj_contents,
+                               {'X-Timestamp': '1402600322.52126',
+                                'Content-Type': 'application/test'})
+        response = self.http_conn.getresponse()
+        self.assertEqual(response.status, 201)
+        response.read()
+
+        with mock.patch('swift.obj.diskfile.os.sendfile',
+                        wraps=os.sendfile) as mock_sendfile:
+            self.http_conn.request('GET', url_path,
+                                   headers={'Range': 'bytes=1005-8004'})
+            response = self.http_conn.getresponse()
+            self.assertEqual(response.status, 206)
+            self.assertEqual('bytes 1005-8004/10000',
+                             response.getheader('Content-Range'))
+            contents = response.read()
+        self.assertEqual(contents, obj_contents[1005:8005])
+        self.assertTrue(mock_sendfile.called)
+
+        # multipart responses are copied
+        with mock.patch('swift.obj.diskfile.os.sendfile',
+                        wraps=os.sendfile) as mock_sendfile:
+            self.http_conn.request('GET', url_path,
+                                   headers={'Range': 'bytes=1-2,5-6'})
+            response = self.http_conn.getresponse()
+            self.assertEqual(response.status, 206)
+            contents = response.read()
+        self.assertIn(b'12', contents)
+        self.assertIn(b'56', contents)
+        self.assertFalse(mock_sendfile.called)
+
+    def test_quarantine(self):
+        obj_hash = hash_path('a', 'c', 'o')
+        url_path = '/sda1/2100/a/c/o'
+        ts = '1402601849.47475'
+
+        self.http_conn.request('PUT', url_path, b'obj contents',
+                               {'X-Timestamp': ts,
+                                'Content-Type': 'application/test'})
+        response = self.http_conn.getresponse()
+        self.assertEqual(response.status, 201)
+        response.read()
+
+        fname = os.path.join(self.testdir, 'sda1', 'objects', '2100',
+                             obj_hash[-3:], obj_hash, ts + '.data')
+        with open(fname, 'rb+') as fh:
+            fh.write(b'XYZ')
+
+        # the etag is left for the auditor to check
+        for _ in range(2):
+            self.http_conn.request('GET', url_path)
+            response = self.http_conn.getresponse()
+            self.assertEqual(response.status, 200)
+            contents = response.read()
+            self.assertEqual(contents, b'XYZ contents')
+
+
 class TestConfigOptionHandling(unittest.TestCase):
 
     def setUp(self):
@@ -1169,6 +1169,60 @@ class TestSsyncReplication(TestBaseSsync):
         self._verify_ondisk_files(tx_objs, policy)
         self._verify_tombstones(tx_tombstones, policy)
 
+    def test_sync_missing_check_batch(self):
+        policy = POLICIES.default
+        self.daemon.ssync_missing_check_batch = 2
+
+        tx_objs = {}
+        rx_objs = {}
+        tx_tombstones = {}
+        tx_df_mgr = self.daemon._df_router[policy]
+        rx_df_mgr = self.rx_controller._diskfile_router[policy]
+        # o1 and o2 are on tx only
+        t1 = next(self.ts_iter)
+        tx_objs['o1'] = self._create_ondisk_files(tx_df_mgr, 'o1', policy, t1)
+        t2 = next(self.ts_iter)
+        tx_objs['o2'] = self._create_ondisk_files(tx_df_mgr, 'o2', policy, t2)
+        # o3 is on tx and older copy on rx
+        t3a = next(self.ts_iter)
+        rx_objs['o3'] = self._create_ondisk_files(rx_df_mgr, 'o3', policy, t3a)
+        t3b = next(self.ts_iter)
+        tx_objs['o3'] = self._create_ondisk_files(tx_df_mgr, 'o3', policy, t3b)
+        # o4 in sync on rx and tx
+        t4 = next(self.ts_iter)
+        tx_objs['o4'] = self._create_ondisk_files(tx_df_mgr, 'o4', policy, t4)
+        rx_objs['o4'] = self._create_ondisk_files(rx_df_mgr, 'o4', policy, t4)
+        # o5 is a tombstone, missing on receiver
+        t5 = next(self.ts_iter)
+        tx_tombstones['o5'] = self._create_ondisk_files(
+            tx_df_mgr, 'o5', policy, t5)
+        tx_tombstones['o5'][0].delete(t5)
+
+        suffixes = set()
+        for diskfiles in list(tx_objs.values()) + list(tx_tombstones.values()):
+            for df in diskfiles:
+                suffixes.add(os.path.basename(os.path.dirname(df._datadir)))
+
+        job = {'device': self.device,
+               'partition': self.partition,
+               'policy': policy}
+        sender = ssync_sender.Sender(self.daemon, dict(self.rx_node), job,
+                                     suffixes)
+        sender.connect, trace = self.make_connect_wrapper(sender)
+
+        success, in_sync_objs = sender()
+
+        self.assertTrue(success)
+        self.assertEqual(5, len(in_sync_objs))
+        self.assertEqual('zlib', sender.missing_check_encoding)
+        # 5 objects offered in batches of at most 2
+        self.assertEqual(3, len([
+            msg for direction, msg in trace['messages']
+            if direction == 'tx' and
+            msg.startswith(b':MISSING_CHECK: BATCH ')]))
+        self._verify_ondisk_files(tx_objs, policy)
+        self._verify_tombstones(tx_tombstones, policy)
+
     def test_nothing_to_sync(self):
         job = {'device': self.device,
                'partition': self.partition,
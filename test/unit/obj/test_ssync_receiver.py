@@ -957,6 +957,60 @@ class TestReceiver(unittest.TestCase):
         self.assertFalse(self.controller.logger.error.called)
         self.assertFalse(self.controller.logger.exception.called)
 
+    def test_MISSING_CHECK_batch(self):
+        object_dir = utils.storage_directory(
+            os.path.join(self.testdir, 'sda1',
+                         diskfile.get_data_dir(POLICIES[0])),
+            '1', self.hash1)
+        utils.mkdirs(object_dir)
+        newer_ts1 = utils.normalize_timestamp(float(self.ts1) + 1)
+        self.metadata1['X-Timestamp'] = newer_ts1
+        fp = open(os.path.join(object_dir, newer_ts1 + '.data'), 'w+')
+        fp.write('1')
+        fp.flush()
+        self.metadata1['Content-Length'] = '1'
+        diskfile.write_metadata(fp, self.metadata1)
+
+        data = ssync_sender.encode_missing_batch([
+            (self.hash1, {'ts_data': utils.Timestamp(self.ts1)}),
+            (self.hash2, {'ts_data': utils.Timestamp(self.ts2)})])
+        self.controller.logger = mock.MagicMock()
+        req = swob.Request.blank(
+            '/sda1/1',
+            environ={'REQUEST_METHOD': 'SSYNC'},
+            headers={'X-Backend-Ssync-Missing-Check-Encoding': 'zlib'},
+            body=b':MISSING_CHECK: START\r\n'
+                 b':MISSING_CHECK: BATCH %x\r\n%s'
+                 b':MISSING_CHECK: END\r\n'
+                 b':UPDATES: START\r\n:UPDATES: END\r\n' % (len(data), data))
+        resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(
+            'zlib', resp.headers['X-Backend-Ssync-Missing-Check-Encoding'])
+        self.assertFalse(self.controller.logger.error.called)
+        self.assertFalse(self.controller.logger.exception.called)
+        head, batch = resp.body.split(b':MISSING_CHECK: BATCH ', 1)
+        self.assertEqual(b'\r\n:MISSING_CHECK: START\r\n', head)
+        length, rest = batch.split(b'\r\n', 1)
+        length = int(length, 16)
+        self.assertEqual([[self.hash2, 'dm']],
+                         ssync_sender.decode_wanted_batch(rest[:length]))
+        self.assertEqual(
+            self.body_lines(rest[length:]),
+            [b':MISSING_CHECK: END', b':UPDATES: START', b':UPDATES: END'])
+
+        # a batch is a protocol error unless the encoding was asked
+        req = swob.Request.blank(
+            '/sda1/1',
+            environ={'REQUEST_METHOD': 'SSYNC'},
+            body=b':MISSING_CHECK: START\r\n'
+                 b':MISSING_CHECK: BATCH %x\r\n%s'
+                 b':MISSING_CHECK: END\r\n' % (len(data), data))
+        resp = req.get_response(self.controller)
+        self.assertNotIn('X-Backend-Ssync-Missing-Check-Encoding',
+                         resp.headers)
+        self.assertEqual(b':ERROR:', self.body_lines(resp.body)[-1][:7])
+
     def test_MISSING_CHECK_have_newer_meta(self):
         object_dir = utils.storage_directory(
             os.path.join(self.testdir, 'sda1',
@@ -1515,6 +1569,117 @@ class TestReceiver(unittest.TestCase):
                     'content-length x-timestamp x-object-meta-test1 '
                     'content-encoding specialty-header')})
 
+    def test_UPDATES_concurrent(self):
+        applied = []
+
+        @server.public
+        def _PUT(request):
+            body = request.environ['wsgi.input'].read()
+            # let the other subrequests in the pool run
+            eventlet.sleep(0.01 if request.path.endswith('/o1') else 0)
+            applied.append((request.method, request.path, body))
+            return swob.HTTPCreated()
+
+        @server.public
+        def _DELETE(request):
+            applied.append((request.method, request.path, None))
+            return swob.HTTPNoContent()
+
+        self.controller.ssync_concurrency = 4
+        self.controller.ssync_buffer_size = 2
+        with mock.patch.object(self.controller, 'PUT', _PUT), \
+                mock.patch.object(self.controller, 'DELETE', _DELETE):
+            self.controller.logger = mock.MagicMock()
+            req = swob.Request.blank(
+                '/device/partition',
+                environ={'REQUEST_METHOD': 'SSYNC'},
+                headers={'X-Backend-Ssync-Concurrency': '8'},
+                body=':MISSING_CHECK: START\r\n:MISSING_CHECK: END\r\n'
+                     ':UPDATES: START\r\n'
+                     'PUT /a/c/o1\r\n'
+                     'Content-Length: 1\r\n'
+                     'X-Timestamp: 1364456113.12344\r\n'
+                     '\r\n'
+                     '1'
+                     'PUT /a/c/o2\r\n'
+                     'Content-Length: 3\r\n'
+                     'X-Timestamp: 1364456113.12344\r\n'
+                     '\r\n'
+                     '123'
+                     'DELETE /a/c/o1\r\n'
+                     'X-Timestamp: 1364456113.76334\r\n'
+                     '\r\n'
+                     'PUT /a/c/o3\r\n'
+                     'Content-Length: 1\r\n'
+                     'X-Timestamp: 1364456113.12344\r\n'
+                     '\r\n'
+                     '3')
+            resp = req.get_response(self.controller)
+            self.assertEqual(
+                self.body_lines(resp.body),
+                [b':MISSING_CHECK: START', b':MISSING_CHECK: END',
+                 b':UPDATES: START', b':UPDATES: END'])
+            self.assertEqual(resp.status_int, 200)
+            self.assertFalse(self.controller.logger.exception.called)
+            self.assertFalse(self.controller.logger.error.called)
+        # the first PUT was still in progress when the other ones were read:
+        # the large body was streamed inline, the small one was applied
+        # in the pool, and the DELETE of the same object waited for the PUT
+        self.assertEqual(applied, [
+            ('PUT', '/device/partition/a/c/o2', b'123'),
+            ('PUT', '/device/partition/a/c/o1', b'1'),
+            ('DELETE', '/device/partition/a/c/o1', None),
+            ('PUT', '/device/partition/a/c/o3', b'3')])
+
+    def test_UPDATES_concurrency_waits_on_error(self):
+        applied = []
+
+        @server.public
+        def _PUT(request):
+            body = request.environ['wsgi.input'].read()
+            eventlet.sleep(0.01)
+            applied.append((request.method, request.path, body))
+            return swob.HTTPCreated()
+
+        self.controller.ssync_concurrency = 4
+        with mock.patch.object(self.controller, 'PUT', _PUT):
+            self.controller.logger = mock.MagicMock()
+            req = swob.Request.blank(
+                '/device/partition',
+                environ={'REQUEST_METHOD': 'SSYNC'},
+                headers={'X-Backend-Ssync-Concurrency': '2'},
+                body=':MISSING_CHECK: START\r\n:MISSING_CHECK: END\r\n'
+                     ':UPDATES: START\r\n'
+                     'PUT /a/c/o1\r\n'
+                     'Content-Length: 1\r\n'
+                     'X-Timestamp: 1364456113.12344\r\n'
+                     '\r\n'
+                     '1'
+                     'BAD_METHOD /a/c/o2\r\n'
+                     '\r\n')
+            resp = req.get_response(self.controller)
+            self.assertEqual(
+                self.body_lines(resp.body),
+                [b':MISSING_CHECK: START', b':MISSING_CHECK: END',
+                 b":ERROR: 0 'Invalid subrequest method BAD_METHOD'"])
+        # the subrequest in progress in the pool was over before
+        # the receiver gave up
+        self.assertEqual(applied, [('PUT', '/device/partition/a/c/o1', b'1')])
+
+    def test_UPDATES_concurrency_bad_header(self):
+        self.controller.ssync_concurrency = 4
+        req = swob.Request.blank(
+            '/device/partition',
+            environ={'REQUEST_METHOD': 'SSYNC'},
+            headers={'X-Backend-Ssync-Concurrency': 'many'},
+            body=':MISSING_CHECK: START\r\n:MISSING_CHECK: END\r\n'
+                 ':UPDATES: START\r\n:UPDATES: END\r\n')
+        resp = req.get_response(self.controller)
+        self.assertEqual(
+            self.body_lines(resp.body),
+            [b"Invalid X-Backend-Ssync-Concurrency 'many'"])
+        self.assertEqual(resp.status_int, 400)
+
     def test_UPDATES_PUT_replication_headers(self):
         self.controller.logger = mock.MagicMock()
 
@@ -16,6 +16,7 @@ import io
 import os
 import time
 import unittest
+import zlib
 
 import eventlet
 import mock
@@ -24,7 +25,7 @@ import six
 from swift.common import exceptions, utils
 from swift.common.storage_policy import POLICIES
 from swift.common.utils import Timestamp
-from swift.obj import ssync_sender, diskfile, ssync_receiver
+from swift.obj import ssync_sender, diskfile, ssync_receiver, mem_diskfile
 from swift.obj.replicator import ObjectReplicator
 
 from test.unit.obj.common import BaseTest
@@ -217,6 +218,27 @@ class TestSender(BaseTest):
                                  method_name, mock_method.mock_calls,
                                  expected_calls))
 
+    def test_connect_concurrency(self):
+        node = dict(replication_ip='1.2.3.4', replication_port=5678,
+                    device='sda1')
+        job = dict(partition='9', policy=POLICIES.legacy)
+        self.daemon.ssync_concurrency = 8
+        self.sender = ssync_sender.Sender(self.daemon, node, job, None)
+        self.sender.suffixes = ['abc']
+        with mock.patch(
+                'swift.obj.ssync_sender.SsyncBufferedHTTPConnection'
+        ) as mock_conn_class:
+            mock_conn = mock_conn_class.return_value
+            mock_resp = mock.MagicMock()
+            mock_resp.status = 200
+            mock_conn.getresponse.return_value = mock_resp
+            self.sender.connect()
+        self.assertEqual([
+            mock.call('Transfer-Encoding', 'chunked'),
+            mock.call('X-Backend-Storage-Policy-Index', 0),
+            mock.call('X-Backend-Ssync-Concurrency', 8),
+        ], mock_conn.putheader.mock_calls)
+
     def test_connect_handoff(self):
         node = dict(replication_ip='1.2.3.4', replication_port=5678,
                     device='sda1')
@@ -1173,6 +1195,43 @@ class TestSender(BaseTest):
             b'11\r\n:UPDATES: START\r\n\r\n'
             b'f\r\n:UPDATES: END\r\n\r\n')
 
+    def test_updates_stats(self):
+        device = 'dev'
+        part = '9'
+        self._make_open_diskfile(device, part, 'a', 'c', 'o', body=b'test')
+        object_hash = utils.hash_path('a', 'c', 'o')
+        connection = FakeConnection()
+        self.sender.job = {
+            'device': device,
+            'partition': part,
+            'policy': POLICIES.legacy,
+            'frag_index': 0,
+        }
+        self.sender.node = {}
+        response = FakeResponse(
+            chunk_body=(
+                ':UPDATES: START\r\n'
+                ':UPDATES: END\r\n'))
+        self.daemon.ssync_stats.reset()
+        self.sender.updates(connection, response,
+                            {object_hash: {'data': True}})
+        self.assertEqual(1, self.sender.updates_sent)
+        # the PUT line and headers, then the body
+        self.assertEqual(0x68 + len(b'test'), self.sender.bytes_sent)
+        stats = self.daemon.ssync_stats
+        self.assertEqual(1, stats.connections)
+        self.assertEqual(1, stats.updates)
+        self.assertEqual(self.sender.bytes_sent, stats.bytes)
+        self.assertEqual(1, len(stats.rates))
+
+        stats.log(self.daemon_logger)
+        self.assertEqual(1, len(self.daemon_logger.get_lines_for_level(
+            'info')))
+        stats.reset()
+        stats.log(self.daemon_logger)
+        self.assertEqual(1, len(self.daemon_logger.get_lines_for_level(
+            'info')))
+
     def test_updates_post(self):
         ts_iter = make_timestamp_iter()
         device = 'dev'
@@ -1631,6 +1690,67 @@ class TestModuleMethods(unittest.TestCase):
         actual = ssync_receiver.decode_missing(msg)
         self.assertEqual(expected, actual)
 
+    def test_encode_missing_batch(self):
+        ts_iter = make_timestamp_iter()
+        t_data = next(ts_iter)
+        t_type = next(ts_iter)
+        t_meta = next(ts_iter)
+        t_older = Timestamp(t_data.raw * utils.PRECISION - 100, offset=3)
+        expected = [
+            {'object_hash': '9d41d8cd98f00b204e9800998ecf0abc',
+             'ts_data': t_data, 'ts_meta': t_meta, 'ts_ctype': t_type},
+            {'object_hash': '1d41d8cd98f00b204e9800998ecf0abc',
+             'ts_data': t_data, 'ts_meta': t_data, 'ts_ctype': t_data},
+            {'object_hash': '5d41d8cd98f00b204e9800998ecf0abc',
+             'ts_data': t_older, 'ts_meta': t_meta, 'ts_ctype': t_older},
+        ]
+        entries = [(e['object_hash'], {'ts_data': e['ts_data'],
+                                       'ts_meta': e['ts_meta'],
+                                       'ts_ctype': e['ts_ctype']})
+                   for e in expected]
+        data = ssync_sender.encode_missing_batch(entries)
+        # sorted by hash, timestamps of data files as deltas
+        self.assertEqual([
+            '1d41d8cd98f00b204e9800998ecf0abc %x' % t_data.raw,
+            '5d41d8cd98f00b204e9800998ecf0abc %x_3 m:%x' % (
+                t_older.raw - t_data.raw, t_meta.raw - t_older.raw),
+            '9d41d8cd98f00b204e9800998ecf0abc %x m:%x,t:%x' % (
+                t_data.raw - t_older.raw, t_meta.raw - t_data.raw,
+                t_type.raw - t_data.raw),
+        ], zlib.decompress(data).decode('ascii').splitlines())
+        # decoded like the lines of the legacy encoding
+        self.assertEqual(
+            [ssync_receiver.decode_missing(ssync_sender.encode_missing(**e))
+             for e in sorted(expected, key=lambda e: e['object_hash'])],
+            ssync_receiver.decode_missing_batch(data))
+
+    def test_encode_missing_batch_size(self):
+        # synthetic partition, as offered by a sender
+        fs = mem_diskfile.InMemoryFileSystem()
+        ts_iter = make_timestamp_iter()
+        for i in range(1000):
+            with fs.get_diskfile('a', 'c', 'o%d' % i).create() as writer:
+                writer.write(b'x')
+                writer.put({'X-Timestamp': next(ts_iter).internal})
+        entries = []
+        for name, (_fp, metadata) in fs._filesystem.items():
+            entries.append((utils.hash_path(*name[1:].split('/', 2)),
+                            {'ts_data': Timestamp(metadata['X-Timestamp'])}))
+        lines = b''.join(b'%s\r\n' % ssync_sender.encode_missing(h, **t)
+                         for h, t in entries)
+        batch = ssync_sender.encode_missing_batch(entries)
+        self.assertLess(len(batch), len(lines) * 0.6)
+        self.assertEqual(1000, len(ssync_receiver.decode_missing_batch(batch)))
+
+    def test_decode_wanted_batch(self):
+        lines = ['9d41d8cd98f00b204e9800998ecf0abc d',
+                 '1d41d8cd98f00b204e9800998ecf0abc dm']
+        data = ssync_receiver.encode_wanted_batch(lines)
+        self.assertEqual(
+            [['9d41d8cd98f00b204e9800998ecf0abc', 'd'],
+             ['1d41d8cd98f00b204e9800998ecf0abc', 'dm']],
+            ssync_sender.decode_wanted_batch(data))
+
     def test_decode_wanted(self):
         parts = ['d']
         expected = {'data': True}
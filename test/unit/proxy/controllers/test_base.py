@@ -34,6 +34,7 @@ from swift.common import exceptions
 from swift.common.utils import split_path, ShardRange, Timestamp, \
     GreenthreadSafeIterator, GreenAsyncPile
 from swift.common.header_key_dict import HeaderKeyDict
+from swift.common.memcached import MemcacheRing
 from swift.common.http import is_success
 from swift.common.storage_policy import StoragePolicy, StoragePolicyCollection
 from test.unit import (
@@ -451,6 +452,40 @@ class TestFuncs(BaseTest):
                                  [(k, str, v, str)
                                   for k, v in subdict.items()])
 
+    def test_get_container_info_get_multi(self):
+        memcache = MemcacheRing(['1.2.3.4:11211'])
+        infos = {
+            'account/a': {'status': 200, 'container_count': 1},
+            'container/a/c': {'status': 200, 'bytes': 3333,
+                              'object_count': 10},
+        }
+        memcache.get = mock.Mock(side_effect=infos.get)
+        memcache.get_multi = mock.Mock(
+            side_effect=lambda keys: [infos.get(k) for k in keys])
+        app = FakeApp()
+        req = Request.blank("/v1/a/c", environ={'swift.cache': memcache})
+        resp = get_container_info(req.environ, app)
+        self.assertEqual(resp['bytes'], 3333)
+        memcache.get_multi.assert_called_once_with(
+            ['account/a', 'container/a/c'])
+        self.assertFalse(memcache.get.called)
+        self.assertEqual(infos, req.environ['swift.infocache'])
+        self.assertEqual([], app.captured_envs)
+
+        # Container info not in memcache: the account info is already
+        # in the request-environment cache.
+        del infos['container/a/c']
+        req = Request.blank("/v1/a/c", environ={'swift.cache': memcache})
+        resp = get_container_info(req.environ, app)
+        self.assertEqual(resp['bytes'], 6666)
+        self.assertEqual(['/v1/a/c'],
+                         [e['PATH_INFO'] for e in app.captured_envs])
+
+        # Nothing to prefetch once the info is cached in the environment
+        memcache.get_multi.reset_mock()
+        get_container_info(req.environ, app)
+        self.assertFalse(memcache.get_multi.called)
+
     def test_get_cache_key(self):
         self.assertEqual(get_cache_key("account", "cont"),
                          'container/account/cont')
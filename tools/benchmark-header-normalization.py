@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# Copyright (c) 2020 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measure the cost of header name normalization in swob and HeaderKeyDict,
+with and without the normalization caches, by replaying the header
+accesses a proxy pipeline makes while handling an object PUT.
+"""
+
+from __future__ import print_function
+
+import argparse
+import time
+
+import mock
+
+from swift.common import header_key_dict, swob
+from swift.common.header_key_dict import HeaderKeyDict
+
+# Headers looked at by s3api, tempauth, slo and versioned_writes
+# (and the proxy itself) while handling a single object PUT.
+LOOKED_AT = [
+    'Authorization', 'X-Amz-Date', 'X-Amz-Content-Sha256',
+    'Content-Md5', 'X-Auth-Token', 'X-Storage-Token',
+    'X-Static-Large-Object', 'X-Copy-From', 'X-Object-Manifest',
+    'X-Versions-Location', 'X-History-Location', 'Transfer-Encoding',
+    'X-Timestamp', 'X-Backend-Storage-Policy-Index', 'If-None-Match',
+    'X-Delete-At', 'X-Delete-After', 'X-Object-Meta-Color']
+
+
+class Uncached(dict):
+    """Stand-in for a NormalizationCache, calling its function every time."""
+
+    def __init__(self, func):
+        super(Uncached, self).__init__()
+        self.func = func
+
+    def __getitem__(self, name):
+        return self.func(name)
+
+
+def make_args_parser():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=10000,
+                        help='requests replayed with and without the '
+                             'caches (default: %(default)s)')
+    return parser
+
+
+def pipeline():
+    req = swob.Request.blank('/v1/a/c/o', method='PUT', headers={
+        'Authorization': 'AWS test:tester:signature',
+        'X-Amz-Date': '20200101T000000Z',
+        'Content-Type': 'text/plain',
+        'Content-Length': '4',
+        'X-Object-Meta-Color': 'blue'})
+    for _ in range(10):
+        for name in LOOKED_AT:
+            name in req.headers
+            req.headers.get(name)
+    req.headers['X-Timestamp'] = '1234567890.12345'
+    resp_headers = HeaderKeyDict(req.headers)
+    for name in LOOKED_AT:
+        resp_headers.get(name)
+
+
+def replay(requests):
+    """:returns: the number of requests per second"""
+    start = time.time()
+    for _ in range(requests):
+        pipeline()
+    return requests / (time.time() - start)
+
+
+def main():
+    args = make_args_parser().parse_args()
+    cached_rate = replay(args.requests)
+    with mock.patch.object(
+            swob, '_environ_keys', Uncached(swob._header_to_environ_key)), \
+            mock.patch.object(swob, '_header_names',
+                              Uncached(swob._environ_key_to_header)), \
+            mock.patch.object(header_key_dict, '_titles',
+                              Uncached(header_key_dict._title)):
+        uncached_rate = replay(args.requests)
+    print('caches    requests/s')
+    print('enabled   %10.0f' % cached_rate)
+    print('disabled  %10.0f' % uncached_rate)
+
+
+if __name__ == '__main__':
+    main()
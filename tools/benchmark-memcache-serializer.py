@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# Copyright (c) 2020 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compare the memcache serializers (memcache_serializer in memcache.conf)
+on container info, as cached by the proxy server: size of the values,
+and time to encode and decode them.
+"""
+
+from __future__ import print_function
+
+import argparse
+import time
+
+from swift.common import memcached
+from swift.proxy.controllers.base import headers_to_container_info
+
+
+def make_args_parser():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=100000,
+                        help='values encoded and decoded with each '
+                             'serializer (default: %(default)s)')
+    return parser
+
+
+def container_info():
+    return headers_to_container_info({
+        'X-Container-Object-Count': '1000',
+        'X-Container-Bytes-Used': '6666',
+        'X-Container-Meta-Color': 'blue',
+        'X-Container-Sysmeta-Versions-Location': 'versions',
+        'X-Container-Read': '.r:*',
+    }, 200)
+
+
+def main():
+    args = make_args_parser().parse_args()
+    info = container_info()
+    serializers = [serializer for serializer in memcached.SERIALIZERS
+                   if serializer != 'msgpack' or memcached.msgpack]
+    print('serializer  bytes  encode/s  decode/s')
+    for serializer in serializers:
+        client = memcached.MemcacheRing([], serializer=serializer)
+        flags, value = client._serialize(info)
+        start = time.time()
+        for _ in range(args.iterations):
+            client._serialize(info)
+        encode_rate = args.iterations / (time.time() - start)
+        start = time.time()
+        for _ in range(args.iterations):
+            client._deserialize(flags, value)
+        decode_rate = args.iterations / (time.time() - start)
+        print('%-10s  %5d  %8.0f  %8.0f' % (
+            serializer, len(value), encode_rate, decode_rate))
+    if 'msgpack' not in serializers:
+        print('msgpack is not installed')
+
+
+if __name__ == '__main__':
+    main()
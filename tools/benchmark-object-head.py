@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# Copyright (c) 2020 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measure the HEAD throughput of an object server at various hit ratios
+of its metadata cache (see metadata_cache_size in object-server.conf).
+
+The objects are written in a temporary directory, which must be on a
+filesystem supporting extended attributes.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from swift.common import utils
+from swift.common.storage_policy import POLICIES
+from swift.common.swob import Request
+from swift.common.utils import Timestamp
+from swift.obj import server as object_server
+
+
+def make_args_parser():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--objects', type=int, default=20,
+                        help='number of objects (default: %(default)s)')
+    parser.add_argument('--requests', type=int, default=10000,
+                        help='HEAD requests for each hit ratio '
+                             '(default: %(default)s)')
+    parser.add_argument('--cache-size', type=int, default=1000,
+                        help='metadata_cache_size (default: %(default)s)')
+    parser.add_argument('--tmpdir', default=None,
+                        help='where to write the objects')
+    return parser
+
+
+def put_objects(app, count):
+    """Write objects, and return the paths of their directories."""
+    datadirs = []
+    old = time.time() - 10
+    for i in range(count):
+        req = Request.blank(
+            '/sda1/p/a/c/o%d' % i, environ={'REQUEST_METHOD': 'PUT'},
+            headers={'X-Timestamp': Timestamp.now().internal,
+                     'Content-Type': 'application/octet-stream',
+                     'X-Object-Meta-Color': 'blue'},
+            body=b'VERIFY')
+        resp = req.get_response(app)
+        if resp.status_int != 201:
+            raise Exception('PUT failed: %s' % resp.status)
+        datadir = app.get_diskfile(
+            'sda1', 'p', 'a', 'c', 'o%d' % i, POLICIES[0])._datadir
+        # Recently changed directories are not cached
+        os.utime(datadir, (old, old))
+        datadirs.append(datadir)
+    return datadirs
+
+
+def head_objects(app, cache, datadirs, requests, cached):
+    """
+    Send HEAD requests, `cached` out of every 10 of them being allowed
+    to hit the cache.
+
+    :returns: the number of requests per second
+    """
+    start = time.time()
+    for i in range(requests):
+        if (i % 10) >= cached:
+            cache.invalidate(datadirs[i % len(datadirs)])
+        req = Request.blank('/sda1/p/a/c/o%d' % (i % len(datadirs)),
+                            environ={'REQUEST_METHOD': 'HEAD'})
+        resp = req.get_response(app)
+        if resp.status_int != 200:
+            raise Exception('HEAD failed: %s' % resp.status)
+    return requests / (time.time() - start)
+
+
+def main():
+    args = make_args_parser().parse_args()
+    utils.HASH_PATH_SUFFIX = b'benchmark'
+    utils.HASH_PATH_PREFIX = b''
+    devices = tempfile.mkdtemp(dir=args.tmpdir)
+    try:
+        os.mkdir(os.path.join(devices, 'sda1'))
+        conf = {'devices': devices, 'mount_check': 'false',
+                'container_update_timeout': 0.0, 'log_requests': 'false',
+                'metadata_cache_size': str(args.cache_size)}
+        app = object_server.ObjectController(conf)
+        cache = app._diskfile_router[POLICIES[0]].metadata_cache
+        datadirs = put_objects(app, args.objects)
+        # Fill the cache
+        head_objects(app, cache, datadirs, len(datadirs), 10)
+        print('hit ratio  HEAD/s')
+        for cached in (0, 5, 9, 10):
+            hits = cache.hits
+            rate = head_objects(app, cache, datadirs, args.requests, cached)
+            print('%8.2f  %7.0f' % (
+                float(cache.hits - hits) / args.requests, rate))
+    finally:
+        shutil.rmtree(devices, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
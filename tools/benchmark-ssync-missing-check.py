@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# Copyright (c) 2020 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compare the size of the missing_check exchange of ssync, sent one line
+per object or in compressed batches (see ssync_missing_check_batch in
+object-server.conf), for a synthetic partition held in a mem_diskfile
+file system.
+
+The sizes include the chunked transfer encoding framing, as sent by
+the ssync sender.
+"""
+
+from __future__ import print_function
+
+import argparse
+import random
+import time
+
+from swift.common import utils
+from swift.common.utils import Timestamp
+from swift.obj import mem_diskfile
+from swift.obj.ssync_sender import encode_missing, encode_missing_batch
+
+
+def make_args_parser():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--objects', type=int, default=1000000,
+                        help='objects in the partition (default: %(default)s)')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='ssync_missing_check_batch '
+                             '(default: %(default)s)')
+    parser.add_argument('--spread', type=float, default=86400 * 30,
+                        help='seconds over which the objects were written '
+                             '(default: %(default)s)')
+    return parser
+
+
+def make_partition(count, spread):
+    """
+    Write `count` objects in an in-memory file system, with timestamps
+    spread over `spread` seconds.
+
+    :returns: the (object hash, timestamps) entries of the partition
+    """
+    fs = mem_diskfile.InMemoryFileSystem()
+    start = time.time() - spread
+    for i in range(count):
+        ts = Timestamp(start + random.random() * spread)
+        with fs.get_diskfile('a', 'c', 'o%d' % i).create() as writer:
+            writer.write(b'x')
+            writer.put({'X-Timestamp': ts.internal})
+    entries = []
+    for name, (_fp, metadata) in fs._filesystem.items():
+        entries.append((utils.hash_path(*name[1:].split('/', 2)),
+                        {'ts_data': Timestamp(metadata['X-Timestamp'])}))
+    return entries
+
+
+def lines_size(entries):
+    size = 0
+    for object_hash, timestamps in entries:
+        msg = b'%s\r\n' % encode_missing(object_hash, **timestamps)
+        size += len(b'%x\r\n%s\r\n' % (len(msg), msg))
+    return size
+
+
+def batches_size(entries, batch_size):
+    size = 0
+    for i in range(0, len(entries), batch_size):
+        data = encode_missing_batch(entries[i:i + batch_size])
+        msg = b':MISSING_CHECK: BATCH %x\r\n%s' % (len(data), data)
+        size += len(b'%x\r\n%s\r\n' % (len(msg), msg))
+    return size
+
+
+def main():
+    args = make_args_parser().parse_args()
+    utils.HASH_PATH_SUFFIX = b'benchmark'
+    utils.HASH_PATH_PREFIX = b''
+    entries = make_partition(args.objects, args.spread)
+    print('encoding  size (MB)  encode (s)')
+    for encoding, measure in (
+            ('lines', lambda: lines_size(entries)),
+            ('zlib', lambda: batches_size(entries, args.batch_size))):
+        start = time.time()
+        size = measure()
+        print('%-8s  %9.1f  %10.2f' % (
+            encoding, size / 1e6, time.time() - start))
+
+
+if __name__ == '__main__':
+    main()